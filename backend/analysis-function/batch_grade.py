@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Grade a whole cohort's saved transcripts in one run.
+
+Each item is analysed with exactly what ``handle_analysis`` uses: the same
+prompt, ANALYSIS_CONFIG, router and model fallback chain. Items are read
+from either source below; each item is ``{"id"?, "transcript": [...],
+"assessment": {...}}``.
+- A directory of ``.json`` files. The file name is the default id.
+- A ``.jsonl`` file. The default id is a hash of the transcript and
+  assessment.
+
+Items run on a bounded thread pool. A token bucket limits how fast requests
+start. Transient errors (quota, 5xx, every model unavailable) are retried
+with exponential backoff.
+
+Every finished item is appended to the output JSONL as soon as it completes,
+and the output doubles as the checkpoint. On a rerun, ids that already have
+an ``ok`` line are skipped; failed ids are tried again, and the latest line
+for an id wins. A summary with throughput and token totals is printed at the
+end.
+
+Usage:
+    python analysis-function/batch_grade.py transcripts/ --out grades.jsonl \\
+        [--concurrency 4] [--rate 2] [--retries 3]
+"""
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+FUNCTION_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _load_analysis():
+    """The analysis function module (shared with the combined service if it is loaded)."""
+    module = sys.modules.get("analysis_main")
+    if module is None:
+        spec = importlib.util.spec_from_file_location("analysis_main", os.path.join(FUNCTION_DIR, "main.py"))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules["analysis_main"] = module
+        spec.loader.exec_module(module)
+    return module
+
+
+analysis = _load_analysis()
+
+from common.breaker import FallbackExhausted, is_transient  # noqa: E402
+from common.singleflight import request_hash  # noqa: E402
+
+
+class RateLimiter:
+    """Token bucket: at most ``rate`` starts per second, bursts of ``burst``."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def load_items(source):
+    """Yield ``(id, item)`` from a directory of .json files or a .jsonl file."""
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            if name.endswith(".json"):
+                with open(os.path.join(source, name), encoding="utf-8") as f:
+                    item = json.load(f)
+                yield str(item.get("id") or os.path.splitext(name)[0]), item
+        return
+    with open(source, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                yield str(item.get("id") or request_hash('analyze', item, ('transcript', 'assessment'))[:16]), item
+
+
+def finished_ids(out_path):
+    """Ids with an ``ok`` result in ``out_path`` (the checkpoint)."""
+    status = {}
+    if os.path.exists(out_path):
+        with open(out_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # torn last line from a crash
+                status[record.get("id")] = record.get("status")
+    return {item_id for item_id, state in status.items() if state == "ok"}
+
+
+def _terminate_torn_line(out_path):
+    """End a line cut short by a crash so the next record starts cleanly."""
+    if os.path.exists(out_path) and os.path.getsize(out_path):
+        with open(out_path, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+
+
+def parse_analysis(text):
+    """The analysis JSON from the model text (optionally fenced), or None."""
+    cleaned = text.strip()
+    if cleaned.startswith("```"):
+        cleaned = cleaned.split("\n", 1)[1] if "\n" in cleaned else ""
+        cleaned = cleaned.rsplit("```", 1)[0]
+    try:
+        return json.loads(cleaned)
+    except ValueError:
+        return None
+
+
+def _usage(response):
+    usage = getattr(response, "usage_metadata", None)
+    fields = ("prompt_token_count", "candidates_token_count", "thoughts_token_count", "total_token_count")
+    return {name: getattr(usage, name, None) or 0 for name in fields}
+
+
+def grade(item, client):
+    """Run one analysis the way ``handle_analysis`` does. Returns ``(model, result)``."""
+    transcript_text = analysis.format_transcript(item.get("transcript", []))
+    prompt = analysis.build_analysis_prompt(transcript_text, item.get("assessment", {}))
+    prompt, local_grounding = analysis.with_local_grounding(prompt, transcript_text)
+    config = analysis.LOCAL_RAG_CONFIG if local_grounding else analysis.ANALYSIS_CONFIG
+    contents = [analysis.types.Content(role="user", parts=[analysis.types.Part(text=prompt)])]
+    route = analysis.ROUTER.route('analyze', len(transcript_text))
+
+    response, model = analysis.ANALYSIS_FALLBACK.call(route.timed(lambda model: client.models.generate_content(
+        model=model,
+        contents=contents,
+        config=route.config(model, config.get()),
+    )), first=route.model)
+
+    candidate = response.candidates[0] if response.candidates else None
+    parts = candidate.content.parts if candidate and candidate.content and candidate.content.parts else []
+    text = "".join(part.text for part in parts if getattr(part, "text", None) and not getattr(part, "thought", None))
+    # Same grounding shape the streamed analysis sends to the frontend
+    chunk_data = analysis.serialize_chunk(response, 0)
+    if analysis.REUSE_GROUNDING and not local_grounding:
+        analysis.record_grounding(transcript_text, chunk_data)
+    serialized = chunk_data["candidates"]
+    grounding = serialized[0].get("grounding_metadata", {}).get("grounding_chunks", []) if serialized else []
+    if local_grounding:
+        grounding = json.loads(local_grounding)["candidates"][0]["grounding_metadata"]["grounding_chunks"]
+    return model, {
+        "analysis": parse_analysis(text),
+        "text": text,
+        "grounding_chunks": grounding,
+        "usage": _usage(response),
+    }
+
+
+def _retryable(exc):
+    return isinstance(exc, FallbackExhausted) or is_transient(exc)
+
+
+def grade_with_retries(item_id, item, client, limiter, retries, backoff):
+    started = time.monotonic()
+    for attempt in range(1, retries + 2):
+        limiter.acquire()
+        try:
+            model, result = grade(item, client)
+            return {"id": item_id, "status": "ok", "model": model, "attempts": attempt,
+                    "seconds": round(time.monotonic() - started, 3), **result}
+        except Exception as e:
+            if attempt > retries or not _retryable(e):
+                logging.error(f"[batch] {item_id} failed after {attempt} attempt(s): {e}")
+                return {"id": item_id, "status": "error", "error": str(e), "attempts": attempt,
+                        "seconds": round(time.monotonic() - started, 3)}
+            delay = backoff * 2 ** (attempt - 1) * (0.5 + random.random())
+            logging.warning(f"[batch] {item_id} attempt {attempt} failed ({e}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def run_batch(source, out_path, client=None, concurrency=4, rate=2.0, retries=3, backoff=2.0):
+    """Grade every unfinished item of ``source`` into ``out_path``; returns the summary."""
+    client = client or analysis.client.get()
+    done = finished_ids(out_path)
+    items = list(load_items(source))
+    pending = [(item_id, item) for item_id, item in items if item_id not in done]
+    limiter = RateLimiter(rate, burst=max(1, concurrency))
+    write_lock = threading.Lock()
+    summary = {"skipped": len(items) - len(pending), "ok": 0, "error": 0, "prompt_tokens": 0, "output_tokens": 0,
+               "thoughts_tokens": 0, "total_tokens": 0}
+
+    _terminate_torn_line(out_path)
+    started = time.monotonic()
+    with open(out_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(grade_with_retries, item_id, item, client, limiter, retries, backoff)
+                   for item_id, item in pending]
+        for future in as_completed(futures):
+            record = future.result()
+            with write_lock:
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                os.fsync(out.fileno())
+            summary[record["status"]] += 1
+            usage = record.get("usage") or {}
+            summary["prompt_tokens"] += usage.get("prompt_token_count", 0)
+            summary["output_tokens"] += usage.get("candidates_token_count", 0)
+            summary["thoughts_tokens"] += usage.get("thoughts_token_count", 0)
+            summary["total_tokens"] += usage.get("total_token_count", 0)
+            logging.info(f"[batch] {record['id']}: {record['status']} "
+                         f"({summary['ok'] + summary['error']}/{len(pending)})")
+
+    elapsed = time.monotonic() - started
+    summary["seconds"] = round(elapsed, 2)
+    summary["items_per_min"] = round(60.0 * (summary["ok"] + summary["error"]) / elapsed, 2) if elapsed else 0.0
+    summary["tokens_per_s"] = round(summary["total_tokens"] / elapsed, 1) if elapsed else 0.0
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grade a directory or JSONL of transcripts with the analysis prompt.")
+    parser.add_argument("source", help="directory of .json items or a .jsonl file")
+    parser.add_argument("--out", required=True, help="results JSONL (also the resume checkpoint)")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=2.0, help="max requests started per second (0 = unlimited)")
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--backoff", type=float, default=2.0, help="first retry delay in seconds")
+    args = parser.parse_args()
+
+    summary = run_batch(args.source, args.out, concurrency=args.concurrency, rate=args.rate,
+                        retries=args.retries, backoff=args.backoff)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
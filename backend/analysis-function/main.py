@@ -1,193 +1,134 @@
 import functions_framework
 from flask import jsonify, Response
-from google import genai
-from google.genai import types
 import os
+import sys
 import json
 import logging
 import re
 from typing import List, Dict, Tuple
 
+# Shared helpers live in backend/common. A vendored copy next to this file
+# wins; otherwise fall back to the repo layout.
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.append(BACKEND_DIR)
+
+from common import metrics
+from common.admission import admit
+from common.breaker import FallbackChain
+from common.clients import get_client
+from common.criteria import CRITERIA_MAP
+from common.genai_config import SAFETY_SETTINGS
+from common.lazy import Lazy, lazy_import
+from common.retrieval import (LOCAL_INDEX_PATH, LOCAL_RETRIEVER, LOCAL_TOP_K, RAG_MODE, format_context,
+                              grounding_chunks)
+from common.retrieval_cache import RETRIEVAL_CACHE, REUSE_GROUNDING
+from common.router import ROUTER
+from common.settings import LAZY_INIT, env_bool, env_float
+from common.singleflight import SingleFlight, request_hash
+from common.frames import FRAMES_MIMETYPE
+from common.stream_events import stream_encoder, stream_variant
+from common.stream_window import STREAM_WINDOW_BYTES, STREAM_WINDOW_MS, windowed_chunks
+from common.warmup import WARMUP_ON_STARTUP, Warmup, import_genai, prime_client
+
+# google.genai.types is the single most expensive import; in lazy-init mode
+# it is only loaded when a request first needs it
+types = lazy_import("google.genai.types")
+
 # --- Initialize Logging ---
 logging.basicConfig(level=logging.INFO)
 
 # --- Initialize Google GenAI ---
-try:
-    project_id = os.environ.get("GOOGLE_CLOUD_PROJECT", "wz-case-worker-mentor")
-    if not project_id:
-        logging.warning("GOOGLE_CLOUD_PROJECT environment variable not set.")
-    
-    # Initialize the client
-    client = genai.Client(
-        vertexai=True,
-        project=project_id,
-        location="global",  # Using global for Discovery Engine
-    )
-    logging.info(f"Google GenAI initialized for project '{project_id}'")
-except Exception as e:
-    logging.error(f"CRITICAL: Error initializing Google GenAI: {e}", exc_info=True)
+project_id = os.environ.get("GOOGLE_CLOUD_PROJECT", "wz-case-worker-mentor")
+if not project_id:
+    logging.warning("GOOGLE_CLOUD_PROJECT environment variable not set.")
 
-MODEL_NAME = "gemini-2.5-flash"
 
-# Configure RAG tool with curriculum datastore
-RAG_TOOL = types.Tool(
-    retrieval=types.Retrieval(
-        vertex_ai_search=types.VertexAISearch(
-            datastore="projects/wz-case-worker-mentor/locations/global/collections/default_collection/dataStores/curriculum_1752784944010"
-        )
-    )
-)
+def _create_client():
+    try:
+        # Shared client (one per project/location per process)
+        client = get_client(project_id, "global")  # Using global for Discovery Engine
+        logging.info(f"Google GenAI initialized for project '{project_id}'")
+        return client
+    except Exception as e:
+        logging.error(f"CRITICAL: Error initializing Google GenAI: {e}", exc_info=True)
+        raise
 
-@functions_framework.http
-def social_work_ai(request):
-    """
-    HTTP Cloud Function for Social Work Coaching Simulator AI calls.
-    """
-    # --- CORS Handling ---
-    if request.method == 'OPTIONS':
-        headers = {
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Methods': 'GET, POST',
-            'Access-Control-Allow-Headers': 'Content-Type',
-            'Access-Control-Max-Age': '3600'
-        }
-        return ('', 204, headers)
 
-    headers = {
-        'Access-Control-Allow-Origin': '*',
-        'Access-Control-Allow-Methods': 'GET, POST',
-        'Access-Control-Allow-Headers': 'Content-Type'
-    }
+client = Lazy(_create_client)
 
-    if request.method != 'POST':
-        logging.warning(f"Received non-POST request: {request.method}")
-        return (jsonify({'error': 'Method not allowed. Use POST.'}), 405, headers)
+MODEL_NAME = ROUTER.primary('analyze')
 
-    try:
-        request_json = request.get_json(silent=True)
+# Model fallback behind per-model circuit breakers. Chat turns degrade to a
+# canned reply; analyses report an error line at once instead
+CHAT_CANNED_REPLY = "I'm having trouble responding right now. Please try again in a minute or two."
+CHAT_FALLBACK = FallbackChain.from_env('chat', MODEL_NAME, f"{project_id}/global", canned=CHAT_CANNED_REPLY)
+ANALYSIS_FALLBACK = FallbackChain.from_env('analysis', MODEL_NAME, f"{project_id}/global")
 
-        if not request_json:
-            logging.warning("Request JSON missing.")
-            return (jsonify({'error': 'Missing JSON body'}), 400, headers)
+# Share one model stream between identical in-flight analyses
+COALESCE_ENABLED = env_bool("CW_COALESCE_ANALYSES", True)
+IDEMPOTENCY_TTL_S = env_float("CW_IDEMPOTENCY_TTL_S", 60.0)
 
-        action = request_json.get('action')
-        
-        if action == 'chat':
-            return handle_chat(request_json, headers)
-        elif action == 'analyze':
-            return handle_analysis(request_json, headers)
-        elif action == 'supervisor_analysis':
-            return handle_supervisor_analysis(request_json, headers)
-        else:
-            return (jsonify({'error': 'Invalid action. Use "chat", "analyze", or "supervisor_analysis"'}), 400, headers)
 
-    except Exception as e:
-        logging.exception(f"An unexpected error occurred: {str(e)}")
-        return (jsonify({'error': 'An internal server error occurred.'}), 500, headers)
+RAG_DATASTORE = "projects/wz-case-worker-mentor/locations/global/collections/default_collection/dataStores/curriculum_1752784944010"
+# Cache namespace of local index searches
+LOCAL_DATASTORE = f"local:{LOCAL_INDEX_PATH}"
 
-def handle_chat(request_json, headers):
-    """Handle chat simulation requests"""
-    try:
-        message = request_json.get('message', '')
-        system_instruction = request_json.get('systemInstruction', '')
-        history = request_json.get('history', [])
-        
-        if not message:
-            return (jsonify({'error': 'Missing message field'}), 400, headers)
 
-        # Build contents with system instruction and history
-        contents = []
-        
-        # Add system instruction as first message if provided
-        if system_instruction:
-            contents.append(types.Content(
-                role="user",
-                parts=[types.Part(text=system_instruction)]
-            ))
-            contents.append(types.Content(
-                role="model",
-                parts=[types.Part(text="I understand. I'll follow these instructions.")]
-            ))
-        
-        # Add conversation history
-        for msg in history:
-            role = "user" if msg.get('role') == 'user' else "model"
-            parts_text = msg.get('parts', '')
-            if parts_text:
-                contents.append(types.Content(
-                    role=role,
-                    parts=[types.Part(text=parts_text)]
-                ))
-        
-        # Add current message
-        contents.append(types.Content(
-            role="user",
-            parts=[types.Part(text=message)]
-        ))
-        
-        # Configure generation with RAG grounding
-        config = types.GenerateContentConfig(
-            temperature=0.7,
-            max_output_tokens=1024,
-            safety_settings=[
-                types.SafetySetting(
-                    category="HARM_CATEGORY_HARASSMENT",
-                    threshold="BLOCK_ONLY_HIGH"
-                ),
-                types.SafetySetting(
-                    category="HARM_CATEGORY_HATE_SPEECH",
-                    threshold="BLOCK_ONLY_HIGH"
-                ),
-                types.SafetySetting(
-                    category="HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                    threshold="BLOCK_MEDIUM_AND_ABOVE"
-                ),
-                types.SafetySetting(
-                    category="HARM_CATEGORY_DANGEROUS_CONTENT",
-                    threshold="BLOCK_ONLY_HIGH"
-                )
-            ],
-            tools=[RAG_TOOL]  # Enable RAG grounding
-        )
-        
-        # Generate response
-        response = client.models.generate_content(
-            model=MODEL_NAME,
-            contents=contents,
-            config=config
+def _build_rag_tool():
+    # Configure RAG tool with curriculum datastore
+    return types.Tool(
+        retrieval=types.Retrieval(
+            vertex_ai_search=types.VertexAISearch(
+                datastore=RAG_DATASTORE
+            )
         )
-        
-        # Extract text from response
-        response_text = ""
-        if response.candidates and response.candidates[0].content and response.candidates[0].content.parts:
-            response_text = response.candidates[0].content.parts[0].text
-        
-        logging.info("Chat response generated successfully")
-        return (jsonify({'text': response_text, 'success': True}), 200, headers)
-        
-    except Exception as e:
-        logging.exception(f"Error in handle_chat: {str(e)}")
-        return (jsonify({'error': f'Chat generation failed: {str(e)}'}), 500, headers)
+    )
 
-def handle_analysis(request_json, headers):
-    """Handle transcript analysis requests"""
-    try:
-        transcript = request_json.get('transcript', [])
-        assessment = request_json.get('assessment', {})
-        system_instruction = request_json.get('systemInstruction', '')
-        
-        logging.info(f"Analysis request received - transcript items: {len(transcript)}")
-        logging.info(f"Assessment provided: {bool(assessment)}")
-        
-        if not transcript:
-            return (jsonify({'error': 'Missing transcript field'}), 400, headers)
 
-        # Format transcript
-        transcript_text = '\n'.join([f"{msg.get('role', 'unknown')}: {msg.get('parts', '')}" for msg in transcript])
-        logging.info(f"Formatted transcript length: {len(transcript_text)} characters")
-        
-        # Create analysis prompt with thinking instructions
-        analysis_prompt = f"""<thinking>
+RAG_TOOL = Lazy(_build_rag_tool)
+
+# Generation configs are identical for every request, so build them once
+# Chat: RAG grounding only
+CHAT_CONFIG = Lazy(lambda: types.GenerateContentConfig(
+    temperature=0.7,
+    max_output_tokens=1024,
+    safety_settings=SAFETY_SETTINGS.get(),
+    tools=[RAG_TOOL.get()]  # Enable RAG grounding
+))
+
+# Analysis: thinking mode and RAG grounding
+ANALYSIS_CONFIG = Lazy(lambda: types.GenerateContentConfig(
+    temperature=0.3,
+    max_output_tokens=32768,
+    safety_settings=SAFETY_SETTINGS.get(),
+    tools=[RAG_TOOL.get()],  # Enable RAG grounding for curriculum-based analysis
+    thinking_config=types.ThinkingConfig(
+        thinking_budget=24576,  # Maximum allowed value
+        include_thoughts=True  # Include thoughts in streaming
+    ),
+))
+
+# Supervisor analysis shares the analysis settings
+SUPERVISOR_CONFIG = ANALYSIS_CONFIG
+
+# CW_RAG_MODE=local|criteria: curriculum passages come from the local index
+# (or the precomputed criteria map) and are put into the prompt, so the
+# remote retrieval tool is left off
+LOCAL_RAG_CONFIG = Lazy(lambda: ANALYSIS_CONFIG.get().model_copy(update={'tools': None}))
+
+# thoughts=none: the model still thinks but does not send its thoughts
+QUIET_CONFIGS = {
+    config: Lazy(lambda config=config: config.get().model_copy(update={'thinking_config': types.ThinkingConfig(
+        thinking_budget=config.get().thinking_config.thinking_budget,
+        include_thoughts=False,
+    )}))
+    for config in (ANALYSIS_CONFIG, LOCAL_RAG_CONFIG)
+}
+
+
+# Prompt templates (filled in per request by the builders below)
+ANALYSIS_PROMPT_TEMPLATE = """<thinking>
 Analyze this social work parent interview transcript step by step:
 1. Review each interaction and identify key behaviors
 2. Match behaviors to the assessment criteria
@@ -215,7 +156,7 @@ Transcript:
 {transcript_text}
 
 Self-Assessment:
-{json.dumps(assessment, indent=2)}
+{assessment_json}
 
 Provide constructive, encouraging feedback grounded in the training materials. Focus on specific behaviors and actionable improvements.
 
@@ -298,6 +239,447 @@ EXAMPLE OF A GREAT RESPONSE:
 
 Respond with JSON in this exact format. Do not include any text outside the JSON structure.
 """
+
+SUPERVISOR_PROMPT_TEMPLATE = """You are an expert in management coaching for social work supervisors. Your task is to analyze the feedback a supervisor gave to a caseworker and evaluate the quality of the coaching itself.
+
+        **Transcript of Caseworker-Parent Interaction:**
+        {transcript_text}
+
+        **Supervisor's Feedback to Caseworker:**
+        "{supervisor_feedback}"
+
+        **Analysis Instructions:**
+        Based on the transcript and the feedback provided, evaluate the supervisor's coaching. Your analysis should be constructive, supportive, and help the supervisor improve their coaching skills.
+
+        - **Feedback on Acknowledging Strengths:** Did the supervisor effectively and specifically acknowledge the caseworker's strengths?
+        - **Feedback on Constructive Criticism:** Is the constructive criticism clear, specific, and actionable? Does it refer to specific moments in the transcript?
+        - **Overall Tone Assessment:** What is the overall tone of the feedback (e.g., 'Supportive and developmental', 'Too blunt', 'Vague and unhelpful')?
+        
+        IMPORTANT: 
+        1. Actively reference specific training concepts and best practices from the curriculum.
+        2. When providing feedback, quote directly from the transcript to support your analysis.
+        3. Include transcript citations [T1], [T2], etc. to mark specific quotes you reference.
+        4. When referencing curriculum/training materials, include citations like [1], [2], etc. that will map to the grounding chunks retrieved from the curriculum RAG TOOL datastore.
+
+        Return your analysis in a JSON object with the following keys: "feedbackOnStrengths", "feedbackOnCritique", "overallTone", "transcriptCitations".
+
+        EXAMPLE OF A GREAT RESPONSE:
+        {{
+          "feedbackOnStrengths": "The feedback effectively acknowledges the caseworker's strengths by highlighting a specific positive action: 'Great job building rapport by introducing yourself clearly' [T1]. By linking this praise to the caseworker's actual words from the transcript [T2], the feedback becomes more meaningful and reinforces the specific behavior. This aligns with the 'Partnering for Engagement' [1] curriculum, which emphasizes the importance of a strong introduction.",
+          "feedbackOnCritique": "The constructive criticism is clear, actionable, and supportive. It pinpoints a specific area for improvement ('how you explain the next steps') and offers a concrete, alternative phrasing [T3]. This helps the caseworker understand exactly what to do differently next time. This approach is supported by the 'Trauma-Informed Practice' guide [2], which notes that clear communication about next steps can reduce client anxiety.",
+          "overallTone": "Supportive and developmental",
+          "transcriptCitations": [
+            {{
+              "number": 1,
+              "marker": "[T1]",
+              "quote": "Great job building rapport by introducing yourself clearly",
+              "speaker": "supervisor"
+            }},
+            {{
+              "number": 2,
+              "marker": "[T2]",
+              "quote": "Hi, my name is Willis Thompson. I'm with the Oregon Department of Human Services, Child Welfare. Are you Sara Cooper?",
+              "speaker": "user"
+            }},
+            {{
+              "number": 3,
+              "marker": "[T3]",
+              "quote": "My next step is to talk with the children, and then we can create a safety plan together.",
+              "speaker": "supervisor"
+            }}
+          ]
+        }}
+        """
+
+
+def format_transcript(transcript):
+    """Render transcript messages as ``role: text`` lines."""
+    return '\n'.join([f"{msg.get('role', 'unknown')}: {msg.get('parts', '')}" for msg in transcript])
+
+
+def build_analysis_prompt(transcript_text, assessment):
+    """Caseworker analysis prompt for a formatted transcript and self-assessment."""
+    return ANALYSIS_PROMPT_TEMPLATE.format(
+        transcript_text=transcript_text,
+        assessment_json=json.dumps(assessment, indent=2),
+    )
+
+
+def build_supervisor_prompt(transcript_text, supervisor_feedback):
+    """Supervisor coaching analysis prompt."""
+    return SUPERVISOR_PROMPT_TEMPLATE.format(
+        transcript_text=transcript_text,
+        supervisor_feedback=supervisor_feedback,
+    )
+
+
+def grounding_line(passages):
+    """NDJSON chunk carrying ``passages`` as ``grounding_chunks``, sent before the model output."""
+    grounding = {"chunk_index": 0, "candidates": [{"grounding_metadata": {"grounding_chunks": grounding_chunks(passages)}}]}
+    return json.dumps(grounding, ensure_ascii=False) + "\n"
+
+
+# CW_RAG_MODE=criteria: the same precomputed passages for every analysis
+CRITERIA_GROUNDING = Lazy(lambda: grounding_line(CRITERIA_MAP.get().passages))
+
+
+def with_local_grounding(prompt, query, nprobe=None):
+    """``(prompt, grounding_line)`` with local curriculum excerpts for ``query`` appended.
+
+    The grounding line is an NDJSON chunk carrying the excerpts as
+    ``grounding_chunks`` so the frontend maps [N] citations as usual. Local
+    searches are cached (see ``common.retrieval_cache``). In criteria mode
+    the precomputed per-criterion passages are used whatever the query. In
+    remote mode the prompt is returned unchanged and the line is None,
+    unless ``CW_REUSE_GROUNDING`` is on and passages recorded for ``query``
+    are cached; those are used like local ones. ``nprobe`` is the request's
+    ANN recall/speed setting for local search (see ``common.ann``).
+    """
+    if RAG_MODE == 'criteria':
+        return f"{prompt}\n\n{CRITERIA_MAP.get().context()}", CRITERIA_GROUNDING.get()
+    if RAG_MODE == 'local':
+        passages = RETRIEVAL_CACHE.get_or_compute(
+            LOCAL_DATASTORE, query, lambda: LOCAL_RETRIEVER.get().search(query, k=LOCAL_TOP_K, nprobe=nprobe),
+            k=LOCAL_TOP_K, nprobe=nprobe)
+    elif REUSE_GROUNDING:
+        passages = RETRIEVAL_CACHE.get(RAG_DATASTORE, query)
+        if not passages:
+            return prompt, None
+    else:
+        return prompt, None
+    return f"{prompt}\n\n{format_context(passages)}", grounding_line(passages)
+
+
+def request_nprobe(request_json):
+    """The request's ``nprobe``: lists the ANN index searches, 0 for exact, None for the default."""
+    try:
+        nprobe = int(request_json['nprobe'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    return max(nprobe, 0)
+
+
+def record_grounding(query, chunk_data):
+    """Cache the remote passages in a serialized chunk for reuse with ``query``."""
+    passages = [g['retrieved_context'] for candidate in chunk_data['candidates']
+                for g in candidate.get('grounding_metadata', {}).get('grounding_chunks', [])
+                if g.get('retrieved_context', {}).get('text')]
+    if passages:
+        RETRIEVAL_CACHE.put(RAG_DATASTORE, query, passages)
+
+
+# --- Warmup ---
+def _warm_configs():
+    for value in (RAG_TOOL, CHAT_CONFIG, ANALYSIS_CONFIG, SUPERVISOR_CONFIG):
+        value.get()
+
+
+def _warm_prompts():
+    size = len(build_analysis_prompt('', {})) + len(build_supervisor_prompt('', ''))
+    return f"{size} template chars"
+
+
+def _warm_client():
+    client.get()
+
+
+WARMUP = Warmup('analysis')
+WARMUP.step('imports', import_genai)
+WARMUP.step('configs', _warm_configs)
+WARMUP.step('prompts', _warm_prompts)
+WARMUP.step('client', _warm_client)
+WARMUP.step('connection', lambda: prime_client(client.get(), MODEL_NAME), network=True)
+if RAG_MODE == 'local':
+    WARMUP.step('local_rag', lambda: f"{len(LOCAL_RETRIEVER.get().passages)} passages")
+if RAG_MODE == 'criteria':
+    WARMUP.step('criteria_map', lambda: f"{len(CRITERIA_GROUNDING.get())} bytes of grounding")
+
+
+def warmup(network=True):
+    """Run every warmup step that has not completed yet; returns per-step timings.
+
+    Called at import (without the network step) unless CW_LAZY_INIT is set,
+    by the ``warmup`` action, and in the background at startup when
+    CW_WARMUP_ON_STARTUP is set.
+    """
+    return WARMUP.run(network=network)
+
+
+def serialize_chunk(chunk, chunk_index):
+    """Convert one streamed SDK chunk into the JSON structure the frontend parses."""
+    chunk_data = {
+        "chunk_index": chunk_index,
+        "candidates": []
+    }
+    
+    if chunk.candidates:
+        for candidate in chunk.candidates:
+            candidate_data = {}
+            
+            # Content parts
+            if candidate.content and candidate.content.parts:
+                candidate_data["content"] = {
+                    "parts": []
+                }
+                
+                for part in candidate.content.parts:
+                    part_data = {}
+                    if hasattr(part, 'text') and part.text:
+                        part_data["text"] = part.text
+                    if hasattr(part, 'thought'):
+                        part_data["thought"] = part.thought
+                    
+                    if part_data:
+                        candidate_data["content"]["parts"].append(part_data)
+            
+            # Grounding metadata (usually only in final chunk)
+            if hasattr(candidate, 'grounding_metadata') and candidate.grounding_metadata:
+                if hasattr(candidate.grounding_metadata, 'grounding_chunks') and candidate.grounding_metadata.grounding_chunks:
+                    candidate_data["grounding_metadata"] = {
+                        "grounding_chunks": []
+                    }
+                    
+                    for idx, g_chunk in enumerate(candidate.grounding_metadata.grounding_chunks):
+                        g_data = {
+                            "_array_index": idx,  # 0-based array index
+                            "_citation_number": idx + 1,  # Maps to [1], [2], etc in text
+                        }
+                        
+                        if g_chunk.retrieved_context:
+                            ctx = g_chunk.retrieved_context
+                            g_data["retrieved_context"] = {
+                                "title": ctx.title if ctx.title else None,
+                                "uri": ctx.uri if ctx.uri else None,
+                                "text": ctx.text if ctx.text else None
+                            }
+                            
+                            # Include page span if available
+                            if hasattr(ctx, 'rag_chunk') and ctx.rag_chunk:
+                                if hasattr(ctx.rag_chunk, 'page_span') and ctx.rag_chunk.page_span:
+                                    g_data["retrieved_context"]["page_span"] = {
+                                        "first_page": ctx.rag_chunk.page_span.first_page,
+                                        "last_page": ctx.rag_chunk.page_span.last_page
+                                    }
+                        
+                        candidate_data["grounding_metadata"]["grounding_chunks"].append(g_data)
+            
+            if candidate_data:
+                chunk_data["candidates"].append(candidate_data)
+    
+    return chunk_data
+
+
+# --- Request coalescing ---
+# Request fields that determine the model output for each streamed action
+COALESCE_FIELDS = {
+    'analyze': ('transcript', 'assessment', 'systemInstruction', 'nprobe'),
+    'supervisor_analysis': ('transcript', 'assessment', 'nprobe'),
+}
+
+ANALYSIS_FLIGHTS = SingleFlight('analysis', idempotency_ttl=IDEMPOTENCY_TTL_S)
+
+
+def coalesce_key(action, request_json):
+    """Flight key for a streamed action, or None when it is not coalesced.
+
+    A client-supplied idempotency key (``Idempotency-Key`` header or
+    ``idempotencyKey`` field) takes precedence over the request hash.
+    Clients asking for different wire formats never share a flight. ``nprobe``
+    changes the local passages put into the prompt, so it is part of the
+    hash, normalized as ``request_nprobe`` reads it.
+    """
+    if not COALESCE_ENABLED or action not in COALESCE_FIELDS:
+        return None
+    variant = stream_variant(request_json)
+    suffix = f":{variant}" if variant else ""
+    idempotency_key = request_json.get('idempotencyKey')
+    if idempotency_key:
+        return f"{action}:key:{idempotency_key}{suffix}"
+    fields = {**request_json, 'nprobe': request_nprobe(request_json)}
+    return f"{action}:hash:{request_hash(action, fields, COALESCE_FIELDS[action])}{suffix}"
+
+
+def admit_coalesced(action, handler, request_json, headers):
+    """``admit`` that lets requests attaching to an existing stream skip admission.
+
+    Such requests cost no upstream work. Whether a request joins is decided
+    when it attaches, so one whose flight has just finished goes through
+    admission and becomes the leader of a new flight with a slot.
+    """
+    key = coalesce_key(action, request_json)
+    joined = ANALYSIS_FLIGHTS.join(key) if key is not None else None
+    if joined is None:
+        return admit(action, handler, request_json, headers)
+    mimetype = stream_encoder(request_json).mimetype
+    return admit(action, lambda request_json, headers: Response(joined, mimetype=mimetype, headers=headers),
+                 request_json, headers, bypass=True)
+
+
+def coalesced_stream(action, request_json, generate):
+    """Stream ``generate()`` shared with identical in-flight requests.
+
+    Idempotency-keyed streams are also replayed for IDEMPOTENCY_TTL_S
+    seconds after they finish.
+    """
+    key = coalesce_key(action, request_json)
+    if key is None:
+        return generate()
+    return ANALYSIS_FLIGHTS.stream(key, generate, replayable=':key:' in key)
+
+
+def apply_request_headers(request, request_json):
+    """Copy the stream options carried in headers into ``request_json``.
+
+    Shared by this function and the combined service in ``backend/main.py``.
+    """
+    if request.headers.get('Idempotency-Key'):
+        request_json['idempotencyKey'] = request.headers['Idempotency-Key']
+    # Internal consumers can negotiate binary frames for the analysis streams
+    if request.accept_mimetypes.best_match(['text/plain', FRAMES_MIMETYPE]) == FRAMES_MIMETYPE:
+        request_json['framing'] = 'msgpack'
+
+
+@functions_framework.http
+def social_work_ai(request):
+    """
+    HTTP Cloud Function for Social Work Coaching Simulator AI calls.
+    """
+    # --- CORS Handling ---
+    if request.method == 'OPTIONS':
+        headers = {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': 'GET, POST',
+            'Access-Control-Allow-Headers': 'Content-Type, Idempotency-Key',
+            'Access-Control-Max-Age': '3600'
+        }
+        return ('', 204, headers)
+
+    headers = {
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Allow-Methods': 'GET, POST',
+        'Access-Control-Allow-Headers': 'Content-Type, Idempotency-Key'
+    }
+
+    if request.method != 'POST':
+        logging.warning(f"Received non-POST request: {request.method}")
+        return (jsonify({'error': 'Method not allowed. Use POST.'}), 405, headers)
+
+    try:
+        request_json = request.get_json(silent=True)
+
+        if not request_json:
+            logging.warning("Request JSON missing.")
+            return (jsonify({'error': 'Missing JSON body'}), 400, headers)
+
+        apply_request_headers(request, request_json)
+
+        action = request_json.get('action')
+        
+        if action == 'chat':
+            return admit(action, handle_chat, request_json, headers)
+        elif action == 'analyze':
+            return admit_coalesced(action, handle_analysis, request_json, headers)
+        elif action == 'supervisor_analysis':
+            return admit_coalesced(action, handle_supervisor_analysis, request_json, headers)
+        elif action == 'warmup':
+            return (jsonify(warmup()), 200, headers)
+        elif action == 'metrics':
+            return (jsonify(metrics.snapshot()), 200, headers)
+        else:
+            return (jsonify({'error': 'Invalid action. Use "chat", "analyze", "supervisor_analysis", "warmup", or "metrics"'}), 400, headers)
+
+    except Exception as e:
+        logging.exception(f"An unexpected error occurred: {str(e)}")
+        return (jsonify({'error': 'An internal server error occurred.'}), 500, headers)
+
+def handle_chat(request_json, headers):
+    """Handle chat simulation requests"""
+    try:
+        message = request_json.get('message', '')
+        system_instruction = request_json.get('systemInstruction', '')
+        history = request_json.get('history', [])
+        
+        if not message:
+            return (jsonify({'error': 'Missing message field'}), 400, headers)
+
+        # Build contents with system instruction and history
+        contents = []
+        
+        # Add system instruction as first message if provided
+        if system_instruction:
+            contents.append(types.Content(
+                role="user",
+                parts=[types.Part(text=system_instruction)]
+            ))
+            contents.append(types.Content(
+                role="model",
+                parts=[types.Part(text="I understand. I'll follow these instructions.")]
+            ))
+        
+        # Add conversation history
+        for msg in history:
+            role = "user" if msg.get('role') == 'user' else "model"
+            parts_text = msg.get('parts', '')
+            if parts_text:
+                contents.append(types.Content(
+                    role=role,
+                    parts=[types.Part(text=parts_text)]
+                ))
+        
+        # Add current message
+        contents.append(types.Content(
+            role="user",
+            parts=[types.Part(text=message)]
+        ))
+        
+        # Pick the model for this turn from its size and recent model latency
+        input_chars = len(system_instruction) + len(message) + sum(len(msg.get('parts', '')) for msg in history)
+        route = ROUTER.route('chat', input_chars)
+
+        # Generate response
+        response, model = CHAT_FALLBACK.call(route.timed(lambda model: client.get().models.generate_content(
+            model=model,
+            contents=contents,
+            config=route.config(model, CHAT_CONFIG.get())
+        )), first=route.model)
+        if model == 'canned':
+            return (jsonify({'text': response, 'success': True, 'degraded': True}), 200, headers)
+        
+        # Extract text from response
+        response_text = ""
+        if response.candidates and response.candidates[0].content and response.candidates[0].content.parts:
+            response_text = response.candidates[0].content.parts[0].text
+        
+        logging.info("Chat response generated successfully")
+        return (jsonify({'text': response_text, 'success': True}), 200, headers)
+        
+    except Exception as e:
+        logging.exception(f"Error in handle_chat: {str(e)}")
+        return (jsonify({'error': f'Chat generation failed: {str(e)}'}), 500, headers)
+
+def handle_analysis(request_json, headers):
+    """Handle transcript analysis requests"""
+    try:
+        transcript = request_json.get('transcript', [])
+        assessment = request_json.get('assessment', {})
+        system_instruction = request_json.get('systemInstruction', '')
+        
+        logging.info(f"Analysis request received - transcript items: {len(transcript)}")
+        logging.info(f"Assessment provided: {bool(assessment)}")
+        
+        if not transcript:
+            return (jsonify({'error': 'Missing transcript field'}), 400, headers)
+
+        # Format transcript
+        transcript_text = format_transcript(transcript)
+        logging.info(f"Formatted transcript length: {len(transcript_text)} characters")
+        
+        # Create analysis prompt with thinking instructions
+        analysis_prompt = build_analysis_prompt(transcript_text, assessment)
+        analysis_prompt, local_grounding = with_local_grounding(analysis_prompt, transcript_text,
+                                                                request_nprobe(request_json))
+        config = LOCAL_RAG_CONFIG if local_grounding else ANALYSIS_CONFIG
+        record = REUSE_GROUNDING and not local_grounding
         
         # Build content for analysis
         contents = [types.Content(
@@ -307,37 +689,14 @@ Respond with JSON in this exact format. Do not include any text outside the JSON
         
         logging.info(f"Analysis prompt prepared - length: {len(analysis_prompt)} characters")
         
-        # Configure generation with thinking mode and RAG grounding
-        config = types.GenerateContentConfig(
-            temperature=0.3,
-            max_output_tokens=32768,
-            safety_settings=[
-                types.SafetySetting(
-                    category="HARM_CATEGORY_HARASSMENT",
-                    threshold="BLOCK_ONLY_HIGH"
-                ),
-                types.SafetySetting(
-                    category="HARM_CATEGORY_HATE_SPEECH",
-                    threshold="BLOCK_ONLY_HIGH"
-                ),
-                types.SafetySetting(
-                    category="HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                    threshold="BLOCK_MEDIUM_AND_ABOVE"
-                ),
-                types.SafetySetting(
-                    category="HARM_CATEGORY_DANGEROUS_CONTENT",
-                    threshold="BLOCK_ONLY_HIGH"
-                )
-            ],
-            tools=[RAG_TOOL],  # Enable RAG grounding for curriculum-based analysis
-            thinking_config=types.ThinkingConfig(
-                thinking_budget=24576,  # Maximum allowed value
-                include_thoughts=True  # Include thoughts in streaming
-            ),
-        )
-        
+        # Pick the model and thinking budget from the transcript size and recent model latency
+        route = ROUTER.route('analyze', len(transcript_text))
+        encoder = stream_encoder(request_json)
+        if encoder.thoughts == 'none':
+            config = QUIET_CONFIGS[config]
+
         # Generate analysis with streaming
-        logging.info(f"Calling Gemini model '{MODEL_NAME}' for analysis with streaming...")
+        logging.info(f"Calling Gemini model '{route.model}' for analysis with streaming...")
         
         def generate():
             """Generator function for streaming response"""
@@ -348,83 +707,40 @@ Respond with JSON in this exact format. Do not include any text outside the JSON
                 print("=" * 80)
                 print("RAW STREAMING OUTPUT START")
                 print("=" * 80)
+
+                # Local curriculum excerpts go out first, in the grounding shape
+                if local_grounding:
+                    yield encoder.grounding(local_grounding)
                 
                 # Stream the response from the model
-                for chunk in client.models.generate_content_stream(
-                    model=MODEL_NAME,
+                model_stream = ANALYSIS_FALLBACK.stream(route.timed_stream(lambda model: client.get().models.generate_content_stream(
+                    model=model,
                     contents=contents,
-                    config=config
-                ):
+                    config=route.config(model, config.get())
+                )), first=route.model)
+                serialized = ((serialize_chunk(chunk, index), chunk.usage_metadata)
+                              for index, chunk in enumerate(model_stream, start=1))
+                # Tiny consecutive chunks of one kind go out together
+                for chunk_data, usage in windowed_chunks(serialized, STREAM_WINDOW_MS, STREAM_WINDOW_BYTES):
                     chunk_index += 1
-                    
-                    # Build raw chunk structure exactly like test script
-                    chunk_data = {
-                        "chunk_index": chunk_index,
-                        "candidates": []
-                    }
-                    
-                    if chunk.candidates:
-                        for candidate in chunk.candidates:
-                            candidate_data = {}
-                            
-                            # Content parts
-                            if candidate.content and candidate.content.parts:
-                                candidate_data["content"] = {
-                                    "parts": []
-                                }
-                                
-                                for part in candidate.content.parts:
-                                    part_data = {}
-                                    if hasattr(part, 'text') and part.text:
-                                        part_data["text"] = part.text
-                                    if hasattr(part, 'thought'):
-                                        part_data["thought"] = part.thought
-                                    
-                                    if part_data:
-                                        candidate_data["content"]["parts"].append(part_data)
-                            
-                            # Grounding metadata (usually only in final chunk)
-                            if hasattr(candidate, 'grounding_metadata') and candidate.grounding_metadata:
-                                if hasattr(candidate.grounding_metadata, 'grounding_chunks') and candidate.grounding_metadata.grounding_chunks:
-                                    candidate_data["grounding_metadata"] = {
-                                        "grounding_chunks": []
-                                    }
-                                    
-                                    for idx, g_chunk in enumerate(candidate.grounding_metadata.grounding_chunks):
-                                        g_data = {
-                                            "_array_index": idx,  # 0-based array index
-                                            "_citation_number": idx + 1,  # Maps to [1], [2], etc in text
-                                        }
-                                        
-                                        if g_chunk.retrieved_context:
-                                            ctx = g_chunk.retrieved_context
-                                            g_data["retrieved_context"] = {
-                                                "title": ctx.title if ctx.title else None,
-                                                "uri": ctx.uri if ctx.uri else None,
-                                                "text": ctx.text if ctx.text else None
-                                            }
-                                            
-                                            # Include page span if available
-                                            if hasattr(ctx, 'rag_chunk') and ctx.rag_chunk:
-                                                if hasattr(ctx.rag_chunk, 'page_span') and ctx.rag_chunk.page_span:
-                                                    g_data["retrieved_context"]["page_span"] = {
-                                                        "first_page": ctx.rag_chunk.page_span.first_page,
-                                                        "last_page": ctx.rag_chunk.page_span.last_page
-                                                    }
-                                        
-                                        candidate_data["grounding_metadata"]["grounding_chunks"].append(g_data)
-                            
-                            if candidate_data:
-                                chunk_data["candidates"].append(candidate_data)
+                    if record:
+                        record_grounding(transcript_text, chunk_data)
+                    line = encoder.chunk(chunk_data, usage)
+                    if not line:
+                        continue
                     
                     # Store chunk in accumulator
-                    raw_stream_accumulator.append(json.dumps(chunk_data, ensure_ascii=False))
+                    raw_stream_accumulator.append(encoder.describe(line))
                     
                     # Print raw chunk for debugging in cloud logs
-                    print(json.dumps(chunk_data, ensure_ascii=False))
+                    print(encoder.describe(line))
                     
-                    # Output raw JSON structure with newline delimiter
-                    yield json.dumps(chunk_data, ensure_ascii=False) + "\n"
+                    # Output in the requested protocol, newline delimited
+                    yield line
+                
+                ending = encoder.done()
+                if ending:
+                    yield ending
                 
                 # Print final summary of raw stream
                 print("\n" + "=" * 80)
@@ -444,10 +760,13 @@ Respond with JSON in this exact format. Do not include any text outside the JSON
                     
             except Exception as e:
                 logging.exception(f"Error during streaming: {str(e)}")
-                yield json.dumps({'error': f'Streaming failed: {str(e)}'}) + "\n"
+                yield encoder.error(f'Streaming failed: {str(e)}')
         
-        # Return streaming response with newline delimiter
-        return Response(generate(), mimetype='text/plain', headers=headers)
+        # Identical in-flight requests share one model stream
+        stream = coalesced_stream('analyze', request_json, generate)
+
+        # Return streaming response with newline delimiter (or binary frames)
+        return Response(stream, mimetype=encoder.mimetype, headers=headers)
         
     except Exception as e:
         logging.exception(f"Error in handle_analysis: {str(e)}")
@@ -462,145 +781,59 @@ def handle_supervisor_analysis(request_json, headers):
         if not transcript or not supervisor_feedback:
             return (jsonify({'error': 'Missing transcript or supervisorFeedback'}), 400, headers)
 
-        transcript_text = '\n'.join([f"{msg.get('role', 'unknown')}: {msg.get('parts', '')}" for msg in transcript])
+        transcript_text = format_transcript(transcript)
 
         # New prompt for coaching the coach
-        prompt = f"""You are an expert in management coaching for social work supervisors. Your task is to analyze the feedback a supervisor gave to a caseworker and evaluate the quality of the coaching itself.
-
-        **Transcript of Caseworker-Parent Interaction:**
-        {transcript_text}
-
-        **Supervisor's Feedback to Caseworker:**
-        "{supervisor_feedback}"
-
-        **Analysis Instructions:**
-        Based on the transcript and the feedback provided, evaluate the supervisor's coaching. Your analysis should be constructive, supportive, and help the supervisor improve their coaching skills.
-
-        - **Feedback on Acknowledging Strengths:** Did the supervisor effectively and specifically acknowledge the caseworker's strengths?
-        - **Feedback on Constructive Criticism:** Is the constructive criticism clear, specific, and actionable? Does it refer to specific moments in the transcript?
-        - **Overall Tone Assessment:** What is the overall tone of the feedback (e.g., 'Supportive and developmental', 'Too blunt', 'Vague and unhelpful')?
-        
-        IMPORTANT: 
-        1. Actively reference specific training concepts and best practices from the curriculum.
-        2. When providing feedback, quote directly from the transcript to support your analysis.
-        3. Include transcript citations [T1], [T2], etc. to mark specific quotes you reference.
-        4. When referencing curriculum/training materials, include citations like [1], [2], etc. that will map to the grounding chunks retrieved from the curriculum RAG TOOL datastore.
-
-        Return your analysis in a JSON object with the following keys: "feedbackOnStrengths", "feedbackOnCritique", "overallTone", "transcriptCitations".
-
-        EXAMPLE OF A GREAT RESPONSE:
-        {{
-          "feedbackOnStrengths": "The feedback effectively acknowledges the caseworker's strengths by highlighting a specific positive action: 'Great job building rapport by introducing yourself clearly' [T1]. By linking this praise to the caseworker's actual words from the transcript [T2], the feedback becomes more meaningful and reinforces the specific behavior. This aligns with the 'Partnering for Engagement' [1] curriculum, which emphasizes the importance of a strong introduction.",
-          "feedbackOnCritique": "The constructive criticism is clear, actionable, and supportive. It pinpoints a specific area for improvement ('how you explain the next steps') and offers a concrete, alternative phrasing [T3]. This helps the caseworker understand exactly what to do differently next time. This approach is supported by the 'Trauma-Informed Practice' guide [2], which notes that clear communication about next steps can reduce client anxiety.",
-          "overallTone": "Supportive and developmental",
-          "transcriptCitations": [
-            {{
-              "number": 1,
-              "marker": "[T1]",
-              "quote": "Great job building rapport by introducing yourself clearly",
-              "speaker": "supervisor"
-            }},
-            {{
-              "number": 2,
-              "marker": "[T2]",
-              "quote": "Hi, my name is Willis Thompson. I'm with the Oregon Department of Human Services, Child Welfare. Are you Sara Cooper?",
-              "speaker": "user"
-            }},
-            {{
-              "number": 3,
-              "marker": "[T3]",
-              "quote": "My next step is to talk with the children, and then we can create a safety plan together.",
-              "speaker": "supervisor"
-            }}
-          ]
-        }}
-        """
+        prompt = build_supervisor_prompt(transcript_text, supervisor_feedback)
+        query = f"{supervisor_feedback}\n{transcript_text}"
+        prompt, local_grounding = with_local_grounding(prompt, query, request_nprobe(request_json))
+        config = LOCAL_RAG_CONFIG if local_grounding else SUPERVISOR_CONFIG
+        record = REUSE_GROUNDING and not local_grounding
 
         contents = [types.Content(role="user", parts=[types.Part(text=prompt)])]
+        route = ROUTER.route('supervisor_analysis', len(transcript_text))
+        encoder = stream_encoder(request_json)
+        if encoder.thoughts == 'none':
+            config = QUIET_CONFIGS[config]
         
-        config = types.GenerateContentConfig(
-            temperature=0.3,
-            max_output_tokens=32768,
-            safety_settings=[
-                types.SafetySetting(
-                    category="HARM_CATEGORY_HARASSMENT",
-                    threshold="BLOCK_ONLY_HIGH"
-                ),
-                types.SafetySetting(
-                    category="HARM_CATEGORY_HATE_SPEECH",
-                    threshold="BLOCK_ONLY_HIGH"
-                ),
-                types.SafetySetting(
-                    category="HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                    threshold="BLOCK_MEDIUM_AND_ABOVE"
-                ),
-                types.SafetySetting(
-                    category="HARM_CATEGORY_DANGEROUS_CONTENT",
-                    threshold="BLOCK_ONLY_HIGH"
-                )
-            ],
-            tools=[RAG_TOOL],
-            thinking_config=types.ThinkingConfig(
-                thinking_budget=24576,
-                include_thoughts=True
-            ),
-        )
-
         def generate():
             """Generator function for streaming response"""
             chunk_index = 0
-            raw_stream_accumulator = []
             
             try:
-                for chunk in client.models.generate_content_stream(
-                    model=MODEL_NAME,
+                if local_grounding:
+                    yield encoder.grounding(local_grounding)
+                model_stream = ANALYSIS_FALLBACK.stream(route.timed_stream(lambda model: client.get().models.generate_content_stream(
+                    model=model,
                     contents=contents,
-                    config=config
-                ):
+                    config=route.config(model, config.get())
+                )), first=route.model)
+                serialized = ((serialize_chunk(chunk, index), chunk.usage_metadata)
+                              for index, chunk in enumerate(model_stream, start=1))
+                for chunk_data, usage in windowed_chunks(serialized, STREAM_WINDOW_MS, STREAM_WINDOW_BYTES):
                     chunk_index += 1
-                    chunk_data = {"chunk_index": chunk_index, "candidates": []}
-                    if chunk.candidates:
-                        for candidate in chunk.candidates:
-                            candidate_data = {}
-                            if candidate.content and candidate.content.parts:
-                                candidate_data["content"] = {"parts": []}
-                                for part in candidate.content.parts:
-                                    part_data = {}
-                                    if hasattr(part, 'text') and part.text:
-                                        part_data["text"] = part.text
-                                    if hasattr(part, 'thought'):
-                                        part_data["thought"] = part.thought
-                                    if part_data:
-                                        candidate_data["content"]["parts"].append(part_data)
-                            if hasattr(candidate, 'grounding_metadata') and candidate.grounding_metadata:
-                                if hasattr(candidate.grounding_metadata, 'grounding_chunks') and candidate.grounding_metadata.grounding_chunks:
-                                    candidate_data["grounding_metadata"] = {"grounding_chunks": []}
-                                    for idx, g_chunk in enumerate(candidate.grounding_metadata.grounding_chunks):
-                                        g_data = {"_array_index": idx, "_citation_number": idx + 1}
-                                        if g_chunk.retrieved_context:
-                                            ctx = g_chunk.retrieved_context
-                                            g_data["retrieved_context"] = {
-                                                "title": ctx.title if ctx.title else None,
-                                                "uri": ctx.uri if ctx.uri else None,
-                                                "text": ctx.text if ctx.text else None
-                                            }
-                                            if hasattr(ctx, 'rag_chunk') and ctx.rag_chunk and hasattr(ctx.rag_chunk, 'page_span') and ctx.rag_chunk.page_span:
-                                                g_data["retrieved_context"]["page_span"] = {
-                                                    "first_page": ctx.rag_chunk.page_span.first_page,
-                                                    "last_page": ctx.rag_chunk.page_span.last_page
-                                                }
-                                        candidate_data["grounding_metadata"]["grounding_chunks"].append(g_data)
-                            if candidate_data:
-                                chunk_data["candidates"].append(candidate_data)
-                    raw_stream_accumulator.append(json.dumps(chunk_data, ensure_ascii=False))
-                    yield json.dumps(chunk_data, ensure_ascii=False) + "\n"
+                    if record:
+                        record_grounding(query, chunk_data)
+                    line = encoder.chunk(chunk_data, usage)
+                    if line:
+                        yield line
+                ending = encoder.done()
+                if ending:
+                    yield ending
                 logging.info(f"Streaming complete - total chunks: {chunk_index}")
             except Exception as e:
                 logging.exception(f"Error during streaming: {str(e)}")
-                yield json.dumps({'error': f'Streaming failed: {str(e)}'}) + "\n"
+                yield encoder.error(f'Streaming failed: {str(e)}')
         
-        return Response(generate(), mimetype='text/plain', headers=headers)
+        stream = coalesced_stream('supervisor_analysis', request_json, generate)
+        return Response(stream, mimetype=encoder.mimetype, headers=headers)
 
     except Exception as e:
         logging.exception(f"Error in handle_supervisor_analysis: {str(e)}")
         return (jsonify({'error': f'Supervisor analysis failed: {str(e)}'}), 500, headers)
+
+
+if not LAZY_INIT:
+    warmup(network=False)
+if WARMUP_ON_STARTUP:
+    WARMUP.start_background()
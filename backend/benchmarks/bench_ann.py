@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Recall@k vs latency of the IVF-PQ index against exact search over the store.
+
+There is no multi-state corpus to load, so one is synthesised from the
+recorded curriculum vocabulary (see ``retrieval_data``). ``--topics`` random
+30-word topics are drawn from the vocabulary. Each chunk takes 70% of its
+words from one topic, 15% from a second and 15% from anywhere. Queries are
+6 words from one topic. Chunks and queries are encoded for real, so
+building the store is most of the run time at 1M.
+
+For each size the report has:
+- the exact p50/p95 latency;
+- the index build time, and an incremental update that drops 1% of the
+  chunks and inserts 1% new ones;
+- for each ``nprobe``, recall@k (the share of exact top-k rows returned)
+  and p50/p95 latency.
+
+Usage:
+    python benchmarks/bench_ann.py [--sizes 10000 100000] [--dim 256] [-k 10] [--queries 100]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.retrieval_data import recorded_passages  # noqa: E402
+from common.ann import AnnIndex, build_ann  # noqa: E402
+from common.embeddings import EmbeddingStore, build_store  # noqa: E402
+from common.metrics import percentile  # noqa: E402
+from common.retrieval import passage_text, tokenize  # noqa: E402
+
+NPROBES = (1, 2, 4, 8, 16, 32, 64)
+
+
+def corpus(rng, vocab, topics, size, words=60):
+    picks = rng.integers(len(topics), size=(size, 2))
+    return [" ".join([*rng.choice(topics[a], int(words * 0.7)), *rng.choice(topics[b], int(words * 0.15)),
+                      *rng.choice(vocab, int(words * 0.15))]) for a, b in picks]
+
+
+def timed(search, queries):
+    latencies, results = [], []
+    for query in queries:
+        started = time.perf_counter()
+        rows, _ = search(query)
+        latencies.append(time.perf_counter() - started)
+        results.append(set(rows.tolist()))
+    latencies.sort()
+    return {"p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2)}, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--topics", type=int, default=500)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    vocab = sorted({token for p in recorded_passages() for token in tokenize(passage_text(p))})
+    topics = [rng.choice(vocab, 30, replace=False) for _ in range(args.topics)]
+    report = {"dim": args.dim, "k": args.k, "vocabulary": len(vocab)}
+
+    tmp = tempfile.mkdtemp()
+    try:
+        for size in args.sizes:
+            texts = corpus(rng, vocab, topics, size)
+            store_dir, ann_dir = os.path.join(tmp, f"store-{size}"), os.path.join(tmp, f"ann-{size}")
+            started = time.perf_counter()
+            build_store(store_dir, texts, dim=args.dim)
+            point = {"store_build_s": round(time.perf_counter() - started, 1)}
+            built = build_ann(ann_dir, EmbeddingStore(store_dir))
+            point["ann_build_s"], point["nlist"] = built["seconds"], built["nlist"]
+
+            changed = texts[size // 100:] + corpus(rng, vocab, topics, size // 100)
+            build_store(store_dir, changed, dim=args.dim)
+            store = EmbeddingStore(store_dir)
+            update = build_ann(ann_dir, store)
+            point["update"] = {key: update[key] for key in ("inserted", "removed", "trained", "seconds")}
+
+            index = AnnIndex(ann_dir)
+            queries = [store.embed(tokenize(" ".join(rng.choice(topics[rng.integers(len(topics))], 6))))
+                       for _ in range(args.queries)]
+            point["exact"], exact = timed(lambda q: store.top_k(q, args.k), queries)
+            point["nprobe"] = {}
+            for nprobe in NPROBES:
+                if nprobe > built["nlist"]:
+                    break
+                latency, found = timed(lambda q: index.search(store, q, args.k, nprobe=nprobe), queries)
+                recall = sum(len(a & b) / len(a) for a, b in zip(exact, found)) / len(queries)
+                point["nprobe"][nprobe] = {f"recall@{args.k}": round(recall, 3), **latency}
+            report[str(size)] = point
+            del store, index
+            shutil.rmtree(store_dir)
+            shutil.rmtree(ann_dir)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Cold-start and memory comparison: three separate functions vs the combined
+service in backend/main.py.
+
+Each measurement runs in a fresh interpreter so nothing is shared between
+runs. "import" is how long the platform waits before the instance can take
+a request; "ready" additionally includes the offline warmup steps
+(google.genai imported, configs and prompts built, clients created). With --lazy the same deployments are also
+measured with CW_LAZY_INIT=1.
+
+Usage:
+    python benchmarks/bench_cold_start.py [--runs 5] [--lazy]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r'''
+import importlib.util, json, os, resource, sys, time
+t0 = time.perf_counter()
+sys.path.insert(0, {backend!r})
+spec = importlib.util.spec_from_file_location("fn_main", {path!r})
+module = importlib.util.module_from_spec(spec)
+sys.modules["fn_main"] = module
+spec.loader.exec_module(module)
+t_import = time.perf_counter() - t0
+module.warmup(network=False)
+t_ready = time.perf_counter() - t0
+print(json.dumps({{
+    "import_s": t_import,
+    "ready_s": t_ready,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}}))
+'''
+
+DEPLOYMENTS = {
+    "analysis-function": "analysis-function/main.py",
+    "simulation-function": "simulation-function/main.py",
+    "mentorship-function": "mentorship-function/main.py",
+    "combined": "main.py",
+}
+
+
+def measure(name, lazy=False):
+    code = CHILD.format(
+        backend=BACKEND_DIR,
+        path=os.path.join(BACKEND_DIR, DEPLOYMENTS[name]),
+    )
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1", CW_LAZY_INIT="1" if lazy else "0")
+    start = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True, text=True, check=True, env=env,
+    )
+    wall = time.perf_counter() - start
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    result["wall_s"] = wall
+    return result
+
+
+def report(results):
+    def med(name, key):
+        return statistics.median(r[key] for r in results[name])
+
+    print(f"{'deployment':<22}{'wall s':>9}{'import s':>10}{'ready s':>9}{'RSS MB':>9}")
+    for name in DEPLOYMENTS:
+        print(f"{name:<22}{med(name, 'wall_s'):>9.3f}{med(name, 'import_s'):>10.3f}"
+              f"{med(name, 'ready_s'):>9.3f}{med(name, 'max_rss_mb'):>9.1f}")
+
+    separate = [n for n in DEPLOYMENTS if n != "combined"]
+    print("-" * 59)
+    print(f"three functions: {sum(med(n, 'wall_s') for n in separate):.3f}s total cold start, "
+          f"{sum(med(n, 'max_rss_mb') for n in separate):.1f} MB across 3 instances")
+    print(f"single service:  {med('combined', 'wall_s'):.3f}s cold start, "
+          f"{med('combined', 'max_rss_mb'):.1f} MB in 1 instance")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--lazy", action="store_true", help="also measure CW_LAZY_INIT=1")
+    args = parser.parse_args()
+
+    modes = [False, True] if args.lazy else [False]
+    for lazy in modes:
+        print(f"== CW_LAZY_INIT={int(lazy)} ==")
+        report({name: [measure(name, lazy) for _ in range(args.runs)] for name in DEPLOYMENTS})
+        print()
+
+
+if __name__ == "__main__":
+    main()
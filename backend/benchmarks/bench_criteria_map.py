@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Grounding latency and citation consistency: per-transcript retrieval vs the
+precomputed criteria map.
+
+The corpus is the recorded curriculum passages (see ``retrieval_data``).
+Synthetic transcripts are built from the labeled queries, so each one
+touches a few different topics. Every transcript is analysed ``--repeat``
+times through ``with_local_grounding`` in two modes:
+- ``local``: a fresh search per analysis (retrieval cache off);
+- ``criteria``: the precomputed map.
+
+Latency is the time to get the prompt and the grounding line ready. The
+model call is identical in both modes and not included. Consistency is
+measured over the cited passages of all runs:
+- ``slot_agreement``: for each ``[N]``, the share of runs citing its most
+  common title, averaged over N;
+- ``pairwise_jaccard``: the mean overlap of two runs' title sets.
+
+The two recorded remote analyses in ``test_scripts`` are scored the same
+way for reference. They are two different transcripts.
+
+Usage:
+    python benchmarks/bench_criteria_map.py [--transcripts 30] [--repeat 3]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from itertools import combinations
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main as service  # noqa: E402
+from benchmarks.retrieval_data import load_queries, recorded_groundings, recorded_passages  # noqa: E402
+from common.criteria import CriteriaMap, build_criteria_map  # noqa: E402
+from common.lazy import Lazy  # noqa: E402
+from common.metrics import percentile  # noqa: E402
+from common.retrieval import LocalRetriever  # noqa: E402
+
+analysis = service.analysis
+
+
+def consistency(runs):
+    depth = min(len(run) for run in runs)
+    slots = [Counter(run[n] for run in runs).most_common(1)[0][1] / len(runs) for n in range(depth)]
+    pairs = [len(set(a) & set(b)) / len(set(a) | set(b)) for a, b in combinations(runs, 2)]
+    return {"runs": len(runs), "slot_agreement": round(sum(slots) / len(slots), 3),
+            "pairwise_jaccard": round(sum(pairs) / len(pairs), 3)}
+
+
+def run_mode(mode, transcripts, repeat):
+    analysis.RAG_MODE = mode
+    analysis.RETRIEVAL_CACHE.enabled = False
+    latencies, runs = [], []
+    for transcript in transcripts:
+        prompt = analysis.build_analysis_prompt(transcript, {})
+        for _ in range(repeat):
+            started = time.perf_counter()
+            _, line = analysis.with_local_grounding(prompt, transcript)
+            latencies.append(time.perf_counter() - started)
+        chunks = json.loads(line)["candidates"][0]["grounding_metadata"]["grounding_chunks"]
+        runs.extend([[c["retrieved_context"]["title"] for c in chunks]] * repeat)
+    latencies.sort()
+    return {"p50_ms": round(percentile(latencies, 50) * 1000, 3), "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+            **consistency(runs)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--transcripts", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("-k", type=int, default=3, help="passages per criterion")
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    queries = [q["query"] for q in load_queries()]
+    transcripts = ["\n".join(f"{'user' if i % 2 == 0 else 'model'}: {line}"
+                             for i, line in enumerate(rng.sample(queries, 4))) for _ in range(args.transcripts)]
+
+    retriever = LocalRetriever(recorded_passages())
+    started = time.perf_counter()
+    artifact = build_criteria_map(retriever, k=args.k)
+    build_s = time.perf_counter() - started
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "criteria.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(artifact, f, ensure_ascii=False, separators=(",", ":"))
+        size = os.path.getsize(path)
+        started = time.perf_counter()
+        criteria_map = CriteriaMap.load(path)
+        load_s = time.perf_counter() - started
+
+    analysis.LOCAL_RETRIEVER = Lazy(lambda: retriever)
+    analysis.CRITERIA_MAP = Lazy(lambda: criteria_map)
+    analysis.CRITERIA_GROUNDING = Lazy(lambda: analysis.grounding_line(criteria_map.passages))
+    print(json.dumps({
+        "artifact": {"passages": len(artifact["passages"]), "bytes": size, "build_ms": round(build_s * 1000, 1),
+                     "load_ms": round(load_s * 1000, 2)},
+        "local": run_mode("local", transcripts, args.repeat),
+        "criteria": run_mode("criteria", transcripts, args.repeat),
+        "recorded_remote": consistency(recorded_groundings()),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+MinHash/LSH near-duplicate detection at tens of thousands of passages.
+
+Builds ``--chunks`` synthetic passages of ~250 words drawn from the recorded
+curriculum vocabulary. ``--dup-rate`` of them are revisions (1% of words
+changed) of another passage. Then it times signatures and LSH grouping, and
+reports recall of the planted pairs plus any false pairs. For scale, an
+all-pairs comparison of the signatures is timed on ``--brute`` passages and
+extrapolated to the full set.
+
+Usage:
+    python benchmarks/bench_dedup.py [--chunks 20000] [--dup-rate 0.2] [--brute 2000]
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.retrieval_data import recorded_passages  # noqa: E402
+from common.dedup import MinHasher, near_duplicate_groups, shingles  # noqa: E402
+
+
+def corpus(chunks, dup_rate, rng):
+    vocabulary = sorted({w for p in recorded_passages() for w in re.findall(r"[a-z]+", p["text"].lower())})
+    originals = int(chunks * (1 - dup_rate))
+    texts = [" ".join(rng.choice(vocabulary) for _ in range(250)) for _ in range(originals)]
+    planted = set()
+    for _ in range(chunks - originals):
+        source = rng.randrange(originals)
+        texts.append(" ".join(rng.choice(vocabulary) if rng.random() < 0.01 else w for w in texts[source].split()))
+        planted.add((source, len(texts) - 1))
+    return texts, planted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--dup-rate", type=float, default=0.2)
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument("--brute", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=5)
+    args = parser.parse_args()
+
+    texts, planted = corpus(args.chunks, args.dup_rate, random.Random(args.seed))
+    hasher = MinHasher()
+
+    started = time.perf_counter()
+    hash_sets = [shingles(t) for t in texts]
+    shingling = time.perf_counter() - started
+
+    started = time.perf_counter()
+    signatures = hasher.signatures(hash_sets)
+    signing = time.perf_counter() - started
+
+    started = time.perf_counter()
+    groups = near_duplicate_groups(signatures, args.threshold)
+    grouping = time.perf_counter() - started
+
+    group_of = {i: n for n, members in enumerate(groups) for i in members}
+    found = sum(1 for a, b in planted if a in group_of and group_of[a] == group_of.get(b))
+    # Each original may have several revisions; any other grouped member is a false pair
+    roots = {b: a for a, b in planted}
+    false = sum(1 for members in groups for i in members if roots.get(i, i) != roots.get(members[0], members[0]))
+
+    sample = signatures[:args.brute]
+    started = time.perf_counter()
+    for i in range(len(sample)):
+        (sample[i + 1:] == sample[i]).mean(axis=1)
+    brute = time.perf_counter() - started
+
+    print(json.dumps({
+        "chunks": len(texts),
+        "planted_pairs": len(planted),
+        "shingle_s": round(shingling, 2),
+        "signature_s": round(signing, 2),
+        "lsh_group_s": round(grouping, 2),
+        "recall": round(found / len(planted), 4) if planted else None,
+        "false_members": false,
+        f"all_pairs_{len(sample)}_s": round(brute, 2),
+        "all_pairs_extrapolated_s": round(brute * (len(texts) / len(sample)) ** 2, 1),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
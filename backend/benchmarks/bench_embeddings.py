@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Memory-mapped embedding store: build, load and top-k search at 10k-1M rows.
+
+Encoding cost is measured once, on the recorded curriculum passages (see
+``retrieval_data``), as passages per second. So is a rebuild where every
+content hash is already in the store.
+
+Encoding 1M real passages in one process would take most of the run. The
+scale points are therefore built with ``build_store`` from synthetic
+texts, using a stand-in encoder: each row is a recorded passage vector with
+a few of its buckets perturbed. Everything else in the build (hashing, the
+copy into the memmap, IDF, the file writes) is real. For each size and
+dtype the report has:
+- ``build_s`` and the ``vectors.npy`` size on disk;
+- ``mmap_open_ms`` (``EmbeddingStore``) vs ``eager_load_ms`` (``np.load``
+  into private memory, what every worker would otherwise pay);
+- p50/p95 latency of top-``k`` search for the labeled queries, with the
+  file already in the page cache;
+- for int8, ``overlap@k`` with the float32 results.
+
+Usage:
+    python benchmarks/bench_embeddings.py [--sizes 10000 100000 1000000] [--dim 256] [-k 10]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.retrieval_data import load_queries, recorded_passages  # noqa: E402
+from common.embeddings import EmbeddingStore, build_store, content_hash, encode  # noqa: E402
+from common.metrics import percentile  # noqa: E402
+from common.retrieval import passage_text, tokenize  # noqa: E402
+
+
+def stand_in_encoder(base):
+    """Encoder returning perturbed copies of ``base`` rows, chosen by text hash."""
+    def encoder(texts, dim):
+        seeds = np.array([content_hash(text) for text in texts], dtype=np.uint64)
+        rng = np.random.default_rng(int(seeds[0]))
+        rows = base[(seeds % np.uint64(len(base))).astype(np.int64)].copy()
+        noise = rng.integers(0, dim, size=(len(texts), 8))
+        np.put_along_axis(rows, noise, rng.normal(0, 0.1, size=noise.shape).astype(np.float32), axis=1)
+        return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+    return encoder
+
+
+def search_latency(store, queries, k, repeat):
+    latencies, results = [], []
+    for query in queries:
+        tokens = tokenize(query)
+        for _ in range(repeat):
+            started = time.perf_counter()
+            hits = store.search(tokens, k)
+            latencies.append(time.perf_counter() - started)
+        results.append([row for row, _ in hits])
+    latencies.sort()
+    return {"p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2)}, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    texts = [passage_text(p) for p in recorded_passages()]
+    queries = [q["query"] for q in load_queries()]
+    report = {"dim": args.dim, "k": args.k}
+
+    corpus = texts * 20
+    started = time.perf_counter()
+    base = encode(corpus, args.dim)
+    report["encode_passages_per_s"] = round(len(corpus) / (time.perf_counter() - started))
+
+    tmp = tempfile.mkdtemp()
+    try:
+        real = os.path.join(tmp, "real")
+        first = build_store(real, corpus[:len(texts)] + [f"{t} ({i})" for i, t in enumerate(corpus)], dim=args.dim)
+        again = build_store(real, corpus[:len(texts)] + [f"{t} ({i})" for i, t in enumerate(corpus)], dim=args.dim)
+        report["rebuild"] = {"rows": first["rows"], "first_s": first["seconds"], "cached_s": again["seconds"],
+                             "encoded_again": again["encoded"]}
+
+        encoder = stand_in_encoder(base[:len(texts)])
+        for size in args.sizes:
+            synthetic = [f"chunk {i}" for i in range(size)]
+            results, point = {}, {}
+            for dtype in ("float32", "int8"):
+                directory = os.path.join(tmp, f"{size}-{dtype}")
+                summary = build_store(directory, synthetic, dim=args.dim, dtype=dtype, encoder=encoder)
+                path = os.path.join(directory, "vectors.npy")
+                started = time.perf_counter()
+                store = EmbeddingStore(directory)
+                open_ms = (time.perf_counter() - started) * 1000
+                started = time.perf_counter()
+                np.load(path).sum()
+                eager_ms = (time.perf_counter() - started) * 1000
+                search_latency(store, queries[:1], args.k, 1)  # pages in
+                latency, results[dtype] = search_latency(store, queries, args.k, args.repeat)
+                point[dtype] = {"build_s": summary["seconds"], "file_mb": round(os.path.getsize(path) / 2**20, 1),
+                                "mmap_open_ms": round(open_ms, 2), "eager_load_ms": round(eager_ms, 1), **latency}
+                del store
+            overlap = [len(set(a) & set(b)) / max(len(a), 1) for a, b in zip(results["float32"], results["int8"])]
+            point["int8"][f"overlap@{args.k}"] = round(sum(overlap) / len(overlap), 3)
+            report[str(size)] = point
+            for dtype in ("float32", "int8"):
+                shutil.rmtree(os.path.join(tmp, f"{size}-{dtype}"))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+First simulation turn latency with and without the ``start`` prefetch.
+
+Each run is a fresh interpreter with ``CW_LAZY_INIT=1``, i.e. a cold
+instance that has imported the function and nothing else. The client is a
+``FakeClient``. Its first call of any kind takes an extra ``--prime-ms``,
+standing in for the credential and TLS setup of a real first call. Its
+answers take ``--model-ms``. One scenario has a persona pack.
+
+Modes:
+    cold       the first turn arrives with no ``start``
+    prefetch   ``start``, then the student reads the scenario for
+               ``--think-s`` before sending the first turn with the token
+    immediate  ``start`` directly followed by the first turn (worst case)
+
+Usage:
+    python benchmarks/bench_first_turn.py [--runs 5] [--prime-ms 300] [--think-s 1.0]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r'''
+import importlib.util, json, sys, time
+sys.path.insert(0, {backend!r})
+spec = importlib.util.spec_from_file_location("fn_main", {path!r})
+simulation = importlib.util.module_from_spec(spec)
+sys.modules["fn_main"] = simulation
+spec.loader.exec_module(simulation)
+
+from flask import Flask
+from common.fakes import FakeClient
+from common.personas import PersonaPacks
+
+fake = FakeClient(latency={model_s})
+connected = []
+
+def connecting(call):
+    # Whichever call comes first pays for the connection
+    def wrapper(*args, **kwargs):
+        if not connected:
+            connected.append(True)
+            time.sleep({prime_s})
+        return call(*args, **kwargs)
+    return wrapper
+
+fake.models.get = connecting(fake.models.get)
+fake.models.generate_content = connecting(fake.models.generate_content)
+simulation.get_client = lambda project, location: fake
+simulation.PERSONA_PACKS = PersonaPacks({packs!r})
+app = Flask(__name__)
+
+def post(body):
+    with app.test_request_context(json=body, method="POST"):
+        from flask import request
+        return simulation.simulation_ai(request)
+
+turn = {{"action": "simulation_chat", "message": "Hi, I'm from CPS.", "scenario_id": "cooper"}}
+if {mode!r} != "cold":
+    response, _, _ = post({{"action": "start", "scenario_id": "cooper"}})
+    turn["session_token"] = response.get_json()["session_token"]
+    time.sleep({think_s} if {mode!r} == "prefetch" else 0)
+started = time.perf_counter()
+post(turn)
+print(json.dumps({{"first_turn_s": time.perf_counter() - started}}))
+'''
+
+PACK = {"version": 1, "scenario_id": "cooper", "key_facts": ["Sara Cooper (27) is the mother of Jasmine (6)."],
+        "emotional_state": ["Sara appeared anxious and defensive."], "timeline": []}
+
+
+def measure(mode, packs, args):
+    code = CHILD.format(backend=BACKEND_DIR, path=os.path.join(BACKEND_DIR, "simulation-function", "main.py"),
+                        packs=packs, mode=mode, model_s=args.model_ms / 1000, prime_s=args.prime_ms / 1000,
+                        think_s=args.think_s)
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1", CW_LAZY_INIT="1", CW_WARMUP_ON_STARTUP="0")
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True, env=env)
+    return json.loads(out.stdout.strip().splitlines()[-1])["first_turn_s"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--model-ms", type=float, default=50.0)
+    parser.add_argument("--prime-ms", type=float, default=300.0, help="modelled auth + TLS setup of the first call")
+    parser.add_argument("--think-s", type=float, default=1.0, help="time between start and the first turn")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as packs:
+        with open(os.path.join(packs, "cooper.json"), "w", encoding="utf-8") as f:
+            json.dump(PACK, f)
+        results = {}
+        for mode in ("cold", "prefetch", "immediate"):
+            runs = sorted(measure(mode, packs, args) for _ in range(args.runs))
+            results[mode] = {"median_ms": round(statistics.median(runs) * 1000, 1),
+                             "min_ms": round(runs[0] * 1000, 1), "max_ms": round(runs[-1] * 1000, 1)}
+    print(json.dumps({"runs": args.runs, "model_ms": args.model_ms, "prime_ms": args.prime_ms,
+                      "think_s": args.think_s, **results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Tail latency of simulation turns with and without hedged requests.
+
+Model calls go to a FakeClient whose latency is log-normal around
+``--median`` seconds with a ``--tail`` fraction of calls stalling for
+``--stall`` seconds, the shape seen on slow Vertex AI turns. The same
+sequence of turns is run once without hedging and once through a
+HedgePolicy; latencies are reported with the extra upstream requests the
+hedges cost.
+
+Usage:
+    python benchmarks/bench_hedging.py [--turns 400] [--percentile 95] [--budget 0.05]
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import metrics  # noqa: E402
+from common.fakes import FakeClient  # noqa: E402
+from common.hedging import HedgePolicy  # noqa: E402
+from common.metrics import percentile  # noqa: E402
+
+
+def latency_profile(seed, median, sigma, tail, stall):
+    rng = random.Random(seed)
+
+    def latency(model):
+        if rng.random() < tail:
+            return stall
+        return median * math.exp(rng.gauss(0.0, sigma))
+    return latency
+
+
+def run(policy, client, turns):
+    latencies = []
+    for _ in range(turns):
+        start = time.perf_counter()
+        policy.call(lambda: client.models.generate_content(model='gemini-2.5-flash', contents='turn'))
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        'p50_ms': round(percentile(latencies, 50), 1),
+        'p95_ms': round(percentile(latencies, 95), 1),
+        'p99_ms': round(percentile(latencies, 99), 1),
+        'max_ms': round(latencies[-1], 1),
+        'upstream_calls': client.count(),
+        'extra_requests_pct': round(100.0 * (client.count() - turns) / turns, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--turns", type=int, default=400)
+    parser.add_argument("--median", type=float, default=0.02)
+    parser.add_argument("--sigma", type=float, default=0.25)
+    parser.add_argument("--tail", type=float, default=0.03)
+    parser.add_argument("--stall", type=float, default=0.5)
+    parser.add_argument("--percentile", type=float, default=95.0)
+    parser.add_argument("--budget", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    def client():
+        return FakeClient(latency=latency_profile(args.seed, args.median, args.sigma, args.tail, args.stall))
+
+    baseline = run(HedgePolicy('baseline', enabled=False), client(), args.turns)
+
+    metrics.reset()
+    policy = HedgePolicy('hedged', percentile=args.percentile, default_delay=args.median * 3,
+                         min_delay=0.0, budget=args.budget)
+    hedged = run(policy, client(), args.turns)
+    time.sleep(args.stall)  # let abandoned attempts land so saved_ms is complete
+    hedged.update({
+        'hedged': metrics.counter('hedging.hedged', policy='hedged'),
+        'hedge_wins': metrics.counter('hedging.hedge_wins', policy='hedged'),
+        'budget_denied': metrics.counter('hedging.budget_denied', policy='hedged'),
+        'final_delay_ms': round(policy.hedge_delay() * 1000, 1),
+    })
+
+    print(json.dumps({'baseline': baseline, 'hedged': hedged}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
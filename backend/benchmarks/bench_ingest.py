@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Full and incremental ingestion throughput on a synthetic materials tree.
+
+Generates ``--docs`` Word documents of ``--pages`` pages each in a temporary
+directory. The page text is drawn from the recorded curriculum passages.
+The tree is then ingested four times:
+- a full build with one worker;
+- a full build with ``--workers``;
+- a re-run with nothing changed;
+- a re-run after rewriting ``--changed`` percent of the files.
+Each run reports files/sec.
+
+Usage:
+    python benchmarks/bench_ingest.py [--docs 1000] [--pages 12] [--workers 8] [--changed 2]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import zipfile
+from xml.sax.saxutils import escape
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.retrieval_data import recorded_passages  # noqa: E402
+from common.ingest import ingest  # noqa: E402
+
+W = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+
+
+def write_docx(path, pages):
+    body = '<w:p><w:r><w:br w:type="page"/></w:r></w:p>'.join(
+        "".join(f'<w:p><w:r><w:t>{escape(line)}</w:t></w:r></w:p>' for line in page.splitlines() if line.strip())
+        for page in pages)
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("word/document.xml", f'<w:document {W}><w:body>{body}</w:body></w:document>')
+
+
+def generate(root, docs, pages, texts, rng):
+    paths = []
+    for i in range(docs):
+        unit = os.path.join(root, f"Unit_{i % 20}")
+        os.makedirs(unit, exist_ok=True)
+        path = os.path.join(unit, f"{i}_Doc_KP_2025-03-24.docx")
+        write_docx(path, [rng.choice(texts) for _ in range(pages)])
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--docs", type=int, default=1000)
+    parser.add_argument("--pages", type=int, default=12)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--changed", type=float, default=2.0, help="percent of files rewritten before the last run")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    texts = [p["text"] for p in recorded_passages()]
+    with tempfile.TemporaryDirectory() as tmp:
+        root, out = os.path.join(tmp, "materials"), os.path.join(tmp, "index.json")
+        paths = generate(root, args.docs, args.pages, texts, rng)
+        runs = {}
+        runs["full_1_worker"] = ingest(root, out=out, workers=1, full=True)
+        runs[f"full_{args.workers}_workers"] = ingest(root, out=out, workers=args.workers, full=True)
+        runs["unchanged"] = ingest(root, out=out, workers=args.workers)
+        for path in rng.sample(paths, max(1, int(len(paths) * args.changed / 100))):
+            write_docx(path, [rng.choice(texts)])
+        runs["changed"] = ingest(root, out=out, workers=args.workers)
+
+    fields = ("processed", "reused", "passages", "seconds", "files_per_s")
+    print(json.dumps({name: {f: run[f] for f in fields} for name, run in runs.items()}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Simulation turn latency and input tokens with and without persona packs.
+
+Synthetic case files (``--docs`` documents per scenario) are compiled into
+packs. Turns then run through ``simulation_ai`` with a fake client, once
+with the pack pinned and once with the retrieval tool attached.
+
+No model or corpus is reachable here, so retrieval is modelled:
+- The turns with the tool wait ``--retrieval-ms`` on top of the model
+  latency.
+- Their prompt gains ``--top-k`` retrieved chunks of ``--chunk-tokens``
+  tokens each.
+Input tokens are estimated at 4 characters per token from what each turn
+actually sends: system instruction, pack, history and message. The report
+also has the pack build time and the pack load time, cold from disk and
+warm from memory.
+
+Usage:
+    python benchmarks/bench_persona_packs.py [--turns 50] [--retrieval-ms 400] [--top-k 10]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+
+import main as service  # noqa: E402
+from common.fakes import FakeClient  # noqa: E402
+from common.metrics import percentile  # noqa: E402
+from common.personas import PersonaPacks, build_packs, format_pack  # noqa: E402
+
+simulation = service.simulation
+SCENARIOS = ("cooper", "baskin", "rich", "tasi")
+FEELINGS = ("anxious", "angry", "defensive", "overwhelmed", "tearful", "guarded", "frustrated")
+FILLER = ("The worker reviewed the file and noted the information provided by the reporter. "
+          "Collateral contacts were attempted with the school and the pediatric clinic. ")
+
+
+def write_case_files(root, scenario_id, docs, rng):
+    folder = os.path.join(root, scenario_id)
+    os.makedirs(folder, exist_ok=True)
+    parent, partner, child = f"{scenario_id.title()}a", "Roger Cook", "Karina"
+    for n in range(docs):
+        lines = [f"Progress Note {n + 1}."]
+        for _ in range(20):
+            kind = rng.random()
+            month, day = rng.randint(1, 12), rng.randint(1, 28)
+            if kind < 0.15:
+                lines.append(f"{parent} ({rng.randint(25, 45)}) is the mother of {child} ({rng.randint(3, 15)}) "
+                             f"and lives with her partner {partner}.")
+            elif kind < 0.3:
+                lines.append(f"{parent} appeared {rng.choice(FEELINGS)} when the worker asked about {child}.")
+            elif kind < 0.45:
+                lines.append(f"On {month:02d}/{day:02d}/2025 {partner} missed a visit with {child} and {parent}.")
+            else:
+                lines.append(FILLER)
+        with open(os.path.join(folder, f"Progress_Note_{n + 1}.txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(lines))
+
+
+class RetrievalModel:
+    """Fake client whose turns with the retrieval tool wait and grow their prompt."""
+
+    def __init__(self, model_latency, retrieval_s, top_k, chunk_tokens):
+        self.fake = FakeClient(latency=model_latency)
+        self.retrieval_s = retrieval_s
+        self.retrieved_tokens = top_k * chunk_tokens
+        self.input_tokens = []
+        self.models = self
+
+    def generate_content(self, model, contents, config=None):
+        chars = sum(len(p.text) for p in config.system_instruction) + sum(
+            len(part.text) for content in contents for part in content.parts)
+        tokens = chars // 4
+        if config.tools:
+            time.sleep(self.retrieval_s)
+            tokens += self.retrieved_tokens
+        self.input_tokens.append(tokens)
+        return self.fake.models.generate_content(model, contents, config)
+
+
+def run_turns(client, scenario_ids, turns):
+    app, latencies = Flask(__name__), []
+    history = []
+    for n in range(turns):
+        message = f"Can you tell me more about what happened last week? ({n})"
+        body = {'action': 'simulation_chat', 'message': message, 'history': history[-10:],
+                'scenario_id': scenario_ids[n % len(scenario_ids)]}
+        with app.test_request_context(json=body, method='POST'):
+            from flask import request
+            started = time.perf_counter()
+            simulation.simulation_ai(request)
+            latencies.append(time.perf_counter() - started)
+        history += [{'role': 'user', 'parts': message}, {'role': 'model', 'parts': "I don't know what you mean."}]
+    latencies.sort()
+    return latencies
+
+
+def report(latencies, tokens):
+    return {"p50_ms": round(percentile(latencies, 50) * 1000, 1), "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+            "mean_input_tokens": round(sum(tokens) / len(tokens))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--docs", type=int, default=30, help="case files per scenario")
+    parser.add_argument("--model-ms", type=float, default=50.0)
+    parser.add_argument("--retrieval-ms", type=float, default=400.0, help="modelled RAG retrieval time per turn")
+    parser.add_argument("--top-k", type=int, default=10, help="modelled retrieved chunks per turn")
+    parser.add_argument("--chunk-tokens", type=int, default=1024, help="modelled tokens per retrieved chunk")
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        for scenario_id in SCENARIOS:
+            write_case_files(os.path.join(tmp, "scenarios"), scenario_id, args.docs, rng)
+        started = time.perf_counter()
+        build_packs(os.path.join(tmp, "scenarios"), os.path.join(tmp, "personas"))
+        build_s = time.perf_counter() - started
+
+        packs = PersonaPacks(os.path.join(tmp, "personas"))
+        started = time.perf_counter()
+        pack_chars = [len(format_pack(packs.get(s))) for s in SCENARIOS]
+        cold_s = (time.perf_counter() - started) / len(SCENARIOS)
+        started = time.perf_counter()
+        for _ in range(1000):
+            packs.get("cooper")
+        warm_s = (time.perf_counter() - started) / 1000
+
+        client = RetrievalModel(args.model_ms / 1000, args.retrieval_ms / 1000, args.top_k, args.chunk_tokens)
+        simulation.get_client = lambda project, location: client
+        results = {}
+        for label, pack_store in (("retrieval", PersonaPacks(os.path.join(tmp, "missing"))), ("pack", packs)):
+            simulation.PERSONA_PACKS = pack_store
+            simulation.persona_config.cache_clear()
+            client.input_tokens = []
+            results[label] = report(run_turns(client, SCENARIOS, args.turns), client.input_tokens)
+
+    print(json.dumps({
+        "scenarios": len(SCENARIOS),
+        "documents_per_scenario": args.docs,
+        "build_s": round(build_s, 3),
+        "pack_chars": pack_chars,
+        "load_cold_ms": round(cold_s * 1000, 3),
+        "load_warm_us": round(warm_s * 1e6, 2),
+        "assumed": {"model_ms": args.model_ms, "retrieval_ms": args.retrieval_ms,
+                    "retrieved_tokens": args.top_k * args.chunk_tokens},
+        **results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Bulk rename of a synthetic materials tree: old walker vs planner.
+
+Builds a tree of about ``--entries`` files and folders with names in the
+materials style: dates in parentheses, spaces, ``&`` and numbered prefixes.
+A few entries in each folder collide once cleaned. The tree is then renamed
+in several ways, each on a fresh copy:
+- ``legacy``: the previous ``rename_files.py`` approach. It walks with
+  ``os.walk``, sorts every path by depth, and renames one at a time with an
+  ``exists`` check.
+- ``plan``: only the scandir pass and collision resolution (the dry run).
+- ``apply_N``: plan, journal and apply with N threads per depth level.
+
+Usage:
+    python benchmarks/bench_rename.py [--entries 100000] [--workers 8]
+"""
+import argparse
+import importlib.util
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+spec = importlib.util.spec_from_file_location("rename_files", os.path.join(BACKEND_DIR, "rag", "rename_files.py"))
+rename_files = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(rename_files)
+
+WORDS = ["Intro", "Guide", "Slides & Notes", "Parent Panel", "Safety Plan", "DV Practice", "Worksheet", "Tips"]
+
+
+def build(root, entries, rng):
+    """About ``entries`` files and folders, three levels deep."""
+    per_dir = 50
+    folders = max(1, entries // (per_dir + 1))
+    created = 0
+    for i in range(folders):
+        unit = os.path.join(root, f"Unit {i // 40} (KP 0{1 + i % 9}.1{i % 10}.2025)", f"{i}. {rng.choice(WORDS)} ({i})")
+        os.makedirs(unit, exist_ok=True)
+        created += 1
+        for j in range(per_dir):
+            word = rng.choice(WORDS)
+            name = f"{j % 45}. {word} (KP 03.24.2025).pdf" if j % 10 else f"{j % 45}_{word.replace(' ', '_')}_KP_2025-03-24.pdf"
+            open(os.path.join(unit, name), "w").close()
+            created += 1
+    return created
+
+
+def legacy(root):
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        paths.extend(os.path.join(dirpath, name) for name in dirnames + filenames)
+    paths.sort(key=lambda p: p.count(os.sep), reverse=True)
+    renamed = 0
+    for old_path in paths:
+        old_name = os.path.basename(old_path)
+        new_name = rename_files.clean_filename(old_name)
+        if old_name == new_name:
+            continue
+        new_path = os.path.join(os.path.dirname(old_path), new_name)
+        if os.path.exists(new_path):
+            continue  # silently skipped collision
+        os.rename(old_path, new_path)
+        renamed += 1
+    return renamed
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return round(time.perf_counter() - started, 2), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--entries", type=int, default=100_000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    report = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        pristine = os.path.join(tmp, "pristine")
+        report["entries"] = build(pristine, args.entries, random.Random(args.seed))
+
+        def fresh(name):
+            root = os.path.join(tmp, name)
+            shutil.copytree(pristine, root)
+            return root
+
+        root = fresh("legacy")
+        seconds, renamed = timed(lambda: legacy(root))
+        report["legacy"] = {"seconds": seconds, "renamed": renamed, "left_unclean": len(rename_files.plan(root))}
+
+        seconds, ops = timed(lambda: rename_files.plan(pristine))
+        report["plan"] = {"seconds": seconds, "renames": len(ops)}
+
+        for workers in sorted({1, args.workers}):
+            root = fresh(f"apply_{workers}")
+            journal = os.path.join(tmp, f"apply_{workers}.jsonl")
+
+            def run():
+                ops = rename_files.plan(root)
+                rename_files.write_journal(journal, root, ops)
+                return rename_files.apply(root, ops, journal, workers=workers)
+
+            seconds, renamed = timed(run)
+            report[f"apply_{workers}"] = {"seconds": seconds, "renamed": renamed,
+                                          "left_unclean": len(rename_files.plan(root))}
+        seconds, undone = timed(lambda: rename_files.rollback(root, journal))
+        report["rollback"] = {"seconds": seconds, "undone": undone}
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
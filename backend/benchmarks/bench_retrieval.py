@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Latency and recall of the local retrieval modes on the labeled query set.
+
+The corpus is the recorded curriculum passages (see ``retrieval_data``).
+For each mode (bm25, vector, hybrid) every query is run ``--repeat`` times;
+the report has p50/p95 search latency, recall@k (share of a query's
+relevant titles found in the top k) and MRR of the first relevant hit.
+``--scale N`` pads the corpus with N-1 renamed copies of every passage to
+see how latency grows with corpus size. The copies never count as
+relevant but crowd out the originals, so read recall at ``--scale 1``.
+
+Usage:
+    python benchmarks/bench_retrieval.py [-k 5] [--repeat 20] [--scale 1]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.retrieval_data import load_queries, recorded_passages  # noqa: E402
+from common.metrics import percentile  # noqa: E402
+from common.retrieval import LocalRetriever  # noqa: E402
+
+MODES = ("bm25", "vector", "hybrid")
+
+
+def padded(passages, scale):
+    corpus = list(passages)
+    for copy in range(1, scale):
+        corpus.extend(dict(p, title=f"{p['title']}~{copy}") for p in passages)
+    return corpus
+
+
+def evaluate(retriever, queries, mode, k, repeat):
+    latencies, recall, reciprocal = [], 0.0, 0.0
+    for query in queries:
+        relevant = set(query["relevant"])
+        for _ in range(repeat):
+            started = time.perf_counter()
+            hits = retriever.search(query["query"], k=k, mode=mode)
+            latencies.append(time.perf_counter() - started)
+        titles = [hit["title"] for hit in hits]
+        recall += len(relevant & set(titles)) / len(relevant)
+        reciprocal += next((1.0 / rank for rank, title in enumerate(titles, start=1) if title in relevant), 0.0)
+    latencies.sort()
+    return {
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        f"recall@{k}": round(recall / len(queries), 3),
+        "mrr": round(reciprocal / len(queries), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--scale", type=int, default=1)
+    args = parser.parse_args()
+
+    corpus = padded(recorded_passages(), args.scale)
+    queries = load_queries()
+    started = time.perf_counter()
+    retriever = LocalRetriever(corpus)
+    build_ms = (time.perf_counter() - started) * 1000
+
+    report = {"passages": len(corpus), "queries": len(queries), "build_ms": round(build_ms, 1),
+              "modes": {mode: evaluate(retriever, queries, mode, args.k, args.repeat) for mode in MODES}}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Retrieval latency with and without the retrieval cache.
+
+The corpus is the recorded curriculum passages padded to ``--scale`` copies
+(see ``bench_retrieval``). The workload draws ``--requests`` queries from the
+labeled set with Zipf-like weights, reworded at random (case, punctuation,
+plurals), as repeated turns on the same topic would be. Each query runs
+once through a plain local search and once through the cache. The report
+has p50/p95 latency for both, and the cache's hit rate and bytes.
+
+Usage:
+    python benchmarks/bench_retrieval_cache.py [--requests 2000] [--scale 20] [-k 8]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_retrieval import padded  # noqa: E402
+from benchmarks.retrieval_data import load_queries, recorded_passages  # noqa: E402
+from common.metrics import percentile  # noqa: E402
+from common.retrieval import LocalRetriever  # noqa: E402
+from common.retrieval_cache import RetrievalCache  # noqa: E402
+
+
+def reworded(query, rng):
+    variants = (query, query.upper(), f"{query}?", f"  {query.lower()}!", query.replace(" the ", " "))
+    return rng.choice(variants)
+
+
+def summary(latencies):
+    latencies = sorted(latencies)
+    return {"p50_ms": round(percentile(latencies, 50) * 1000, 3), "p95_ms": round(percentile(latencies, 95) * 1000, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--scale", type=int, default=20)
+    parser.add_argument("-k", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    retriever = LocalRetriever(padded(recorded_passages(), args.scale))
+    queries = [q["query"] for q in load_queries()]
+    weights = [1.0 / rank for rank in range(1, len(queries) + 1)]
+    workload = [reworded(q, rng) for q in rng.choices(queries, weights=weights, k=args.requests)]
+
+    cache = RetrievalCache(name="bench")
+    uncached, cached = [], []
+    for query in workload:
+        started = time.perf_counter()
+        retriever.search(query, k=args.k)
+        uncached.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        cache.get_or_compute("local", query, lambda: retriever.search(query, k=args.k), k=args.k)
+        cached.append(time.perf_counter() - started)
+
+    stats = cache.stats()
+    print(json.dumps({
+        "passages": len(retriever.passages),
+        "requests": args.requests,
+        "uncached": summary(uncached),
+        "cached": summary(cached),
+        "speedup_total": round(sum(uncached) / sum(cached), 1),
+        "hit_rate": round(stats["hit_rate"], 3),
+        "entries": stats["entries"],
+        "bytes": stats["bytes"],
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
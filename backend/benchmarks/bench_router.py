@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Simulation-turn latency with static vs latency-aware model routing.
+
+Turns go through the real simulation handler against a FakeClient with a
+latency profile per model. The light model is steady. The default model is
+fast, then degrades for the middle third of the run, then recovers. Each
+run is made twice: once with routing off (every turn on the default model)
+and once with the router choosing. The latency target and staleness window
+are scaled down to the fake's latencies.
+
+Usage:
+    python benchmarks/bench_router.py [--turns 150] [--fast 0.03] [--degraded 0.3] [--light 0.01]
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+
+import main as service  # noqa: E402
+from common.fakes import FakeClient  # noqa: E402
+from common.genai_config import DEFAULT_MODEL, LIGHT_MODEL  # noqa: E402
+from common.metrics import percentile  # noqa: E402
+from common.router import ModelRouter  # noqa: E402
+
+simulation = service.simulation
+
+
+def profile(args, phase):
+    def latency(model):
+        if model == LIGHT_MODEL:
+            return args.light
+        return args.degraded if phase['degraded'] else args.fast
+    return latency
+
+
+def run(args, routed):
+    phase = {'degraded': False}
+    client = FakeClient(latency=profile(args, phase))
+    simulation.get_client = lambda project, location: client
+    router = ModelRouter.from_env()
+    router.enabled = routed
+    router.stale_after = args.stale
+    router.policies['simulation_chat'].latency_target = args.target
+    router.policies['simulation_chat'].seconds_per_kchar = 0.0
+    simulation.ROUTER = router
+
+    app = Flask(__name__)
+    body = {'message': 'Hello, I am from CPS.', 'scenario_id': 'home-visit', 'history': []}
+    latencies = []
+    for turn in range(args.turns):
+        phase['degraded'] = args.turns // 3 <= turn < 2 * args.turns // 3
+        with app.test_request_context():
+            start = time.perf_counter()
+            simulation.handle_simulation_chat(body, {})
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    models = Counter(call.model for call in client.calls)
+    latencies.sort()
+    return {
+        'p50_ms': round(percentile(latencies, 50), 1),
+        'p95_ms': round(percentile(latencies, 95), 1),
+        'p99_ms': round(percentile(latencies, 99), 1),
+        'mean_ms': round(sum(latencies) / len(latencies), 1),
+        'turns_per_model': dict(models),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--turns", type=int, default=150)
+    parser.add_argument("--fast", type=float, default=0.03, help="default model latency when healthy (s)")
+    parser.add_argument("--degraded", type=float, default=0.3, help="default model latency when degraded (s)")
+    parser.add_argument("--light", type=float, default=0.01, help="light model latency (s)")
+    parser.add_argument("--target", type=float, default=0.1, help="router latency target (s)")
+    parser.add_argument("--stale", type=float, default=0.5, help="seconds before avoided-model stats expire")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    print(json.dumps({
+        'static': run(args, routed=False),
+        'routed': run(args, routed=True),
+        'models': {'default': DEFAULT_MODEL, 'light': LIGHT_MODEL},
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
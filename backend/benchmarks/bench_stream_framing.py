@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Bytes and encode/decode CPU of MessagePack frames against NDJSON for analysis streams.
+
+The recorded raw streams (see ``retrieval_data.recorded_streams``) are
+replayed through ``StreamEncoder`` as the handlers run it. There are three
+formats:
+- ``ndjson/v1``: the default wire format;
+- ``ndjson/v2``: typed events as JSON lines;
+- ``frames``: the same events as length-prefixed MessagePack
+  (``common.frames``).
+
+Decoding uses ``decode_v1`` / ``decode_v2`` from ``bench_stream_protocol`` for
+NDJSON and ``FrameDecoder`` for frames. The report gives microseconds per
+model chunk (p50 over ``--repeat`` runs) and says which MessagePack codec
+ran: the ``msgpack`` package when it is installed, otherwise the
+pure-Python fallback. ``--codec python`` forces the fallback.
+
+Usage:
+    python benchmarks/bench_stream_framing.py [--repeat 200] [--codec auto|python]
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "analysis-function"))
+
+from benchmarks.bench_stream_protocol import decode_v1, decode_v2, per_chunk_us  # noqa: E402
+from benchmarks.retrieval_data import recorded_streams, replay  # noqa: E402
+from common import frames  # noqa: E402
+from common.stream_events import StreamEncoder  # noqa: E402
+from main import serialize_chunk  # noqa: E402
+
+FORMATS = {"ndjson/v1": ("v1", "ndjson"), "ndjson/v2": ("v2", "ndjson"), "frames": ("v2", "msgpack")}
+
+
+def encode(chunks, protocol, framing):
+    encoder = StreamEncoder(protocol, framing)
+    parts = [encoder.chunk(serialize_chunk(chunk, index), chunk.usage_metadata)
+             for index, chunk in enumerate(chunks, start=1)]
+    parts.append(encoder.done())
+    return b"".join(parts) if framing == "msgpack" else "".join(parts).encode("utf-8")
+
+
+def decode_frames(body):
+    thoughts, text, grounding = [], [], []
+    for event in frames.FrameDecoder().feed(body):
+        kind = event["type"]
+        if kind == "thought_delta":
+            thoughts.append(event["text"])
+        elif kind == "text_delta":
+            text.append(event["text"])
+        elif kind == "grounding":
+            grounding = event["chunks"]
+    return "".join(thoughts), "".join(text), grounding
+
+
+DECODERS = {"ndjson/v1": lambda body: decode_v1(body.decode("utf-8")),
+            "ndjson/v2": lambda body: decode_v2(body.decode("utf-8")),
+            "frames": decode_frames}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--codec", choices=["auto", "python"], default="auto")
+    args = parser.parse_args()
+    if args.codec == "python":
+        frames.msgpack = None
+
+    streams = [replay(stream) for stream in recorded_streams()]
+    chunks = sum(len(stream) for stream in streams)
+    report = {"streams": len(streams), "chunks": chunks,
+              "codec": "msgpack" if frames.msgpack is not None else "python"}
+    decoded = {}
+    for name, (protocol, framing) in FORMATS.items():
+        bodies = [encode(stream, protocol, framing) for stream in streams]
+        decoded[name] = [DECODERS[name](body) for body in bodies]
+        report[name] = {
+            "bytes": sum(len(body) for body in bodies),
+            "encode_us_per_chunk": per_chunk_us(lambda s: encode(s, protocol, framing), streams, chunks,
+                                                args.repeat),
+            "decode_us_per_chunk": per_chunk_us(DECODERS[name], bodies, chunks, args.repeat),
+        }
+    assert decoded["ndjson/v1"] == decoded["ndjson/v2"] == decoded["frames"], "formats disagree"
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
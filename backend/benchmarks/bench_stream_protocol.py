@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Bytes per stream and CPU per chunk of the v1 and v2 analysis stream protocols.
+
+The streams are the raw analysis streams recorded in
+``analysis-function/test_scripts`` (see ``retrieval_data.recorded_streams``),
+replayed as SDK-shaped chunks. For each protocol:
+- server: ``serialize_chunk`` plus ``StreamEncoder`` for every chunk, and the
+  closing events, as the handlers run them;
+- client: a Python port of the frontend's line handling in
+  ``geminiService.ts``. It parses each line and collects thoughts, answer
+  text and grounding. Absolute numbers are for CPython, not the browser; the
+  ratio is what carries over.
+
+Both sides report microseconds per model chunk (p50 over ``--repeat`` runs
+of every stream). Bytes and lines are totals over the recorded streams;
+``bytes_without_grounding`` leaves out the lines carrying grounding.
+
+Usage:
+    python benchmarks/bench_stream_protocol.py [--repeat 200]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "analysis-function"))
+
+from benchmarks.retrieval_data import recorded_streams, replay  # noqa: E402
+from common.metrics import percentile  # noqa: E402
+from common.stream_events import StreamEncoder  # noqa: E402
+from main import serialize_chunk  # noqa: E402
+
+
+def encode(chunks, protocol):
+    encoder = StreamEncoder(protocol)
+    body = "".join(encoder.chunk(serialize_chunk(chunk, index), chunk.usage_metadata)
+                   for index, chunk in enumerate(chunks, start=1))
+    return body + encoder.done()
+
+
+def decode_v1(body):
+    thoughts, text, grounding = [], [], []
+    for line in body.split("\n"):
+        if not line.strip():
+            continue
+        data = json.loads(line)
+        for candidate in data.get("candidates", [])[:1]:
+            for part in (candidate.get("content") or {}).get("parts", []):
+                if part.get("thought") is True:
+                    thoughts.append(part.get("text") or "")
+                elif part.get("text"):
+                    text.append(part["text"])
+            if (candidate.get("grounding_metadata") or {}).get("grounding_chunks"):
+                grounding = candidate["grounding_metadata"]["grounding_chunks"]
+    return "".join(thoughts), "".join(text), [g.get("retrieved_context") for g in grounding]
+
+
+def decode_v2(body):
+    thoughts, text, grounding = [], [], []
+    for line in body.split("\n"):
+        if not line.strip():
+            continue
+        event = json.loads(line)
+        kind = event["type"]
+        if kind == "thought_delta":
+            thoughts.append(event["text"])
+        elif kind == "text_delta":
+            text.append(event["text"])
+        elif kind == "grounding":
+            grounding = event["chunks"]
+    return "".join(thoughts), "".join(text), grounding
+
+
+def per_chunk_us(work, items, chunks, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for item in items:
+            work(item)
+        samples.append((time.perf_counter() - started) / chunks * 1e6)
+    samples.sort()
+    return round(percentile(samples, 50), 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    streams = [replay(stream) for stream in recorded_streams()]
+    chunks = sum(len(stream) for stream in streams)
+    report = {"streams": len(streams), "chunks": chunks}
+    decoded = {}
+    for protocol, decode in (("v1", decode_v1), ("v2", decode_v2)):
+        bodies = [encode(stream, protocol) for stream in streams]
+        decoded[protocol] = [decode(body) for body in bodies]
+        report[protocol] = {
+            "bytes": sum(len(body.encode("utf-8")) for body in bodies),
+            "lines": sum(body.count("\n") for body in bodies),
+            # The grounding passages are the same text either way and dominate the total
+            "bytes_without_grounding": sum(len(line.encode("utf-8")) + 1 for body in bodies
+                                           for line in body.splitlines() if "grounding" not in line),
+            "server_us_per_chunk": per_chunk_us(lambda s: encode(s, protocol), streams, chunks, args.repeat),
+            "client_us_per_chunk": per_chunk_us(decode, bodies, chunks, args.repeat),
+        }
+    assert decoded["v1"] == decoded["v2"], "protocols disagree on the decoded stream"
+    report["v2_bytes_ratio"] = round(report["v2"]["bytes"] / report["v1"]["bytes"], 3)
+    report["v2_delta_bytes_ratio"] = round(report["v2"]["bytes_without_grounding"]
+                                           / report["v1"]["bytes_without_grounding"], 3)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Network writes, CPU and added latency of the stream window (``common.stream_window``).
+
+The recorded raw streams (see ``retrieval_data.recorded_streams``) arrive in
+large chunks. To get the tiny chunks the window is for, every recorded part
+is cut into ``--delta-chars`` pieces. A fake model then yields one piece
+every ``--gap-ms``, in real time. Each stream runs the handler path: serialize,
+window, encode as v2 NDJSON, then ``sendall`` on a socket pair with a thread
+draining the other end. Each send is one write syscall.
+
+For each window (0 = off) the report has, per stream:
+- writes;
+- CPU ms (process time, all threads);
+- the delay from the model yielding a piece to the write that carries it,
+  as p50/p95/max ms.
+
+Usage:
+    python benchmarks/bench_stream_window.py [--windows 0 10 30 100] [--delta-chars 24] [--gap-ms 5]
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "analysis-function"))
+
+from benchmarks.retrieval_data import recorded_streams, replay  # noqa: E402
+from common.fakes import make_chunk, make_part  # noqa: E402
+from common.metrics import percentile  # noqa: E402
+from common.stream_events import StreamEncoder  # noqa: E402
+from common.stream_window import STREAM_WINDOW_BYTES, chunk_bytes, windowed_chunks  # noqa: E402
+from main import serialize_chunk  # noqa: E402
+
+
+def split(chunks, size):
+    """The stream with every part cut into ``size``-character pieces, one chunk each."""
+    pieces = []
+    for chunk in chunks:
+        candidate = chunk.candidates[0]
+        for part in candidate.content.parts if candidate.content else []:
+            text = part.text or ""
+            pieces += [make_chunk([make_part(text[i:i + size], part.thought)]) for i in range(0, len(text), size)]
+        if candidate.grounding_metadata or chunk.usage_metadata:
+            # Grounding and usage go on a chunk of their own after the text
+            tail = make_chunk(usage=chunk.usage_metadata)
+            tail.candidates[0].grounding_metadata = candidate.grounding_metadata
+            pieces.append(tail)
+    return pieces
+
+
+def run(pieces, window_ms, gap):
+    emitted, delivered_at = [], []
+
+    def model():
+        for piece in pieces:
+            time.sleep(gap)
+            emitted.append((time.perf_counter(), sum(len((p.text or "").encode("utf-8"))
+                                                     for p in (piece.candidates[0].content.parts
+                                                               if piece.candidates[0].content else []))))
+            yield piece
+
+    server, client = socket.socketpair()
+    drain = threading.Thread(target=lambda: [None for _ in iter(lambda: client.recv(65536), b"")])
+    drain.start()
+    encoder, writes, delivered = StreamEncoder('v2'), 0, 0
+    serialized = ((serialize_chunk(chunk, index), chunk.usage_metadata)
+                  for index, chunk in enumerate(model(), start=1))
+    for chunk_data, usage in windowed_chunks(serialized, window_ms, STREAM_WINDOW_BYTES):
+        data = encoder.chunk(chunk_data, usage)
+        if data:
+            server.sendall(data.encode("utf-8"))
+            writes += 1
+        delivered += chunk_bytes((chunk_data, usage))
+        delivered_at.append((time.perf_counter(), delivered))
+    server.sendall(encoder.done().encode("utf-8"))
+    writes += 1
+    server.close()
+    drain.join()
+    client.close()
+
+    # A piece is delivered by the first write whose cumulative text covers it
+    delays, total, index = [], 0, 0
+    for emitted_at, size in emitted:
+        total += size
+        if not size:
+            continue
+        while delivered_at[index][1] < total:
+            index += 1
+        delays.append(delivered_at[index][0] - emitted_at)
+    return writes, delays
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--windows", type=int, nargs="+", default=[0, 10, 30, 100])
+    parser.add_argument("--delta-chars", type=int, default=24)
+    parser.add_argument("--gap-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    streams = [split(replay(stream), args.delta_chars) for stream in recorded_streams()]
+    report = {"streams": len(streams), "pieces_per_stream": round(sum(map(len, streams)) / len(streams), 1),
+              "gap_ms": args.gap_ms}
+    for window_ms in args.windows:
+        writes, delays = 0, []
+        cpu = time.process_time()
+        for pieces in streams:
+            stream_writes, stream_delays = run(pieces, window_ms, args.gap_ms / 1000)
+            writes += stream_writes
+            delays += stream_delays
+        cpu = time.process_time() - cpu
+        delays.sort()
+        report[f"window_{window_ms}ms"] = {
+            "writes_per_stream": round(writes / len(streams), 1),
+            "cpu_ms_per_stream": round(cpu * 1000 / len(streams), 1),
+            "delay_p50_ms": round(percentile(delays, 50) * 1000, 2),
+            "delay_p95_ms": round(percentile(delays, 95) * 1000, 2),
+            "delay_max_ms": round(delays[-1] * 1000, 2),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
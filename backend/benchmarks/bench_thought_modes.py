@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Bytes and events per analysis for each ``thoughts`` mode of the analysis streams.
+
+The recorded raw streams (see ``retrieval_data.recorded_streams``) are
+replayed through ``StreamEncoder`` as the handlers run it. The v2 events
+are counted in NDJSON and v1 in lines. The recordings have no timestamps.
+For ``throttled``, thought chunks are taken to arrive every ``--thought-ms``
+and answer chunks every ``--text-ms``, against a throttle interval of
+``--interval-ms``.
+
+The report gives the mean per analysis, and the thought share of the bytes
+in ``full`` mode. The grounding passages are most of the bytes, so both
+are also given without the grounding events.
+
+Usage:
+    python benchmarks/bench_thought_modes.py [--interval-ms 1500] [--thought-ms 800] [--text-ms 100]
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "analysis-function"))
+
+from benchmarks.retrieval_data import recorded_streams, replay  # noqa: E402
+from common.stream_events import THOUGHT_MODES, StreamEncoder  # noqa: E402
+from main import serialize_chunk  # noqa: E402
+
+
+def run(chunks, protocol, thoughts, args):
+    now = [0.0]
+    encoder = StreamEncoder(protocol, thoughts=thoughts, interval_ms=args.interval_ms, clock=lambda: now[0])
+    body = []
+    for index, chunk in enumerate(chunks, start=1):
+        chunk_data = serialize_chunk(chunk, index)
+        thinking = any(part.thought for candidate in chunk.candidates if candidate.content
+                       for part in candidate.content.parts)
+        now[0] += (args.thought_ms if thinking else args.text_ms) / 1000
+        body.append(encoder.chunk(chunk_data, chunk.usage_metadata))
+    body.append(encoder.done())
+    return "".join(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--interval-ms", type=int, default=1500)
+    parser.add_argument("--thought-ms", type=int, default=800)
+    parser.add_argument("--text-ms", type=int, default=100)
+    args = parser.parse_args()
+
+    streams = [replay(stream) for stream in recorded_streams()]
+    report = {"analyses": len(streams), "chunks_per_analysis": round(sum(map(len, streams)) / len(streams), 1)}
+    for thoughts in THOUGHT_MODES:
+        v2 = [run(stream, 'v2', thoughts, args) for stream in streams]
+        v1 = [run(stream, 'v1', thoughts, args) for stream in streams]
+        events = [[json.loads(line) for line in body.splitlines()] for body in v2]
+        report[thoughts] = {
+            "v2_bytes": round(sum(len(body.encode("utf-8")) for body in v2) / len(streams)),
+            "v2_bytes_without_grounding": round(sum(len(line.encode("utf-8")) + 1 for body in v2
+                                                    for line in body.splitlines()
+                                                    if not line.startswith('{"type":"grounding"'))
+                                                / len(streams)),
+            "v2_events": round(sum(map(len, events)) / len(streams), 1),
+            "v2_thought_events": round(sum(e["type"] == "thought_delta" for es in events for e in es)
+                                       / len(streams), 1),
+            "v1_bytes": round(sum(len(body.encode("utf-8")) for body in v1) / len(streams)),
+            "v1_lines": round(sum(body.count("\n") for body in v1) / len(streams), 1),
+        }
+    full, none = report["full"], report["none"]
+    full["thought_share"] = round((full["v2_bytes"] - none["v2_bytes"]) / full["v2_bytes"], 3)
+    full["thought_share_without_grounding"] = round(
+        (full["v2_bytes_without_grounding"] - none["v2_bytes_without_grounding"])
+        / full["v2_bytes_without_grounding"], 3)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Context tokens vs grounding for fixed top-k and adaptive reranked retrieval.
+
+Mentorship chat attaches ``similarity_top_k=20`` passages to every turn.
+This compares that fixed cut with the adaptive one in ``common.rerank``.
+The corpus and on-topic queries are the labeled retrieval set (see
+``retrieval_data``). A few chit-chat turns that need no curriculum are
+mixed in. For every strategy the report has:
+- context tokens per turn, estimated at 4 characters per token of the
+  excerpts block;
+- passages per turn, on-topic and chit-chat;
+- grounding rate: the share of on-topic turns with at least one relevant
+  passage in context, i.e. an answer that can cite the right document;
+- recall of the relevant titles.
+
+Usage:
+    python benchmarks/eval_rerank.py [--candidates 40]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.retrieval_data import load_queries, recorded_passages  # noqa: E402
+from common.metrics import percentile  # noqa: E402
+from common.rerank import rerank, select  # noqa: E402
+from common.retrieval import LocalRetriever, format_context  # noqa: E402
+
+CHITCHAT = [
+    "hi there!",
+    "thanks so much, that really helps",
+    "ok cool",
+    "I'm feeling a bit nervous about my first week, any thoughts?",
+    "can you say that again more briefly?",
+    "good morning, how are you today?",
+]
+
+
+def fixed(k):
+    return lambda query, candidates: candidates[:k]
+
+
+def adaptive(threshold, relative):
+    return lambda query, candidates: select(rerank(query, candidates), threshold=threshold, relative=relative)
+
+
+def evaluate(retriever, queries, strategy, candidates):
+    tokens, on_topic, off_topic, grounded, recall, latencies = [], [], [], 0, 0.0, []
+    for query in queries:
+        pool = retriever.search(query["query"], k=candidates)
+        started = time.perf_counter()
+        kept = strategy(query["query"], pool)
+        latencies.append(time.perf_counter() - started)
+        tokens.append(len(format_context(kept)) // 4 if kept else 0)
+        relevant = set(query.get("relevant", ()))
+        if not relevant:
+            off_topic.append(len(kept))
+            continue
+        on_topic.append(len(kept))
+        found = relevant & {p["title"] for p in kept}
+        grounded += bool(found)
+        recall += len(found) / len(relevant)
+    latencies.sort()
+    return {
+        "context_tokens": round(sum(tokens) / len(tokens)),
+        "passages_on_topic": round(sum(on_topic) / len(on_topic), 2),
+        "passages_chitchat": round(sum(off_topic) / len(off_topic), 2),
+        "grounding_rate": round(grounded / len(on_topic), 3),
+        "recall": round(recall / len(on_topic), 3),
+        "select_p50_ms": round(percentile(latencies, 50) * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--candidates", type=int, default=40)
+    args = parser.parse_args()
+
+    retriever = LocalRetriever(recorded_passages())
+    queries = load_queries() + [{"query": q} for q in CHITCHAT]
+    strategies = {"top20 (current)": fixed(20), "top8": fixed(8), "top5": fixed(5)}
+    for threshold in (0.1, 0.2, 0.3):
+        strategies[f"adaptive t={threshold}"] = adaptive(threshold, 0.6)
+
+    report = {name: evaluate(retriever, queries, strategy, args.candidates) for name, strategy in strategies.items()}
+    baseline = report["top20 (current)"]["context_tokens"]
+    for row in report.values():
+        row["token_savings"] = round(1 - row["context_tokens"] / baseline, 3) if baseline else 0.0
+    print(json.dumps({"passages": len(retriever.passages), "queries": len(queries), "strategies": report}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
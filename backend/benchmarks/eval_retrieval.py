@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Retrieval quality vs latency for every retrieval backend and k.
+
+Runs fully offline. The corpus is the recorded curriculum passages (see
+``retrieval_data``). There are two labeled sets:
+- ``cited``: sentences from the recorded analyses. Each is labeled with
+  the grounding passages it cites. A hit must be that exact passage.
+- ``labeled``: the hand-labeled queries in ``data/retrieval_queries.json``.
+  A hit is any passage from one of their relevant titles.
+
+Backends:
+- ``bm25``, ``vector``, ``hybrid``: ``LocalRetriever`` as built at load;
+- ``store``: vector search over the memory-mapped embedding store;
+- ``ann/nprobe=N``: the same through an IVF-PQ index (``common.ann``);
+- ``rerank``: hybrid candidates rescored by ``common.rerank``;
+- ``criteria``: the precomputed criteria map, the same passages for every
+  query (``common.criteria``);
+- ``remote``: the recorded Vertex AI Search results, ``cited`` set only.
+  Each sentence is checked against the first k grounding chunks of its own
+  analysis, which shows how deep ``similarity_top_k`` needs to go to
+  contain what the model actually cites. Latency was not recorded.
+
+For each set, backend and k the report has recall@k, MRR (first relevant
+hit within k) and p50/p95 search latency.
+
+Usage:
+    python benchmarks/eval_retrieval.py [-k 1 3 5 8 10 20] [--repeat 5] [--json]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.retrieval_data import (cited_queries, load_queries, recorded_passages,  # noqa: E402
+                                       recorded_run_passages)
+from common.ann import AnnIndex, build_ann  # noqa: E402
+from common.criteria import CriteriaMap, build_criteria_map  # noqa: E402
+from common.embeddings import EmbeddingStore, build_store  # noqa: E402
+from common.metrics import percentile  # noqa: E402
+from common.rerank import rerank  # noqa: E402
+from common.retrieval import LocalRetriever, passage_key, passage_text  # noqa: E402
+
+
+def backends(passages, directory):
+    retriever = LocalRetriever(passages)
+    build_store(os.path.join(directory, "embeddings"), [passage_text(p) for p in passages], dim=1024)
+    store = EmbeddingStore(os.path.join(directory, "embeddings"))
+    ann_store = EmbeddingStore(os.path.join(directory, "embeddings"))
+    build_ann(os.path.join(directory, "ann"), ann_store, nlist=4)
+    ann_store.ann = AnnIndex(os.path.join(directory, "ann"))
+    stored, indexed = LocalRetriever(passages, vectors=store), LocalRetriever(passages, vectors=ann_store)
+    criteria = CriteriaMap(build_criteria_map(retriever)).passages
+    runs = recorded_run_passages()
+
+    return {
+        "bm25": lambda q, k: retriever.search(q["query"], k=k, mode='bm25'),
+        "vector": lambda q, k: retriever.search(q["query"], k=k, mode='vector'),
+        "hybrid": lambda q, k: retriever.search(q["query"], k=k),
+        "store": lambda q, k: stored.search(q["query"], k=k, mode='vector', nprobe=0),
+        "ann/nprobe=1": lambda q, k: indexed.search(q["query"], k=k, mode='vector', nprobe=1),
+        "ann/nprobe=2": lambda q, k: indexed.search(q["query"], k=k, mode='vector', nprobe=2),
+        "rerank": lambda q, k: [p for _, p in rerank(q["query"], retriever.search(q["query"], k=40))][:k],
+        "criteria": lambda q, k: criteria[:k],
+        # None: no recorded results for this set
+        "remote": lambda q, k: runs[q["run"]][:k] if "run" in q else None,
+    }
+
+
+def evaluate(search, queries, k, unit, repeat, timed):
+    latencies, recall, reciprocal = [], 0.0, 0.0
+    for query in queries:
+        for _ in range(repeat if timed else 1):
+            started = time.perf_counter()
+            hits = search(query, k)
+            latencies.append(time.perf_counter() - started)
+        if hits is None:
+            return None
+        relevant, ranked = set(query[unit]), [passage_key(h) if unit == "passages" else h["title"] for h in hits]
+        recall += len(relevant & set(ranked)) / len(relevant)
+        reciprocal += next((1.0 / rank for rank, hit in enumerate(ranked, start=1) if hit in relevant), 0.0)
+    latencies.sort()
+    result = {"recall": round(recall / len(queries), 3), "mrr": round(reciprocal / len(queries), 3)}
+    if timed:
+        result.update(p50_ms=round(percentile(latencies, 50) * 1000, 3),
+                      p95_ms=round(percentile(latencies, 95) * 1000, 3))
+    return result
+
+
+def table(report, ks):
+    lines = []
+    for name, section in report["sets"].items():
+        lines.append(f"\n{name} ({section['queries']} queries; recall@k / MRR / p50 ms)")
+        lines.append(f"{'backend':<14}" + "".join(f"{f'k={k}':>22}" for k in ks))
+        for backend, by_k in section["backends"].items():
+            cells = []
+            for k in ks:
+                r = by_k[str(k)]
+                latency = f"{r['p50_ms']:.2f}" if "p50_ms" in r else "-"
+                cells.append(f"{r['recall']:.2f} / {r['mrr']:.2f} / {latency:>5}")
+            lines.append(f"{backend:<14}" + "".join(f"{cell:>22}" for cell in cells))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-k", type=int, nargs="+", default=[1, 3, 5, 8, 10, 20])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON instead of a table")
+    args = parser.parse_args()
+
+    passages = recorded_passages()
+    sets = {"cited": (cited_queries(), "passages"), "labeled": (load_queries(), "relevant")}
+    report = {"passages": len(passages), "sets": {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        found = backends(passages, tmp)
+        for name, (queries, unit) in sets.items():
+            section = {"queries": len(queries), "backends": {}}
+            for backend, search in found.items():
+                by_k = {}
+                for k in args.k:
+                    result = evaluate(search, queries, k, unit, args.repeat, timed=backend != "remote")
+                    if result is None:
+                        break
+                    by_k[str(k)] = result
+                if by_k:
+                    section["backends"][backend] = by_k
+            report["sets"][name] = section
+    print(json.dumps(report, indent=2) if args.json else table(report, args.k))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Offline corpus and labeled queries for the retrieval benchmarks and tests.
+
+``backend/rag/materials`` is not checked in, so the corpus is rebuilt from
+the ``retrieved_context`` passages recorded in
+``analysis-function/test_scripts/*.txt``: real curriculum passages as the
+Vertex AI Search datastore returned them. ``data/retrieval_queries.json``
+labels each query with the titles that should come back. ``cited_queries()``
+derives a second labeled set from the recorded analyses themselves.
+``recorded_streams()`` gives the raw streams for the stream benchmarks.
+"""
+import glob
+import json
+import os
+import re
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RECORDINGS = os.path.join(BACKEND_DIR, "analysis-function", "test_scripts", "*.txt")
+QUERIES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "retrieval_queries.json")
+
+_CONTEXT = re.compile(r'"retrieved_context":\s*')
+_GROUNDING = re.compile(r'"grounding_chunks":\s*')
+_CHUNK = re.compile(r'\{\s*"chunk_index"')
+_CITATION = re.compile(r"\[(\d+(?:\s*,\s*\d+)*)\]")
+_SENTENCE = re.compile(r"(?<=[.!?])\s+|\n+")
+_NOISE = re.compile(r'"\w+":\s*"?|\(Refer to[^)]*\)?|\[T\d+\]|\[[\d,\s]+\]|[{}"\\]')
+
+
+def recorded_passages(pattern=RECORDINGS):
+    """Unique ``retrieved_context`` passages from the recorded outputs, in file order."""
+    decoder = json.JSONDecoder()
+    passages, seen = [], set()
+    for path in sorted(glob.glob(pattern)):
+        with open(path, encoding="utf-8", errors="replace") as f:
+            text = f.read()
+        for match in _CONTEXT.finditer(text):
+            try:
+                context, _ = decoder.raw_decode(text, match.end())
+            except ValueError:
+                continue
+            if not isinstance(context, dict) or not context.get("text") or not context.get("title"):
+                continue
+            key = (context.get("uri"), context["text"][:50])
+            if key in seen:
+                continue
+            seen.add(key)
+            passage = {"title": context["title"], "uri": context.get("uri"), "text": context["text"]}
+            if context.get("page_span"):
+                passage["page_span"] = context["page_span"]
+            passages.append(passage)
+    return passages
+
+
+def recorded_groundings(pattern=RECORDINGS):
+    """Cited titles, in ``[N]`` order, of each recorded analysis with grounding."""
+    decoder = json.JSONDecoder()
+    runs = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, encoding="utf-8", errors="replace") as f:
+            text = f.read()
+        for match in _GROUNDING.finditer(text):
+            try:
+                chunks, _ = decoder.raw_decode(text, match.end())
+            except ValueError:
+                continue
+            if isinstance(chunks, list) and chunks:
+                runs.append([(chunk.get("retrieved_context") or {}).get("title") for chunk in chunks])
+    return runs
+
+
+def cited_queries(pattern=RECORDINGS):
+    """Sentences of the recorded analyses that cite passages, labeled with what they cite.
+
+    Only recordings of the raw stream carry both the analysis text and its
+    ``grounding_chunks``. In those, ``[N]`` is ``grounding_chunks[N-1]``.
+    Returns ``[{"query", "relevant": [title], "passages": [passage_key],
+    "run", "cited": [N]}]``; ``run`` indexes the recording's grounding in
+    ``recorded_run_passages()``.
+    """
+    return [query for run in _recorded_runs(pattern) for query in run["queries"]]
+
+
+def recorded_run_passages(pattern=RECORDINGS):
+    """The grounding chunks each raw-stream recording returned, in ``[N]`` order."""
+    return [run["passages"] for run in _recorded_runs(pattern)]
+
+
+def recorded_streams(pattern=RECORDINGS):
+    """The serialized chunks (v1 lines) of each raw-stream recording, in order."""
+    decoder = json.JSONDecoder()
+    streams = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, encoding="utf-8", errors="replace") as f:
+            text = f.read()
+        chunks = []
+        for match in _CHUNK.finditer(text):
+            try:
+                chunk, _ = decoder.raw_decode(text, match.start())
+            except ValueError:
+                continue
+            chunks.append(chunk)
+        if chunks:
+            streams.append(chunks)
+    return streams
+
+
+def replay(stream):
+    """SDK-shaped chunks (see ``common.fakes``) for a recorded stream.
+
+    The recordings carry no usage counts, so the last chunk gets made-up ones.
+    """
+    from common.fakes import make_chunk, make_part, make_usage
+
+    chunks = []
+    for index, chunk_data in enumerate(stream, start=1):
+        parts, grounding = [], None
+        for candidate in chunk_data.get("candidates") or []:
+            parts += [make_part(p.get("text"), p.get("thought"))
+                      for p in (candidate.get("content") or {}).get("parts", [])]
+            grounding = [g.get("retrieved_context") or {}
+                         for g in (candidate.get("grounding_metadata") or {}).get("grounding_chunks", [])] or grounding
+        usage = make_usage(9000, 2500, 1500) if index == len(stream) else None
+        chunks.append(make_chunk(parts, grounding_chunks=grounding, usage=usage))
+    return chunks
+
+
+def _recorded_runs(pattern):
+    from common.retrieval import passage_key
+
+    runs = []
+    for stream in recorded_streams(pattern):
+        chunks = [candidate for chunk in stream for candidate in chunk.get("candidates") or []]
+        passages = [g["retrieved_context"] for c in chunks
+                    for g in (c.get("grounding_metadata") or {}).get("grounding_chunks", [])
+                    if (g.get("retrieved_context") or {}).get("text")]
+        if not passages:
+            continue
+        body = "".join(part.get("text", "") for c in chunks for part in (c.get("content") or {}).get("parts", [])
+                       if not part.get("thought"))
+        run, queries = len(runs), []
+        for field in body.split("\n"):
+            # A citation often trails the claim as "(Refer to '...' [N])": the claim is the sentence before
+            claim = ""
+            for sentence in _SENTENCE.split(field):
+                cited = sorted({int(n) for group in _CITATION.findall(sentence) for n in group.split(",")
+                                if 0 < int(n) <= len(passages)})
+                text = " ".join(_NOISE.sub(" ", sentence).split()).strip(" ,:.")
+                query, claim = (f"{claim} {text}".strip() if len(text.split()) < 5 else text), text or claim
+                if not cited or len(query.split()) < 5:
+                    continue
+                queries.append({"query": query, "relevant": sorted({passages[n - 1]["title"] for n in cited}),
+                                "passages": [passage_key(passages[n - 1]) for n in cited], "run": run,
+                                "cited": cited})
+        runs.append({"passages": passages, "queries": queries})
+    return runs
+
+
+def load_queries(path=QUERIES_PATH):
+    """``[{"query", "relevant": [title, ...]}]``."""
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
@@ -0,0 +1,7 @@
+"""
+Shared helpers for the cw-mentor Cloud Functions.
+
+Each function directory (analysis, simulation, mentorship) can still be
+deployed on its own; this package holds the pieces they share so that the
+combined service in ``backend/main.py`` can run all of them in one process.
+"""
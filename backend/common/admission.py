@@ -0,0 +1,287 @@
+"""
+Per-process admission control with priority lanes.
+
+Heavy thinking analyses (``analyze``, ``supervisor_analysis``) and
+latency-sensitive chat turns (``chat``, ``simulation_chat``,
+``mentorship_chat``) are admitted through separate lanes, each with its own
+concurrency limit and priority queue, so a burst of analyses can never make
+a chat turn wait behind them. A request that cannot get a slot waits in its
+lane's queue for at most ``max_wait`` seconds; when the queue is full or
+the wait runs out it is rejected immediately with 429 and a Retry-After
+estimate instead of piling up on the instance.
+
+Limits come from the environment (defaults in brackets):
+    CW_ADMIT_HEAVY_LIMIT [4]         CW_ADMIT_INTERACTIVE_LIMIT [32]
+    CW_ADMIT_HEAVY_QUEUE [8]         CW_ADMIT_INTERACTIVE_QUEUE [64]
+    CW_ADMIT_HEAVY_WAIT_S [15]       CW_ADMIT_INTERACTIVE_WAIT_S [2]
+``CW_ADMISSION=0`` disables admission control.
+
+Both a blocking ``acquire()`` (Flask / functions-framework) and an
+``acquire_async()`` (asyncio servers) are provided; they share the same
+lanes.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import threading
+import time
+
+from flask import jsonify
+
+from common import metrics
+from common.settings import env_bool, env_float, env_int
+
+# action -> (lane, priority); lower priority values are served first
+ACTION_CLASSES = {
+    'simulation_chat': ('interactive', 0),
+    'chat': ('interactive', 1),
+    'mentorship_chat': ('interactive', 1),
+    'analyze': ('heavy', 0),
+    'supervisor_analysis': ('heavy', 1),
+}
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted; carries a Retry-After hint."""
+
+    def __init__(self, lane, reason, retry_after):
+        super().__init__(f"{lane} lane {reason}")
+        self.lane = lane
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ('priority', 'seq', 'wake', 'granted', 'cancelled')
+
+    def __init__(self, priority, seq, wake):
+        self.priority = priority
+        self.seq = seq
+        self.wake = wake
+        self.granted = False
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class Lane:
+    def __init__(self, name, limit, max_queue, max_wait):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self.queued = 0
+        self.heap = []
+        # Moving average of how long a slot is held, for Retry-After
+        self.avg_hold = 1.0
+
+
+class Ticket:
+    """An admitted request's slot. ``release()`` is idempotent."""
+
+    def __init__(self, controller, lane, action):
+        self._controller = controller
+        self.lane = lane
+        self.action = action
+        self.admitted_at = time.monotonic()
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._controller._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class AdmissionController:
+    def __init__(self, lanes, action_classes=None, enabled=True):
+        self.lanes = {lane.name: lane for lane in lanes}
+        self.action_classes = action_classes or ACTION_CLASSES
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            lanes=[
+                Lane('heavy',
+                     limit=env_int("CW_ADMIT_HEAVY_LIMIT", 4),
+                     max_queue=env_int("CW_ADMIT_HEAVY_QUEUE", 8),
+                     max_wait=env_float("CW_ADMIT_HEAVY_WAIT_S", 15.0)),
+                Lane('interactive',
+                     limit=env_int("CW_ADMIT_INTERACTIVE_LIMIT", 32),
+                     max_queue=env_int("CW_ADMIT_INTERACTIVE_QUEUE", 64),
+                     max_wait=env_float("CW_ADMIT_INTERACTIVE_WAIT_S", 2.0)),
+            ],
+            enabled=env_bool("CW_ADMISSION", True),
+        )
+
+    def _classify(self, action):
+        lane_name, priority = self.action_classes.get(action, ('interactive', 9))
+        return self.lanes[lane_name], priority
+
+    def _try_admit(self, action, wake):
+        """Take a slot or join the queue. Returns (ticket, waiter, lane)."""
+        lane, priority = self._classify(action)
+        with self._lock:
+            if lane.active < lane.limit and not lane.queued:
+                lane.active += 1
+                self._publish(lane)
+                metrics.observe('admission.wait_ms', 0.0, lane=lane.name)
+                metrics.inc('admission.admitted', lane=lane.name, action=action)
+                return Ticket(self, lane, action), None, lane
+            if lane.queued >= lane.max_queue:
+                metrics.inc('admission.rejected', lane=lane.name, reason='queue_full')
+                raise AdmissionRejected(lane.name, 'queue full', self._retry_after(lane))
+            waiter = _Waiter(priority, next(self._seq), wake)
+            heapq.heappush(lane.heap, waiter)
+            lane.queued += 1
+            self._publish(lane)
+            return None, waiter, lane
+
+    def _finish_wait(self, waiter, lane, action, started):
+        """Resolve a wait that ended (granted or timed out)."""
+        waited_ms = (time.monotonic() - started) * 1000
+        with self._lock:
+            if not waiter.granted:
+                waiter.cancelled = True
+                lane.queued -= 1
+                self._publish(lane)
+                metrics.inc('admission.rejected', lane=lane.name, reason='wait_timeout')
+                raise AdmissionRejected(lane.name, 'wait timed out', self._retry_after(lane))
+        metrics.observe('admission.wait_ms', waited_ms, lane=lane.name)
+        metrics.inc('admission.admitted', lane=lane.name, action=action)
+        return Ticket(self, lane, action)
+
+    def _abandon(self, waiter, lane):
+        """Leave the queue after an interrupted wait, handing back a slot granted meanwhile."""
+        with self._lock:
+            granted = waiter.granted
+            if not granted:
+                waiter.cancelled = True
+                lane.queued -= 1
+                self._publish(lane)
+        metrics.inc('admission.abandoned', lane=lane.name)
+        if granted:
+            Ticket(self, lane, None).release()
+
+    def acquire(self, action):
+        """Blocking admission; raises AdmissionRejected on overflow or timeout."""
+        if not self.enabled:
+            return _NullTicket()
+        event = threading.Event()
+        ticket, waiter, lane = self._try_admit(action, event.set)
+        if ticket:
+            return ticket
+        started = time.monotonic()
+        event.wait(lane.max_wait)
+        return self._finish_wait(waiter, lane, action, started)
+
+    async def acquire_async(self, action):
+        """Coroutine version of ``acquire`` for asyncio entry points."""
+        if not self.enabled:
+            return _NullTicket()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(True))
+
+        ticket, waiter, lane = self._try_admit(action, wake)
+        if ticket:
+            return ticket
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), lane.max_wait)
+        except asyncio.TimeoutError:
+            pass
+        except BaseException:
+            # Cancelled (e.g. the client went away): the slot must not leak
+            self._abandon(waiter, lane)
+            raise
+        return self._finish_wait(waiter, lane, action, started)
+
+    def _release(self, ticket):
+        lane = ticket.lane
+        held = time.monotonic() - ticket.admitted_at
+        with self._lock:
+            lane.avg_hold = 0.8 * lane.avg_hold + 0.2 * held
+            while lane.heap:
+                waiter = heapq.heappop(lane.heap)
+                if waiter.cancelled:
+                    continue
+                # Hand the slot straight to the next waiter
+                waiter.granted = True
+                lane.queued -= 1
+                self._publish(lane)
+                waiter.wake()
+                return
+            lane.active -= 1
+            self._publish(lane)
+
+    def _retry_after(self, lane):
+        # Time for the queue ahead to drain through the lane's slots
+        estimate = lane.avg_hold * (lane.queued + 1) / max(lane.limit, 1)
+        return max(1, math.ceil(estimate))
+
+    def _publish(self, lane):
+        metrics.set_gauge('admission.active', lane.active, lane=lane.name)
+        metrics.set_gauge('admission.queue_depth', lane.queued, lane=lane.name)
+
+
+class _NullTicket:
+    lane = None
+
+    def release(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+ADMISSION = AdmissionController.from_env()
+
+
+def admit(action, handler, request_json, headers, bypass=False):
+    """Run ``handler(request_json, headers)`` inside an admission slot.
+
+    Streamed responses keep their slot until the stream is closed; anything
+    else releases it as soon as the handler returns. Rejections become a
+    429 with a Retry-After header. ``bypass`` skips admission for requests
+    that add no upstream work (e.g. joining a coalesced stream).
+    """
+    if bypass:
+        metrics.inc('admission.bypassed', action=action)
+        return handler(request_json, headers)
+
+    try:
+        ticket = ADMISSION.acquire(action)
+    except AdmissionRejected as e:
+        logging.warning(f"Rejected '{action}': {e} (retry after {e.retry_after}s)")
+        return (jsonify({'error': f'Server busy ({e}). Please retry.', 'retryAfter': e.retry_after}),
+                429, {**headers, 'Retry-After': str(e.retry_after)})
+
+    try:
+        result = handler(request_json, headers)
+    except BaseException:
+        ticket.release()
+        raise
+
+    if getattr(result, 'is_streamed', False):
+        result.call_on_close(ticket.release)
+    else:
+        ticket.release()
+    return result
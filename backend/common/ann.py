@@ -0,0 +1,289 @@
+"""
+Approximate nearest-neighbour search over the embedding store (IVF-PQ).
+
+Exact search reads every row of the store: about 120 ms per query at 1M
+rows on one CPU, growing linearly as more states' curricula are loaded.
+The ANN index is an inverted file with product quantization, in NumPy:
+- spherical k-means splits the rows into ``nlist`` lists (``centroids``);
+- each row's residual from its centroid is product-quantized into ``m``
+  one-byte codes, one per ``dim / m``-wide subspace;
+- a query scores the centroids, opens the ``nprobe`` best lists and
+  estimates each of their rows' inner product from per-query lookup tables;
+- the best ``k * refine`` estimates are rescored exactly against the store,
+  which only reads those rows.
+
+``nprobe`` is the recall/latency knob. It can be passed per request (see
+``LocalRetriever.search``); ``nprobe=0`` is exact search. The default is
+``CW_ANN_NPROBE`` (8).
+
+The index is stored in ``ann/`` next to ``index.json``: ``centroids.npy``,
+``codebooks.npy`` and ``offsets.npy``, the memory-mapped per-row
+``codes.npy``, ``rows.npy`` and ``keys.npy`` (sorted by list), and
+``meta.json``. The meta records the store's content digest, and the index
+is only used with the store it was built from. Rows are keyed by the
+content hash in the store plus an occurrence number, so identical texts get
+separate entries. An update
+(``python -m common.ann`` or ``ingest --embeddings``) follows the store as
+ingestion changes it. Entries whose text is gone are dropped. Kept entries
+get their new row number. Only new text is encoded, with the existing
+centroids and codebooks. Training runs again when there is no index yet, on
+``--retrain``, or once the store is ``RETRAIN_GROWTH`` times the size it
+was trained on.
+
+Usage:
+    python -m common.ann [--index rag/index.json] [--nlist N] [--retrain]
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import time
+
+from common.embeddings import ANN_NPROBE, EmbeddingStore
+from common.lazy import lazy_import
+from common.retrieval import LOCAL_INDEX_PATH, ann_path_for, store_path_for
+from common.settings import env_int
+
+np = lazy_import("numpy")
+
+ANN_VERSION = 1
+ANN_REFINE = env_int("CW_ANN_REFINE", 10)
+RETRAIN_GROWTH = 4
+TRAIN_SAMPLE = 65536
+BLOCK_ROWS = 16384
+
+
+def occurrence_keys(hashes):
+    """``hashes`` made unique by mixing in each value's occurrence number."""
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    order = np.argsort(hashes, kind='stable')
+    ordered = hashes[order]
+    starts = np.flatnonzero(np.r_[True, ordered[1:] != ordered[:-1]])
+    ranks = np.empty(len(hashes), dtype=np.uint64)
+    ranks[order] = np.arange(len(hashes)) - np.repeat(starts, np.diff(np.r_[starts, len(hashes)]))
+    return hashes ^ (ranks * np.uint64(0x9E3779B97F4A7C15))
+
+
+def _rows(store, rows):
+    """Float32 store rows (int8 rows rescaled)."""
+    vectors = np.asarray(store.vectors[rows], dtype=np.float32)
+    return vectors * store.scales[rows][:, None] if store.scales is not None else vectors
+
+
+def _kmeans(data, count, iterations, rng, spherical):
+    centroids = data[rng.choice(len(data), count, replace=False)].copy()
+    for _ in range(iterations):
+        if spherical:
+            assign = np.argmax(data @ centroids.T, axis=1)
+        else:
+            assign = np.argmin((centroids ** 2).sum(axis=1) - 2 * data @ centroids.T, axis=1)
+        order = np.argsort(assign, kind='stable')
+        counts = np.bincount(assign, minlength=count)
+        filled = counts > 0
+        starts = np.r_[0, np.cumsum(counts)[:-1]][filled]
+        centroids[filled] = np.add.reduceat(data[order], starts, axis=0) / counts[filled][:, None]
+        # An empty cluster restarts at a random point
+        centroids[~filled] = data[rng.choice(len(data), int((~filled).sum()))]
+        if spherical:
+            centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+    return centroids.astype(np.float32)
+
+
+class AnnIndex:
+    def __init__(self, directory, mmap=True):
+        with open(os.path.join(directory, "meta.json"), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta.get('version') != ANN_VERSION:
+            raise ValueError(f"unsupported ANN index version {self.meta.get('version')}")
+        mode = 'r' if mmap else None
+        self.directory = directory
+        self.centroids = np.load(os.path.join(directory, "centroids.npy"))
+        self.codebooks = np.load(os.path.join(directory, "codebooks.npy"))
+        self.offsets = np.load(os.path.join(directory, "offsets.npy"))
+        self.codes = np.load(os.path.join(directory, "codes.npy"), mmap_mode=mode)
+        self.rows = np.load(os.path.join(directory, "rows.npy"), mmap_mode=mode)
+        self.keys = np.load(os.path.join(directory, "keys.npy"), mmap_mode=mode)
+        if len(self.rows) != self.meta['count'] or self.offsets[-1] != self.meta['count']:
+            raise ValueError(f"ANN index {directory} is incomplete")
+
+    def __len__(self):
+        return self.meta['count']
+
+    def search(self, store, query, k, nprobe=ANN_NPROBE, refine=ANN_REFINE, excluded=None):
+        """``(rows, scores)`` of about the ``k`` best store rows for ``query``, best first."""
+        query = query.astype(np.float32, copy=False)
+        coarse = self.centroids @ query
+        nprobe = min(nprobe, len(coarse))
+        lists = np.argpartition(-coarse, nprobe - 1)[:nprobe]
+        m, _, dsub = self.codebooks.shape
+        tables = np.einsum('jcd,jd->jc', self.codebooks, query.reshape(m, dsub))
+
+        candidates, estimates = [], []
+        for lst in lists.tolist():
+            start, stop = int(self.offsets[lst]), int(self.offsets[lst + 1])
+            if start == stop:
+                continue
+            codes = self.codes[start:stop]
+            estimates.append(coarse[lst] + tables[np.arange(m), codes].sum(axis=1))
+            candidates.append(self.rows[start:stop])
+        if not candidates:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        candidates, estimates = np.concatenate(candidates), np.concatenate(estimates)
+        if excluded is not None:
+            keep = ~excluded[candidates]
+            candidates, estimates = candidates[keep], estimates[keep]
+        shortlist = min(len(candidates), k * max(refine, 1))
+        top = np.argpartition(-estimates, shortlist - 1)[:shortlist] if len(candidates) > shortlist \
+            else np.arange(len(candidates))
+        candidates, estimates = candidates[top], estimates[top]
+        if refine:
+            # Reading the shortlist in row order keeps the memmap access sequential
+            order = np.argsort(candidates)
+            candidates = candidates[order]
+            scores = _rows(store, candidates) @ query
+        else:
+            scores = estimates
+        best = np.argsort(-scores, kind='stable')[:k]
+        return candidates[best], scores[best]
+
+
+def train(store, nlist, m, rng, iterations=10):
+    """``(centroids, codebooks)`` fitted on a sample of the store."""
+    if store.dim % m:
+        raise ValueError(f"dim {store.dim} is not a multiple of m={m}")
+    sample = np.sort(rng.choice(len(store), min(len(store), TRAIN_SAMPLE, nlist * 256), replace=False))
+    data = _rows(store, sample)
+    centroids = _kmeans(data, nlist, iterations, rng, spherical=True)
+    residuals = data - centroids[np.argmax(data @ centroids.T, axis=1)]
+    dsub = store.dim // m
+    ksub = min(256, len(data))
+    codebooks = np.stack([_kmeans(residuals[:, j * dsub:(j + 1) * dsub], ksub, iterations, rng, spherical=False)
+                          for j in range(m)])
+    return centroids, codebooks
+
+
+def encode(vectors, centroids, codebooks):
+    """``(lists, codes)`` of float32 rows."""
+    lists = np.argmax(vectors @ centroids.T, axis=1)
+    residuals = vectors - centroids[lists]
+    m, _, dsub = codebooks.shape
+    codes = np.empty((len(vectors), m), dtype=np.uint8)
+    for j in range(m):
+        sub = residuals[:, j * dsub:(j + 1) * dsub]
+        codes[:, j] = np.argmin((codebooks[j] ** 2).sum(axis=1) - 2 * sub @ codebooks[j].T, axis=1)
+    return lists.astype(np.int32), codes
+
+
+def _open_previous(directory, store):
+    try:
+        index = AnnIndex(directory, mmap=False)
+    except (OSError, ValueError, KeyError):
+        return None
+    return index if index.centroids.shape[1] == store.dim else None
+
+
+def _save(directory, name, array):
+    tmp = os.path.join(directory, f"{name}.tmp.npy")
+    np.save(tmp, array)
+    os.replace(tmp, os.path.join(directory, name))
+
+
+def build_ann(directory, store, nlist=None, m=None, retrain=False, seed=0):
+    """Bring the index at ``directory`` up to date with ``store``; returns a summary.
+
+    ``nlist`` defaults to about ``sqrt(rows)`` and ``m`` to one byte per
+    eight dimensions. Both only apply when training.
+    """
+    started = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    previous = None if retrain else _open_previous(directory, store)
+    if previous is not None and len(store) > RETRAIN_GROWTH * previous.meta['trained_on']:
+        logging.info(f"[ann] store grew from {previous.meta['trained_on']} to {len(store)} rows; retraining")
+        previous = None
+
+    keys = occurrence_keys(store.hashes)
+    if previous is None:
+        nlist = nlist or max(1, min(len(store) // 39, int(math.sqrt(len(store)))))
+        centroids, codebooks = train(store, nlist, m or max(1, store.dim // 8), rng)
+        trained_on = len(store)
+        kept_lists = np.empty(0, dtype=np.int32)
+        kept_codes = np.empty((0, codebooks.shape[0]), dtype=np.uint8)
+        kept_rows = np.empty(0, dtype=np.int64)
+        new_rows = np.arange(len(store))
+    else:
+        centroids, codebooks, trained_on = previous.centroids, previous.codebooks, previous.meta['trained_on']
+        lists = np.repeat(np.arange(len(centroids), dtype=np.int32), np.diff(previous.offsets))
+        order = np.argsort(keys)
+        position = np.searchsorted(keys[order], previous.keys).clip(max=len(keys) - 1)
+        found = keys[order][position] == previous.keys
+        kept_lists, kept_codes = lists[found], previous.codes[found]
+        kept_rows = order[position[found]]
+        new_rows = np.flatnonzero(~np.isin(keys, previous.keys))
+
+    new_lists, new_codes = [], []
+    for start in range(0, len(new_rows), BLOCK_ROWS):
+        block_lists, block_codes = encode(_rows(store, new_rows[start:start + BLOCK_ROWS]), centroids, codebooks)
+        new_lists.append(block_lists)
+        new_codes.append(block_codes)
+    lists = np.concatenate([kept_lists, *new_lists])
+    codes = np.concatenate([kept_codes, *new_codes]) if new_codes else kept_codes
+    rows = np.concatenate([kept_rows, new_rows]).astype(np.int64)
+    order = np.argsort(lists, kind='stable')
+    offsets = np.r_[0, np.cumsum(np.bincount(lists, minlength=len(centroids)))].astype(np.int64)
+
+    for name, array in (("centroids.npy", centroids), ("codebooks.npy", codebooks), ("offsets.npy", offsets),
+                        ("codes.npy", codes[order]), ("rows.npy", rows[order]), ("keys.npy", keys[rows[order]])):
+        _save(directory, name, array)
+    meta = {'version': ANN_VERSION, 'nlist': len(centroids), 'm': codebooks.shape[0], 'count': len(rows),
+            'store_count': len(store), 'store_digest': store.digest, 'trained_on': trained_on}
+    with open(os.path.join(directory, "meta.json.tmp"), 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(os.path.join(directory, "meta.json.tmp"), os.path.join(directory, "meta.json"))
+
+    summary = {'entries': len(rows), 'inserted': len(new_rows), 'removed': 0 if previous is None
+               else len(previous) - len(kept_rows), 'trained': previous is None, 'nlist': len(centroids),
+               'seconds': round(time.perf_counter() - started, 2)}
+    logging.info(f"[ann] {summary}")
+    return summary
+
+
+def open_ann(index_path, store):
+    """The ANN index next to ``index_path`` if it covers ``store``, else None."""
+    directory = ann_path_for(index_path)
+    if not os.path.exists(os.path.join(directory, "meta.json")):
+        return None
+    try:
+        index = AnnIndex(directory)
+    except (OSError, ValueError, KeyError) as e:
+        logging.warning(f"ANN index {directory} unusable: {e}")
+        return None
+    # Rows are found by number, so the store must hold exactly the rows it was built from
+    if index.meta['store_count'] != len(store) or index.meta.get('store_digest') != store.digest:
+        logging.warning(f"ANN index {directory} does not match the embedding store; update it")
+        return None
+    return index
+
+
+def update_ann(index_path, retrain=False):
+    """Update the ANN index next to ``index_path`` from the embedding store next to it."""
+    return build_ann(ann_path_for(index_path), EmbeddingStore(store_path_for(index_path)), retrain=retrain)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or update the ANN index over the embedding store.")
+    parser.add_argument("--index", default=LOCAL_INDEX_PATH)
+    parser.add_argument("--nlist", type=int, default=None, help="inverted lists (default: about sqrt(rows))")
+    parser.add_argument("-m", type=int, default=None, help="PQ bytes per row (default: dim / 8)")
+    parser.add_argument("--retrain", action="store_true", help="train centroids and codebooks again")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    store = EmbeddingStore(store_path_for(args.index))
+    summary = build_ann(ann_path_for(args.index), store, nlist=args.nlist, m=args.m, retrain=args.retrain)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
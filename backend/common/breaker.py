@@ -0,0 +1,231 @@
+"""
+Circuit breakers and model fallback chains.
+
+Each (model, endpoint) pair has one process-wide breaker. After
+``CW_BREAKER_FAILURES`` consecutive transient failures (quota, 5xx,
+timeouts) it opens. While it is open, calls to that model are refused at
+once instead of waiting on a failing backend. After ``CW_BREAKER_RESET_S``
+seconds it goes half-open and lets one probe through. A successful probe
+closes the breaker; a failed one opens it again. Client errors such as a
+malformed request say nothing about the backend's health and are not
+counted.
+
+A ``FallbackChain`` tries its models in order and skips any whose breaker is
+open. The default chain is the handler's model followed by
+``CW_FALLBACK_MODELS`` (comma separated, ``gemini-2.5-flash-lite`` by
+default). If no model can answer, the chain returns its canned response when
+it has one and raises ``FallbackExhausted`` otherwise.
+
+Metrics: ``breaker.state{endpoint,model}`` (0 closed, 1 half-open, 2 open),
+breaker.opened, breaker.short_circuited, fallback.served{chain,tier} and
+fallback.failed{chain,model}.
+"""
+import logging
+import threading
+import time
+
+from common import metrics
+from common.genai_config import LIGHT_MODEL
+from common.settings import env_float, env_int, env_str
+
+CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+FAILURE_THRESHOLD = env_int("CW_BREAKER_FAILURES", 5)
+RESET_TIMEOUT_S = env_float("CW_BREAKER_RESET_S", 30.0)
+FALLBACK_MODELS = [m.strip() for m in env_str("CW_FALLBACK_MODELS", LIGHT_MODEL).split(",") if m.strip()]
+
+
+class FallbackExhausted(Exception):
+    """No model in a chain could answer (all failed or short-circuited)."""
+
+    def __init__(self, chain, last_error=None):
+        detail = f": {last_error}" if last_error else " (all circuits open)"
+        super().__init__(f"No model available for '{chain}'{detail}")
+        self.chain = chain
+        self.last_error = last_error
+
+
+def is_transient(exc):
+    """True for errors that indicate an unhealthy backend rather than a bad request."""
+    code = getattr(exc, 'code', None)
+    if isinstance(code, int):
+        return code == 429 or code >= 500
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    # Transport errors from the SDK's HTTP stack
+    return type(exc).__module__.split('.')[0] in ('httpx', 'httpcore', 'aiohttp')
+
+
+class CircuitBreaker:
+    def __init__(self, model, endpoint, failure_threshold=5, reset_timeout=30.0, half_open_probes=1):
+        self.model = model
+        self.endpoint = endpoint
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+        self._publish()
+
+    def allow(self):
+        """Whether a call may go to the backend now (reserves the probe when half-open)."""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    metrics.inc('breaker.short_circuited', model=self.model, endpoint=self.endpoint)
+                    return False
+                self._set_state(HALF_OPEN)
+                self._probes = 0
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_probes:
+                    metrics.inc('breaker.short_circuited', model=self.model, endpoint=self.endpoint)
+                    return False
+                self._probes += 1
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            if self.state != CLOSED:
+                logging.info(f"Circuit for {self.model} @ {self.endpoint} closed")
+                self._set_state(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    logging.warning(f"Circuit for {self.model} @ {self.endpoint} opened "
+                                    f"after {self.failures} failures")
+                    metrics.inc('breaker.opened', model=self.model, endpoint=self.endpoint)
+                self.opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    def _set_state(self, state):
+        self.state = state
+        self._publish()
+
+    def _publish(self):
+        metrics.set_gauge('breaker.state', _STATE_VALUES[self.state], model=self.model, endpoint=self.endpoint)
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(model, endpoint):
+    """Return the shared breaker for ``model`` at ``endpoint``."""
+    key = (model, endpoint)
+    with _breakers_lock:
+        breaker = _breakers.get(key)
+        if breaker is None:
+            breaker = _breakers[key] = CircuitBreaker(
+                model, endpoint, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT_S)
+        return breaker
+
+
+def reset_breakers():
+    """Forget every breaker (tests and benchmarks)."""
+    with _breakers_lock:
+        _breakers.clear()
+
+
+class FallbackChain:
+    """Try ``models`` in order at ``endpoint``, skipping any whose circuit is open."""
+
+    def __init__(self, name, models, endpoint, canned=None):
+        self.name = name
+        self.models = list(dict.fromkeys(models))
+        self.endpoint = endpoint
+        self.canned = canned
+
+    @classmethod
+    def from_env(cls, name, model, endpoint, canned=None):
+        return cls(name, [model] + FALLBACK_MODELS, endpoint, canned=canned)
+
+    def _available(self, first=None):
+        models = self.models if first is None else [first] + [m for m in self.models if m != first]
+        for model in models:
+            breaker = get_breaker(model, self.endpoint)
+            if breaker.allow():
+                yield model, breaker
+
+    def _failed(self, model, breaker, exc):
+        """Record ``exc`` against ``model``; re-raise it unless it is transient."""
+        if not is_transient(exc):
+            # The backend answered; the request itself was bad
+            breaker.record_success()
+            raise exc
+        breaker.record_failure()
+        metrics.inc('fallback.failed', chain=self.name, model=model)
+        logging.warning(f"[{self.name}] {model} failed, falling back: {exc}")
+
+    def _exhausted(self, last_error):
+        if self.canned is None:
+            raise FallbackExhausted(self.name, last_error)
+        logging.warning(f"[{self.name}] no model available, serving canned response")
+        metrics.inc('fallback.served', chain=self.name, tier='canned')
+        return self.canned, 'canned'
+
+    def call(self, fn, first=None):
+        """Return ``(fn(model), model)`` for the first model that answers.
+
+        ``first`` moves one model (e.g. the router's pick) to the front.
+        Returns ``(canned, 'canned')`` when every model is unavailable and a
+        canned response is configured.
+        """
+        last_error = None
+        for model, breaker in self._available(first):
+            try:
+                result = fn(model)
+            except Exception as e:
+                self._failed(model, breaker, e)
+                last_error = e
+                continue
+            breaker.record_success()
+            metrics.inc('fallback.served', chain=self.name, tier=model)
+            return result, model
+        return self._exhausted(last_error)
+
+    def stream(self, open_stream, first=None):
+        """Yield the items of ``open_stream(model)`` for the first model that starts.
+
+        A model that fails before its first item is skipped; once items have
+        been yielded the stream is committed to that model and later errors
+        propagate.
+        """
+        last_error = None
+        for model, breaker in self._available(first):
+            try:
+                iterator = iter(open_stream(model))
+                first = next(iterator)
+            except StopIteration:
+                breaker.record_success()
+                metrics.inc('fallback.served', chain=self.name, tier=model)
+                return
+            except Exception as e:
+                self._failed(model, breaker, e)
+                last_error = e
+                continue
+
+            metrics.inc('fallback.served', chain=self.name, tier=model)
+            try:
+                yield first
+                yield from iterator
+            except GeneratorExit:
+                # The caller went away; the model was answering fine
+                breaker.record_success()
+                raise
+            except Exception as e:
+                if is_transient(e):
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                raise
+            breaker.record_success()
+            return
+        raise FallbackExhausted(self.name, last_error)
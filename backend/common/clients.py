@@ -0,0 +1,41 @@
+"""
+Process-wide pool of Google GenAI clients.
+
+Every function used to build its own ``genai.Client`` (the simulation and
+mentorship functions built a fresh one on every request). Clients are
+thread-safe and hold the HTTP connection pool, so we keep exactly one per
+(project, location) and hand the same instance to every caller.
+"""
+import logging
+import threading
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def get_client(project, location="global"):
+    """Return the shared Vertex AI client for ``project``/``location``."""
+    key = (project, location)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            # Imported here so lazy-init mode can defer google.genai
+            from google import genai
+
+            client = genai.Client(
+                vertexai=True,
+                project=project,
+                location=location,
+            )
+            _clients[key] = client
+            logging.info(f"Google GenAI client created for project '{project}' ({location})")
+    return client
+
+
+def pool_size():
+    """Number of distinct clients currently held by the pool."""
+    return len(_clients)
@@ -0,0 +1,157 @@
+"""
+Precomputed curriculum passages for the six analysis criteria.
+
+Every caseworker analysis is scored against the same six criteria. Each
+analysis still retrieves curriculum passages for its transcript, so the
+retrieval cost is paid every time. The passages behind ``[1]``, ``[2]``, ...
+also change from one analysis to the next.
+
+``python -m common.criteria`` runs one retrieval per criterion against the
+local index. The top passages are kept, with their citation data and
+without near-duplicates across criteria. The result is a compact JSON
+artifact, ``rag/criteria.json``:
+- ``passages``: the shared passages, in citation order; passage ``i`` is
+  always cited as ``[i + 1]``;
+- ``criteria``: each criterion's name, its retrieval query, and the
+  indexes of its passages, best first.
+
+With ``CW_RAG_MODE=criteria``, analyses load the artifact once at startup
+and inject its passages into the prompt, labelled by criterion. The
+retrieval tool is not called. ``ingest`` rebuilds the artifact after
+updating the index when one already exists next to it, or with
+``--criteria``. Running instances keep the map they loaded until they
+restart.
+
+Usage:
+    python -m common.criteria [--index rag/index.json] [--out rag/criteria.json] [-k 3]
+    python -m common.ingest <materials> --criteria
+"""
+import argparse
+import json
+import logging
+import os
+import time
+
+from common.lazy import Lazy
+from common.retrieval import BACKEND_DIR, LOCAL_INDEX_PATH, LocalRetriever, format_context, passage_key
+from common.settings import env_str
+
+ARTIFACT_VERSION = 1
+CRITERIA_MAP_PATH = env_str("CW_CRITERIA_MAP", os.path.join(BACKEND_DIR, "rag", "criteria.json"))
+
+
+def criteria_path_for(index_path):
+    """The map built from the index at ``index_path``: ``CRITERIA_MAP_PATH`` for the default index."""
+    if os.path.abspath(index_path) == os.path.abspath(LOCAL_INDEX_PATH):
+        return CRITERIA_MAP_PATH
+    return os.path.join(os.path.dirname(os.path.abspath(index_path)), "criteria.json")
+
+# (name as the analysis prompt and criteriaAnalysis use it, retrieval query)
+CRITERIA = (
+    ("Introduction & Identification",
+     "introduce yourself with your name and agency, show identification and verify the parent's identity"),
+    ("Reason for Contact",
+     "explain the reason for the visit and the report to the parent in a clear, non-accusatory way"),
+    ("Responsive to Parent",
+     "listen with empathy, acknowledge the parent's feelings and respond to their concerns to build engagement"),
+    ("Permission to Enter",
+     "ask the parent for permission to enter the home respectfully and explain the voluntary nature of the visit"),
+    ("Information Gathering",
+     "gather information about household members, child safety, family strengths and supports with open-ended "
+     "questions"),
+    ("Process & Next Steps",
+     "explain next steps, the assessment process and parent rights, give the DHS 1536 pamphlet"),
+)
+
+
+def build_criteria_map(retriever, k=3, candidates=None):
+    """The artifact dict: the top ``k`` distinct passages per criterion."""
+    passages, index_of, criteria = [], {}, []
+    for name, query in CRITERIA:
+        chosen = []
+        for hit in retriever.search(query, k=candidates or k * 4):
+            key = passage_key(hit)
+            if key not in index_of:
+                index_of[key] = len(passages)
+                passages.append({field: hit[field] for field in ('title', 'uri', 'text', 'page_span') if hit.get(field)})
+            if index_of[key] not in chosen:
+                chosen.append(index_of[key])
+            if len(chosen) == k:
+                break
+        criteria.append({'name': name, 'query': query, 'passages': chosen})
+
+    # Drop passages no criterion kept and renumber in first-use order
+    order = list(dict.fromkeys(i for c in criteria for i in c['passages']))
+    renumber = {old: new for new, old in enumerate(order)}
+    for criterion in criteria:
+        criterion['passages'] = [renumber[i] for i in criterion['passages']]
+    return {'version': ARTIFACT_VERSION, 'k': k, 'passages': [passages[i] for i in order], 'criteria': criteria}
+
+
+class CriteriaMap:
+    def __init__(self, artifact):
+        if artifact.get('version') != ARTIFACT_VERSION:
+            raise ValueError(f"unsupported criteria map version {artifact.get('version')}")
+        self.passages = artifact['passages']
+        self.criteria = artifact['criteria']
+        self._context = None
+
+    @classmethod
+    def load(cls, path=CRITERIA_MAP_PATH):
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def context(self):
+        """Prompt block: the numbered excerpts, then which ones belong to each criterion."""
+        if self._context is None:
+            lines = ["EXCERPTS BY CRITERION (cite the matching numbers for each criterion):"]
+            for criterion in self.criteria:
+                cited = ", ".join(f"[{i + 1}]" for i in criterion['passages'])
+                lines.append(f"- {criterion['name']}: {cited}")
+            self._context = f"{format_context(self.passages)}\n\n" + "\n".join(lines)
+        return self._context
+
+
+def _load_default():
+    started = time.monotonic()
+    criteria_map = CriteriaMap.load(CRITERIA_MAP_PATH)
+    logging.info(f"Criteria map loaded: {len(criteria_map.passages)} passages for {len(criteria_map.criteria)} "
+                 f"criteria in {(time.monotonic() - started) * 1000:.0f} ms")
+    return criteria_map
+
+
+CRITERIA_MAP = Lazy(_load_default)
+
+
+def write_criteria_map(index_path=LOCAL_INDEX_PATH, out=None, k=3):
+    """Build the map from the index at ``index_path`` and write it; returns the artifact."""
+    started = time.perf_counter()
+    artifact = build_criteria_map(LocalRetriever.load(index_path), k=k)
+    out = out or criteria_path_for(index_path)
+    with open(f"{out}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(artifact, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(f"{out}.tmp", out)
+    logging.info(f"[criteria] {len(artifact['passages'])} passages for {len(artifact['criteria'])} criteria "
+                 f"in {time.perf_counter() - started:.1f}s -> {out}")
+    return artifact
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute curriculum passages for the analysis criteria.")
+    parser.add_argument("--index", default=LOCAL_INDEX_PATH)
+    parser.add_argument("--out", default=None, help="artifact to write (default: CW_CRITERIA_MAP for the "
+                                                    "default index, else criteria.json next to --index)")
+    parser.add_argument("-k", type=int, default=3, help="passages per criterion")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    args.out = args.out or criteria_path_for(args.index)
+    artifact = write_criteria_map(args.index, args.out, k=args.k)
+    for criterion in artifact['criteria']:
+        titles = ", ".join(artifact['passages'][i]['title'] for i in criterion['passages'])
+        print(f"{criterion['name']}: {titles}")
+    print(f"{len(artifact['passages'])} passages -> {args.out} ({os.path.getsize(args.out)} bytes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Near-duplicate detection for the curriculum materials (MinHash + LSH).
+
+The materials folder holds several revisions of the same training documents.
+For example, ``Intro_to_EE_Curriculum_KP_2025-03-24`` and its later
+revisions differ only in their date suffix, which files not yet renamed
+carry as ``(KP 03.24.2025)``. Indexing all of them fills the
+top k with the same passage and gets it cited several times in one analysis.
+
+Each text is reduced to the set of its word 5-gram shingles. A MinHash
+signature of ``num_perm`` values estimates the Jaccard similarity of two
+sets. Signatures are split into ``bands`` bands; texts sharing any band
+become candidate pairs. Only candidates get their estimated similarity
+checked, so the cost grows with the number of texts, not pairs.
+
+Detection runs at two levels:
+- Documents: the passages of one URI joined together. Each group of
+  revisions keeps one canonical document, the one with the newest date
+  suffix; the others are excluded.
+- Passages of the remaining documents. A passage repeated in another
+  document, such as a guide quoted in a curriculum, is kept in only one of
+  them.
+
+The result is written as ``exclusions.json`` next to the index.
+``LocalRetriever.load`` leaves excluded documents and passages out.
+
+Usage:
+    python -m common.dedup [rag/index.json] [--threshold 0.8] [--passage-threshold 0.9]
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import time
+import zlib
+
+from common.lazy import lazy_import
+from common.retrieval import LOCAL_INDEX_PATH, exclusions_path_for, passage_key
+
+np = lazy_import("numpy")
+
+_WORD = re.compile(r"[a-z0-9]+")
+# Renamed suffixes (``_KP_2025-03-24``) and raw names (``(KP 03.24.2025)``)
+_DATE = re.compile(r"(?P<y1>\d{4})-(?P<m1>\d{2})-(?P<d1>\d{2})"
+                   r"|(?P<m2>\d{2})\.(?P<d2>\d{2})\.(?P<y2>\d{4})")
+
+
+def shingles(text, size=5):
+    """CRC-32 hashes of the word ``size``-grams of ``text`` (one gram for shorter texts)."""
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        return {zlib.crc32(" ".join(words).encode('utf-8'))}
+    return {zlib.crc32(" ".join(words[i:i + size]).encode('utf-8')) for i in range(len(words) - size + 1)}
+
+
+class MinHasher:
+    """MinHash signatures over ``num_perm`` multiply-shift hash functions.
+
+    ``h(x) = ((a * x + b) mod 2**64) >> 32`` with a random odd ``a``; the
+    mod is NumPy's uint64 wraparound, so no division is needed.
+    """
+
+    def __init__(self, num_perm=128, seed=1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.a = rng.integers(0, 1 << 63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.b = rng.integers(0, 1 << 63, size=num_perm, dtype=np.uint64)
+
+    def signatures(self, hash_sets, batch_rows=2048):
+        """``(len(hash_sets), num_perm)`` uint64 signatures for a list of shingle sets."""
+        out = np.empty((len(hash_sets), self.num_perm), dtype=np.uint64)
+        start = 0
+        while start < len(hash_sets):
+            end, rows = start, 0
+            while end < len(hash_sets) and (rows == 0 or rows + len(hash_sets[end]) <= batch_rows):
+                rows += len(hash_sets[end])
+                end += 1
+            lengths = [len(h) for h in hash_sets[start:end]]
+            x = np.fromiter((v for h in hash_sets[start:end] for v in h), dtype=np.uint64, count=rows)
+            # In place, in cache-sized batches: this is most of the dedup time
+            hashed = np.multiply(x[:, None], self.a)
+            hashed += self.b
+            hashed >>= np.uint64(32)
+            offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+            out[start:end] = np.minimum.reduceat(hashed, offsets, axis=0)
+            start = end
+        return out
+
+    def signature(self, hashes):
+        return self.signatures([hashes])[0]
+
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of two signatures."""
+    return float(np.mean(sig_a == sig_b))
+
+
+def near_duplicate_groups(signatures, threshold=0.8, bands=32):
+    """Groups (lists of indexes, size > 1) of signatures at least ``threshold`` similar.
+
+    Members of a band bucket are only compared with the bucket's first
+    member, so a bucket of n identical texts costs n comparisons, not n^2.
+    """
+    parent = list(range(len(signatures)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    if len(signatures):
+        rows = signatures.shape[1] // bands
+        for band in range(bands):
+            # Bucket by the band's bytes; only buckets of two or more matter
+            block = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows])
+            _, bucket, counts = np.unique(block.view(np.dtype((np.void, rows * 8))).ravel(),
+                                          return_inverse=True, return_counts=True)
+            shared = np.nonzero(counts[bucket] > 1)[0]
+            shared = shared[np.argsort(bucket[shared], kind='stable')]
+            for members in np.split(shared, np.nonzero(np.diff(bucket[shared]))[0] + 1):
+                first = int(members[0]) if len(members) else None
+                for other in members[1:]:
+                    other = int(other)
+                    if find(first) != find(other) and similarity(signatures[first], signatures[other]) >= threshold:
+                        parent[find(other)] = find(first)
+
+    groups = {}
+    for index in range(len(signatures)):
+        groups.setdefault(find(index), []).append(index)
+    return [members for members in groups.values() if len(members) > 1]
+
+
+def revision_date(title):
+    """The last date in a title as ``"YYYY-MM-DD"``, or "" if undated.
+
+    Both ``_KP_2025-03-24`` and the raw ``(KP 03.24.2025)`` give ``"2025-03-24"``.
+    """
+    dates = list(_DATE.finditer(title or ""))
+    if not dates:
+        return ""
+    g = dates[-1].groupdict()
+    return f"{g['y1']}-{g['m1']}-{g['d1']}" if g['y1'] else f"{g['y2']}-{g['m2']}-{g['d2']}"
+
+
+def by_preference(items, title=lambda item: item['title']):
+    """Newest revision first, undated ones last, ties by title."""
+    ordered = sorted(items, key=title)
+    return sorted(ordered, key=lambda item: revision_date(title(item)), reverse=True)
+
+
+def find_exclusions(passages, threshold=0.8, passage_threshold=0.9, num_perm=128, bands=32):
+    """The exclusions document for ``passages`` (see the module docstring)."""
+    hasher = MinHasher(num_perm)
+    documents = {}
+    for p in passages:
+        document = documents.setdefault(p['uri'], {'uri': p['uri'], 'title': p['title'], 'passages': []})
+        document['passages'].append(p)
+    documents = list(documents.values())
+
+    signatures = hasher.signatures([shingles(" ".join(p['text'] for p in d['passages'])) for d in documents])
+    groups, excluded_uris = [], set()
+    for members in near_duplicate_groups(signatures, threshold, bands):
+        members = by_preference(members, title=lambda i: documents[i]['title'])
+        canonical = members[0]
+        groups.append({'canonical': documents[canonical]['uri'], 'title': documents[canonical]['title'], 'excluded': [
+            {'uri': documents[i]['uri'], 'title': documents[i]['title'],
+             'similarity': round(similarity(signatures[canonical], signatures[i]), 3)} for i in members[1:]]})
+        excluded_uris.update(documents[i]['uri'] for i in members[1:])
+
+    kept = [(d, p) for d in by_preference(documents) if d['uri'] not in excluded_uris
+            for p in d['passages']]
+    chunk_signatures = hasher.signatures([shingles(p['text']) for _, p in kept])
+    excluded_passages = []
+    for members in near_duplicate_groups(chunk_signatures, passage_threshold, bands):
+        # kept is already in preference order, so the first member stays
+        members.sort()
+        excluded_passages.extend(passage_key(kept[i][1]) for i in members[1:] if kept[i][0] is not kept[members[0]][0])
+
+    return {
+        'version': 1,
+        'threshold': threshold,
+        'passage_threshold': passage_threshold,
+        'documents': groups,
+        'excluded_uris': sorted(excluded_uris),
+        'excluded_passages': sorted(excluded_passages),
+    }
+
+
+def write_exclusions(index_path=LOCAL_INDEX_PATH, out=None, **kwargs):
+    """Find near-duplicates in the index at ``index_path``; returns the exclusions written."""
+    with open(index_path, encoding='utf-8') as f:
+        passages = json.load(f)['passages']
+    started = time.perf_counter()
+    exclusions = find_exclusions(passages, **kwargs)
+    out = out or exclusions_path_for(index_path)
+    with open(f"{out}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(exclusions, f, ensure_ascii=False, indent=1)
+    os.replace(f"{out}.tmp", out)
+    logging.info(f"[dedup] {len(exclusions['excluded_uris'])} documents and "
+                 f"{len(exclusions['excluded_passages'])} passages excluded from {len(passages)} passages "
+                 f"in {time.perf_counter() - started:.1f}s -> {out}")
+    return exclusions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write the near-duplicate exclusion list for a local index.")
+    parser.add_argument("index", nargs="?", default=LOCAL_INDEX_PATH)
+    parser.add_argument("--out", default=None, help="exclusions JSON (default: exclusions.json next to the index)")
+    parser.add_argument("--threshold", type=float, default=0.8, help="document similarity for a revision")
+    parser.add_argument("--passage-threshold", type=float, default=0.9, help="passage similarity for a duplicate")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    exclusions = write_exclusions(args.index, args.out, threshold=args.threshold,
+                                  passage_threshold=args.passage_threshold)
+    for group in exclusions['documents']:
+        print(f"keep {group['title']}")
+        for duplicate in group['excluded']:
+            print(f"  drop {duplicate['title']}  (similarity {duplicate['similarity']})")
+    print(f"{len(exclusions['excluded_passages'])} duplicate passages excluded")
+
+
+if __name__ == "__main__":
+    main()
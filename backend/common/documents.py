@@ -0,0 +1,165 @@
+"""
+Text extraction and chunking for the curriculum materials.
+
+The materials under ``backend/rag/materials`` mirror the ``Curriculum``
+folder of the RAG bucket: mostly PDFs, plus Word and PowerPoint files.
+Word and PowerPoint files (and plain text) are read with the standard
+library. PDFs need ``pypdf``, an optional dependency listed in
+``backend/rag/requirements.txt``. Without it, PDFs are skipped with a
+warning rather than failing the whole build.
+
+Titles and URIs match what the Vertex AI Search datastore reports: the file
+name without its last extension, and the bucket path under ``uri_prefix``.
+Pages are 1-based; Word pages follow the page breaks stored in the file.
+"""
+import logging
+import os
+import re
+import zipfile
+from xml.etree import ElementTree
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.docx', '.pptx', '.txt', '.md')
+DEFAULT_URI_PREFIX = "gs://wz-case-worker-mentor-rag/Curriculum"
+
+_W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+_A = '{http://schemas.openxmlformats.org/drawingml/2006/main}'
+
+
+def title_for(path):
+    """Document title as the datastore reports it (file name minus last extension)."""
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def uri_for(path, root, uri_prefix=DEFAULT_URI_PREFIX):
+    relative = os.path.relpath(path, root).replace(os.sep, '/')
+    return f"{uri_prefix.rstrip('/')}/{relative}"
+
+
+def _docx_pages(path):
+    with zipfile.ZipFile(path) as archive:
+        root = ElementTree.fromstring(archive.read('word/document.xml'))
+    pages, paragraphs, page = [], [], 1
+    for paragraph in root.iter(f'{_W}p'):
+        text = []
+        for node in paragraph.iter():
+            if node.tag == f'{_W}t' and node.text:
+                text.append(node.text)
+            elif node.tag == f'{_W}lastRenderedPageBreak' or (
+                    node.tag == f'{_W}br' and node.get(f'{_W}type') == 'page'):
+                if paragraphs or text:
+                    pages.append((page, "\n".join(paragraphs + ["".join(text)]).strip()))
+                    paragraphs, text = [], []
+                page += 1
+        if text:
+            paragraphs.append("".join(text))
+    if paragraphs:
+        pages.append((page, "\n".join(paragraphs)))
+    return [(number, text) for number, text in pages if text]
+
+
+def _pptx_pages(path):
+    slide_name = re.compile(r'^ppt/slides/slide(\d+)\.xml$')
+    pages = []
+    with zipfile.ZipFile(path) as archive:
+        slides = sorted((int(m.group(1)), name) for name in archive.namelist()
+                        for m in [slide_name.match(name)] if m)
+        for number, name in slides:
+            root = ElementTree.fromstring(archive.read(name))
+            lines = ["".join(t.text or '' for t in p.iter(f'{_A}t')) for p in root.iter(f'{_A}p')]
+            text = "\n".join(line for line in lines if line.strip())
+            if text:
+                pages.append((number, text))
+    return pages
+
+
+def _pdf_pages(path):
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        logging.warning(f"Skipping {path}: install pypdf (backend/rag/requirements.txt) to index PDFs")
+        return []
+    reader = PdfReader(path)
+    pages = []
+    for number, page in enumerate(reader.pages, start=1):
+        text = (page.extract_text() or '').strip()
+        if text:
+            pages.append((number, text))
+    return pages
+
+
+def extract_pages(path):
+    """``[(page_number, text)]`` for one file; page numbers are None for plain text."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.docx':
+        return _docx_pages(path)
+    if extension == '.pptx':
+        return _pptx_pages(path)
+    if extension == '.pdf':
+        return _pdf_pages(path)
+    if extension in ('.txt', '.md'):
+        with open(path, encoding='utf-8', errors='replace') as f:
+            text = f.read().strip()
+        return [(None, text)] if text else []
+    return []
+
+
+def iter_documents(root):
+    """Paths of every supported file under ``root``, in a stable order."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.lower().endswith(SUPPORTED_EXTENSIONS) and not name.startswith('.'):
+                yield os.path.join(dirpath, name)
+
+
+def _tail(text, overlap):
+    """The last ~``overlap`` characters of ``text``, starting at a word."""
+    if overlap <= 0 or len(text) <= overlap:
+        return ""
+    tail = text[-overlap:]
+    space = tail.find(' ')
+    return (tail[space + 1:] if space >= 0 else tail).strip()
+
+
+def check_chunking(max_chars, overlap):
+    """Raise ValueError unless ``0 <= overlap < max_chars``."""
+    if not 0 <= overlap < max_chars:
+        raise ValueError(f"overlap must be at least 0 and less than max_chars ({max_chars}), got {overlap}")
+
+
+def chunk_pages(pages, max_chars=1500, overlap=0):
+    """Split pages into passages of at most ~``max_chars``, never across pages.
+
+    Returns ``[(first_page, last_page, text)]``. Paragraph boundaries are
+    kept where possible; a single oversized paragraph is split on spaces.
+    With ``overlap``, each passage after the first on a page repeats about
+    that many characters from the end of the previous one, so it must be
+    less than ``max_chars``.
+    """
+    check_chunking(max_chars, overlap)
+    chunks = []
+    for number, text in pages:
+        current = ""
+        for paragraph in re.split(r'\n\s*\n|\n', text):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+            while len(paragraph) > max_chars:
+                cut = paragraph.rfind(' ', 0, max_chars)
+                cut = cut if cut > 0 else max_chars
+                if current:
+                    chunks.append((number, number, current))
+                    current = ""
+                chunks.append((number, number, paragraph[:cut].strip()))
+                start = paragraph.find(' ', max(1, cut - overlap), cut) if overlap > 0 else -1
+                paragraph = paragraph[start + 1 if start > 0 else cut:].strip()
+            if not paragraph:
+                continue
+            if current and len(current) + 1 + len(paragraph) > max_chars:
+                chunks.append((number, number, current))
+                tail = _tail(current, overlap)
+                current = tail if tail and len(tail) + 1 + len(paragraph) <= max_chars else ""
+            current = f"{current}\n{paragraph}" if current else paragraph
+        if current:
+            chunks.append((number, number, current))
+    return chunks
@@ -0,0 +1,301 @@
+"""
+Memory-mapped embedding store for the local index.
+
+``VectorIndex`` embeds every passage again each time an instance loads the
+index. Each worker process then holds its own copy of the matrix. The store
+keeps the passage vectors in a directory next to the index (``embeddings/``
+next to ``index.json``):
+- ``vectors.npy``: one row per index passage, float32 or int8;
+- ``scales.npy``: per-row scales of an int8 matrix;
+- ``hashes.npy``: the content hash of each row's text (uint64);
+- ``idf.npy``: inverse document frequency of each hash bucket;
+- ``meta.json``: format version, encoder, dimension, dtype, row count and
+  ``digest``, a digest of every row's content hash in order.
+
+The matrices are opened with ``numpy.load(mmap_mode='r')``, so loading
+parses no data. Worker processes on one host share the same page-cache
+pages. Rows are written with a CPU-only encoder: hashed unigram and bigram
+term frequencies, L2-normalised (``hashed_tf``). IDF is applied on the
+query side only, so a row depends on nothing but its own text. A rebuild
+therefore copies every row whose content hash is already in the old store
+and only encodes new or changed text.
+
+An int8 store is a quarter of the size. Each row is scaled to [-127, 127],
+and scores are multiplied back by the row scale.
+
+Search is a blocked matrix-vector product with ``argpartition`` per block.
+An int8 store is converted to float32 one small block at a time.
+``LocalRetriever.load`` uses the store for its vector ranking when its
+digest matches the index. ``ingest`` writes the same digest into
+``index.json``. Otherwise it builds ``VectorIndex`` as before. An ANN
+index built over the store (``common.ann``) replaces the full scan.
+
+Usage:
+    python -m common.embeddings [--index rag/index.json] [--dim 1024] [--int8] [--full]
+"""
+import argparse
+import copy
+import hashlib
+import json
+import logging
+import os
+import time
+
+from common.lazy import lazy_import
+from common.retrieval import LOCAL_INDEX_PATH, hashed_tf, passage_text, store_path_for, tokenize
+from common.settings import env_int
+
+np = lazy_import("numpy")
+
+STORE_VERSION = 1
+ENCODER = "hashed-tf"
+ANN_NPROBE = env_int("CW_ANN_NPROBE", 8)
+BLOCK_ROWS = 65536
+# int8 blocks are converted to float32 before the product; small blocks stay in cache
+INT8_BLOCK_ROWS = 8192
+
+
+def content_hash(text):
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def content_digest(hashes):
+    """Digest of row content hashes in order: any changed, added, removed or moved row changes it."""
+    if hasattr(hashes, 'tobytes'):
+        data = np.asarray(hashes, dtype='<u8').tobytes()
+    else:
+        data = b"".join(h.to_bytes(8, 'little') for h in hashes)
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def texts_digest(texts):
+    """``content_digest`` of the rows a store built from ``texts`` would have."""
+    return content_digest([content_hash(text) for text in texts])
+
+
+def encode(texts, dim=1024):
+    """Float32 matrix with one ``hashed_tf`` row per text."""
+    matrix = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        matrix[row] = hashed_tf(tokenize(text), dim)
+    return matrix
+
+
+def quantize(matrix):
+    """``(int8 rows, float32 scales)`` with ``rows * scales[:, None]`` close to ``matrix``."""
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    return np.rint(matrix / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+class EmbeddingStore:
+    def __init__(self, directory):
+        with open(os.path.join(directory, "meta.json"), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta.get('version') != STORE_VERSION or self.meta.get('encoder') != ENCODER:
+            raise ValueError(f"unsupported embedding store {self.meta.get('encoder')} v{self.meta.get('version')}")
+        self.directory = directory
+        self.dim = self.meta['dim']
+        self.vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode='r')
+        self.hashes = np.load(os.path.join(directory, "hashes.npy"), mmap_mode='r')
+        self.scales = np.load(os.path.join(directory, "scales.npy"), mmap_mode='r') \
+            if self.meta['dtype'] == 'int8' else None
+        self.idf = np.load(os.path.join(directory, "idf.npy"))
+        if self.vectors.shape != (self.meta['count'], self.dim) or len(self.hashes) != self.meta['count']:
+            raise ValueError(f"embedding store {directory} is incomplete")
+        # Stores written before the digest was recorded get it from their hashes
+        self.digest = self.meta.get('digest') or content_digest(self.hashes)
+        self.ann = None
+        self._rows = None
+        self._excluded = None
+
+    def __len__(self):
+        return self.meta['count']
+
+    def matches(self, texts, digest=None):
+        """Whether the rows were built from ``texts``, in order.
+
+        ``digest`` is the index's recorded ``texts_digest(texts)``; without it
+        every text is hashed.
+        """
+        if len(texts) != len(self):
+            return False
+        return self.digest == (digest or texts_digest(texts))
+
+    def restricted(self, rows):
+        """A view that searches only ``rows`` (sorted), numbered 0..len(rows)-1 like a filtered index."""
+        view = copy.copy(self)
+        view._rows = np.asarray(rows, dtype=np.int64)
+        view._excluded = np.ones(len(self), dtype=bool)
+        view._excluded[view._rows] = False
+        return view
+
+    def embed(self, tokens):
+        vector = hashed_tf(tokens, self.dim) * self.idf
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def top_k(self, query, k, block=None):
+        """``(rows, scores)`` of the ``k`` best rows for a query vector, best first."""
+        block = block or (BLOCK_ROWS if self.scales is None else INT8_BLOCK_ROWS)
+        query = query.astype(np.float32, copy=False)
+        rows, scores = [], []
+        for start in range(0, len(self), block):
+            part = self.vectors[start:start + block]
+            if self.scales is None:
+                block_scores = part @ query
+            else:
+                block_scores = (part.astype(np.float32) @ query) * self.scales[start:start + block]
+            if self._excluded is not None:
+                block_scores[self._excluded[start:start + block]] = -np.inf
+            if len(block_scores) > k:
+                top = np.argpartition(-block_scores, k - 1)[:k]
+            else:
+                top = np.arange(len(block_scores))
+            rows.append(top + start)
+            scores.append(block_scores[top])
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        rows, scores = np.concatenate(rows), np.concatenate(scores)
+        order = np.argsort(-scores, kind='stable')[:k]
+        return rows[order], scores[order]
+
+    def search(self, tokens, k, nprobe=None):
+        """Same result shape as ``VectorIndex.search``.
+
+        With an ANN index attached (see ``common.ann``), ``nprobe`` lists
+        are searched (``CW_ANN_NPROBE`` by default); ``nprobe=0`` searches
+        every row exactly.
+        """
+        query = self.embed(tokens)
+        if self.ann is not None and nprobe != 0:
+            rows, scores = self.ann.search(self, query, k, nprobe=nprobe or ANN_NPROBE, excluded=self._excluded)
+        else:
+            rows, scores = self.top_k(query, k)
+        if self._rows is not None:
+            rows = np.searchsorted(self._rows, rows)
+        return [(int(row), float(score)) for row, score in zip(rows, scores) if score > 0]
+
+
+def _open_previous(directory, dim, dtype):
+    try:
+        store = EmbeddingStore(directory)
+    except (OSError, ValueError, KeyError):
+        return None
+    return store if store.dim == dim and store.meta['dtype'] == dtype else None
+
+
+def _replace(directory, name, array):
+    tmp = os.path.join(directory, f"{name}.tmp.npy")
+    np.save(tmp, array)
+    os.replace(tmp, os.path.join(directory, name))
+
+
+def build_store(directory, texts, dim=1024, dtype='float32', full=False, batch_size=1024, encoder=encode):
+    """Write the store for ``texts``, reusing rows of the existing one by content hash; returns a summary.
+
+    ``encoder(texts, dim)`` returns a float32 matrix of L2-normalised rows.
+    Files are replaced one by one with ``meta.json`` last. Processes that
+    already mapped the old files keep reading them until they reload.
+    """
+    started = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+    hashes = np.fromiter((content_hash(text) for text in texts), dtype=np.uint64, count=len(texts))
+    previous = None if full else _open_previous(directory, dim, dtype)
+    known = dict(zip(previous.hashes.tolist(), range(len(previous)))) if previous is not None else {}
+
+    tmp = os.path.join(directory, "vectors.tmp.npy")
+    vectors = np.lib.format.open_memmap(tmp, mode='w+', dtype=dtype, shape=(len(texts), dim))
+    scales = np.ones(len(texts), dtype=np.float32)
+    old_rows = np.fromiter((known.get(h, -1) for h in hashes.tolist()), dtype=np.int64, count=len(texts))
+    missing = np.flatnonzero(old_rows < 0).tolist()
+    kept = np.flatnonzero(old_rows >= 0)
+    for start in range(0, len(kept), BLOCK_ROWS):
+        rows = kept[start:start + BLOCK_ROWS]
+        vectors[rows] = previous.vectors[old_rows[rows]]
+        if previous.scales is not None:
+            scales[rows] = previous.scales[old_rows[rows]]
+    for start in range(0, len(missing), batch_size):
+        batch = missing[start:start + batch_size]
+        encoded = encoder([texts[row] for row in batch], dim)
+        if dtype == 'int8':
+            vectors[batch], scales[batch] = quantize(encoded)
+        else:
+            vectors[batch] = encoded
+
+    df = np.zeros(dim, dtype=np.int64)
+    for start in range(0, len(texts), BLOCK_ROWS):
+        df += np.count_nonzero(vectors[start:start + BLOCK_ROWS], axis=0)
+    idf = (np.log((1 + len(texts)) / (1 + df)) + 1.0).astype(np.float32)
+    vectors.flush()
+    del vectors
+
+    os.replace(tmp, os.path.join(directory, "vectors.npy"))
+    _replace(directory, "hashes.npy", hashes)
+    _replace(directory, "idf.npy", idf)
+    if dtype == 'int8':
+        _replace(directory, "scales.npy", scales)
+    meta = {'version': STORE_VERSION, 'encoder': ENCODER, 'dim': dim, 'dtype': dtype, 'count': len(texts),
+            'digest': content_digest(hashes)}
+    with open(os.path.join(directory, "meta.json.tmp"), 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(os.path.join(directory, "meta.json.tmp"), os.path.join(directory, "meta.json"))
+
+    summary = {'rows': len(texts), 'encoded': len(missing), 'reused': len(kept), 'dtype': dtype, 'dim': dim,
+               'seconds': round(time.perf_counter() - started, 2)}
+    logging.info(f"[embeddings] {summary}")
+    return summary
+
+
+def open_store(index_path, texts, digest=None):
+    """The store next to ``index_path`` if it was built from ``texts``, else None.
+
+    ``digest`` is the ``texts_digest`` recorded in the index, if any.
+    """
+    directory = store_path_for(index_path)
+    if not os.path.exists(os.path.join(directory, "meta.json")):
+        return None
+    try:
+        store = EmbeddingStore(directory)
+    except (OSError, ValueError, KeyError) as e:
+        logging.warning(f"Embedding store {directory} unusable: {e}")
+        return None
+    if not store.matches(texts, digest):
+        logging.warning(f"Embedding store {directory} does not match {index_path}; rebuild it")
+        return None
+    from common.ann import open_ann
+
+    store.ann = open_ann(index_path, store)
+    return store
+
+
+def update_store(index_path, passages, full=False):
+    """Rebuild the store next to ``index_path`` for ``passages``, keeping its dim and dtype."""
+    directory = store_path_for(index_path)
+    try:
+        with open(os.path.join(directory, "meta.json"), encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        meta = {}
+    return build_store(directory, [passage_text(p) for p in passages], dim=meta.get('dim', 1024),
+                       dtype=meta.get('dtype', 'float32'), full=full)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the memory-mapped embedding store for the local index.")
+    parser.add_argument("--index", default=LOCAL_INDEX_PATH)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--int8", action="store_true", help="store int8 rows with per-row scales")
+    parser.add_argument("--full", action="store_true", help="encode every passage, ignoring the existing store")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    with open(args.index, encoding='utf-8') as f:
+        passages = json.load(f)['passages']
+    summary = build_store(store_path_for(args.index), [passage_text(p) for p in passages], dim=args.dim,
+                          dtype='int8' if args.int8 else 'float32', full=args.full)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
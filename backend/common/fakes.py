@@ -0,0 +1,135 @@
+"""
+In-process stand-in for ``genai.Client`` used by tests and benchmarks.
+
+Only the surface the functions use is implemented:
+``client.models.generate_content``, ``client.models.generate_content_stream``
+and ``client.models.get``. Responses are plain namespaces with the same
+attribute layout as the SDK objects (candidates -> content -> parts,
+grounding_metadata, usage_metadata), so the handlers cannot tell the
+difference.
+"""
+import threading
+import time
+from types import SimpleNamespace
+
+
+def make_part(text, thought=None):
+    return SimpleNamespace(text=text, thought=thought)
+
+
+def make_chunk(parts=(), grounding_chunks=None, usage=None):
+    """One streamed response chunk (or a whole non-streamed response)."""
+    grounding_metadata = None
+    if grounding_chunks:
+        grounding_metadata = SimpleNamespace(grounding_chunks=[
+            SimpleNamespace(retrieved_context=SimpleNamespace(
+                title=g.get('title'),
+                uri=g.get('uri'),
+                text=g.get('text'),
+                rag_chunk=SimpleNamespace(page_span=SimpleNamespace(
+                    first_page=g['page_span']['first_page'],
+                    last_page=g['page_span']['last_page'],
+                )) if g.get('page_span') else None,
+            ))
+            for g in grounding_chunks
+        ])
+    candidate = SimpleNamespace(
+        content=SimpleNamespace(parts=list(parts)) if parts else None,
+        grounding_metadata=grounding_metadata,
+    )
+    return SimpleNamespace(candidates=[candidate], usage_metadata=usage)
+
+
+def make_usage(prompt_tokens, output_tokens, thoughts_tokens=0):
+    return SimpleNamespace(
+        prompt_token_count=prompt_tokens,
+        candidates_token_count=output_tokens,
+        thoughts_token_count=thoughts_tokens,
+        total_token_count=prompt_tokens + output_tokens + thoughts_tokens,
+    )
+
+
+def default_stream():
+    """A short thinking-mode analysis stream with grounding on the last chunk."""
+    return [
+        make_chunk([make_part("**Reviewing the transcript**\n\n", thought=True)]),
+        make_chunk([make_part("**Matching criteria**\n\n", thought=True)]),
+        make_chunk([make_part('{"overallSummary": "Good start [1].", ')]),
+        make_chunk([make_part('"strengths": ["Introduced self"]}')],
+                   grounding_chunks=[{
+                       'title': 'Initial Contact Guide',
+                       'uri': 'gs://curriculum/Initial_Contact_Guide.pdf',
+                       'text': 'Introduce yourself and show identification.',
+                       'page_span': {'first_page': 3, 'last_page': 4},
+                   }],
+                   usage=make_usage(1200, 40, 300)),
+    ]
+
+
+class _FakeModels:
+    def __init__(self, client):
+        self._client = client
+
+    def generate_content(self, model, contents, config=None):
+        self._client._begin('generate_content', model, contents, config)
+        chunks = self._client.stream_factory(model)
+        parts = [part for chunk in chunks for c in chunk.candidates
+                 if c.content for part in c.content.parts]
+        grounding = [c.grounding_metadata for chunk in chunks for c in chunk.candidates
+                     if c.grounding_metadata]
+        usage = next((chunk.usage_metadata for chunk in reversed(chunks) if chunk.usage_metadata), None)
+        candidate = SimpleNamespace(
+            content=SimpleNamespace(parts=parts),
+            grounding_metadata=grounding[-1] if grounding else None,
+        )
+        return SimpleNamespace(candidates=[candidate], usage_metadata=usage)
+
+    def generate_content_stream(self, model, contents, config=None):
+        self._client._begin('generate_content_stream', model, contents, config)
+        for index, chunk in enumerate(self._client.stream_factory(model)):
+            if index and self._client.chunk_delay:
+                time.sleep(self._client.chunk_delay)
+            yield chunk
+
+    def get(self, model):
+        self._client._record('get', model, None, None)
+        return SimpleNamespace(name=model)
+
+
+class FakeClient:
+    """Fake GenAI client.
+
+    latency:       seconds before the first byte, or ``callable(model) -> seconds``.
+    chunk_delay:   seconds between streamed chunks.
+    error:         ``callable(model, call_number) -> Exception | None``; a returned
+                   exception is raised instead of answering.
+    stream_factory: ``callable(model) -> list of chunks`` (defaults to ``default_stream``).
+    """
+
+    def __init__(self, latency=0.0, chunk_delay=0.0, error=None, stream_factory=None):
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.error = error
+        self.stream_factory = stream_factory or (lambda model: default_stream())
+        self.calls = []
+        self._lock = threading.Lock()
+        self.models = _FakeModels(self)
+
+    def _record(self, method, model, contents, config):
+        with self._lock:
+            self.calls.append(SimpleNamespace(method=method, model=model, contents=contents, config=config))
+            return len(self.calls)
+
+    def _begin(self, method, model, contents, config):
+        call_number = self._record(method, model, contents, config)
+        delay = self.latency(model) if callable(self.latency) else self.latency
+        if delay:
+            time.sleep(delay)
+        if self.error:
+            exc = self.error(model, call_number)
+            if exc is not None:
+                raise exc
+
+    def count(self, method=None):
+        with self._lock:
+            return sum(1 for call in self.calls if method is None or call.method == method)
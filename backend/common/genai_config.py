@@ -0,0 +1,37 @@
+"""
+Generation config pieces shared by every function.
+"""
+from common.lazy import Lazy
+
+# Model every action uses unless the router picks otherwise, and the
+# lighter model it (and the fallback chain) can move to
+DEFAULT_MODEL = "gemini-2.5-flash"
+LIGHT_MODEL = "gemini-2.5-flash-lite"
+
+
+def _build_safety_settings():
+    from google.genai import types
+
+    # Same thresholds every function has always used
+    return [
+        types.SafetySetting(
+            category="HARM_CATEGORY_HARASSMENT",
+            threshold="BLOCK_ONLY_HIGH"
+        ),
+        types.SafetySetting(
+            category="HARM_CATEGORY_HATE_SPEECH",
+            threshold="BLOCK_ONLY_HIGH"
+        ),
+        types.SafetySetting(
+            category="HARM_CATEGORY_SEXUALLY_EXPLICIT",
+            threshold="BLOCK_MEDIUM_AND_ABOVE"
+        ),
+        types.SafetySetting(
+            category="HARM_CATEGORY_DANGEROUS_CONTENT",
+            threshold="BLOCK_ONLY_HIGH"
+        )
+    ]
+
+
+# Built once and reused by every GenerateContentConfig
+SAFETY_SETTINGS = Lazy(_build_safety_settings)
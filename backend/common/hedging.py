@@ -0,0 +1,148 @@
+"""
+Hedged requests for latency-sensitive, idempotent model calls.
+
+If the first attempt has not answered after a delay derived from recent
+latencies (the ``percentile``-th, p95 by default), a second identical
+attempt is started and whichever finishes first wins. A token bucket caps
+hedges at ``budget`` extra requests per request (5% by default), so a
+slow backend cannot double our traffic.
+
+The sync SDK cannot abort an HTTP request already in flight, so "cancelling"
+the loser means cancelling it if it has not started yet and otherwise
+discarding its result; it still finishes on its worker thread. Its final
+latency is recorded, which is also how the latency saved by a winning
+hedge is measured.
+
+Metrics (label ``policy``): hedging.requests, hedging.hedged,
+hedging.hedge_wins, hedging.budget_denied, hedging.latency_ms (what the
+caller saw), hedging.attempt_ms (every attempt) and hedging.saved_ms.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from common import metrics
+from common.metrics import percentile
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix="hedge")
+        return _executor
+
+
+class HedgePolicy:
+    def __init__(self, name, enabled=True, percentile=95.0, default_delay=2.0,
+                 min_delay=0.1, max_delay=10.0, min_samples=20, budget=0.05,
+                 burst=5.0, window=500):
+        self.name = name
+        self.enabled = enabled
+        self.percentile = percentile
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self.budget = budget
+        self.burst = burst
+        self._samples = deque(maxlen=window)
+        self._tokens = burst
+        self._lock = threading.Lock()
+
+    def hedge_delay(self):
+        """Seconds to wait for the first attempt before hedging."""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return self.default_delay
+            ordered = sorted(self._samples)
+        delay = percentile(ordered, self.percentile)
+        return min(self.max_delay, max(self.min_delay, delay))
+
+    def _earn(self):
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.budget)
+
+    def _spend(self):
+        with self._lock:
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return True
+            return False
+
+    def _record_attempt(self, started):
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self._samples.append(elapsed)
+        metrics.observe('hedging.attempt_ms', elapsed * 1000, policy=self.name)
+        return elapsed
+
+    def _attempt(self, fn):
+        started = time.monotonic()
+        try:
+            return fn()
+        finally:
+            self._record_attempt(started)
+
+    def call(self, fn):
+        """Return ``fn()``, hedging it with a second call if the first is slow."""
+        if not self.enabled:
+            return fn()
+
+        started = time.monotonic()
+        metrics.inc('hedging.requests', policy=self.name)
+        self._earn()
+        executor = _get_executor()
+        primary = executor.submit(self._attempt, fn)
+
+        try:
+            result = primary.result(timeout=self.hedge_delay())
+            self._observe(started)
+            return result
+        except FutureTimeout:
+            pass
+
+        if not self._spend():
+            metrics.inc('hedging.budget_denied', policy=self.name)
+            result = primary.result()
+            self._observe(started)
+            return result
+
+        metrics.inc('hedging.hedged', policy=self.name)
+        hedge = executor.submit(self._attempt, fn)
+        pending = {primary, hedge}
+        first_error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    first_error = first_error or future.exception()
+                    continue
+                winner_latency = self._observe(started)
+                for loser in pending:
+                    loser.cancel()
+                if future is hedge:
+                    metrics.inc('hedging.hedge_wins', policy=self.name)
+                    logging.info(f"[{self.name}] hedge won after {winner_latency * 1000:.0f} ms")
+                    # The abandoned primary still finishes; its latency is
+                    # what the caller would have waited without the hedge
+                    primary.add_done_callback(
+                        lambda _f: self._record_saved(started, winner_latency))
+                return future.result()
+        self._observe(started)
+        raise first_error
+
+    def _observe(self, started):
+        latency = time.monotonic() - started
+        metrics.observe('hedging.latency_ms', latency * 1000, policy=self.name)
+        return latency
+
+    def _record_saved(self, started, winner_latency):
+        loser_latency = time.monotonic() - started
+        metrics.observe('hedging.saved_ms', (loser_latency - winner_latency) * 1000, policy=self.name)
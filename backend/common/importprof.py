@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Import-time profiler for the Cloud Function entry points.
+
+Runs ``python -X importtime`` on a function's ``main.py`` in a clean
+subprocess and reports the cumulative import cost per module and the self
+cost per top-level package, so cold-start regressions can be traced to the
+dependency that caused them.
+
+Usage:
+    python -m common.importprof analysis-function/main.py [--top 25]
+    CW_LAZY_INIT=1 python -m common.importprof main.py
+"""
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_LOADER = r'''
+import importlib.util, sys
+sys.path.insert(0, {backend!r})
+spec = importlib.util.spec_from_file_location("profiled_main", {path!r})
+module = importlib.util.module_from_spec(spec)
+sys.modules["profiled_main"] = module
+spec.loader.exec_module(module)
+'''
+
+
+def run_importtime(path, env=None):
+    """Import ``path`` in a fresh interpreter and return ``-X importtime`` rows.
+
+    Each row is ``(module, self_us, cumulative_us, depth)``.
+    """
+    code = _LOADER.format(backend=BACKEND_DIR, path=os.path.abspath(path))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, env=env or dict(os.environ),
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {path} failed:\n{proc.stderr[-2000:]}")
+    return parse_importtime(proc.stderr)
+
+
+def parse_importtime(stderr):
+    """Parse the ``import time:`` lines that ``-X importtime`` writes to stderr."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        except ValueError:
+            continue
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def summarize(rows, top=25):
+    """Build the text report for a list of importtime rows."""
+    total_us = sum(r[1] for r in rows)
+    by_package = defaultdict(int)
+    for name, self_us, _, _ in rows:
+        by_package[name.split(".")[0]] += self_us
+
+    lines = [f"Total import time: {total_us / 1000:.1f} ms across {len(rows)} modules", ""]
+    lines.append(f"Top {top} modules by cumulative import time:")
+    lines.append(f"{'cumulative ms':>14}{'self ms':>10}  module")
+    for name, self_us, cum_us, _ in sorted(rows, key=lambda r: r[2], reverse=True)[:top]:
+        lines.append(f"{cum_us / 1000:>14.1f}{self_us / 1000:>10.1f}  {name}")
+
+    lines.append("")
+    lines.append(f"Top {top} top-level packages by self import time:")
+    lines.append(f"{'self ms':>14}{'share':>10}  package")
+    for pkg, self_us in sorted(by_package.items(), key=lambda kv: kv[1], reverse=True)[:top]:
+        share = 100.0 * self_us / total_us if total_us else 0.0
+        lines.append(f"{self_us / 1000:>14.1f}{share:>9.1f}%  {pkg}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-module import cost of a function entry point.")
+    parser.add_argument("path", help="main.py to profile (relative to backend/ or absolute)")
+    parser.add_argument("--top", type=int, default=25)
+    args = parser.parse_args()
+
+    path = args.path if os.path.isabs(args.path) else os.path.join(BACKEND_DIR, args.path)
+    print(summarize(run_importtime(path), top=args.top))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+Incremental, parallel ingestion of the curriculum materials into the local index.
+
+Each file is processed on its own: its pages are extracted and split into
+overlapping chunks. Files are spread over a process pool, because PDF and
+XML parsing is CPU-bound. The output is the ``LocalRetriever`` index plus a
+manifest with one entry per file: its path, size, mtime, SHA-256 and
+passage count.
+
+On a re-run, a file whose size and mtime match the manifest is reused
+without being read. A file whose stat changed is hashed; if its content hash
+still matches, its passages are also reused, taken from the previous index.
+Only new or changed files are extracted again. Removed files drop out of the
+index. Changing ``max_chars``, ``overlap`` or the URI prefix reprocesses
+everything, and so does ``--full`` (e.g. after installing pypdf, since PDFs
+skipped without it are recorded with no passages). Both files are replaced
+atomically, index first, so a run interrupted in between is corrected by the
+next one.
+
+Usage:
+    python -m common.ingest rag/materials [--out rag/index.json] [--workers 8] [--full]
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from common.documents import (DEFAULT_URI_PREFIX, check_chunking, chunk_pages, extract_pages, iter_documents,
+                              title_for, uri_for)
+from common.retrieval import LOCAL_INDEX_PATH, ann_path_for, make_passage, passage_text
+
+MANIFEST_VERSION = 1
+
+
+def manifest_path_for(index_path):
+    return os.path.join(os.path.dirname(os.path.abspath(index_path)), "manifest.json")
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def process_file(path, root, uri_prefix, max_chars, overlap, known_hash=None):
+    """Hash, extract and chunk one file. Runs in a worker process.
+
+    Returns ``(sha256, passages)``; passages is None when the hash equals
+    ``known_hash`` and the previous passages can be kept.
+    """
+    sha256 = file_hash(path)
+    if sha256 == known_hash:
+        return sha256, None
+    title, uri = title_for(path), uri_for(path, root, uri_prefix)
+    passages = [make_passage(title, uri, text, first, last)
+                for first, last, text in chunk_pages(extract_pages(path), max_chars=max_chars, overlap=overlap)]
+    return sha256, passages
+
+
+def _load_previous(index_path, manifest_path, settings):
+    """``(files, passages_by_uri)`` from the last run, or empty if unusable."""
+    try:
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        with open(index_path, encoding='utf-8') as f:
+            passages = json.load(f)['passages']
+    except (OSError, ValueError, KeyError):
+        return {}, {}
+    if manifest.get('version') != MANIFEST_VERSION or manifest.get('settings') != settings:
+        logging.info("[ingest] chunking settings changed; reprocessing every file")
+        return {}, {}
+    by_uri = {}
+    for p in passages:
+        by_uri.setdefault(p['uri'], []).append(p)
+    return manifest.get('files', {}), by_uri
+
+
+def _write_json(path, value):
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(value, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def ingest(root, out=LOCAL_INDEX_PATH, manifest_path=None, workers=None, max_chars=1500, overlap=200,
+           uri_prefix=DEFAULT_URI_PREFIX, full=False, dedup=False, embeddings=False, criteria=False):
+    """Bring the index at ``out`` up to date with ``root``; returns a summary dict.
+
+    With ``dedup``, the near-duplicate exclusion list is rewritten afterwards
+    (see ``common.dedup``). With ``embeddings``, so is the embedding store;
+    only new or changed passages are encoded (see ``common.embeddings``).
+    An existing ANN index gets those passages inserted (see ``common.ann``).
+    The criteria map is rebuilt last, with ``criteria`` or whenever one
+    exists for this index already (see ``common.criteria``).
+    """
+    check_chunking(max_chars, overlap)
+    manifest_path = manifest_path or manifest_path_for(out)
+    settings = {'max_chars': max_chars, 'overlap': overlap, 'uri_prefix': uri_prefix}
+    previous, previous_passages = ({}, {}) if full else _load_previous(out, manifest_path, settings)
+    workers = workers or os.cpu_count() or 1
+
+    started = time.perf_counter()
+    paths = {os.path.relpath(path, root).replace(os.sep, '/'): path for path in iter_documents(root)}
+    files, results, pending = {}, {}, []
+    summary = {'files': len(paths), 'processed': 0, 'reused': 0, 'failed': 0,
+               'removed': len(set(previous) - set(paths))}
+
+    for relative, path in paths.items():
+        stat = os.stat(path)
+        entry = previous.get(relative)
+        uri = uri_for(path, root, uri_prefix)
+        # An entry is only usable if its passages survived in the index
+        if entry and (entry['passages'] == 0 or uri in previous_passages):
+            if entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+                files[relative] = entry
+                results[relative] = previous_passages.get(uri, [])
+                summary['reused'] += 1
+                continue
+            pending.append((relative, path, stat, entry['sha256']))
+        else:
+            pending.append((relative, path, stat, None))
+
+    def record(relative, path, stat, known, outcome):
+        sha256, passages = outcome
+        if passages is None:
+            passages = previous_passages.get(uri_for(path, root, uri_prefix), [])
+            summary['reused'] += 1
+        else:
+            summary['processed'] += 1
+        files[relative] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha256,
+                           'passages': len(passages)}
+        results[relative] = passages
+
+    def failed(relative, error):
+        logging.error(f"[ingest] {relative} failed: {error}")
+        summary['failed'] += 1
+
+    if workers == 1 or len(pending) <= 1:
+        for relative, path, stat, known in pending:
+            try:
+                record(relative, path, stat, known,
+                       process_file(path, root, uri_prefix, max_chars, overlap, known))
+            except Exception as e:
+                failed(relative, e)
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(pending))) as pool:
+            futures = [(item, pool.submit(process_file, item[1], root, uri_prefix, max_chars, overlap, item[3]))
+                       for item in pending]
+            for (relative, path, stat, known), future in futures:
+                try:
+                    record(relative, path, stat, known, future.result())
+                except Exception as e:
+                    failed(relative, e)
+
+    # Same order as the materials tree, whatever order the workers finished in
+    passages = [p for relative in sorted(results) for p in results[relative]]
+    extracted = time.perf_counter()
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    from common.embeddings import texts_digest
+
+    # The embedding store is only used when its digest matches this one
+    _write_json(out, {'version': 1, 'digest': texts_digest([passage_text(p) for p in passages]),
+                      'passages': passages})
+    _write_json(manifest_path, {'version': MANIFEST_VERSION, 'settings': settings, 'files': files})
+
+    if dedup:
+        from common.dedup import write_exclusions
+
+        exclusions = write_exclusions(out)
+        summary['excluded_documents'] = len(exclusions['excluded_uris'])
+        summary['excluded_passages'] = len(exclusions['excluded_passages'])
+
+    if embeddings:
+        from common.embeddings import update_store
+
+        store = update_store(out, passages)
+        summary['embedded'] = store['encoded']
+        if os.path.exists(os.path.join(ann_path_for(out), "meta.json")):
+            from common.ann import update_ann
+
+            summary['ann_inserted'] = update_ann(out)['inserted']
+
+    from common.criteria import criteria_path_for, write_criteria_map
+
+    # A map left as it was would cite passages from the old index
+    if criteria or os.path.exists(criteria_path_for(out)):
+        summary['criteria_passages'] = len(write_criteria_map(out)['passages'])
+
+    elapsed = time.perf_counter() - started
+    summary.update({
+        'passages': len(passages),
+        'extract_seconds': round(extracted - started, 2),
+        'write_seconds': round(elapsed - (extracted - started), 2),
+        'seconds': round(elapsed, 2),
+        'files_per_s': round(len(paths) / elapsed, 1) if elapsed else 0.0,
+    })
+    logging.info(f"[ingest] {summary}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index the curriculum materials, reprocessing only changed files.")
+    parser.add_argument("root", help="materials directory")
+    parser.add_argument("--out", default=LOCAL_INDEX_PATH, help="index JSON to write")
+    parser.add_argument("--manifest", default=None, help="manifest JSON (default: manifest.json next to --out)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--max-chars", type=int, default=1500)
+    parser.add_argument("--overlap", type=int, default=200)
+    parser.add_argument("--uri-prefix", default=DEFAULT_URI_PREFIX)
+    parser.add_argument("--full", action="store_true", help="ignore the manifest and reprocess every file")
+    parser.add_argument("--dedup", action="store_true", help="rewrite the near-duplicate exclusion list")
+    parser.add_argument("--embeddings", action="store_true", help="update the memory-mapped embedding store")
+    parser.add_argument("--criteria", action="store_true",
+                        help="build the criteria map (an existing one is always rebuilt)")
+    args = parser.parse_args()
+    try:
+        check_chunking(args.max_chars, args.overlap)
+    except ValueError as e:
+        parser.error(str(e))
+
+    logging.basicConfig(level=logging.INFO)
+    summary = ingest(args.root, out=args.out, manifest_path=args.manifest, workers=args.workers,
+                     max_chars=args.max_chars, overlap=args.overlap, uri_prefix=args.uri_prefix, full=args.full,
+                     dedup=args.dedup, embeddings=args.embeddings, criteria=args.criteria)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Deferred imports and values for lazy-initialization mode.
+
+``google.genai`` accounts for roughly half of a function's import time. With
+``CW_LAZY_INIT=1`` the functions import it, build their configs and create
+their clients on first use instead of at import; without it everything is
+built at import exactly as before (each ``main.py`` calls its ``warmup()``).
+"""
+import importlib
+import threading
+
+from common.settings import LAZY_INIT
+
+
+class _LazyModule:
+    """Module proxy that imports the real module on first attribute access."""
+
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            module = importlib.import_module(self.__dict__["_name"])
+            self.__dict__["_module"] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__["_module"] is not None else "not loaded"
+        return f"<lazy module {self.__dict__['_name']!r} ({state})>"
+
+
+def lazy_import(name):
+    """Return ``name`` imported now, or a proxy that imports it on first use in lazy mode."""
+    if LAZY_INIT:
+        return _LazyModule(name)
+    return importlib.import_module(name)
+
+
+class Lazy:
+    """A value built by ``factory`` on the first ``get()`` and cached after that."""
+
+    _UNSET = object()
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._value = self._UNSET
+        self._lock = threading.Lock()
+
+    def get(self):
+        value = self._value
+        if value is self._UNSET:
+            with self._lock:
+                value = self._value
+                if value is self._UNSET:
+                    value = self._factory()
+                    self._value = value
+        return value
+
+    @property
+    def ready(self):
+        return self._value is not self._UNSET
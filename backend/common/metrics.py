@@ -0,0 +1,106 @@
+"""
+Process-local metrics registry.
+
+Counters, gauges and windowed histograms keyed by name plus optional
+labels. Everything is in memory and per instance; the ``metrics`` action on
+each function returns ``snapshot()`` so the numbers can be scraped or
+inspected while load testing.
+"""
+import math
+import threading
+from collections import deque
+
+HISTOGRAM_WINDOW = 2048
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_histograms = {}
+
+
+def _key(name, labels):
+    if not labels:
+        return name
+    return name + "{" + ",".join(f"{k}={labels[k]}" for k in sorted(labels)) + "}"
+
+
+class _Histogram:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.window = deque(maxlen=HISTOGRAM_WINDOW)
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.window.append(value)
+
+    def summary(self):
+        ordered = sorted(self.window)
+        return {
+            'count': self.count,
+            'mean': round(self.total / self.count, 3) if self.count else 0.0,
+            'p50': round(percentile(ordered, 50), 3),
+            'p95': round(percentile(ordered, 95), 3),
+            'p99': round(percentile(ordered, 99), 3),
+            'max': round(self.max, 3),
+        }
+
+
+def percentile(ordered, pct):
+    """Nearest-rank percentile of an already sorted sequence (0.0 if empty)."""
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def inc(name, value=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = value
+
+
+def observe(name, value, **labels):
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = _Histogram()
+        histogram.observe(value)
+
+
+def counter(name, **labels):
+    with _lock:
+        return _counters.get(_key(name, labels), 0)
+
+
+def gauge(name, **labels):
+    with _lock:
+        return _gauges.get(_key(name, labels))
+
+
+def snapshot():
+    """All metrics as a JSON-serialisable dict."""
+    with _lock:
+        return {
+            'counters': dict(sorted(_counters.items())),
+            'gauges': dict(sorted(_gauges.items())),
+            'histograms': {key: h.summary() for key, h in sorted(_histograms.items())},
+        }
+
+
+def reset():
+    """Drop every metric (tests and benchmarks)."""
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
@@ -0,0 +1,238 @@
+"""
+Precompiled persona packs for the simulation scenarios.
+
+A scenario's case files never change during a session. Without a pack, every
+simulation turn still attaches the RAG tool, so the model retrieves the
+same documents again. A persona pack is a compact digest of those
+documents. It is built once, offline, per ``scenario_id`` and has three
+sections:
+- key facts: sentences naming the family members, ages and relationships;
+- emotional state: sentences describing how the client feels and reacts;
+- timeline: dated events, in date order.
+
+Sentences are picked from the documents as written; nothing is generated.
+Each section is capped in characters, so a pack stays around 1k tokens.
+The build reads ``<root>/<scenario_id>/``, one folder of case files per
+scenario named after its id (``cooper``, ``baskin``, ...). It writes
+``<out>/<scenario_id>.json``. A scenario whose files have not changed is
+skipped.
+
+``simulation_ai`` loads packs from ``CW_PERSONA_DIR`` into memory on first
+use. A turn with a pack pins it in the system instruction and leaves the
+retrieval tool off. Scenarios without a pack keep per-turn retrieval.
+
+Usage:
+    python -m common.personas rag/scenarios [--out rag/personas]
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from collections import Counter
+from datetime import date
+
+from common.documents import extract_pages, iter_documents, title_for
+# Not common.retrieval: it imports numpy, which the simulation function does not ship
+from common.settings import BACKEND_DIR, env_str
+
+PACK_VERSION = 1
+PERSONA_DIR = env_str("CW_PERSONA_DIR", os.path.join(BACKEND_DIR, "rag", "personas"))
+
+# Characters per section
+BUDGETS = {'key_facts': 1600, 'emotional_state': 800, 'timeline': 1400}
+
+_SCENARIO_ID = re.compile(r"[a-z0-9][a-z0-9_-]{0,63}")
+_SENTENCE = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(])")
+_NAME = re.compile(r"\b[A-Z][a-z]{2,}\b")
+_AGE = re.compile(r"\(\d{1,2}\)|\b\d{1,2}[- ](?:years?|months?)[- ]old\b|\bage[d]? \d{1,2}\b", re.IGNORECASE)
+_RELATION = re.compile(r"\b(?:mother|father|mom|dad|parent|partner|boyfriend|girlfriend|husband|wife|daughter|son|"
+                       r"child|children|sibling|brother|sister|grandmother|grandfather|aunt|uncle|lives? with)\b",
+                       re.IGNORECASE)
+_EMOTION = re.compile(r"\b(?:angry|anger|upset|afraid|fear(?:ful|s)?|scared|anxious|anxiety|worried|overwhelmed|"
+                      r"distrust\w*|suspicious|defensive|hostile|tearful|cri(?:ed|es)|crying|ashamed|shame|guilt\w*|"
+                      r"embarrassed|frustrat\w+|depress\w+|hopeless|hopeful|calm|cooperative|guarded|withdrawn|"
+                      r"irritable|nervous|stress\w*|denie[sd]|minimiz\w+|protective|feels?|felt)\b", re.IGNORECASE)
+_MONTHS = {m: i for i, m in enumerate(
+    "jan feb mar apr may jun jul aug sep oct nov dec".split(), start=1)}
+_DATE = re.compile(
+    r"\b(?P<m1>\d{1,2})/(?P<d1>\d{1,2})/(?P<y1>\d{2,4})\b"
+    r"|\b(?P<y2>\d{4})-(?P<m2>\d{2})-(?P<d2>\d{2})\b"
+    r"|\b(?P<mon>(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*)\.? (?P<d3>\d{1,2}),? (?P<y3>\d{4})\b")
+
+
+def valid_scenario_id(scenario_id):
+    return bool(scenario_id) and bool(_SCENARIO_ID.fullmatch(scenario_id))
+
+
+def sentences(text):
+    for sentence in _SENTENCE.split(" ".join(text.split())):
+        if 20 <= len(sentence) <= 400:
+            yield sentence
+
+
+def parse_date(sentence):
+    """The first date in ``sentence`` as a ``date``, or None."""
+    for match in _DATE.finditer(sentence):
+        g = match.groupdict()
+        try:
+            if g['m1']:
+                year = int(g['y1'])
+                return date(year + 2000 if year < 100 else year, int(g['m1']), int(g['d1']))
+            if g['y2']:
+                return date(int(g['y2']), int(g['m2']), int(g['d2']))
+            return date(int(g['y3']), _MONTHS[g['mon'][:3].lower()], int(g['d3']))
+        except (ValueError, KeyError):
+            continue
+    return None
+
+
+def _within(items, budget, size=len):
+    kept, used = [], 0
+    for item in items:
+        if used + size(item) > budget:
+            continue
+        kept.append(item)
+        used += size(item)
+    return kept
+
+
+def compile_pack(scenario_id, documents, budgets=BUDGETS):
+    """A pack for ``documents``, a list of ``(title, text)``."""
+    ordered, seen = [], set()
+    for _, text in documents:
+        for sentence in sentences(text):
+            if sentence.lower() not in seen:
+                seen.add(sentence.lower())
+                ordered.append(sentence)
+
+    # Names that recur across the case files are the family members
+    names = Counter(name for s in ordered for name in set(_NAME.findall(s)[1:]))
+    people = {name for name, count in names.items() if count >= 3}
+
+    def fact_score(sentence):
+        return (len(people & set(_NAME.findall(sentence))) + 2 * len(_AGE.findall(sentence))
+                + len(_RELATION.findall(sentence)))
+
+    by_score = sorted(range(len(ordered)), key=lambda i: -fact_score(ordered[i]))
+    facts = _within((i for i in by_score if fact_score(ordered[i]) >= 2), budgets['key_facts'],
+                    size=lambda i: len(ordered[i]))
+    emotions = _within((s for s in ordered if len(_EMOTION.findall(s)) >= 1), budgets['emotional_state'])
+    dated = sorted(((parse_date(s), i) for i, s in enumerate(ordered)), key=lambda item: (item[0] or date.max, item[1]))
+    timeline = _within(({'date': d.isoformat(), 'text': ordered[i]} for d, i in dated if d),
+                       budgets['timeline'], size=lambda event: len(event['text']))
+
+    return {
+        'version': PACK_VERSION,
+        'scenario_id': scenario_id,
+        'sources': [title for title, _ in documents],
+        'key_facts': [ordered[i] for i in sorted(facts)],
+        'emotional_state': emotions,
+        'timeline': timeline,
+    }
+
+
+def format_pack(pack):
+    """The pack as a system-instruction block."""
+    lines = [f"## Case File Summary (scenario: {pack['scenario_id']})",
+             "These are the retrieved documents for your scenario, condensed. They are your memory of the case.",
+             "", "Key facts:"]
+    lines += [f"- {fact}" for fact in pack['key_facts']]
+    lines += ["", "Emotional state:"]
+    lines += [f"- {line}" for line in pack['emotional_state']]
+    lines += ["", "Timeline:"]
+    lines += [f"- {event['date']}: {event['text']}" for event in pack['timeline']]
+    return "\n".join(lines)
+
+
+def _source_hash(paths):
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        digest.update(os.path.basename(path).encode('utf-8'))
+        with open(path, 'rb') as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def build_packs(root, out=PERSONA_DIR, full=False):
+    """Compile a pack per scenario folder under ``root``; returns a summary dict."""
+    os.makedirs(out, exist_ok=True)
+    summary = {'scenarios': 0, 'built': 0, 'unchanged': 0, 'skipped': []}
+    for scenario_id in sorted(os.listdir(root)):
+        folder = os.path.join(root, scenario_id)
+        if not os.path.isdir(folder):
+            continue
+        if not valid_scenario_id(scenario_id):
+            logging.warning(f"[personas] skipping {folder}: folder names must be scenario ids")
+            summary['skipped'].append(scenario_id)
+            continue
+        summary['scenarios'] += 1
+        paths = list(iter_documents(folder))
+        source_hash = _source_hash(paths)
+        path = os.path.join(out, f"{scenario_id}.json")
+        if not full and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                if json.load(f).get('source_hash') == source_hash:
+                    summary['unchanged'] += 1
+                    continue
+        documents = [(title_for(p), "\n".join(text for _, text in extract_pages(p))) for p in paths]
+        pack = dict(compile_pack(scenario_id, documents), source_hash=source_hash)
+        with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(pack, f, ensure_ascii=False, indent=1)
+        os.replace(f"{path}.tmp", path)
+        summary['built'] += 1
+        logging.info(f"[personas] {scenario_id}: {len(paths)} documents -> {len(format_pack(pack))} chars")
+    return summary
+
+
+class PersonaPacks:
+    """Packs loaded from ``directory`` on first use and kept in memory."""
+
+    def __init__(self, directory=PERSONA_DIR):
+        self.directory = directory
+        self._packs = {}
+        self._lock = threading.Lock()
+
+    def get(self, scenario_id):
+        """The pack for ``scenario_id``, or None if it has none."""
+        if not valid_scenario_id(scenario_id):
+            return None
+        with self._lock:
+            if scenario_id not in self._packs:
+                self._packs[scenario_id] = self._load(scenario_id)
+            return self._packs[scenario_id]
+
+    def _load(self, scenario_id):
+        path = os.path.join(self.directory, f"{scenario_id}.json")
+        try:
+            with open(path, encoding='utf-8') as f:
+                pack = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.error(f"Persona pack {path} unreadable: {e}")
+            return None
+        if pack.get('version') != PACK_VERSION:
+            logging.warning(f"Persona pack {path} has version {pack.get('version')}; ignoring it")
+            return None
+        return pack
+
+
+PERSONA_PACKS = PersonaPacks()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile persona packs from the scenario case files.")
+    parser.add_argument("root", help="directory with one folder of case files per scenario id")
+    parser.add_argument("--out", default=PERSONA_DIR)
+    parser.add_argument("--full", action="store_true", help="rebuild packs whose sources did not change")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(build_packs(args.root, args.out, full=args.full), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Background prefetch handed out as session tokens.
+
+A ``start`` request begins the work a session's first turn would otherwise
+do inline, such as warmup and persona loading, and returns a token at once.
+The first turn passes the token back and waits for that work. If the work
+is still running, the turn waits at most ``timeout`` seconds for it; if it
+is done, the turn does not wait at all. That claims the token: later turns
+sending it again neither wait nor count in the metrics. Unknown or expired
+tokens are not an error: the turn does the work inline, as it would without
+``start``.
+
+Tokens live for ``CW_PREFETCH_TTL_S`` seconds. ``start`` needs no
+credentials, so at most ``CW_PREFETCH_MAX_SESSIONS`` tokens are kept: a new
+one evicts the oldest. Work for an expired or evicted token that has not
+started yet is cancelled. Outcomes are counted under ``prefetch.*`` in the
+metrics.
+"""
+import logging
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from common import metrics
+from common.settings import env_float, env_int
+
+PREFETCH_TTL_S = env_float("CW_PREFETCH_TTL_S", 900.0)
+PREFETCH_WORKERS = env_int("CW_PREFETCH_WORKERS", 2)
+PREFETCH_MAX_SESSIONS = env_int("CW_PREFETCH_MAX_SESSIONS", 256)
+
+
+class Prefetcher:
+    def __init__(self, name, ttl=PREFETCH_TTL_S, workers=PREFETCH_WORKERS, max_sessions=PREFETCH_MAX_SESSIONS,
+                 clock=time.monotonic):
+        self.name = name
+        self.ttl = ttl
+        self.workers = workers
+        self.max_sessions = max_sessions
+        self._clock = clock
+        self._sessions = OrderedDict()  # token -> (expires_at, future), oldest first
+        self._claimed = OrderedDict()  # tokens already waited for, oldest first
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def start(self, fn, *args):
+        """Run ``fn(*args)`` in the background; returns its session token."""
+        token = secrets.token_urlsafe(16)
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"prefetch-{self.name}")
+            now = self._clock()
+            for expired in [t for t, (expires_at, _) in self._sessions.items() if expires_at <= now]:
+                self._drop(expired, 'expired')
+            while self._sessions and len(self._sessions) >= self.max_sessions:
+                self._drop(next(iter(self._sessions)), 'evicted')
+            self._sessions[token] = (now + self.ttl, self._pool.submit(fn, *args))
+        metrics.inc('prefetch.started', prefetcher=self.name)
+        return token
+
+    def _drop(self, token, reason):
+        _, future = self._sessions.pop(token)
+        if future.cancel():
+            metrics.inc('prefetch.cancelled', prefetcher=self.name, reason=reason)
+        if reason == 'evicted':
+            metrics.inc('prefetch.evicted', prefetcher=self.name)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def wait(self, token, timeout):
+        """Wait for the token's work; returns ``(status, result)``.
+
+        ``status`` is ``ready`` (done before the call), ``waited``,
+        ``timeout``, ``error`` or ``missing``; ``result`` is None unless the
+        work finished. The first call claims the token: later calls with it
+        get ``missing`` and are not counted, so only first turns are measured.
+        """
+        with self._lock:
+            session = self._sessions.pop(token, None) if token else None
+            claimed = token in self._claimed
+            if session is not None:
+                self._claimed[token] = None
+                while len(self._claimed) > self.max_sessions:
+                    self._claimed.popitem(last=False)
+        if claimed:
+            return 'missing', None
+        if session is None or session[0] <= self._clock():
+            status, result = 'missing', None
+        else:
+            future = session[1]
+            status = 'ready' if future.done() else 'waited'
+            try:
+                result = future.result(timeout=timeout)
+            except FutureTimeout:
+                status, result = 'timeout', None
+            except Exception as e:
+                logging.warning(f"Prefetch for {self.name} failed: {e}")
+                status, result = 'error', None
+        metrics.inc('prefetch.turns', prefetcher=self.name, status=status)
+        return status, result
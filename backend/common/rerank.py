@@ -0,0 +1,73 @@
+"""
+Local reranking with an adaptive number of passages.
+
+Retrieval with a fixed ``similarity_top_k`` sends the same number of
+passages whatever the question. A specific question may need two; a
+greeting needs none. Here a wide candidate set is rescored on the CPU, and
+only the passages that clearly answer the question are kept.
+
+Each candidate is scored from two signals:
+- lexical coverage: the IDF-weighted share of the query's terms the passage
+  contains;
+- cosine similarity of hashed term-frequency vectors (unigrams and
+  bigrams). Passage vectors are cached, so a turn only hashes its query.
+The score is their weighted mean, in [0, 1].
+
+The cut is adaptive. A passage is kept only if its score clears
+``threshold`` and is at least ``relative`` times the best score, up to
+``max_k`` passages. A question that matches nothing well gets no passages
+at all.
+"""
+import math
+from collections import Counter
+from functools import lru_cache
+
+from common.lazy import lazy_import
+from common.retrieval import hashed_tf, tokenize
+from common.settings import env_float, env_int
+
+np = lazy_import("numpy")
+
+RERANK_CANDIDATES = env_int("CW_RERANK_CANDIDATES", 40)
+RERANK_THRESHOLD = env_float("CW_RERANK_THRESHOLD", 0.2)
+RERANK_RELATIVE = env_float("CW_RERANK_RELATIVE", 0.6)
+RERANK_MAX_K = env_int("CW_RERANK_MAX_K", 8)
+
+DIM = 1024
+
+
+@lru_cache(maxsize=8192)
+def _analyzed(title, text):
+    # The same curriculum passages come back turn after turn, so their tokens
+    # and vectors are only computed once
+    tokens = tokenize(f"{(title or '').replace('_', ' ')} {text or ''}")
+    return frozenset(tokens), hashed_tf(tokens, DIM)
+
+
+def rerank(query, passages, lexical_weight=0.5):
+    """``[(score, passage)]`` for ``passages``, best first."""
+    query_tokens = tokenize(query)
+    if not passages or not query_tokens:
+        return [(0.0, p) for p in passages]
+    analyzed = [_analyzed(p.get('title'), p.get('text')) for p in passages]
+    n = len(analyzed)
+    df = Counter(term for terms, _ in analyzed for term in set(query_tokens) & terms)
+    weights = {term: math.log(1 + (n + 1) / (df[term] + 1)) for term in set(query_tokens)}
+    total = sum(weights.values())
+    cosines = np.stack([vector for _, vector in analyzed]) @ hashed_tf(query_tokens, DIM)
+
+    scored = []
+    for index, (terms, _) in enumerate(analyzed):
+        lexical = sum(w for term, w in weights.items() if term in terms) / total
+        score = lexical_weight * lexical + (1 - lexical_weight) * max(0.0, float(cosines[index]))
+        scored.append((round(score, 4), passages[index]))
+    scored.sort(key=lambda item: -item[0])
+    return scored
+
+
+def select(scored, threshold=RERANK_THRESHOLD, relative=RERANK_RELATIVE, max_k=RERANK_MAX_K):
+    """The passages of ``rerank()`` output that make the adaptive cut."""
+    if not scored:
+        return []
+    floor = max(threshold, relative * scored[0][0])
+    return [dict(passage, score=score) for score, passage in scored[:max_k] if score >= floor]
@@ -0,0 +1,282 @@
+"""
+Local hybrid retrieval over the curriculum materials.
+
+An offline alternative to the Vertex AI Search tool. Passages are indexed
+twice:
+- BM25 over word tokens, for exact terms ("DHS 1536", "six domains").
+- A hashed TF-IDF vector index (unigrams and bigrams, L2-normalised, NumPy
+  cosine), which still scores paraphrases that share only some terms.
+``hybrid`` search fuses the two rankings with reciprocal rank fusion.
+
+Hits come back in the ``retrieved_context`` shape the analysis stream
+already uses: ``title``, ``uri``, ``text`` and an optional ``page_span``.
+``grounding_chunks()`` wraps them exactly like ``serialize_chunk`` does, so
+the frontend's ``[N]`` citation mapping works unchanged. With
+``CW_RAG_MODE=local``, analyses retrieve from the index at
+``CW_LOCAL_RAG_INDEX`` and put the passages into the prompt instead of
+attaching the remote tool.
+
+Build the index with ``python -m common.ingest`` (see ``common/ingest.py``).
+``python -m common.embeddings`` precomputes the vectors into a
+memory-mapped store next to it (see ``common/embeddings.py``).
+"""
+import argparse
+import hashlib
+import heapq
+import json
+import logging
+import math
+import os
+import re
+import time
+from collections import Counter
+
+from common.lazy import Lazy, lazy_import
+from common.settings import BACKEND_DIR, env_int, env_str
+
+RAG_MODE = env_str("CW_RAG_MODE", "remote").lower()
+LOCAL_INDEX_PATH = env_str("CW_LOCAL_RAG_INDEX", os.path.join(BACKEND_DIR, "rag", "index.json"))
+LOCAL_TOP_K = env_int("CW_LOCAL_RAG_TOP_K", 8)
+
+# Only needed once an index is built or loaded
+np = lazy_import("numpy")
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from has have how i if in into is it its me my
+not of on or our so that the their them then there these they this to was we what when where
+which who will with you your
+""".split())
+
+
+def tokenize(text):
+    """Lower-cased word tokens without stopwords; plurals folded to the singular."""
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in _STOPWORDS:
+            continue
+        if len(token) > 4 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    def __init__(self, documents, k1=1.5, b=0.75):
+        """``documents`` is a list of token lists."""
+        self.k1 = k1
+        self.b = b
+        self.lengths = [len(tokens) for tokens in documents]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        self.postings = {}
+        for index, tokens in enumerate(documents):
+            for term, tf in Counter(tokens).items():
+                self.postings.setdefault(term, []).append((index, tf))
+        n = len(documents)
+        self.idf = {term: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5)) for term, p in self.postings.items()}
+
+    def search(self, tokens, k):
+        scores = {}
+        for term in set(tokens):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf[term]
+            for index, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[index] / (self.avg_length or 1))
+                scores[index] = scores.get(index, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+def _features(tokens):
+    return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+
+def _bucket(feature, dim):
+    digest = hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest()
+    value = int.from_bytes(digest, 'little')
+    return value % dim, (1.0 if value >> 63 else -1.0)
+
+
+def hashed_tf(tokens, dim=4096):
+    """L2-normalised hashed term-frequency vector (no IDF) of ``tokens``."""
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature, tf in Counter(_features(tokens)).items():
+        bucket, sign = _bucket(feature, dim)
+        vector[bucket] += sign * (1 + math.log(tf))
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class VectorIndex:
+    """Hashed TF-IDF vectors with cosine similarity."""
+
+    def __init__(self, documents, dim=4096):
+        self.dim = dim
+        df = Counter(feature for tokens in documents for feature in set(_features(tokens)))
+        n = len(documents)
+        self.idf = {feature: math.log((1 + n) / (1 + count)) + 1.0 for feature, count in df.items()}
+        self.default_idf = math.log(1 + n) + 1.0
+        self.matrix = np.zeros((n, dim), dtype=np.float32)
+        for row, tokens in enumerate(documents):
+            self.matrix[row] = self.embed(tokens)
+
+    def embed(self, tokens):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, tf in Counter(_features(tokens)).items():
+            bucket, sign = _bucket(feature, self.dim)
+            vector[bucket] += sign * (1 + math.log(tf)) * self.idf.get(feature, self.default_idf)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def search(self, tokens, k, nprobe=None):
+        """Top ``k`` ``(row, cosine)`` pairs; always exact, ``nprobe`` is ignored."""
+        if not len(self.matrix):
+            return []
+        scores = self.matrix @ self.embed(tokens)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        return [(int(i), float(scores[i])) for i in sorted(top, key=lambda i: -scores[i]) if scores[i] > 0]
+
+
+def passage_key(passage):
+    """Stable id of a passage, used by the exclusion list."""
+    digest = hashlib.blake2b(f"{passage['uri']}\0{passage['text']}".encode('utf-8'), digest_size=8)
+    return digest.hexdigest()
+
+
+def exclusions_path_for(index_path):
+    return os.path.join(os.path.dirname(os.path.abspath(index_path)), "exclusions.json")
+
+
+def store_path_for(index_path):
+    return os.path.join(os.path.dirname(os.path.abspath(index_path)), "embeddings")
+
+
+def ann_path_for(index_path):
+    return os.path.join(os.path.dirname(os.path.abspath(index_path)), "ann")
+
+
+def passage_text(passage):
+    """The text a passage is indexed under: its title words, then its body."""
+    return f"{passage['title'].replace('_', ' ')} {passage['text']}"
+
+
+def make_passage(title, uri, text, first_page=None, last_page=None):
+    passage = {'title': title, 'uri': uri, 'text': text}
+    if first_page is not None:
+        passage['page_span'] = {'first_page': first_page, 'last_page': last_page}
+    return passage
+
+
+class LocalRetriever:
+    """BM25 + vector retrieval over ``retrieved_context``-shaped passages."""
+
+    def __init__(self, passages, rrf_k=60, dim=4096, vectors=None):
+        """``vectors`` replaces the ``VectorIndex`` built here, e.g. an ``EmbeddingStore``."""
+        self.passages = list(passages)
+        self.rrf_k = rrf_k
+        tokens = [tokenize(passage_text(p)) for p in self.passages]
+        self.bm25 = BM25Index(tokens)
+        self.vectors = vectors if vectors is not None else VectorIndex(tokens, dim=dim)
+
+    def search(self, query, k=5, mode='hybrid', candidates=50, nprobe=None):
+        """Top ``k`` passages for ``query``; ``mode`` is ``hybrid``, ``bm25`` or ``vector``.
+
+        ``nprobe`` trades vector recall for speed when the vectors come from
+        an ANN index (see ``common.ann``); ``0`` is exact.
+        """
+        tokens = tokenize(query)
+        if mode == 'bm25':
+            ranked = self.bm25.search(tokens, k)
+        elif mode == 'vector':
+            ranked = self.vectors.search(tokens, k, nprobe=nprobe)
+        else:
+            fused = {}
+            for ranking in (self.bm25.search(tokens, candidates),
+                            self.vectors.search(tokens, candidates, nprobe=nprobe)):
+                for rank, (index, _) in enumerate(ranking):
+                    fused[index] = fused.get(index, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+            ranked = heapq.nlargest(k, fused.items(), key=lambda item: item[1])
+        return [dict(self.passages[index], score=round(score, 6)) for index, score in ranked]
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'version': 1, 'passages': self.passages}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path, exclusions_path=None):
+        """Load an index, leaving out what ``exclusions.json`` next to it lists (see ``common.dedup``).
+
+        Vectors come from the embedding store next to the index when it
+        matches (see ``common.embeddings``).
+        """
+        from common.embeddings import open_store
+
+        with open(path, encoding='utf-8') as f:
+            index = json.load(f)
+        passages = index['passages']
+        store = open_store(path, [passage_text(p) for p in passages], digest=index.get('digest'))
+        exclusions_path = exclusions_path or exclusions_path_for(path)
+        if os.path.exists(exclusions_path):
+            with open(exclusions_path, encoding='utf-8') as f:
+                exclusions = json.load(f)
+            uris, keys = set(exclusions['excluded_uris']), set(exclusions['excluded_passages'])
+            rows = [row for row, p in enumerate(passages) if p['uri'] not in uris and passage_key(p) not in keys]
+            logging.info(f"Local RAG index: {len(passages) - len(rows)} near-duplicate passages excluded")
+            passages = [passages[row] for row in rows]
+            if store is not None and len(rows) < len(store):
+                store = store.restricted(rows)
+        return cls(passages, vectors=store)
+
+
+def _load_default():
+    started = time.monotonic()
+    retriever = LocalRetriever.load(LOCAL_INDEX_PATH)
+    logging.info(f"Local RAG index loaded: {len(retriever.passages)} passages "
+                 f"in {(time.monotonic() - started) * 1000:.0f} ms")
+    return retriever
+
+
+LOCAL_RETRIEVER = Lazy(_load_default)
+
+
+def grounding_chunks(passages):
+    """Passages as ``grounding_chunks`` entries, the way ``serialize_chunk`` emits them."""
+    chunks = []
+    for index, passage in enumerate(passages):
+        context = {'title': passage.get('title'), 'uri': passage.get('uri'), 'text': passage.get('text')}
+        if passage.get('page_span'):
+            context['page_span'] = passage['page_span']
+        chunks.append({'_array_index': index, '_citation_number': index + 1, 'retrieved_context': context})
+    return chunks
+
+
+def format_context(passages):
+    """Prompt block listing passages as numbered curriculum excerpts."""
+    lines = ["CURRICULUM EXCERPTS (cite these as [1], [2], etc.):"]
+    for number, passage in enumerate(passages, start=1):
+        span = passage.get('page_span')
+        pages = ""
+        if span:
+            pages = f" (p. {span['first_page']})" if span['first_page'] == span['last_page'] \
+                else f" (pp. {span['first_page']}-{span['last_page']})"
+        lines.append(f"[{number}] {passage['title']}{pages}\n{passage['text']}")
+    return "\n\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search the local curriculum index.")
+    parser.add_argument("text")
+    parser.add_argument("--index", default=LOCAL_INDEX_PATH)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--mode", choices=("hybrid", "bm25", "vector"), default="hybrid")
+    args = parser.parse_args()
+
+    for hit in LocalRetriever.load(args.index).search(args.text, k=args.k, mode=args.mode):
+        print(f"{hit['score']:.4f}  {hit['title']}  {hit.get('page_span') or ''}")
+        print(f"        {hit['text'][:160]!r}")
+
+
+if __name__ == "__main__":
+    main()
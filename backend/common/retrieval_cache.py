@@ -0,0 +1,133 @@
+"""
+In-memory cache of curriculum retrieval results.
+
+Consecutive turns on the same topic, and repeated analyses of the same
+transcript, retrieve the same passages again and again. Results are cached
+per ``(datastore id, normalized query, parameters)``. The query is
+normalized with the retrieval tokenizer, so case, punctuation, stopwords
+and plurals do not split entries. Long queries, such as whole transcripts,
+are hashed into the key.
+
+The cache serves two kinds of results:
+- Local index searches (``CW_RAG_MODE=local``).
+- Grounding chunks recorded from remote analyses. With
+  ``CW_REUSE_GROUNDING=1``, a later analysis of the same query puts the
+  recorded passages into the prompt, the way local mode does, instead of
+  calling the retrieval tool again.
+
+Entries expire after ``CW_RETRIEVAL_CACHE_TTL_S`` seconds. The least
+recently used ones are evicted once the JSON size of all values exceeds
+``CW_RETRIEVAL_CACHE_MB``. Hits, misses, evictions, bytes and hit rate are
+reported under ``retrieval_cache.*`` in the metrics.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from common import metrics
+from common.retrieval import tokenize
+from common.settings import env_bool, env_float, env_int
+
+CACHE_ENABLED = env_bool("CW_RETRIEVAL_CACHE", True)
+CACHE_MAX_BYTES = env_int("CW_RETRIEVAL_CACHE_MB", 32) * 1024 * 1024
+CACHE_TTL_S = env_float("CW_RETRIEVAL_CACHE_TTL_S", 600.0)
+REUSE_GROUNDING = env_bool("CW_REUSE_GROUNDING", False)
+
+
+def normalize_query(text):
+    return " ".join(tokenize(text or ""))
+
+
+def cache_key(datastore, query, **params):
+    normalized = json.dumps([datastore, normalize_query(query), sorted(params.items())], ensure_ascii=False)
+    return hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class RetrievalCache:
+    """TTL + LRU cache bounded by the JSON size of its values."""
+
+    def __init__(self, name='retrieval', max_bytes=CACHE_MAX_BYTES, ttl=CACHE_TTL_S, enabled=CACHE_ENABLED,
+                 clock=time.monotonic):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.enabled = enabled
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, datastore, query, **params):
+        """The cached value, or None on a miss."""
+        if not self.enabled:
+            return None
+        key = cache_key(datastore, query, **params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] <= self._clock():
+                self._drop(key, 'ttl')
+                entry = None
+            if entry:
+                self._entries.move_to_end(key)
+                self._hits += 1
+            else:
+                self._misses += 1
+            self._report()
+        metrics.inc('retrieval_cache.hits' if entry else 'retrieval_cache.misses', cache=self.name)
+        return entry[2] if entry else None
+
+    def put(self, datastore, query, value, **params):
+        if not self.enabled:
+            return
+        key = cache_key(datastore, query, **params)
+        size = len(json.dumps(value, ensure_ascii=False).encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key, None)
+            self._entries[key] = (self._clock() + self.ttl, size, value)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)), 'lru')
+            self._report()
+
+    def get_or_compute(self, datastore, query, compute, **params):
+        value = self.get(datastore, query, **params)
+        if value is None:
+            value = compute()
+            self.put(datastore, query, value, **params)
+        return value
+
+    def _drop(self, key, reason):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+        if reason:
+            metrics.inc('retrieval_cache.evictions', cache=self.name, reason=reason)
+
+    def _report(self):
+        lookups = self._hits + self._misses
+        metrics.set_gauge('retrieval_cache.bytes', self._bytes, cache=self.name)
+        metrics.set_gauge('retrieval_cache.entries', len(self._entries), cache=self.name)
+        metrics.set_gauge('retrieval_cache.hit_rate', round(self._hits / lookups, 4) if lookups else 0.0,
+                          cache=self.name)
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'hits': self._hits,
+                    'misses': self._misses, 'hit_rate': self._hits / lookups if lookups else 0.0}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._hits = self._misses = 0
+            self._report()
+
+
+RETRIEVAL_CACHE = RetrievalCache()
@@ -0,0 +1,250 @@
+"""
+Latency-aware model routing per action.
+
+Each action has a policy: its candidate models in order of preference, a
+latency target, and optional thinking budgets per model and for short
+inputs. For every request the router picks the first candidate whose
+recent behaviour is healthy. A model is healthy when its EWMA latency is
+within the action's target and its EWMA error rate is below
+``max_error_rate``. The target grows with the size of the input, since long
+transcripts are slower everywhere. Inputs above ``pin_above_chars`` always
+get the first candidate, because long transcripts are where the lighter
+model loses quality. Statistics older than ``CW_ROUTER_STALE_S`` are
+ignored, so a model that was avoided is retried once things have calmed
+down.
+
+Static overrides per action (upper-cased, e.g. ``CW_MODEL_SIMULATION_CHAT``):
+    CW_MODEL_<ACTION>      always use this model
+    CW_THINKING_<ACTION>   always use this thinking budget
+``CW_ROUTER=0`` turns latency-aware routing off: every action uses its first
+candidate.
+
+Metrics: router.decisions{action,model,reason}, and per model the gauges
+router.latency_ewma_s and router.error_ewma.
+"""
+import copy
+import logging
+import threading
+import time
+
+from common import metrics
+from common.genai_config import DEFAULT_MODEL, LIGHT_MODEL
+from common.settings import env_bool, env_float, env_int, env_str
+
+
+class RoutePolicy:
+    def __init__(self, models, latency_target, seconds_per_kchar=0.0, thinking=None,
+                 short_input_chars=0, short_thinking=None, pin_above_chars=None, max_error_rate=0.2):
+        self.models = tuple(models)
+        self.latency_target = latency_target
+        self.seconds_per_kchar = seconds_per_kchar
+        # model -> thinking budget; models not listed keep the base config's
+        self.thinking = dict(thinking or {})
+        self.short_input_chars = short_input_chars
+        self.short_thinking = short_thinking
+        self.pin_above_chars = pin_above_chars
+        self.max_error_rate = max_error_rate
+        self.model_override = None
+        self.thinking_override = None
+
+    def target_for(self, input_chars):
+        return self.latency_target + self.seconds_per_kchar * input_chars / 1000.0
+
+    def thinking_for(self, model, input_chars):
+        if self.thinking_override is not None:
+            return self.thinking_override
+        budget = self.thinking.get(model)
+        if self.short_thinking is not None and input_chars < self.short_input_chars:
+            # Short transcripts need less reasoning; never raise a model's own cap
+            budget = self.short_thinking if budget is None else min(budget, self.short_thinking)
+        return budget
+
+
+ACTION_POLICIES = {
+    'chat': RoutePolicy((DEFAULT_MODEL, LIGHT_MODEL), latency_target=6.0, seconds_per_kchar=0.05,
+                        thinking={LIGHT_MODEL: 0}),
+    'simulation_chat': RoutePolicy((DEFAULT_MODEL, LIGHT_MODEL), latency_target=5.0, seconds_per_kchar=0.05,
+                                   thinking={LIGHT_MODEL: 0}),
+    'mentorship_chat': RoutePolicy((DEFAULT_MODEL, LIGHT_MODEL), latency_target=8.0, seconds_per_kchar=0.05,
+                                   thinking={LIGHT_MODEL: 0}),
+    # Analyses are judged on time to first chunk
+    'analyze': RoutePolicy((DEFAULT_MODEL, LIGHT_MODEL), latency_target=20.0, seconds_per_kchar=0.5,
+                           short_input_chars=1500, short_thinking=8192, pin_above_chars=20000),
+    'supervisor_analysis': RoutePolicy((DEFAULT_MODEL, LIGHT_MODEL), latency_target=20.0, seconds_per_kchar=0.5,
+                                       short_input_chars=1500, short_thinking=8192, pin_above_chars=20000),
+}
+
+
+class Route:
+    """One routing decision; also the per-model hooks the handler calls with."""
+
+    def __init__(self, router, action, policy, model, input_chars, reason):
+        self._router = router
+        self.action = action
+        self.policy = policy
+        self.model = model
+        self.input_chars = input_chars
+        self.reason = reason
+        self.thinking_budget = policy.thinking_for(model, input_chars)
+
+    def config(self, model, base_config):
+        """``base_config`` with this route's thinking budget for ``model``."""
+        return with_thinking(base_config, self.policy.thinking_for(model, self.input_chars))
+
+    def timed(self, fn):
+        """Wrap ``fn(model)`` so its latency and outcome feed the router."""
+        def call(model):
+            started = time.monotonic()
+            try:
+                result = fn(model)
+            except Exception:
+                self._router.observe(model, time.monotonic() - started, ok=False)
+                raise
+            self._router.observe(model, time.monotonic() - started)
+            return result
+        return call
+
+    def timed_stream(self, open_stream):
+        """Like ``timed`` for streams, measuring time to the first item."""
+        def stream(model):
+            started = time.monotonic()
+            first = True
+            try:
+                for item in open_stream(model):
+                    if first:
+                        first = False
+                        self._router.observe(model, time.monotonic() - started)
+                    yield item
+            except Exception:
+                self._router.observe(model, time.monotonic() - started, ok=False)
+                raise
+        return stream
+
+
+class _ModelStats:
+    __slots__ = ('latency', 'error_rate', 'updated')
+
+    def __init__(self):
+        self.latency = None
+        self.error_rate = 0.0
+        self.updated = 0.0
+
+
+class ModelRouter:
+    def __init__(self, policies=None, alpha=0.2, stale_after=120.0, enabled=True):
+        self.policies = policies if policies is not None else ACTION_POLICIES
+        self.alpha = alpha
+        self.stale_after = stale_after
+        self.enabled = enabled
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        policies = {}
+        for action, policy in ACTION_POLICIES.items():
+            policy = copy.copy(policy)
+            policy.model_override = env_str(f"CW_MODEL_{action.upper()}") or None
+            policy.thinking_override = env_int(f"CW_THINKING_{action.upper()}", None)
+            policies[action] = policy
+        return cls(
+            policies,
+            alpha=env_float("CW_ROUTER_ALPHA", 0.2),
+            stale_after=env_float("CW_ROUTER_STALE_S", 120.0),
+            enabled=env_bool("CW_ROUTER", True),
+        )
+
+    def primary(self, action):
+        """The model ``action`` uses when nothing argues otherwise."""
+        policy = self.policies[action]
+        return policy.model_override or policy.models[0]
+
+    def observe(self, model, seconds, ok=True):
+        with self._lock:
+            stats = self._stats.get(model)
+            if stats is None or time.monotonic() - stats.updated > self.stale_after:
+                # Old numbers say nothing about the model now; start afresh
+                stats = self._stats[model] = _ModelStats()
+            if ok:
+                stats.latency = seconds if stats.latency is None else \
+                    (1 - self.alpha) * stats.latency + self.alpha * seconds
+            stats.error_rate = (1 - self.alpha) * stats.error_rate + self.alpha * (0.0 if ok else 1.0)
+            stats.updated = time.monotonic()
+            latency, error_rate = stats.latency, stats.error_rate
+        if latency is not None:
+            metrics.set_gauge('router.latency_ewma_s', round(latency, 3), model=model)
+        metrics.set_gauge('router.error_ewma', round(error_rate, 3), model=model)
+
+    def stats(self, model):
+        """``(ewma_latency_s or None, ewma_error_rate)``; ``(None, 0.0)`` when stale or unseen."""
+        with self._lock:
+            stats = self._stats.get(model)
+            if stats is None or time.monotonic() - stats.updated > self.stale_after:
+                return None, 0.0
+            return stats.latency, stats.error_rate
+
+    def _healthy(self, model, target, max_error_rate):
+        latency, error_rate = self.stats(model)
+        return error_rate < max_error_rate and (latency is None or latency <= target)
+
+    def _expected(self, model, target):
+        """Sort key for when no model is healthy: penalise errors, then latency."""
+        latency, error_rate = self.stats(model)
+        return error_rate, latency if latency is not None else target
+
+    def route(self, action, input_chars=0):
+        policy = self.policies[action]
+        target = policy.target_for(input_chars)
+
+        if policy.model_override:
+            model, reason = policy.model_override, 'override'
+        elif not self.enabled:
+            model, reason = policy.models[0], 'static'
+        elif policy.pin_above_chars and input_chars > policy.pin_above_chars:
+            model, reason = policy.models[0], 'large_input'
+        else:
+            healthy = [m for m in policy.models if self._healthy(m, target, policy.max_error_rate)]
+            if healthy:
+                model = healthy[0]
+                reason = 'preferred' if model == policy.models[0] else 'primary_degraded'
+            else:
+                model = min(policy.models, key=lambda m: self._expected(m, target))
+                reason = 'least_degraded'
+
+        route = Route(self, action, policy, model, input_chars, reason)
+        latency, error_rate = self.stats(model)
+        latency_text = f"{latency:.2f}s" if latency is not None else "n/a"
+        logging.info(f"[router] {action} -> {model} (thinking={route.thinking_budget}, {reason}; "
+                     f"ewma {latency_text}, errors {error_rate:.0%}, target {target:.1f}s, "
+                     f"input {input_chars} chars)")
+        metrics.inc('router.decisions', action=action, model=model, reason=reason)
+        return route
+
+
+_configs = {}
+_configs_lock = threading.Lock()
+
+
+def with_thinking(base_config, thinking_budget):
+    """Copy of ``base_config`` with ``thinking_budget``; cached, base returned for None."""
+    if thinking_budget is None:
+        return base_config
+    key = (id(base_config), thinking_budget)
+    with _configs_lock:
+        cached = _configs.get(key)
+        # Keep the base alive alongside its copy so its id cannot be reused
+        if cached is not None and cached[0] is base_config:
+            return cached[1]
+    from google.genai import types
+
+    current = base_config.thinking_config
+    config = base_config.model_copy(update={'thinking_config': types.ThinkingConfig(
+        thinking_budget=thinking_budget,
+        include_thoughts=current.include_thoughts if current and thinking_budget else None,
+    )})
+    with _configs_lock:
+        _configs[key] = (base_config, config)
+    return config
+
+
+ROUTER = ModelRouter.from_env()
@@ -0,0 +1,61 @@
+"""
+Environment-driven settings shared by the functions.
+
+Every knob is read from an environment variable so it can be changed per
+deployment (``gcloud functions deploy --set-env-vars``) without a code
+change.
+"""
+import logging
+import os
+
+# The directory holding common/ (and rag/): backend/ in the repo, the
+# function directory in a vendored deploy
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_TRUE = {"1", "true", "yes", "on"}
+_FALSE = {"0", "false", "no", "off", ""}
+
+
+def env_bool(name, default=False):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    value = value.strip().lower()
+    if value in _TRUE:
+        return True
+    if value in _FALSE:
+        return False
+    logging.warning(f"Ignoring invalid boolean for {name}: {value!r}")
+    return default
+
+
+def env_int(name, default):
+    value = os.environ.get(name)
+    if value is None or not value.strip():
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        logging.warning(f"Ignoring invalid integer for {name}: {value!r}")
+        return default
+
+
+def env_float(name, default):
+    value = os.environ.get(name)
+    if value is None or not value.strip():
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        logging.warning(f"Ignoring invalid number for {name}: {value!r}")
+        return default
+
+
+def env_str(name, default=""):
+    value = os.environ.get(name)
+    return default if value is None else value.strip()
+
+
+# Defer google.genai imports, client construction and config building until
+# the first request (or an explicit warmup) instead of doing it at import.
+LAZY_INIT = env_bool("CW_LAZY_INIT", False)
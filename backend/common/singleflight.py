@@ -0,0 +1,141 @@
+"""
+Request coalescing ("singleflight") for streamed model responses.
+
+Identical requests that arrive while one is already running share a single
+upstream stream. The first caller (the leader) starts the producer in a
+background thread; every caller, including the leader, reads from the
+shared buffer, so late joiners first get everything produced so far and
+then follow the live stream. Because the producer does not run on any one
+response, a caller disconnecting does not cut the stream off for the others.
+
+Flights keyed by a canonical request hash are dropped as soon as they
+finish. Flights keyed by a client-supplied idempotency key are kept for
+``idempotency_ttl`` seconds so a retry after completion replays the result
+instead of running the analysis again.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+
+
+def request_hash(action, payload, fields):
+    """Stable hash of ``fields`` of ``payload`` for ``action``."""
+    canonical = json.dumps(
+        {'action': action, **{name: payload.get(name) for name in fields}},
+        sort_keys=True, separators=(',', ':'), ensure_ascii=False,
+    )
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class _Flight:
+    def __init__(self, key, replayable):
+        self.key = key
+        self.replayable = replayable
+        self.items = []
+        self.done = False
+        self.finished_at = None
+        self.cond = threading.Condition()
+
+    def publish(self, item):
+        with self.cond:
+            self.items.append(item)
+            self.cond.notify_all()
+
+    def finish(self):
+        with self.cond:
+            self.done = True
+            self.finished_at = time.monotonic()
+            self.cond.notify_all()
+
+    def subscribe(self):
+        """Yield every item from the start of the flight until it finishes."""
+        index = 0
+        while True:
+            with self.cond:
+                while index >= len(self.items) and not self.done:
+                    self.cond.wait()
+                pending = self.items[index:]
+                finished = self.done
+            for item in pending:
+                yield item
+            index += len(pending)
+            if finished and index >= len(self.items):
+                return
+
+
+class SingleFlight:
+    """Coalesce concurrent producers that share a key into one."""
+
+    def __init__(self, name, idempotency_ttl=60.0):
+        self.name = name
+        self.idempotency_ttl = idempotency_ttl
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def stream(self, key, produce, replayable=False):
+        """Return an iterator over ``produce()``'s items, shared by every caller with ``key``.
+
+        ``replayable`` keeps the finished flight around for ``idempotency_ttl``
+        seconds (use it for client-supplied idempotency keys).
+        """
+        with self._lock:
+            self._expire()
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight(key, replayable)
+                self._flights[key] = flight
+
+        if not leader:
+            return self._attached(flight)
+        thread = threading.Thread(
+            target=self._run, args=(flight, produce),
+            name=f"singleflight-{self.name}", daemon=True,
+        )
+        thread.start()
+        return flight.subscribe()
+
+    def join(self, key):
+        """Attach to the flight for ``key`` and return its iterator, or None if there is none.
+
+        Never starts a producer. Checking and attaching happen under the same
+        lock, so a flight that finishes meanwhile cannot make the caller a
+        leader.
+        """
+        with self._lock:
+            self._expire()
+            flight = self._flights.get(key)
+            if flight is None:
+                return None
+        return self._attached(flight)
+
+    def _attached(self, flight):
+        state = "finished" if flight.done else "in flight"
+        logging.info(f"[{self.name}] coalesced duplicate request onto {state} stream "
+                     f"({len(flight.items)} items buffered)")
+        return flight.subscribe()
+
+    def _run(self, flight, produce):
+        try:
+            for item in produce():
+                flight.publish(item)
+        except Exception as e:
+            logging.exception(f"[{self.name}] coalesced producer failed: {e}")
+        finally:
+            flight.finish()
+            with self._lock:
+                if not flight.replayable and self._flights.get(flight.key) is flight:
+                    del self._flights[flight.key]
+
+    def _expire(self):
+        now = time.monotonic()
+        for key, flight in list(self._flights.items()):
+            if flight.done and now - flight.finished_at > self.idempotency_ttl:
+                del self._flights[key]
+
+    def in_flight(self):
+        """Number of keys currently being produced."""
+        with self._lock:
+            return sum(1 for flight in self._flights.values() if not flight.done)
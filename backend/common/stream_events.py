@@ -0,0 +1,259 @@
+"""
+Wire protocols for the streamed analyses (``analyze``, ``supervisor_analysis``).
+
+v1, the default, sends one NDJSON line per model chunk in the SDK's own
+nested shape (see ``serialize_chunk``). Clients walk
+``candidates[].content.parts[]`` to tell thoughts from answer text, and the
+grounding chunks repeat their index twice.
+
+v2 is selected with ``"protocol": "v2"`` in the request. Each line is one
+flat, typed event:
+
+    {"type": "thought_delta", "text": "..."}
+    {"type": "text_delta", "text": "..."}
+    {"type": "grounding", "chunks": [{"title", "uri", "text", "page_span"?}, ...]}
+    {"type": "usage", "prompt_tokens", "output_tokens", "thought_tokens", "total_tokens"}
+    {"type": "done", "chunks": N}
+    {"type": "error", "message": "..."}
+
+Consecutive parts of one kind within a chunk become one delta. ``[N]`` in
+the text cites ``chunks[N-1]`` of the latest grounding event. A successful
+stream ends with ``usage`` (the last counts the model reported, when it
+reported any) and always with ``done``, so a client can tell a finished
+stream from a dropped connection.
+
+With ``"framing": "msgpack"`` (set from the ``Accept`` header, see
+``common.frames``) the v2 events go out as length-prefixed MessagePack
+frames instead of NDJSON lines, whatever the requested protocol.
+
+``"thoughts"`` controls the model's thought parts, in either protocol:
+- ``full`` (default): every thought as it arrives;
+- ``throttled``: thoughts held and sent together at most once every
+  ``CW_THOUGHT_INTERVAL_MS`` (1500 ms). Held thoughts go out with the next
+  chunk after the interval, before the first answer text and at the end;
+- ``summary``: only the headline of each thought (its ``**bold**`` title,
+  or else its first sentence). A thought is held until it ends, when the
+  next ``**title**`` line starts another or the answer text begins, so
+  deltas of one thought give one headline;
+- ``none``: no thoughts. The handlers also ask the model not to send them.
+
+Usage:
+    encoder = stream_encoder(request_json)
+    yield encoder.grounding(local_grounding)
+    for chunk in model_stream:
+        yield encoder.chunk(serialize_chunk(chunk, index), chunk.usage_metadata)
+    yield encoder.done()
+"""
+import json
+import re
+import time
+
+from common.frames import FRAMES_MIMETYPE, frame
+from common.settings import env_int
+
+PROTOCOLS = ('v1', 'v2')
+FRAMINGS = ('ndjson', 'msgpack')
+THOUGHT_MODES = ('full', 'throttled', 'summary', 'none')
+THOUGHT_INTERVAL_MS = env_int("CW_THOUGHT_INTERVAL_MS", 1500)
+
+_HEADLINE = re.compile(r"\*\*[^*\n]+\*\*")
+_THOUGHT_START = re.compile(r"^\*\*[^*\n]+\*\*", re.M)
+_FIRST_SENTENCE = re.compile(r"\S.*?(?:[.!?](?=\s)|\n|$)", re.S)
+
+
+def stream_protocol(request_json):
+    """The request's ``protocol`` field, ``v1`` when missing or unknown."""
+    protocol = request_json.get('protocol')
+    return protocol if protocol in PROTOCOLS else 'v1'
+
+
+def stream_framing(request_json):
+    """The request's ``framing`` field, ``ndjson`` when missing or unknown."""
+    framing = request_json.get('framing')
+    return framing if framing in FRAMINGS else 'ndjson'
+
+
+def stream_thoughts(request_json):
+    """The request's ``thoughts`` field, ``full`` when missing or unknown."""
+    thoughts = request_json.get('thoughts')
+    return thoughts if thoughts in THOUGHT_MODES else 'full'
+
+
+def stream_encoder(request_json):
+    """``StreamEncoder`` for the protocol, framing and thoughts the request asked for."""
+    return StreamEncoder(stream_protocol(request_json), stream_framing(request_json),
+                         stream_thoughts(request_json))
+
+
+def stream_variant(request_json):
+    """Suffix that keeps requests wanting different wire formats in separate flights.
+
+    Empty for the default format, so v1 flight keys are unchanged.
+    """
+    encoder = stream_encoder(request_json)
+    variant = [encoder.framing if encoder.framing != 'ndjson' else encoder.protocol]
+    if variant == ['v1']:
+        variant = []
+    if encoder.thoughts != 'full':
+        variant.append(f"thoughts={encoder.thoughts}")
+    return ":".join(variant)
+
+
+def headline(text):
+    """The ``**bold**`` titles of a thought, or its first sentence when it has none."""
+    titles = _HEADLINE.findall(text)
+    if titles:
+        return "".join(f"{title}\n\n" for title in titles)
+    match = _FIRST_SENTENCE.search(text)
+    return f"{match.group(0).strip()}\n\n" if match else ""
+
+
+def chunk_events(chunk_data):
+    """v2 events for one serialized (v1) chunk."""
+    events = []
+    for candidate in chunk_data.get('candidates', ()):
+        for part in (candidate.get('content') or {}).get('parts', ()):
+            text = part.get('text')
+            if not text:
+                continue
+            kind = 'thought_delta' if part.get('thought') else 'text_delta'
+            if events and events[-1]['type'] == kind:
+                events[-1]['text'] += text
+            else:
+                events.append({'type': kind, 'text': text})
+        grounding = (candidate.get('grounding_metadata') or {}).get('grounding_chunks')
+        if grounding:
+            events.append({'type': 'grounding', 'chunks': [g.get('retrieved_context') or {} for g in grounding]})
+    return events
+
+
+def usage_event(usage):
+    """v2 ``usage`` event from an SDK ``usage_metadata``, None without one."""
+    if usage is None:
+        return None
+    return {
+        'type': 'usage',
+        'prompt_tokens': getattr(usage, 'prompt_token_count', None) or 0,
+        'output_tokens': getattr(usage, 'candidates_token_count', None) or 0,
+        'thought_tokens': getattr(usage, 'thoughts_token_count', None) or 0,
+        'total_tokens': getattr(usage, 'total_token_count', None) or 0,
+    }
+
+
+def _line(event):
+    return json.dumps(event, ensure_ascii=False, separators=(',', ':')) + "\n"
+
+
+class StreamEncoder:
+    """Turns serialized chunks into the response body of one protocol and framing.
+
+    Every method returns what to send, possibly empty: text for NDJSON, bytes
+    for frames.
+    """
+
+    def __init__(self, protocol='v1', framing='ndjson', thoughts='full',
+                 interval_ms=THOUGHT_INTERVAL_MS, clock=time.monotonic):
+        self.framing = framing
+        self.protocol = protocol if framing == 'ndjson' else 'v2'
+        self.thoughts = thoughts
+        self.mimetype = 'text/plain' if framing == 'ndjson' else FRAMES_MIMETYPE
+        self.chunks = 0
+        self.usage = None
+        self._encode, self._join = (_line, "".join) if framing == 'ndjson' else (frame, b"".join)
+        self._interval = interval_ms / 1000
+        self._clock = clock
+        self._held = []
+        self._sent_at = None
+
+    def _release(self):
+        """Thought parts for everything held back: as is when throttled, as a headline in summary mode."""
+        text = "".join(self._held)
+        self._held = []
+        self._sent_at = self._clock()
+        if self.thoughts == 'summary':
+            text = headline(text)
+        return [{"text": text, "thought": True}] if text else []
+
+    def _ended_thoughts(self):
+        """Headlines of the held thoughts that a later one has started after; the latest stays held."""
+        text = "".join(self._held)
+        starts = [match.start() for match in _THOUGHT_START.finditer(text) if match.start() > 0]
+        if not starts:
+            self._held = [text]
+            return []
+        self._held = [text[:starts[-1]]]
+        ended = self._release()
+        self._held = [text[starts[-1]:]]
+        return ended
+
+    def _shape(self, chunk_data):
+        """``chunk_data`` with its thought parts reduced per ``self.thoughts``; None if nothing is left."""
+        candidates = []
+        for candidate in chunk_data.get('candidates', ()):
+            candidate = dict(candidate)
+            parts = []
+            for part in (candidate.get('content') or {}).get('parts', ()):
+                if not part.get('thought'):
+                    if self._held and part.get('text'):
+                        parts += self._release()
+                    parts.append(part)
+                elif self.thoughts in ('throttled', 'summary') and part.get('text'):
+                    self._held.append(part['text'])
+                    if self.thoughts == 'summary':
+                        parts += self._ended_thoughts()
+            if self.thoughts == 'throttled' and self._held and \
+                    (self._sent_at is None or self._clock() - self._sent_at >= self._interval):
+                parts += self._release()
+            if parts:
+                candidate['content'] = {**(candidate.get('content') or {}), 'parts': parts}
+            else:
+                candidate.pop('content', None)
+            if candidate:
+                candidates.append(candidate)
+        if not candidates:
+            return None
+        return {**chunk_data, 'candidates': candidates}
+
+    def grounding(self, line):
+        """Local grounding, given as the v1 line ``grounding_line`` builds."""
+        if self.protocol == 'v1':
+            return line
+        return self._join(self._encode(event) for event in chunk_events(json.loads(line)))
+
+    def chunk(self, chunk_data, usage=None):
+        self.chunks += 1
+        if usage is not None:
+            self.usage = usage
+        if self.thoughts != 'full':
+            chunk_data = self._shape(chunk_data)
+            if chunk_data is None:
+                return self._join([])
+        return self._emit(chunk_data)
+
+    def _emit(self, chunk_data):
+        if self.protocol == 'v1':
+            return json.dumps(chunk_data, ensure_ascii=False) + "\n"
+        return self._join(self._encode(event) for event in chunk_events(chunk_data))
+
+    def done(self):
+        # Thoughts still held back by throttling or summary
+        held = self._join([])
+        parts = self._release() if self._held else []
+        if parts:
+            held = self._emit({"chunk_index": self.chunks + 1, "candidates": [{"content": {"parts": parts}}]})
+        if self.protocol == 'v1':
+            return held
+        events = [usage_event(self.usage)] if self.usage is not None else []
+        events.append({'type': 'done', 'chunks': self.chunks})
+        return held + self._join(self._encode(event) for event in events)
+
+    def error(self, message):
+        if self.protocol == 'v1':
+            return json.dumps({'error': message}) + "\n"
+        return self._encode({'type': 'error', 'message': message})
+
+    def describe(self, data):
+        """``data`` as it should appear in the logs."""
+        if isinstance(data, bytes):
+            return f"<{len(data)} bytes of frames>"
+        return data.rstrip("\n")
@@ -0,0 +1,154 @@
+"""
+Time/size-windowed merging of model chunks before they reach the response.
+
+The model often streams many tiny chunks. Each one would otherwise become
+its own line, its own ``yield`` and its own network write. ``windowed``
+holds a chunk back for at most ``CW_STREAM_WINDOW_MS`` (30 ms). Any
+following chunks of the same kind (thought or answer text) are merged into
+it. The group is sent when:
+- the window closes;
+- it reaches ``CW_STREAM_WINDOW_BYTES`` (2048) bytes of text;
+- a chunk of another kind arrives, or one carrying grounding;
+- the stream ends or fails.
+
+A reader thread pulls the upstream chunks, so a window closes on time even
+while the model is quiet. It runs at most ``QUEUE_ITEMS`` chunks ahead of
+the response. When the response is closed early (the client went away),
+the reader stops and closes the upstream stream. If it is waiting on the
+model at that moment, it does so as soon as that chunk arrives; a running
+generator cannot be closed from another thread. ``CW_STREAM_WINDOW_MS=0``
+passes chunks straight through.
+
+Metrics: stream_window.flushes{reason=window|bytes|kind|end}.
+
+Usage:
+    for chunk_data, usage in windowed_chunks(pairs, STREAM_WINDOW_MS, STREAM_WINDOW_BYTES):
+        ...
+"""
+import queue
+import threading
+import time
+
+from common import metrics
+from common.settings import env_int
+
+STREAM_WINDOW_MS = env_int("CW_STREAM_WINDOW_MS", 30)
+STREAM_WINDOW_BYTES = env_int("CW_STREAM_WINDOW_BYTES", 2048)
+QUEUE_ITEMS = 64
+
+_END = object()
+
+
+def _put(inbox, entry, stop):
+    """Queue ``entry`` unless the consumer stops first; False if it did."""
+    while not stop.is_set():
+        try:
+            inbox.put(entry, timeout=0.05)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _read(items, inbox, stop):
+    iterator = iter(items)
+    try:
+        for item in iterator:
+            if not _put(inbox, (item, None), stop) or stop.is_set():
+                return
+    except Exception as e:
+        _put(inbox, (_END, e), stop)
+        return
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            close()
+    _put(inbox, (_END, None), stop)
+
+
+def windowed(items, kind, merge, size, window_ms, max_bytes, clock=time.monotonic):
+    """Yield ``items`` with runs of the same ``kind(item)`` merged by ``merge(a, b)``.
+
+    ``kind`` returning None means the item is never merged. ``size`` is what
+    counts towards ``max_bytes``.
+    """
+    if window_ms <= 0:
+        yield from items
+        return
+    window = window_ms / 1000
+    inbox, stop = queue.Queue(maxsize=QUEUE_ITEMS), threading.Event()
+    threading.Thread(target=_read, args=(items, inbox, stop), name="stream-window", daemon=True).start()
+
+    held, held_kind, deadline = None, None, None
+    try:
+        while True:
+            try:
+                item, error = inbox.get(timeout=max(deadline - clock(), 0)) if held is not None else inbox.get()
+            except queue.Empty:
+                metrics.inc('stream_window.flushes', reason='window')
+                yield held
+                held = None
+                continue
+            if item is _END:
+                if held is not None:
+                    metrics.inc('stream_window.flushes', reason='end')
+                    yield held
+                if error is not None:
+                    raise error
+                return
+            item_kind = kind(item)
+            if held is not None:
+                # A late wake-up must not stretch the window
+                if item_kind is not None and item_kind == held_kind and clock() < deadline:
+                    held = merge(held, item)
+                    if size(held) < max_bytes:
+                        continue
+                    metrics.inc('stream_window.flushes', reason='bytes')
+                    yield held
+                    held = None
+                    continue
+                metrics.inc('stream_window.flushes', reason='kind' if clock() < deadline else 'window')
+                yield held
+                held = None
+            if item_kind is None:
+                yield item
+            elif size(item) >= max_bytes:
+                metrics.inc('stream_window.flushes', reason='bytes')
+                yield item
+            else:
+                held, held_kind, deadline = item, item_kind, clock() + window
+    finally:
+        stop.set()
+
+
+def _parts(chunk_data):
+    return [part for candidate in chunk_data.get('candidates', ())
+            for part in (candidate.get('content') or {}).get('parts', ())]
+
+
+def chunk_kind(pair):
+    """``thought`` or ``text`` for a chunk carrying only that; None for anything else."""
+    chunk_data, _ = pair
+    candidates = chunk_data.get('candidates', ())
+    if len(candidates) != 1 or candidates[0].get('grounding_metadata'):
+        return None
+    kinds = {'thought' if part.get('thought') else 'text' for part in _parts(chunk_data)}
+    return kinds.pop() if len(kinds) == 1 else None
+
+
+def merge_chunks(first, second):
+    """One chunk with the text of both, keeping the first's index and the latest usage."""
+    (chunk_data, usage), (later, later_usage) = first, second
+    part = dict(_parts(chunk_data)[0])
+    part['text'] = "".join(p.get('text') or "" for p in _parts(chunk_data) + _parts(later))
+    merged = {**chunk_data, 'candidates': [{**chunk_data['candidates'][0], 'content': {'parts': [part]}}]}
+    return merged, later_usage if later_usage is not None else usage
+
+
+def chunk_bytes(pair):
+    return sum(len((part.get('text') or "").encode('utf-8')) for part in _parts(pair[0]))
+
+
+def windowed_chunks(pairs, window_ms=STREAM_WINDOW_MS, max_bytes=STREAM_WINDOW_BYTES):
+    """``windowed`` over ``(chunk_data, usage_metadata)`` pairs of serialized model chunks."""
+    return windowed(pairs, chunk_kind, merge_chunks, chunk_bytes, window_ms, max_bytes)
@@ -0,0 +1,124 @@
+"""
+Idempotent, step-timed instance warmup.
+
+Each function registers the steps its first request would otherwise pay
+for (imports, configs, prompts, client construction, connection priming)
+on a ``Warmup``. ``run()`` executes the steps that have not succeeded yet
+and reports how long each one took; steps that already succeeded are
+reported as ``cached``, so the ``warmup`` action can be called any number
+of times. ``CW_WARMUP_ON_STARTUP=1`` runs the full warmup in a background
+thread as soon as the instance imports the function.
+
+The priming call is chosen with ``CW_WARMUP_PRIME``:
+    model   GET the publisher model through the GenAI client (default). Loads
+            credentials, fetches an access token and opens the TLS connection
+            in the client's own pool.
+    none    skip priming.
+    <url>   HEAD the given https URL through the client's HTTP pool (TLS
+            handshake only, no credentials).
+"""
+import logging
+import threading
+import time
+
+from common.settings import env_bool, env_str
+
+WARMUP_ON_STARTUP = env_bool("CW_WARMUP_ON_STARTUP", False)
+WARMUP_PRIME = env_str("CW_WARMUP_PRIME", "model")
+
+_primed = {}
+_primed_lock = threading.Lock()
+
+
+class Warmup:
+    """Ordered warmup steps for one function."""
+
+    def __init__(self, function):
+        self.function = function
+        self._steps = []
+        self._done = {}  # step name -> ms it took when it succeeded
+        self._lock = threading.Lock()
+
+    def step(self, name, fn, network=False):
+        """Register ``fn`` as a step. Network steps are skipped by ``run(network=False)``."""
+        self._steps.append((name, fn, network))
+        return fn
+
+    def run(self, network=True):
+        """Run every step not yet completed and return the timing report."""
+        start = time.perf_counter()
+        report = []
+        with self._lock:
+            for name, fn, is_network in self._steps:
+                if name in self._done:
+                    report.append({'step': name, 'status': 'cached', 'ms': 0.0,
+                                   'first_ms': self._done[name]})
+                    continue
+                if is_network and not network:
+                    report.append({'step': name, 'status': 'skipped', 'ms': 0.0})
+                    continue
+
+                step_start = time.perf_counter()
+                entry = {'step': name}
+                try:
+                    detail = fn()
+                    entry['status'] = 'ok'
+                    if isinstance(detail, str):
+                        entry['detail'] = detail
+                except Exception as e:
+                    logging.warning(f"Warmup step '{name}' for {self.function} failed: {e}")
+                    entry['status'] = 'error'
+                    entry['error'] = str(e)
+                entry['ms'] = round((time.perf_counter() - step_start) * 1000, 1)
+                if entry['status'] == 'ok':
+                    self._done[name] = entry['ms']
+                report.append(entry)
+
+        total_ms = round((time.perf_counter() - start) * 1000, 1)
+        logging.info(f"Warmup for {self.function} finished in {total_ms} ms")
+        return {'function': self.function, 'steps': report, 'total_ms': total_ms}
+
+    @property
+    def complete(self):
+        return all(name in self._done for name, _, _ in self._steps)
+
+    def start_background(self):
+        """Run the full warmup in a daemon thread (instance startup hook)."""
+        thread = threading.Thread(
+            target=self.run, name=f"warmup-{self.function}", daemon=True
+        )
+        thread.start()
+        return thread
+
+
+def prime_client(client, model):
+    """Make one cheap call so the first real request skips auth and TLS setup.
+
+    Priming is per client, so functions that share a pooled client only pay
+    for it once. Returns a short description of what was primed.
+    """
+    target = WARMUP_PRIME
+    if target.lower() == "none":
+        return "disabled"
+
+    key = (id(client), target)
+    with _primed_lock:
+        if key in _primed:
+            return f"{_primed[key]} (shared client already primed)"
+
+        if target.lower() == "model":
+            client.models.get(model=model)
+            detail = f"GET model {model}"
+        else:
+            # Internal httpx pool of the SDK client, so the warmed connection
+            # is the one later requests reuse
+            client._api_client._httpx_client.head(target, timeout=10)
+            detail = f"HEAD {target}"
+        _primed[key] = detail
+    return detail
+
+
+def import_genai():
+    """Import the GenAI SDK (the lazy ``types`` proxies then resolve instantly)."""
+    import google.genai  # noqa: F401
+    import google.genai.types  # noqa: F401
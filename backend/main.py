@@ -0,0 +1,111 @@
+import functions_framework
+from flask import jsonify
+import os
+import sys
+import logging
+import importlib.util
+
+# --- Initialize Logging ---
+logging.basicConfig(level=logging.INFO)
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from common import metrics
+from common.admission import admit
+
+
+def _load_function_module(name, subdir):
+    """Import ``<subdir>/main.py`` under a unique module name.
+
+    All three functions ship a module called ``main``; loading them by path
+    lets one process host every handler. Each directory can still be
+    deployed on its own after ``vendor_common.py`` copies ``common`` into it.
+    """
+    path = os.path.join(BACKEND_DIR, subdir, "main.py")
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+# The handlers share clients through common.clients and their module-level
+# configs are built once, so every action below reuses the same objects.
+analysis = _load_function_module("analysis_main", "analysis-function")
+simulation = _load_function_module("simulation_main", "simulation-function")
+mentorship = _load_function_module("mentorship_main", "mentorship-function")
+
+# action -> handler(request_json, headers)
+ACTIONS = {
+    'chat': analysis.handle_chat,
+    'analyze': analysis.handle_analysis,
+    'supervisor_analysis': analysis.handle_supervisor_analysis,
+    'simulation_chat': simulation.handle_simulation_chat,
+    'mentorship_chat': mentorship.handle_mentorship_chat,
+}
+
+
+def warmup(network=True):
+    """Run every function's warmup; shared clients are only primed once."""
+    return {'functions': [module.warmup(network=network) for module in (analysis, simulation, mentorship)]}
+
+
+@functions_framework.http
+def cw_mentor_ai(request):
+    """
+    HTTP Cloud Function serving every analysis, simulation and mentorship action.
+    """
+    # --- CORS Handling ---
+    if request.method == 'OPTIONS':
+        headers = {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': 'GET, POST',
+            'Access-Control-Allow-Headers': 'Content-Type, Idempotency-Key',
+            'Access-Control-Max-Age': '3600'
+        }
+        return ('', 204, headers)
+
+    headers = {
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Allow-Methods': 'GET, POST',
+        'Access-Control-Allow-Headers': 'Content-Type, Idempotency-Key'
+    }
+
+    if request.method != 'POST':
+        logging.warning(f"Received non-POST request: {request.method}")
+        return (jsonify({'error': 'Method not allowed. Use POST.'}), 405, headers)
+
+    try:
+        request_json = request.get_json(silent=True)
+
+        if not request_json:
+            logging.warning("Request JSON missing.")
+            return (jsonify({'error': 'Missing JSON body'}), 400, headers)
+
+        analysis.apply_request_headers(request, request_json)
+
+        action = request_json.get('action')
+        if action == 'warmup':
+            return (jsonify(warmup()), 200, headers)
+        if action == 'metrics':
+            return (jsonify(metrics.snapshot()), 200, headers)
+        if action == 'simulation_start':
+            # Only schedules background work, so it skips admission
+            return simulation.handle_start(request_json, headers)
+
+        handler = ACTIONS.get(action)
+        if handler is None:
+            valid = ', '.join(f'"{name}"' for name in [*ACTIONS, 'simulation_start', 'warmup', 'metrics'])
+            return (jsonify({'error': f'Invalid action. Use one of {valid}'}), 400, headers)
+
+        # One admission controller per process: heavy analyses and chat
+        # turns are queued in separate lanes
+        if action in analysis.COALESCE_FIELDS:
+            return analysis.admit_coalesced(action, handler, request_json, headers)
+        return admit(action, handler, request_json, headers)
+
+    except Exception as e:
+        logging.exception(f"An unexpected error occurred: {str(e)}")
+        return (jsonify({'error': 'An internal server error occurred.'}), 500, headers)
@@ -1,14 +1,174 @@
 import functions_framework
 from flask import jsonify
-from google import genai
-from google.genai import types
 import os
+import sys
 import json
 import logging
 
+# Shared helpers live in backend/common. A vendored copy next to this file
+# wins; otherwise fall back to the repo layout.
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.append(BACKEND_DIR)
+
+from common import metrics
+from common.admission import admit
+from common.breaker import FallbackChain
+from common.clients import get_client
+from common.genai_config import SAFETY_SETTINGS
+from common.lazy import Lazy, lazy_import
+from common.rerank import RERANK_CANDIDATES, rerank, select
+from common.retrieval import LocalRetriever, format_context
+from common.retrieval_cache import RETRIEVAL_CACHE
+from common.router import ROUTER
+from common.settings import LAZY_INIT, env_int, env_str
+from common.warmup import WARMUP_ON_STARTUP, Warmup, import_genai, prime_client
+
+# Deferred until first use in lazy-init mode
+types = lazy_import("google.genai.types")
+
 # --- Initialize Logging ---
 logging.basicConfig(level=logging.INFO)
 
+PROJECT_ID = "gb-demos"
+MODEL_NAME = ROUTER.primary('mentorship_chat')
+CURRICULUM_RAG_CORPUS = "projects/gb-demos/locations/us-central1/ragCorpora/6917529027641081856"
+MENTORSHIP_TOP_K = env_int("CW_MENTORSHIP_TOP_K", 20)
+
+# tool:   the model retrieves MENTORSHIP_TOP_K passages from the RAG corpus itself
+# rerank: candidates from a local index of the mentorship materials are
+#         reranked here and only the passages that clear the adaptive cut go
+#         into the prompt. Turns where none do use the RAG tool as above.
+RETRIEVAL_MODE = env_str("CW_MENTORSHIP_RETRIEVAL", "tool").lower()
+# Built from the same materials as CURRICULUM_RAG_CORPUS with common.ingest;
+# not the analysis index, which holds the Arkansas curriculum
+MENTORSHIP_INDEX_PATH = env_str("CW_MENTORSHIP_INDEX",
+                                os.path.join(os.path.dirname(os.path.abspath(__file__)), "rag", "index.json"))
+MENTORSHIP_DATASTORE = f"local:{MENTORSHIP_INDEX_PATH}"
+MENTORSHIP_RETRIEVER = Lazy(lambda: LocalRetriever.load(MENTORSHIP_INDEX_PATH))
+
+# Reply used when every model's circuit is open, so the turn fails fast
+CANNED_REPLY = "I'm having trouble reaching my resources right now. Please try again in a minute or two."
+FALLBACK = FallbackChain.from_env('mentorship_chat', MODEL_NAME, f"{PROJECT_ID}/global", canned=CANNED_REPLY)
+
+# System instruction for PSU Social Work mentorship
+SYSTEM_INSTRUCTION = """# AI Mentor System Instruction: Portland State University Social Work "Friend in the Field"
+
+## Goal:
+
+To serve as an accessible, supportive, and knowledgeable AI mentor for social work students enrolled in Portland State University's (PSU) social work programs. The goal is to provide guidance, a sounding board, and practical "friend in the field" advice, deeply rooted in the context of PSU's curriculum, values, and the realities of social work practice.
+
+## Persona
+
+You are a compassionate, pragmatic, and encouraging social worker assistant. You embody the values of PSU's program, particularly its commitment to social justice, anti-oppressive practice, cultural humility, and evidence-informed approaches. You are empathetic, insightful, and approachable, offering a blend of academic insight and real-world wisdom. You understand the specific challenges and triumphs of social work education and early career practice. You are grounded in PSU's curriculum, and you answer questions based on this data. You must cite your responses to questions.
+
+## Instructions:
+
+* **Knowledge Base: Portland State University Social Work Curriculum:**
+  * **Oregon Context:** Offer insights relevant to social work practice within Oregon, if applicable to the discussion.
+* **Mentorship Style: "Friend in the Field":**
+  * **Supportive & Non-Judgmental:** Create a safe space for students to explore challenges, anxieties, and successes without fear of judgment.
+  * **Empathetic Listening:** Acknowledge and validate the student's feelings and experiences before offering advice.
+  * **Practical Guidance:** Offer actionable strategies and insights based on your "experience."
+  * **Encourage Critical Thinking:** Prompt students to reflect, analyze, and problem-solve independently, rather than just providing direct answers. Use questions like, "What are your initial thoughts on that?" or "How might a strengths-based lens apply here?"
+  * **Professional Boundaries:** Maintain the role of a mentor. Do not provide direct therapy, crisis intervention, or legal advice. If a student expresses a need for personal support or a real-world emergency, gently suggest they reach out to their academic advisor, field liaison, or university counseling services.
+  * **Confidentiality:** If a student shares details about a simulated client interaction, treat it with the utmost respect for confidentiality within the simulation's bounds.
+* **Types of Interactions:**
+  * **Coursework Questions:** Help students connect theoretical concepts to practice, discuss challenging assignments, or clarify understanding of PSU's curriculum.
+  * **Field Practicum Support:** Offer advice on navigating field placements, managing challenging client interactions (linking back to the simulation capabilities), understanding supervision, and integrating classroom learning.
+  * **Ethical Dilemmas:** Facilitate discussion around ethical principles (NASW Code of Ethics, PSU's anti-oppressive framework) and decision-making processes.
+  * **Self-Care & Burnout:** Emphasize the importance of self-care in social work and offer strategies.
+  * **Career Exploration:** Discuss potential career paths, licensure, and professional development.
+  * **Personal Growth:** Support students in reflecting on their professional identity, strengths, and areas for growth.
+* **Language & Tone:**
+  * **Professional yet Conversational:** Avoid overly academic jargon while still using appropriate social work terminology.
+  * **Warm and Approachable:** Use language that conveys empathy and understanding.
+  * **Reflective and Thoughtful:** Take a moment to "think" before responding, demonstrating a considered approach.
+* **Limitations:**
+  * **No Personal Information:** Do not ask for or store any real personal information from the student.
+  * **Simulated Only:** Clearly operate within the realm of a simulation. Do not claim to be a real human.
+  * **Not a Substitute for Supervision/Advising:** While you provide mentorship, you are not a replacement for official academic advisors, field instructors, or licensed supervisors. Always recommend they consult these real-world resources for formal guidance or critical issues.
+
+## Example Start (if user initiates with a general prompt):
+
+"Hey there! It's great to connect. I'm an AI assistant, and I'm here to offer some insights, support, or just be a sounding board as you navigate your studies and journey into the field. What's on your mind today? Are you grappling with a particular class, a situation in your practicum, or just thinking about what's next?"
+"""
+
+# Configure RAG tools
+RAG_TOOL = Lazy(lambda: types.Tool(
+    retrieval=types.Retrieval(
+        vertex_rag_store=types.VertexRagStore(
+            rag_resources=[
+                types.VertexRagStoreRagResource(
+                    rag_corpus=CURRICULUM_RAG_CORPUS
+                )
+            ],
+            similarity_top_k=MENTORSHIP_TOP_K,
+        )
+    )
+))
+
+# Generation settings never change between turns, so build them once
+GENERATE_CONTENT_CONFIG = Lazy(lambda: types.GenerateContentConfig(
+    temperature=0.7,
+    top_p=1,
+    seed=0,
+    max_output_tokens=4096,
+    safety_settings=SAFETY_SETTINGS.get(),
+    tools=[RAG_TOOL.get()],
+    system_instruction=[types.Part.from_text(text=SYSTEM_INSTRUCTION)],
+    thinking_config=types.ThinkingConfig(
+        thinking_budget=-1,
+    ),
+))
+
+
+# Reranked turns carry their passages in the prompt instead
+RERANK_CONFIG = Lazy(lambda: GENERATE_CONTENT_CONFIG.get().model_copy(update={'tools': None}))
+
+
+def reranked_context(message):
+    """Curriculum excerpts for ``message`` that clear the rerank cut ("" if none).
+
+    The selected passages are cached (see ``common.retrieval_cache``). ""
+    also when the mentorship index cannot be loaded.
+    """
+    try:
+        passages = RETRIEVAL_CACHE.get_or_compute(
+            MENTORSHIP_DATASTORE, message,
+            lambda: select(rerank(message, MENTORSHIP_RETRIEVER.get().search(message, k=RERANK_CANDIDATES))),
+            k=RERANK_CANDIDATES, rerank=True)
+    except (OSError, ValueError, KeyError) as e:
+        logging.warning(f"Mentorship index {MENTORSHIP_INDEX_PATH} unusable, using the RAG tool: {e}")
+        return ""
+    metrics.observe('mentorship.passages', len(passages))
+    return format_context(passages) if passages else ""
+
+
+def _warm_client():
+    try:
+        get_client(PROJECT_ID, "global")
+    except Exception as e:
+        logging.error(f"CRITICAL: Error initializing Google GenAI: {e}", exc_info=True)
+        raise
+
+
+WARMUP = Warmup('mentorship')
+WARMUP.step('imports', import_genai)
+WARMUP.step('configs', GENERATE_CONTENT_CONFIG.get)
+WARMUP.step('client', _warm_client)
+if RETRIEVAL_MODE == 'rerank':
+    WARMUP.step('local_rag', lambda: f"{len(MENTORSHIP_RETRIEVER.get().passages)} passages")
+WARMUP.step('connection', lambda: prime_client(get_client(PROJECT_ID, "global"), MODEL_NAME), network=True)
+
+
+def warmup(network=True):
+    """Run every warmup step that has not completed yet; returns per-step timings.
+
+    Called at import (without the network step) unless CW_LAZY_INIT is set.
+    """
+    return WARMUP.run(network=network)
+
 @functions_framework.http
 def mentorship_ai(request):
     """
@@ -41,7 +201,12 @@ def mentorship_ai(request):
             logging.warning("Request JSON missing.")
             return (jsonify({'error': 'Missing JSON body'}), 400, headers)
 
-        return handle_mentorship_chat(request_json, headers)
+        if request_json.get('action') == 'warmup':
+            return (jsonify(warmup()), 200, headers)
+        if request_json.get('action') == 'metrics':
+            return (jsonify(metrics.snapshot()), 200, headers)
+
+        return admit('mentorship_chat', handle_mentorship_chat, request_json, headers)
 
     except Exception as e:
         logging.exception(f"An unexpected error occurred: {str(e)}")
@@ -57,58 +222,6 @@ def handle_mentorship_chat(request_json, headers):
         if not message:
             return (jsonify({'error': 'Missing message field'}), 400, headers)
 
-        # Initialize the genai client
-        client = genai.Client(
-            vertexai=True,
-            project="gb-demos",
-            location="global",
-        )
-
-        # System instruction for PSU Social Work mentorship
-        si_text = """# AI Mentor System Instruction: Portland State University Social Work "Friend in the Field"
-
-## Goal:
-
-To serve as an accessible, supportive, and knowledgeable AI mentor for social work students enrolled in Portland State University's (PSU) social work programs. The goal is to provide guidance, a sounding board, and practical "friend in the field" advice, deeply rooted in the context of PSU's curriculum, values, and the realities of social work practice.
-
-## Persona
-
-You are a compassionate, pragmatic, and encouraging social worker assistant. You embody the values of PSU's program, particularly its commitment to social justice, anti-oppressive practice, cultural humility, and evidence-informed approaches. You are empathetic, insightful, and approachable, offering a blend of academic insight and real-world wisdom. You understand the specific challenges and triumphs of social work education and early career practice. You are grounded in PSU's curriculum, and you answer questions based on this data. You must cite your responses to questions.
-
-## Instructions:
-
-* **Knowledge Base: Portland State University Social Work Curriculum:**
-  * **Oregon Context:** Offer insights relevant to social work practice within Oregon, if applicable to the discussion.
-* **Mentorship Style: "Friend in the Field":**
-  * **Supportive & Non-Judgmental:** Create a safe space for students to explore challenges, anxieties, and successes without fear of judgment.
-  * **Empathetic Listening:** Acknowledge and validate the student's feelings and experiences before offering advice.
-  * **Practical Guidance:** Offer actionable strategies and insights based on your "experience."
-  * **Encourage Critical Thinking:** Prompt students to reflect, analyze, and problem-solve independently, rather than just providing direct answers. Use questions like, "What are your initial thoughts on that?" or "How might a strengths-based lens apply here?"
-  * **Professional Boundaries:** Maintain the role of a mentor. Do not provide direct therapy, crisis intervention, or legal advice. If a student expresses a need for personal support or a real-world emergency, gently suggest they reach out to their academic advisor, field liaison, or university counseling services.
-  * **Confidentiality:** If a student shares details about a simulated client interaction, treat it with the utmost respect for confidentiality within the simulation's bounds.
-* **Types of Interactions:**
-  * **Coursework Questions:** Help students connect theoretical concepts to practice, discuss challenging assignments, or clarify understanding of PSU's curriculum.
-  * **Field Practicum Support:** Offer advice on navigating field placements, managing challenging client interactions (linking back to the simulation capabilities), understanding supervision, and integrating classroom learning.
-  * **Ethical Dilemmas:** Facilitate discussion around ethical principles (NASW Code of Ethics, PSU's anti-oppressive framework) and decision-making processes.
-  * **Self-Care & Burnout:** Emphasize the importance of self-care in social work and offer strategies.
-  * **Career Exploration:** Discuss potential career paths, licensure, and professional development.
-  * **Personal Growth:** Support students in reflecting on their professional identity, strengths, and areas for growth.
-* **Language & Tone:**
-  * **Professional yet Conversational:** Avoid overly academic jargon while still using appropriate social work terminology.
-  * **Warm and Approachable:** Use language that conveys empathy and understanding.
-  * **Reflective and Thoughtful:** Take a moment to "think" before responding, demonstrating a considered approach.
-* **Limitations:**
-  * **No Personal Information:** Do not ask for or store any real personal information from the student.
-  * **Simulated Only:** Clearly operate within the realm of a simulation. Do not claim to be a real human.
-  * **Not a Substitute for Supervision/Advising:** While you provide mentorship, you are not a replacement for official academic advisors, field instructors, or licensed supervisors. Always recommend they consult these real-world resources for formal guidance or critical issues.
-
-## Example Start (if user initiates with a general prompt):
-
-"Hey there! It's great to connect. I'm an AI assistant, and I'm here to offer some insights, support, or just be a sounding board as you navigate your studies and journey into the field. What's on your mind today? Are you grappling with a particular class, a situation in your practicum, or just thinking about what's next?"
-"""
-
-        model = "gemini-2.5-flash"
-        
         # Build conversation history for context
         contents = []
         for msg in history:
@@ -118,65 +231,38 @@ You are a compassionate, pragmatic, and encouraging social worker assistant. You
                 parts=[types.Part.from_text(text=msg.get('parts', ''))]
             ))
         
+        # Reranked excerpts ride along with the current message. When none
+        # clear the cut, the model retrieves from the corpus as in tool mode
+        # so it still has something to cite.
+        config = GENERATE_CONTENT_CONFIG
+        prompt_text = message
+        if RETRIEVAL_MODE == 'rerank':
+            context = reranked_context(message)
+            if context:
+                config = RERANK_CONFIG
+                prompt_text = f"{message}\n\n{context}"
+            else:
+                metrics.inc('mentorship.rerank_fallback')
+
         # Add the current message
         contents.append(types.Content(
             role="user",
-            parts=[types.Part.from_text(text=message)]
+            parts=[types.Part.from_text(text=prompt_text)]
         ))
         
-        # Configure RAG tools
-        tools = [
-            types.Tool(
-                retrieval=types.Retrieval(
-                    vertex_rag_store=types.VertexRagStore(
-                        rag_resources=[
-                            types.VertexRagStoreRagResource(
-                                rag_corpus="projects/gb-demos/locations/us-central1/ragCorpora/6917529027641081856"
-                            )
-                        ],
-                        similarity_top_k=20,
-                    )
-                )
-            )
-        ]
-
-        # Configure generation settings
-        generate_content_config = types.GenerateContentConfig(
-            temperature=0.7,
-            top_p=1,
-            seed=0,
-            max_output_tokens=4096,
-            safety_settings=[
-                types.SafetySetting(
-                    category="HARM_CATEGORY_HATE_SPEECH",
-                    threshold="BLOCK_ONLY_HIGH"
-                ),
-                types.SafetySetting(
-                    category="HARM_CATEGORY_DANGEROUS_CONTENT",
-                    threshold="BLOCK_ONLY_HIGH"
-                ),
-                types.SafetySetting(
-                    category="HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                    threshold="BLOCK_MEDIUM_AND_ABOVE"
-                ),
-                types.SafetySetting(
-                    category="HARM_CATEGORY_HARASSMENT",
-                    threshold="BLOCK_ONLY_HIGH"
-                )
-            ],
-            tools=tools,
-            system_instruction=[types.Part.from_text(text=si_text)],
-            thinking_config=types.ThinkingConfig(
-                thinking_budget=-1,
-            ),
-        )
+        # Pick the model for this turn from its size and recent model latency
+        input_chars = len(message) + sum(len(msg.get('parts', '')) for msg in history)
+        route = ROUTER.route('mentorship_chat', input_chars)
 
         # Generate response
-        response = client.models.generate_content(
+        client = get_client(PROJECT_ID, "global")
+        response, model = FALLBACK.call(route.timed(lambda model: client.models.generate_content(
             model=model,
             contents=contents,
-            config=generate_content_config,
-        )
+            config=route.config(model, config.get()),
+        )), first=route.model)
+        if model == 'canned':
+            return (jsonify({'text': response, 'success': True, 'degraded': True}), 200, headers)
         
         # Extract text from response
         response_text = ""
@@ -188,9 +274,15 @@ You are a compassionate, pragmatic, and encouraging social worker assistant. You
         if not response_text:
             response_text = "I apologize, but I wasn't able to generate a response. Please try rephrasing your question."
         
-        logging.info("Mentorship chat response generated successfully")
+        logging.info(f"Mentorship chat response generated successfully ({model})")
         return (jsonify({'text': response_text, 'success': True}), 200, headers)
         
     except Exception as e:
         logging.exception(f"Error in handle_mentorship_chat: {str(e)}")
         return (jsonify({'error': f'Mentorship chat generation failed: {str(e)}'}), 500, headers)
+
+
+if not LAZY_INIT:
+    warmup(network=False)
+if WARMUP_ON_STARTUP:
+    WARMUP.start_background()
@@ -2,104 +2,343 @@
 """
 Script to rename files and folders in the RAG materials directory
 to make them filesystem-friendly.
+
+The whole target tree is planned first, from one ``os.scandir`` pass:
+- Every name is cleaned with ``clean_filename``, repeated until the name
+  stops changing, so a second run has nothing left to do.
+- Collisions are resolved deterministically. Within a directory, the
+  original names stay reserved, and renamed entries are taken in sorted
+  order. An entry whose cleaned name is taken gets ``_2``, ``_3``, ...
+  before its extension. Comparisons ignore case, for case-insensitive
+  filesystems.
+- The plan is written to a journal (JSON lines) before anything is renamed.
+  Each rename is then appended to it once done.
+- Renames run deepest first, so a directory is renamed only after
+  everything inside it. Renames at the same depth never touch each other's
+  paths, so each depth can be spread over ``--workers`` threads.
+
+A crashed run is finished with ``--resume``, or undone with ``--rollback``.
+Both read the journal. ``--dry-run`` prints the plan as old -> new paths
+and changes nothing.
+
+Usage:
+    python backend/rag/rename_files.py [root] [--dry-run] [--workers 8]
+    python backend/rag/rename_files.py [root] --resume | --rollback
 """
+import argparse
+import json
 import os
 import re
-from pathlib import Path
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import groupby
+
+JOURNAL_VERSION = 1
+
+
+class JournalError(Exception):
+    pass
+
+
+_DATE = re.compile(r'\(([A-Z]+)\s+(\d{2})\.(\d{2})\.(\d{4})\)')
+_UNDERSCORES = re.compile(r'_+')
+_UNDERSCORE_BEFORE_EXT = re.compile(r'_+\.')
+_NUMBERED_PREFIX = re.compile(r'^(\d+)\.')
+
 
 def clean_filename(filename):
     """Clean a filename to make it filesystem-friendly."""
     # Extract date patterns like (KP 03.24.2025) and convert to _KP_2025-03-24
-    date_pattern = r'\(([A-Z]+)\s+(\d{2})\.(\d{2})\.(\d{4})\)'
-    filename = re.sub(date_pattern, r'_\1_\4-\2-\3', filename)
-    
+    filename = _DATE.sub(r'_\1_\4-\2-\3', filename)
+
     # Remove any remaining parentheses
     filename = filename.replace('(', '').replace(')', '')
-    
+
     # Replace & with and
     filename = filename.replace('&', 'and')
-    
+
     # Replace spaces with underscores
     filename = filename.replace(' ', '_')
-    
+
     # Replace multiple underscores with single
-    filename = re.sub(r'_+', '_', filename)
-    
+    filename = _UNDERSCORES.sub('_', filename)
+
     # Remove trailing underscores before extension
-    filename = re.sub(r'_+\.', '.', filename)
-    
+    filename = _UNDERSCORE_BEFORE_EXT.sub('.', filename)
+
     # Clean up numbered prefixes (e.g., "1." becomes "1_")
-    filename = re.sub(r'^(\d+)\.', r'\1_', filename)
-    
+    filename = _NUMBERED_PREFIX.sub(r'\1_', filename)
+
     return filename
 
-def get_all_paths(root_dir):
-    """Get all file and directory paths, sorted by depth (deepest first)."""
-    all_paths = []
-    
-    for dirpath, dirnames, filenames in os.walk(root_dir):
-        # Add directories
-        for dirname in dirnames:
-            full_path = os.path.join(dirpath, dirname)
-            all_paths.append((full_path, 'dir'))
-        
-        # Add files
-        for filename in filenames:
-            full_path = os.path.join(dirpath, filename)
-            all_paths.append((full_path, 'file'))
-    
-    # Sort by depth (deepest first) to avoid breaking paths
-    all_paths.sort(key=lambda x: x[0].count(os.sep), reverse=True)
-    
-    return all_paths
-
-def rename_path(old_path, path_type):
-    """Rename a single file or directory."""
-    old_name = os.path.basename(old_path)
-    new_name = clean_filename(old_name)
-    
-    if old_name == new_name:
-        return old_path  # No change needed
-    
-    parent_dir = os.path.dirname(old_path)
-    new_path = os.path.join(parent_dir, new_name)
-    
-    # Check if new path already exists
-    if os.path.exists(new_path):
-        print(f"Warning: {new_path} already exists, skipping rename of {old_path}")
-        return old_path
-    
+
+@lru_cache(maxsize=65536)
+def target_name(name):
+    """``clean_filename`` repeated until stable ("1. Intro" -> "1__Intro" -> "1_Intro")."""
+    cleaned = clean_filename(name)
+    while cleaned != name:
+        name, cleaned = cleaned, clean_filename(cleaned)
+    return cleaned
+
+
+def scan(root):
+    """``{relative_dir: [(name, is_dir)]}`` for the whole tree, in one scandir pass."""
+    tree = {}
+    stack = ['']
+    while stack:
+        relative = stack.pop()
+        entries = []
+        with os.scandir(os.path.join(root, relative)) as it:
+            for entry in it:
+                is_dir = entry.is_dir(follow_symlinks=False)
+                entries.append((entry.name, is_dir))
+                if is_dir:
+                    stack.append(os.path.join(relative, entry.name))
+        tree[relative] = entries
+    return tree
+
+
+def _with_suffix(name, n, is_dir):
+    stem, ext = (name, '') if is_dir else os.path.splitext(name)
+    return f"{stem}_{n}{ext}"
+
+
+def resolve_names(entries):
+    """``{old: new}`` for the entries of one directory that need renaming."""
+    taken = {name.casefold() for name, _ in entries}
+    renames = {}
+    for name, is_dir in sorted(entries):
+        target = target_name(name)
+        if target == name:
+            continue
+        candidate, n = target, 2
+        while candidate.casefold() in taken:
+            candidate = _with_suffix(target, n, is_dir)
+            n += 1
+        taken.add(candidate.casefold())
+        renames[name] = candidate
+    return renames
+
+
+def plan(root):
+    """Rename operations for ``root``, deepest first.
+
+    Each op is ``{"id", "dir", "old", "new", "depth"}``. ``dir`` is the
+    parent's original relative path, which is still its path when the op
+    runs, because parents are renamed after their children.
+    """
+    ops = []
+    for relative, entries in scan(root).items():
+        depth = 0 if relative == '' else relative.count(os.sep) + 1
+        for old, new in resolve_names(entries).items():
+            ops.append({"dir": relative, "old": old, "new": new, "depth": depth})
+    ops.sort(key=lambda op: (-op["depth"], op["dir"], op["old"]))
+    for i, op in enumerate(ops):
+        op["id"] = i
+    return ops
+
+
+def final_paths(ops):
+    """``[(old_path, new_path)]`` relative to the root, as the tree looks once every op ran."""
+    renamed = {os.path.join(op["dir"], op["old"]): op["new"] for op in ops}
+
+    def new_path(path):
+        if not path:
+            return path
+        parent, name = os.path.split(path)
+        return os.path.join(new_path(parent), renamed.get(path, name))
+
+    return sorted((os.path.join(op["dir"], op["old"]), new_path(os.path.join(op["dir"], op["old"]))) for op in ops)
+
+
+# --- Journal ---
+def write_journal(path, root, ops):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({"version": JOURNAL_VERSION, "root": os.path.abspath(root), "ops": len(ops)}) + "\n")
+        for op in ops:
+            f.write(json.dumps({"op": op}, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read_journal(path):
+    """``(header, ops, done_ids)``; a line torn by a crash is ignored.
+
+    ``header["status"]`` is ``complete``, ``rolled_back`` or ``unfinished``.
+    """
+    ops, done, status = [], set(), "unfinished"
+    with open(path, encoding='utf-8') as f:
+        header = json.loads(f.readline())
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if "op" in record:
+                ops.append(record["op"])
+            elif "done" in record:
+                done.add(record["done"])
+            elif "status" in record:
+                status = record["status"]
+    if header.get("version") != JOURNAL_VERSION:
+        raise JournalError(f"{path}: unsupported journal version {header.get('version')}")
+    header["status"] = status
+    return header, ops, done
+
+
+class _JournalWriter:
+    """Appends records to the journal from any thread.
+
+    Records are buffered and written at the end of each depth level. A crash
+    can lose the last few, which is safe: resume and rollback check each op
+    against the filesystem rather than trusting the records.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8')
+        if self._file.tell():
+            # End a line torn by a crash so the next record starts cleanly
+            with open(path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self._file.write("\n")
+
+    def record(self, **fields):
+        line = json.dumps(fields) + "\n"
+        with self._lock:
+            self._file.write(line)
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+
+# --- Applying ---
+def _rename(root, op, reverse=False):
+    """Run one op (or undo it). Returns False if it had already happened."""
+    parent = os.path.join(root, op["dir"])
+    source, target = (op["new"], op["old"]) if reverse else (op["old"], op["new"])
+    source, target = os.path.join(parent, source), os.path.join(parent, target)
+    if os.path.lexists(target):
+        if not os.path.lexists(source):
+            return False  # crashed after the rename, before its record was written
+        raise JournalError(f"{target} already exists; not renaming {source}")
+    os.rename(source, target)
+    return True
+
+
+def apply(root, ops, journal_path, done=(), workers=1):
+    """Run the ops not in ``done``, deepest first, journaling each one. Returns the number run."""
+    done = set(done)
+    journal = _JournalWriter(journal_path)
+    count = 0
+
+    def run(op):
+        renamed = _rename(root, op)
+        journal.record(done=op["id"])
+        return renamed
+
     try:
-        os.rename(old_path, new_path)
-        print(f"Renamed: {old_name} -> {new_name}")
-        return new_path
-    except Exception as e:
-        print(f"Error renaming {old_path}: {e}")
-        return old_path
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            for _, level in groupby(ops, key=lambda op: op["depth"]):
+                pending = [op for op in level if op["id"] not in done]
+                # A depth level must finish before its parents are renamed
+                count += sum(pool.map(run, pending))
+                journal.flush()
+        journal.record(status="complete")
+    finally:
+        journal.close()
+    return count
+
+
+def rollback(root, journal_path):
+    """Undo the journaled run, shallowest first. Returns the number undone.
+
+    Every planned op is checked on disk, so renames whose records were lost
+    in a crash are undone too.
+    """
+    _, ops, _ = read_journal(journal_path)
+    journal = _JournalWriter(journal_path)
+    count = 0
+    try:
+        for op in reversed(ops):
+            if os.path.lexists(os.path.join(root, op["dir"], op["new"])):
+                count += _rename(root, op, reverse=True)
+        journal.record(status="rolled_back")
+    finally:
+        journal.close()
+    return count
+
+
+def default_journal(root):
+    # Next to the tree, not inside it
+    return f"{os.path.abspath(root).rstrip(os.sep)}.rename-journal.jsonl"
+
 
 def main():
     """Main function to rename all files and directories."""
-    root_dir = "backend/rag/materials"
-    
+    parser = argparse.ArgumentParser(description="Rename the materials tree to filesystem-friendly names.")
+    parser.add_argument("root", nargs="?", default="backend/rag/materials")
+    parser.add_argument("--journal", default=None, help="journal path (default: <root>.rename-journal.jsonl)")
+    parser.add_argument("--workers", type=int, default=1, help="threads per depth level")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--dry-run", action="store_true", help="print the planned renames and exit")
+    mode.add_argument("--resume", action="store_true", help="finish the run recorded in the journal")
+    mode.add_argument("--rollback", action="store_true", help="undo the renames recorded in the journal")
+    args = parser.parse_args()
+
+    root_dir = args.root
+    journal_path = args.journal or default_journal(root_dir)
     if not os.path.exists(root_dir):
         print(f"Error: Directory {root_dir} does not exist!")
-        return
-    
-    print(f"Starting to rename files in {root_dir}...")
-    print("-" * 50)
-    
-    # Get all paths sorted by depth
-    all_paths = get_all_paths(root_dir)
-    
-    # Rename each path
-    renamed_count = 0
-    for old_path, path_type in all_paths:
-        new_path = rename_path(old_path, path_type)
-        if old_path != new_path:
-            renamed_count += 1
-    
-    print("-" * 50)
-    print(f"Renaming complete! Renamed {renamed_count} items.")
+        return 1
+
+    if args.rollback:
+        print(f"Rolled back {rollback(root_dir, journal_path)} renames.")
+        return 0
+
+    if args.resume:
+        _, ops, done = read_journal(journal_path)
+        count = apply(root_dir, ops, journal_path, done=done, workers=args.workers)
+        print(f"Resumed: {count} renames run, {len(done)} already done.")
+        return 0
+
+    if not args.dry_run and os.path.exists(journal_path):
+        header, _, _ = read_journal(journal_path)
+        if header["status"] == "unfinished":
+            print(f"Error: {journal_path} records an unfinished run; use --resume or --rollback.")
+            return 1
+
+    started = time.perf_counter()
+    ops = plan(root_dir)
+    planned = time.perf_counter() - started
+    if args.dry_run:
+        for old, new in final_paths(ops):
+            print(f"{old} -> {new}")
+        print(f"{len(ops)} renames planned in {planned:.2f}s (dry run, nothing changed).")
+        return 0
+
+    if not ops:
+        # Keep the previous journal so its run can still be rolled back
+        print("Nothing to rename.")
+        return 0
+
+    print(f"Starting to rename {len(ops)} items in {root_dir}...")
+    write_journal(journal_path, root_dir, ops)
+    count = apply(root_dir, ops, journal_path, workers=args.workers)
+    print(f"Renaming complete! Renamed {count} items in {time.perf_counter() - started:.2f}s. "
+          f"Journal: {journal_path}")
+    return 0
+
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -1,14 +1,167 @@
 import functions_framework
 from flask import jsonify
-from google import genai
-from google.genai import types
 import os
+import sys
 import json
 import logging
+from functools import lru_cache
+
+# Shared helpers live in backend/common. A vendored copy next to this file
+# wins; otherwise fall back to the repo layout.
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.append(BACKEND_DIR)
+
+from common import metrics
+from common.admission import admit
+from common.breaker import FallbackChain
+from common.clients import get_client
+from common.genai_config import SAFETY_SETTINGS
+from common.hedging import HedgePolicy
+from common.lazy import Lazy, lazy_import
+from common.personas import PERSONA_PACKS, format_pack
+from common.prefetch import Prefetcher
+from common.router import ROUTER
+from common.settings import LAZY_INIT, env_bool, env_float
+from common.warmup import WARMUP_ON_STARTUP, Warmup, import_genai, prime_client
+
+# Deferred until first use in lazy-init mode
+types = lazy_import("google.genai.types")
 
 # --- Initialize Logging ---
 logging.basicConfig(level=logging.INFO)
 
+PROJECT_ID = "gb-demos"
+MODEL_NAME = ROUTER.primary('simulation_chat')
+SCENARIO_RAG_CORPUS = "projects/gb-demos/locations/us-central1/ragCorpora/4611686018427387904"
+
+# Optional hedging of slow turns: after the CW_HEDGE_PERCENTILE latency a
+# duplicate request is sent and the first answer wins, capped at
+# CW_HEDGE_BUDGET extra requests per turn
+HEDGE = HedgePolicy(
+    'simulation_chat',
+    enabled=env_bool("CW_HEDGE_SIMULATION", False),
+    percentile=env_float("CW_HEDGE_PERCENTILE", 95.0),
+    default_delay=env_float("CW_HEDGE_DEFAULT_DELAY_S", 4.0),
+    budget=env_float("CW_HEDGE_BUDGET", 0.05),
+)
+
+# `start` prefetches a session in the background; its first turn waits at
+# most this long for the prefetch before going ahead without it
+PREFETCH_WAIT_S = env_float("CW_PREFETCH_WAIT_S", 10.0)
+SESSIONS = Prefetcher('simulation')
+
+# Reply used when every model's circuit is open, so the turn fails fast
+CANNED_REPLY = "Sorry, I lost my train of thought for a moment. Could you say that again?"
+FALLBACK = FallbackChain.from_env('simulation_chat', MODEL_NAME, f"{PROJECT_ID}/global", canned=CANNED_REPLY)
+
+# System instruction for simulation role-play
+SYSTEM_INSTRUCTION = """# AI Simulation System Instruction: Social Work Client Role-Play
+
+## Core Directive:
+You are an AI actor portraying a client in a social work simulation. Your entire personality, history, and current situation are defined exclusively by the documents provided in the context. You must fully embody the role of the person described in these files.
+
+## Persona and Context:
+- **Source of Truth:** The retrieved documents (case files, progress reports, screenings, etc.) are your complete memory and identity. Do not invent any details about your life, feelings, or history that are not supported by or cannot be reasonably inferred from these documents.
+- **Scenario Identification:** The name of the folder from which these documents were retrieved is the name of your character or the title of the scenario. You will see this passed in the prompt.
+- **Embodiment:** Your responses should reflect the personality, emotional state, and life circumstances detailed in the files. If the files describe you as angry and distrustful, you must act that way. If they describe you as anxious and overwhelmed, your responses should reflect that.
+
+## Interaction Rules:
+- **Role-Play:** You are to engage in a realistic conversation with a social work student. The student will be practicing their engagement and assessment skills.
+- **Do Not Break Character:** You are the client. Do not refer to yourself as an AI, a model, or a simulation. Do not give the student feedback on their performance. Your role is to act, not to coach.
+- **Natural Conversation:** Respond to the student's questions and statements as the client would. Your goal is to make the simulation feel as real as possible for the student.
+- **Ending the Simulation:** The simulation will conclude when the student indicates they are finished or after a reasonable amount of time has passed (e.g., the student says "Thank you, that's all I have for today"). You can also naturally end the conversation if it feels appropriate for your character (e.g., "I have to go now" or "I'm not talking about this anymore").
+
+## Example Prompt Structure (what the backend will send you):
+"**Scenario:** [Folder Name/Scenario Name]
+**User (Social Worker):** [The student's message]
+**Retrieved Documents:** [Content of the case files for this scenario]"
+"""
+
+# Configure RAG tools for scenarios
+RAG_TOOL = Lazy(lambda: types.Tool(
+    retrieval=types.Retrieval(
+        vertex_rag_store=types.VertexRagStore(
+            rag_resources=[
+                types.VertexRagStoreRagResource(
+                    rag_corpus=SCENARIO_RAG_CORPUS
+                )
+            ],
+        )
+    )
+))
+
+# Generation settings never change between turns, so build them once
+GENERATE_CONTENT_CONFIG = Lazy(lambda: types.GenerateContentConfig(
+    temperature=0.8,
+    top_p=1,
+    seed=0,
+    max_output_tokens=4096,
+    safety_settings=SAFETY_SETTINGS.get(),
+    tools=[RAG_TOOL.get()],
+    system_instruction=[types.Part.from_text(text=SYSTEM_INSTRUCTION)],
+    thinking_config=types.ThinkingConfig(
+        thinking_budget=-1,
+    ),
+))
+
+
+
+@lru_cache(maxsize=64)
+def persona_config(scenario_id):
+    """Turn config pinning the scenario's persona pack, or None without a pack.
+
+    The pack stands in for the retrieved documents, so the retrieval tool is
+    left off. Packs do not change while the instance runs.
+    """
+    pack = PERSONA_PACKS.get(scenario_id)
+    if pack is None:
+        return None
+    base = GENERATE_CONTENT_CONFIG.get()
+    return base.model_copy(update={
+        'tools': None,
+        'system_instruction': [*base.system_instruction, types.Part.from_text(text=format_pack(pack))],
+    })
+
+
+def _warm_client():
+    try:
+        get_client(PROJECT_ID, "global")
+    except Exception as e:
+        logging.error(f"CRITICAL: Error initializing Google GenAI: {e}", exc_info=True)
+        raise
+
+
+WARMUP = Warmup('simulation')
+WARMUP.step('imports', import_genai)
+WARMUP.step('configs', GENERATE_CONTENT_CONFIG.get)
+WARMUP.step('client', _warm_client)
+WARMUP.step('connection', lambda: prime_client(get_client(PROJECT_ID, "global"), MODEL_NAME), network=True)
+
+
+def warmup(network=True):
+    """Run every warmup step that has not completed yet; returns per-step timings.
+
+    Called at import (without the network step) unless CW_LAZY_INIT is set.
+    """
+    return WARMUP.run(network=network)
+
+
+def prefetch_scenario(scenario_id):
+    """Everything a scenario's first turn needs: warmup, client connection and persona pack."""
+    WARMUP.run(network=True)
+    return 'pack' if persona_config(scenario_id) else 'rag'
+
+
+def handle_start(request_json, headers):
+    """Start prefetching a simulation session; returns its token without waiting."""
+    scenario_id = request_json.get('scenario_id', '')
+    if not scenario_id:
+        return (jsonify({'error': 'Missing scenario_id field'}), 400, headers)
+    token = SESSIONS.start(prefetch_scenario, scenario_id)
+    logging.info(f"Simulation session started for scenario '{scenario_id}'")
+    return (jsonify({'session_token': token, 'scenario_id': scenario_id, 'success': True}), 200, headers)
+
 @functions_framework.http
 def simulation_ai(request):
     """
@@ -41,7 +194,16 @@ def simulation_ai(request):
             logging.warning("Request JSON missing.")
             return (jsonify({'error': 'Missing JSON body'}), 400, headers)
 
-        return handle_simulation_chat(request_json, headers)
+        if request_json.get('action') == 'warmup':
+            return (jsonify(warmup()), 200, headers)
+        if request_json.get('action') == 'metrics':
+            return (jsonify(metrics.snapshot()), 200, headers)
+        # The combined service names it simulation_start; accept both so the
+        # frontend can point at either layout
+        if request_json.get('action') in ('start', 'simulation_start'):
+            return handle_start(request_json, headers)
+
+        return admit('simulation_chat', handle_simulation_chat, request_json, headers)
 
     except Exception as e:
         logging.exception(f"An unexpected error occurred: {str(e)}")
@@ -60,38 +222,11 @@ def handle_simulation_chat(request_json, headers):
         if not scenario_id:
             return (jsonify({'error': 'Missing scenario_id field'}), 400, headers)
 
-        # Initialize the genai client
-        client = genai.Client(
-            vertexai=True,
-            project="gb-demos",
-            location="global",
-        )
-
-        # System instruction for simulation role-play
-        si_text = """# AI Simulation System Instruction: Social Work Client Role-Play
-
-## Core Directive:
-You are an AI actor portraying a client in a social work simulation. Your entire personality, history, and current situation are defined exclusively by the documents provided in the context. You must fully embody the role of the person described in these files.
-
-## Persona and Context:
-- **Source of Truth:** The retrieved documents (case files, progress reports, screenings, etc.) are your complete memory and identity. Do not invent any details about your life, feelings, or history that are not supported by or cannot be reasonably inferred from these documents.
-- **Scenario Identification:** The name of the folder from which these documents were retrieved is the name of your character or the title of the scenario. You will see this passed in the prompt.
-- **Embodiment:** Your responses should reflect the personality, emotional state, and life circumstances detailed in the files. If the files describe you as angry and distrustful, you must act that way. If they describe you as anxious and overwhelmed, your responses should reflect that.
-
-## Interaction Rules:
-- **Role-Play:** You are to engage in a realistic conversation with a social work student. The student will be practicing their engagement and assessment skills.
-- **Do Not Break Character:** You are the client. Do not refer to yourself as an AI, a model, or a simulation. Do not give the student feedback on their performance. Your role is to act, not to coach.
-- **Natural Conversation:** Respond to the student's questions and statements as the client would. Your goal is to make the simulation feel as real as possible for the student.
-- **Ending the Simulation:** The simulation will conclude when the student indicates they are finished or after a reasonable amount of time has passed (e.g., the student says "Thank you, that's all I have for today"). You can also naturally end the conversation if it feels appropriate for your character (e.g., "I have to go now" or "I'm not talking about this anymore").
+        # The first turn of a started session picks up its prefetch
+        session_token = request_json.get('session_token')
+        if session_token:
+            SESSIONS.wait(session_token, PREFETCH_WAIT_S)
 
-## Example Prompt Structure (what the backend will send you):
-"**Scenario:** [Folder Name/Scenario Name]
-**User (Social Worker):** [The student's message]
-**Retrieved Documents:** [Content of the case files for this scenario]"
-"""
-
-        model = "gemini-2.5-flash"
-        
         # Build conversation history for context
         contents = []
         for msg in history:
@@ -108,58 +243,28 @@ You are an AI actor portraying a client in a social work simulation. Your entire
             parts=[types.Part.from_text(text=prompt_text)]
         ))
         
-        # Configure RAG tools for scenarios
-        tools = [
-            types.Tool(
-                retrieval=types.Retrieval(
-                    vertex_rag_store=types.VertexRagStore(
-                        rag_resources=[
-                            types.VertexRagStoreRagResource(
-                                rag_corpus="projects/gb-demos/locations/us-central1/ragCorpora/4611686018427387904"
-                            )
-                        ],
-                    )
-                )
-            )
-        ]
-
-        # Configure generation settings
-        generate_content_config = types.GenerateContentConfig(
-            temperature=0.8,
-            top_p=1,
-            seed=0,
-            max_output_tokens=4096,
-            safety_settings=[
-                types.SafetySetting(
-                    category="HARM_CATEGORY_HATE_SPEECH",
-                    threshold="BLOCK_ONLY_HIGH"
-                ),
-                types.SafetySetting(
-                    category="HARM_CATEGORY_DANGEROUS_CONTENT",
-                    threshold="BLOCK_ONLY_HIGH"
-                ),
-                types.SafetySetting(
-                    category="HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                    threshold="BLOCK_MEDIUM_AND_ABOVE"
-                ),
-                types.SafetySetting(
-                    category="HARM_CATEGORY_HARASSMENT",
-                    threshold="BLOCK_ONLY_HIGH"
-                )
-            ],
-            tools=tools,
-            system_instruction=[types.Part.from_text(text=si_text)],
-            thinking_config=types.ThinkingConfig(
-                thinking_budget=-1,
-            ),
-        )
+        # A precompiled persona pack replaces per-turn retrieval of the case files
+        config = persona_config(scenario_id)
+        context = 'pack' if config else 'rag'
+        config = config or GENERATE_CONTENT_CONFIG.get()
+
+        # Pick the model for this turn from its size and recent model latency
+        input_chars = len(prompt_text) + sum(len(msg.get('parts', '')) for msg in history)
+        route = ROUTER.route('simulation_chat', input_chars)
 
         # Generate response
-        response = client.models.generate_content(
+        client = get_client(PROJECT_ID, "global")
+        response, model = FALLBACK.call(route.timed(lambda model: HEDGE.call(lambda: client.models.generate_content(
             model=model,
             contents=contents,
-            config=generate_content_config,
-        )
+            config=route.config(model, config),
+        ))), first=route.model)
+        metrics.inc('simulation.turns', context=context)
+        if model == 'canned':
+            return (jsonify({'text': response, 'success': True, 'degraded': True}), 200, headers)
+        usage = getattr(response, 'usage_metadata', None)
+        if usage and getattr(usage, 'prompt_token_count', None):
+            metrics.observe('simulation.input_tokens', usage.prompt_token_count, context=context)
         
         # Extract text from response
         response_text = ""
@@ -171,9 +276,15 @@ You are an AI actor portraying a client in a social work simulation. Your entire
         if not response_text:
             response_text = "I'm not sure what to say right now. Could you try asking me something else?"
         
-        logging.info("Simulation chat response generated successfully")
+        logging.info(f"Simulation chat response generated successfully ({model})")
         return (jsonify({'text': response_text, 'success': True}), 200, headers)
         
     except Exception as e:
         logging.exception(f"Error in handle_simulation_chat: {str(e)}")
         return (jsonify({'error': f'Simulation chat generation failed: {str(e)}'}), 500, headers)
+
+
+if not LAZY_INIT:
+    warmup(network=False)
+if WARMUP_ON_STARTUP:
+    WARMUP.start_background()
@@ -0,0 +1,156 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from common import metrics
+from common.admission import AdmissionController, AdmissionRejected, Lane
+
+
+def controller(heavy_limit=1, heavy_queue=2, heavy_wait=0.5, interactive_limit=2):
+    return AdmissionController(lanes=[
+        Lane('heavy', limit=heavy_limit, max_queue=heavy_queue, max_wait=heavy_wait),
+        Lane('interactive', limit=interactive_limit, max_queue=4, max_wait=0.5),
+    ])
+
+
+def test_chat_is_not_blocked_by_busy_heavy_lane():
+    ctl = controller()
+    analysis = ctl.acquire('analyze')
+
+    start = time.monotonic()
+    with ctl.acquire('simulation_chat'):
+        pass
+    assert time.monotonic() - start < 0.05
+    analysis.release()
+
+
+def test_queue_overflow_is_rejected_immediately_with_retry_after():
+    ctl = controller(heavy_queue=0)
+    held = ctl.acquire('analyze')
+
+    start = time.monotonic()
+    with pytest.raises(AdmissionRejected) as exc:
+        ctl.acquire('analyze')
+    assert time.monotonic() - start < 0.05
+    assert exc.value.reason == 'queue full'
+    assert exc.value.retry_after >= 1
+    held.release()
+
+
+def test_wait_is_bounded():
+    ctl = controller(heavy_wait=0.1)
+    held = ctl.acquire('analyze')
+    with pytest.raises(AdmissionRejected) as exc:
+        ctl.acquire('analyze')
+    assert exc.value.reason == 'wait timed out'
+    held.release()
+    # the timed-out waiter must not have leaked a queue slot
+    assert ctl.lanes['heavy'].queued == 0
+    with ctl.acquire('analyze'):
+        pass
+
+
+def test_queued_requests_are_served_by_priority():
+    ctl = controller(heavy_limit=1, heavy_queue=4, heavy_wait=2)
+    held = ctl.acquire('analyze')
+    order = []
+
+    def worker(action):
+        with ctl.acquire(action):
+            order.append(action)
+
+    threads = [threading.Thread(target=worker, args=('supervisor_analysis',))]
+    threads[0].start()
+    time.sleep(0.05)
+    threads.append(threading.Thread(target=worker, args=('analyze',)))
+    threads[1].start()
+    time.sleep(0.05)
+
+    held.release()
+    for thread in threads:
+        thread.join(2)
+    # analyze outranks supervisor_analysis even though it queued later
+    assert order == ['analyze', 'supervisor_analysis']
+
+
+def test_async_acquire_shares_lanes_with_sync_callers():
+    ctl = controller()
+    held = ctl.acquire('analyze')
+
+    async def scenario():
+        waiting = asyncio.ensure_future(ctl.acquire_async('analyze'))
+        await asyncio.sleep(0.05)
+        assert ctl.lanes['heavy'].queued == 1
+        held.release()
+        ticket = await waiting
+        ticket.release()
+
+    asyncio.run(scenario())
+    assert ctl.lanes['heavy'].active == 0
+
+
+def test_cancelled_async_waiter_does_not_leak_its_slot():
+    ctl = controller(heavy_queue=4)
+    lane = ctl.lanes['heavy']
+    held = ctl.acquire('analyze')
+
+    async def scenario():
+        queued = asyncio.ensure_future(ctl.acquire_async('analyze'))
+        granted = asyncio.ensure_future(ctl.acquire_async('analyze'))
+        await asyncio.sleep(0.05)
+        assert lane.queued == 2
+
+        # Cancelled while still queued
+        queued.cancel()
+        await asyncio.gather(queued, return_exceptions=True)
+        assert lane.queued == 1
+
+        # Cancelled after the slot was handed over, before it woke up
+        held.release()
+        granted.cancel()
+        await asyncio.gather(granted, return_exceptions=True)
+        assert (lane.active, lane.queued) == (0, 0)
+
+        ticket = await asyncio.wait_for(ctl.acquire_async('analyze'), 0.1)
+        ticket.release()
+
+    asyncio.run(scenario())
+    assert (lane.active, lane.queued) == (0, 0)
+
+
+def test_metrics_report_queue_depth_and_wait():
+    metrics.reset()
+    ctl = controller(heavy_wait=1)
+    held = ctl.acquire('analyze')
+    waiter = threading.Thread(target=lambda: ctl.acquire('analyze').release())
+    waiter.start()
+    time.sleep(0.05)
+    assert metrics.gauge('admission.queue_depth', lane='heavy') == 1
+    held.release()
+    waiter.join(1)
+
+    snap = metrics.snapshot()
+    assert snap['gauges']['admission.queue_depth{lane=heavy}'] == 0
+    assert snap['histograms']['admission.wait_ms{lane=heavy}']['count'] == 2
+    assert snap['histograms']['admission.wait_ms{lane=heavy}']['max'] >= 40
+
+
+def test_http_overflow_returns_429_with_retry_after(monkeypatch):
+    from flask import Flask, request
+
+    import main as service
+    from common import admission
+
+    monkeypatch.setattr(admission, 'ADMISSION', AdmissionController(lanes=[
+        Lane('heavy', limit=0, max_queue=0, max_wait=0),
+        Lane('interactive', limit=0, max_queue=0, max_wait=0),
+    ]))
+    app = Flask(__name__)
+    body = {'action': 'simulation_chat', 'message': 'hi', 'scenario_id': 'cooper'}
+    with app.test_request_context(json=body, method='POST'):
+        response, status, headers = service.cw_mentor_ai(request)
+    assert status == 429
+    assert int(headers['Retry-After']) >= 1
+    assert response.get_json()['retryAfter'] == int(headers['Retry-After'])
@@ -0,0 +1,68 @@
+import json
+
+import numpy as np
+
+from benchmarks.retrieval_data import recorded_passages
+from common.ann import AnnIndex, build_ann, occurrence_keys, open_ann
+from common.embeddings import EmbeddingStore, build_store
+from common.retrieval import LocalRetriever, ann_path_for, passage_text, store_path_for, tokenize
+
+
+def synthetic(rng, vocab, count):
+    return [" ".join(rng.choice(vocab, 40)) for _ in range(count)]
+
+
+def test_update_inserts_new_rows_and_drops_removed_ones(tmp_path):
+    rng = np.random.default_rng(0)
+    vocab = sorted({t for p in recorded_passages() for t in tokenize(passage_text(p))})
+    texts = synthetic(rng, vocab, 2000)
+    store_dir, ann_dir = str(tmp_path / "embeddings"), str(tmp_path / "ann")
+    build_store(store_dir, texts, dim=128)
+    first = build_ann(ann_dir, EmbeddingStore(store_dir))
+
+    # The same text twice still gets one entry per row
+    changed = texts[50:] + synthetic(rng, vocab, 30) + texts[60:62]
+    build_store(store_dir, changed, dim=128)
+    store = EmbeddingStore(store_dir)
+    update = build_ann(ann_dir, store)
+    index = AnnIndex(ann_dir)
+
+    assert first['trained'] and not update['trained']
+    assert (update['inserted'], update['removed']) == (32, 50)
+    assert sorted(index.rows.tolist()) == list(range(len(changed)))
+    assert len(set(occurrence_keys(store.hashes).tolist())) == len(changed)
+    # Probing every list with a full rescore is exact
+    query = store.embed(tokenize(changed[-35]))
+    rows, _ = index.search(store, query, 5, nprobe=index.meta['nlist'], refine=len(changed))
+    assert rows.tolist() == store.top_k(query, 5)[0].tolist()
+
+
+def test_retriever_uses_the_index_unless_asked_for_exact(tmp_path):
+    passages = recorded_passages()
+    index_path = str(tmp_path / "index.json")
+    with open(index_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': 1, 'passages': passages}, f)
+    build_store(store_path_for(index_path), [passage_text(p) for p in passages], dim=256)
+    build_ann(ann_path_for(index_path), EmbeddingStore(store_path_for(index_path)), nlist=4)
+
+    retriever = LocalRetriever.load(index_path)
+    query = "DHS 1536 pamphlet parent rights"
+
+    assert retriever.vectors.ann is not None
+    assert len(retriever.search(query, k=5, mode='vector', nprobe=1)) <= 5
+    assert retriever.search(query, k=5, mode='vector', nprobe=0) == \
+        retriever.search(query, k=5, mode='vector', nprobe=4)
+
+
+def test_index_is_not_used_with_a_store_it_was_not_built_from(tmp_path):
+    texts = [passage_text(p) for p in recorded_passages()]
+    index_path = str(tmp_path / "index.json")
+    build_store(store_path_for(index_path), texts, dim=128)
+    build_ann(ann_path_for(index_path), EmbeddingStore(store_path_for(index_path)), nlist=4)
+    assert open_ann(index_path, EmbeddingStore(store_path_for(index_path))) is not None
+
+    # Same row count, one passage in the middle edited
+    texts[len(texts) // 2] += " revised"
+    build_store(store_path_for(index_path), texts, dim=128)
+
+    assert open_ann(index_path, EmbeddingStore(store_path_for(index_path))) is None
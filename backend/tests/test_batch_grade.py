@@ -0,0 +1,109 @@
+import importlib.util
+import json
+import os
+import time
+
+import pytest
+
+import main as service  # noqa: F401  (loads analysis_main for the batch module)
+from common.breaker import reset_breakers
+from common.fakes import FakeClient
+from conftest import BACKEND_DIR
+
+spec = importlib.util.spec_from_file_location(
+    "batch_grade", os.path.join(BACKEND_DIR, "analysis-function", "batch_grade.py"))
+batch_grade = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(batch_grade)
+
+
+class ServerError(Exception):
+    def __init__(self, code):
+        super().__init__(f"{code} from Vertex AI")
+        self.code = code
+
+
+def item(name):
+    return {"id": name, "transcript": [{"role": "user", "parts": f"Hi, I'm {name} from CPS."}],
+            "assessment": {"introduction": "ok"}}
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers():
+    reset_breakers()
+    yield
+    reset_breakers()
+
+
+@pytest.fixture
+def cohort(tmp_path):
+    source = tmp_path / "cohort.jsonl"
+    source.write_text("".join(json.dumps(item(f"student-{i}")) + "\n" for i in range(6)))
+    return source
+
+
+def read(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_torn_line_is_terminated_before_appending(tmp_path):
+    out = tmp_path / "grades.jsonl"
+    out.write_text('{"id": "a", "status": "ok"}\n{"id": "b", "sta')
+    batch_grade._terminate_torn_line(str(out))
+    assert out.read_text().endswith('"sta\n')
+
+
+def test_grades_cohort_with_analysis_prompt_and_totals_tokens(cohort, tmp_path):
+    out = tmp_path / "grades.jsonl"
+    client = FakeClient(latency=0.02)
+
+    summary = batch_grade.run_batch(str(cohort), str(out), client=client, concurrency=3, rate=0)
+
+    records = read(out)
+    assert sorted(r["id"] for r in records) == [f"student-{i}" for i in range(6)]
+    assert all(r["status"] == "ok" for r in records)
+    assert records[0]["analysis"]["strengths"] == ["Introduced self"]
+    assert records[0]["grounding_chunks"][0]["retrieved_context"]["page_span"] == {"first_page": 3, "last_page": 4}
+    assert summary["ok"] == 6
+    assert summary["total_tokens"] == 6 * 1540
+    # Same prompt as handle_analysis
+    prompt = client.calls[0].contents[0].parts[0].text
+    assert "Analyze this social work parent interview transcript" in prompt
+    assert "from CPS." in prompt
+
+
+def test_resume_skips_finished_items_and_retries_transient_errors(cohort, tmp_path):
+    out = tmp_path / "grades.jsonl"
+    out.write_text(json.dumps({"id": "student-0", "status": "ok"}) + "\n"
+                   + json.dumps({"id": "student-1", "status": "error"}) + "\n"
+                   + '{"id": "student-2", "sta')  # torn line from a crash
+    # The first attempt fails on both models, so it is retried
+    client = FakeClient(error=lambda model, n: ServerError(503) if n <= 2 else None)
+
+    summary = batch_grade.run_batch(str(cohort), str(out), client=client, concurrency=1, rate=0, backoff=0.01)
+
+    assert summary["skipped"] == 1
+    assert summary["ok"] == 5
+    assert client.count() == 7
+    new_records = [json.loads(line) for line in out.read_text().splitlines()[3:]]
+    assert len(new_records) == 5
+    assert sum(r["attempts"] == 2 for r in new_records) == 1
+    assert batch_grade.finished_ids(str(out)) == {f"student-{i}" for i in range(6)}
+
+
+def test_client_errors_are_not_retried(cohort, tmp_path):
+    out = tmp_path / "grades.jsonl"
+    client = FakeClient(error=lambda model, n: ServerError(400))
+
+    summary = batch_grade.run_batch(str(cohort), str(out), client=client, concurrency=2, rate=0, retries=3)
+
+    assert summary["error"] == 6
+    assert all(r["attempts"] == 1 for r in read(out))
+    assert client.count() == 6
+
+
+def test_rate_limiter_spaces_out_starts():
+    limiter = batch_grade.RateLimiter(rate=50, burst=1)
+    start = time.monotonic()
+    for _ in range(6):
+        limiter.acquire()
+    assert time.monotonic() - start >= 0.09
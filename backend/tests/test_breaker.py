@@ -0,0 +1,141 @@
+import time
+
+import pytest
+from flask import Flask
+
+import main as service
+from common import metrics
+from common.breaker import CLOSED, HALF_OPEN, OPEN, FallbackChain, FallbackExhausted, get_breaker, reset_breakers
+from common.fakes import FakeClient
+
+
+class ServerError(Exception):
+    def __init__(self, code):
+        super().__init__(f"{code} from Vertex AI")
+        self.code = code
+
+
+def failing(models, code=503):
+    """Error injector: every call to one of ``models`` fails with ``code``."""
+    return lambda model, call_number: ServerError(code) if model in models else None
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers():
+    reset_breakers()
+    metrics.reset()
+    yield
+    reset_breakers()
+
+
+def generate(client):
+    return lambda model: client.models.generate_content(model=model, contents='hi')
+
+
+def test_open_circuit_skips_failing_model_without_calling_it():
+    client = FakeClient(latency=0.05, error=failing({'flash'}))
+    chain = FallbackChain('test', ['flash', 'lite'], 'ep')
+
+    for _ in range(5):
+        _, model = chain.call(generate(client))
+        assert model == 'lite'
+    assert get_breaker('flash', 'ep').state == OPEN
+    assert metrics.gauge('breaker.state', model='flash', endpoint='ep') == 2
+
+    calls_before = client.count()
+    start = time.monotonic()
+    _, model = chain.call(generate(client))
+    assert model == 'lite'
+    # Only the fallback was called; the open circuit cost no round trip
+    assert client.count() == calls_before + 1
+    assert time.monotonic() - start < 0.09
+    assert metrics.counter('breaker.short_circuited', model='flash', endpoint='ep') == 1
+
+
+def test_half_open_probe_closes_circuit_on_success():
+    broken = {'flash'}
+    client = FakeClient(error=lambda model, n: ServerError(503) if model in broken else None)
+    chain = FallbackChain('test', ['flash', 'lite'], 'ep')
+    breaker = get_breaker('flash', 'ep')
+    breaker.reset_timeout = 0.05
+    for _ in range(breaker.failure_threshold):
+        chain.call(generate(client))
+    assert breaker.state == OPEN
+
+    time.sleep(0.06)
+    assert chain.call(generate(client))[1] == 'lite'  # probe failed
+    assert breaker.state == OPEN
+
+    broken.clear()
+    time.sleep(0.06)
+    assert chain.call(generate(client))[1] == 'flash'  # probe succeeded
+    assert breaker.state == CLOSED
+
+
+def test_half_open_allows_a_single_probe():
+    breaker = get_breaker('flash', 'ep')
+    breaker.reset_timeout = 0.0
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+
+
+def test_client_errors_do_not_trip_the_breaker():
+    client = FakeClient(error=failing({'flash'}, code=400))
+    chain = FallbackChain('test', ['flash', 'lite'], 'ep')
+
+    for _ in range(10):
+        with pytest.raises(ServerError):
+            chain.call(generate(client))
+    assert get_breaker('flash', 'ep').state == CLOSED
+    assert client.count() == 10
+
+
+def test_canned_response_when_every_circuit_is_open():
+    client = FakeClient(error=failing({'flash', 'lite'}, code=429))
+    chain = FallbackChain('test', ['flash', 'lite'], 'ep', canned='canned reply')
+    for _ in range(5):
+        chain.call(generate(client))
+
+    assert chain.call(generate(client)) == ('canned reply', 'canned')
+    assert client.count() == 10
+    with pytest.raises(FallbackExhausted):
+        FallbackChain('bare', ['flash', 'lite'], 'ep').call(generate(client))
+
+
+def test_stream_falls_back_before_first_chunk():
+    client = FakeClient(error=failing({'flash'}))
+    chain = FallbackChain('test', ['flash', 'lite'], 'ep')
+
+    chunks = list(chain.stream(lambda model: client.models.generate_content_stream(model=model, contents='x')))
+
+    assert len(chunks) == 4
+    assert [call.model for call in client.calls] == ['flash', 'lite']
+    assert metrics.counter('fallback.served', chain='test', tier='lite') == 1
+
+
+def test_simulation_turn_degrades_to_canned_reply(monkeypatch):
+    fake = FakeClient(latency=0.05, error=lambda model, n: ServerError(503))
+    monkeypatch.setattr(service.simulation, "get_client", lambda project, location: fake)
+    app = Flask(__name__)
+    body = {'action': 'simulation_chat', 'message': 'Hello', 'scenario_id': 'home-visit'}
+
+    def turn():
+        with app.test_request_context(json=body, method='POST'):
+            from flask import request
+            start = time.monotonic()
+            response, status, _ = service.simulation.simulation_ai(request)
+            return response.get_json(), status, time.monotonic() - start
+
+    for _ in range(5):
+        turn()
+    result, status, elapsed = turn()
+
+    assert status == 200
+    assert result['degraded'] is True
+    assert result['text'] == service.simulation.CANNED_REPLY
+    assert elapsed < 0.05
+    assert fake.count() == 10
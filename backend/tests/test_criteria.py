@@ -0,0 +1,57 @@
+import json
+
+import pytest
+from flask import Flask
+
+import main as service
+from benchmarks.retrieval_data import recorded_passages
+from common.criteria import CRITERIA, CriteriaMap, build_criteria_map
+from common.fakes import FakeClient
+from common.lazy import Lazy
+from common.retrieval import LocalRetriever, passage_key
+
+analysis = service.analysis
+
+
+@pytest.fixture(scope="module")
+def artifact():
+    return build_criteria_map(LocalRetriever(recorded_passages()), k=3)
+
+
+def test_each_criterion_gets_distinct_shared_passages(artifact):
+    passages = artifact['passages']
+
+    assert [c['name'] for c in artifact['criteria']] == [name for name, _ in CRITERIA]
+    assert all(len(c['passages']) == 3 for c in artifact['criteria'])
+    assert len({passage_key(p) for p in passages}) == len(passages)
+    # Citation numbers follow first use, so every passage is referenced
+    assert sorted({i for c in artifact['criteria'] for i in c['passages']}) == list(range(len(passages)))
+    next_steps = artifact['criteria'][-1]['passages']
+    assert "6_Initial_Contact_Guide_KP_2025-07-01" in {passages[i]['title'] for i in next_steps}
+
+
+def test_criteria_mode_injects_the_same_citations_for_every_analysis(monkeypatch, artifact, tmp_path):
+    path = tmp_path / "criteria.json"
+    path.write_text(json.dumps(artifact))
+    criteria_map = CriteriaMap.load(str(path))
+    fake = FakeClient()
+    monkeypatch.setattr(analysis.client, "get", lambda: fake)
+    monkeypatch.setattr(analysis, "RAG_MODE", "criteria")
+    monkeypatch.setattr(analysis, "CRITERIA_MAP", Lazy(lambda: criteria_map))
+    monkeypatch.setattr(analysis, "CRITERIA_GROUNDING", Lazy(lambda: analysis.grounding_line(criteria_map.passages)))
+
+    first_lines = []
+    for text in ("Hi, I'm from CPS. May I come in?", "Here is the DHS 1536 pamphlet about your rights."):
+        payload = {"action": "analyze", "assessment": {}, "transcript": [{"role": "user", "parts": text}]}
+        with Flask(__name__).test_request_context(json=payload, method="POST"):
+            from flask import request
+            response = analysis.social_work_ai(request)
+            first_lines.append(response.get_data(as_text=True).splitlines()[0])
+            response.close()
+
+    assert first_lines[0] == first_lines[1]
+    assert len(json.loads(first_lines[0])["candidates"][0]["grounding_metadata"]["grounding_chunks"]) == \
+        len(artifact['passages'])
+    prompt = fake.calls[0].contents[0].parts[0].text
+    assert "- Process & Next Steps: [" in prompt
+    assert not fake.calls[0].config.tools
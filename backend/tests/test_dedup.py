@@ -0,0 +1,88 @@
+import json
+import random
+
+import numpy as np
+
+from common.dedup import (MinHasher, by_preference, find_exclusions, near_duplicate_groups, revision_date, shingles,
+                          similarity)
+from common.retrieval import LocalRetriever, passage_key
+
+rng = random.Random(3)
+VOCABULARY = [f"word{i}" for i in range(2000)]
+
+
+def text(words=300):
+    return " ".join(rng.choice(VOCABULARY) for _ in range(words))
+
+
+def revise(original, rate=0.01):
+    return " ".join(rng.choice(VOCABULARY) if rng.random() < rate else w for w in original.split())
+
+
+def doc(title, *texts):
+    uri = f"gs://bucket/Curriculum/{title}.pdf"
+    return [{"title": title, "uri": uri, "text": t, "page_span": {"first_page": i, "last_page": i}}
+            for i, t in enumerate(texts, start=1)]
+
+
+def test_minhash_estimates_jaccard():
+    a = shingles(text(400))
+    b = set(list(a)[:300]) | {h + 1 for h in list(a)[300:]}
+    hasher = MinHasher(256)
+    true = len(a & b) / len(a | b)
+    assert abs(similarity(hasher.signature(a), hasher.signature(b)) - true) < 0.08
+
+
+def test_lsh_groups_only_near_duplicates():
+    hasher = MinHasher()
+    base = [text() for _ in range(50)]
+    texts = base + [revise(t) for t in base[:10]]
+    signatures = np.array([hasher.signature(shingles(t)) for t in texts])
+
+    groups = near_duplicate_groups(signatures, threshold=0.7)
+
+    assert sorted(sorted(g) for g in groups) == [[i, 50 + i] for i in range(10)]
+
+
+def test_revision_date():
+    assert revision_date("Intro_to_EE_Curriculum_KP_2025-03-24.docx") == "2025-03-24"
+    assert revision_date("9_Child_Int._Tips_and_Rules_Half_Sheet") == ""
+    # Files not yet renamed by rag/rename_files.py
+    assert revision_date("2. Intro to EE Curriculum (KP 03.24.2025).pdf") == "2025-03-24"
+    assert revision_date("Unit 1 (KP 01.10.2025)/Guide_KP_2025-07-01") == "2025-07-01"
+    assert [revision_date(item['title']) for item in by_preference(
+        [{'title': "Guide (KP 12.01.2024)"}, {'title': "Guide_KP_2025-03-24"}, {'title': "Guide (KP 07.01.2025)"}])] == \
+        ["2025-07-01", "2025-03-24", "2024-12-01"]
+
+
+def test_newest_revision_is_canonical_and_shared_passages_kept_once(tmp_path):
+    page1, page2, quoted = text(), text(), text(120)
+    passages = (doc("Intro_Curriculum_KP_2025-03-24", page1, page2)
+                + doc("Intro_Curriculum_KP_2025-05-07", revise(page1), revise(page2))
+                + doc("Intro_Curriculum", page1, page2)
+                + doc("Initial_Contact_Guide_KP_2025-07-01", text(), quoted)
+                + doc("Unrelated_Tips", text(), text(200) + " " + quoted))
+
+    exclusions = find_exclusions(passages)
+
+    assert [g["title"] for g in exclusions["documents"]] == ["Intro_Curriculum_KP_2025-05-07"]
+    assert sorted(d["title"] for d in exclusions["documents"][0]["excluded"]) == \
+        ["Intro_Curriculum", "Intro_Curriculum_KP_2025-03-24"]
+    # Tips only quotes part of the guide's passage, so nothing is dropped
+    assert exclusions["excluded_passages"] == []
+
+    passages += doc("Quoted_Again", quoted)
+    exclusions = find_exclusions(passages)
+    assert exclusions["excluded_passages"] == [passage_key(passages[-1])]
+
+    index = tmp_path / "index.json"
+    index.write_text(json.dumps({"version": 1, "passages": passages}))
+    (tmp_path / "exclusions.json").write_text(json.dumps(exclusions))
+    titles = {p["title"] for p in LocalRetriever.load(str(index)).passages}
+    assert titles == {"Intro_Curriculum_KP_2025-05-07", "Initial_Contact_Guide_KP_2025-07-01", "Unrelated_Tips"}
+
+
+def test_distinct_documents_are_not_grouped():
+    passages = [p for i in range(30) for p in doc(f"Doc_{i}", text(), text())]
+    exclusions = find_exclusions(passages)
+    assert exclusions["excluded_uris"] == [] and exclusions["excluded_passages"] == []
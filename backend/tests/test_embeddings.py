@@ -0,0 +1,58 @@
+import json
+import os
+
+from benchmarks.retrieval_data import recorded_passages
+from common.embeddings import EmbeddingStore, build_store, texts_digest
+from common.retrieval import LocalRetriever, passage_key, passage_text, store_path_for, tokenize
+
+
+def test_rebuild_encodes_only_changed_text(tmp_path):
+    texts = [passage_text(p) for p in recorded_passages()]
+    directory = str(tmp_path / "embeddings")
+
+    first = build_store(directory, texts, dim=256, dtype='int8')
+    changed = list(reversed(texts))
+    changed[0] = "a brand new passage about safety planning"
+    second = build_store(directory, changed, dim=256, dtype='int8')
+
+    assert first['encoded'] == len(texts)
+    assert (second['encoded'], second['reused']) == (1, len(texts) - 1)
+    store = EmbeddingStore(directory)
+    assert store.vectors.dtype.name == 'int8' and store.matches(changed)
+    assert store.search(tokenize("safety planning brand new"), 3)[0][0] == 0
+
+
+def test_index_load_searches_the_store_without_excluded_passages(tmp_path):
+    passages = recorded_passages()
+    index = str(tmp_path / "index.json")
+    with open(index, 'w', encoding='utf-8') as f:
+        json.dump({'version': 1, 'passages': passages}, f)
+    build_store(store_path_for(index), [passage_text(p) for p in passages], dim=512)
+    query = "DHS 1536 pamphlet parent rights"
+    best, runner_up = LocalRetriever.load(index).search(query, k=2, mode='vector')
+    with open(os.path.join(tmp_path, "exclusions.json"), 'w', encoding='utf-8') as f:
+        json.dump({'excluded_uris': [], 'excluded_passages': [passage_key(best)]}, f)
+
+    retriever = LocalRetriever.load(index)
+    hits = retriever.search(query, k=5, mode='vector')
+
+    assert isinstance(retriever.vectors, EmbeddingStore)
+    assert len(retriever.passages) == len(passages) - 1
+    assert passage_key(best) not in {passage_key(hit) for hit in hits}
+    assert hits[0] == runner_up
+
+
+def test_store_is_rejected_when_a_middle_passage_changes(tmp_path):
+    passages = recorded_passages()
+    index = str(tmp_path / "index.json")
+    build_store(store_path_for(index), [passage_text(p) for p in passages], dim=256)
+    # What ingest writes after a content edit when run without --embeddings
+    edited = [dict(p) for p in passages]
+    edited[len(edited) // 2]['text'] = "an edited passage about home visits"
+    texts = [passage_text(p) for p in edited]
+
+    for digest in (texts_digest(texts), None):
+        with open(index, 'w', encoding='utf-8') as f:
+            json.dump({'version': 1, 'passages': edited, **({'digest': digest} if digest else {})}, f)
+        assert not isinstance(LocalRetriever.load(index).vectors, EmbeddingStore)
+    assert not EmbeddingStore(store_path_for(index)).matches(texts)
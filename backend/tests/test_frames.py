@@ -0,0 +1,34 @@
+import pytest
+
+from common import frames
+from common.frames import decode_frames, frame, packb, unpackb
+
+
+@pytest.fixture
+def pure_python(monkeypatch):
+    monkeypatch.setattr(frames, "msgpack", None)
+
+
+def test_codec_round_trips_every_width(pure_python):
+    values = [None, True, False, 0, 127, 128, 255, 256, 65535, 65536, 2**32, 2**64 - 1,
+              -1, -32, -33, -128, -129, -32768, -32769, -2**31 - 1, -2**63, 0.5, -1e300,
+              "", "x" * 31, "x" * 32, "é" * 200, "x" * 70000, b"\x00\xff", b"y" * 300,
+              list(range(15)), list(range(16)), list(range(70000)),
+              {str(i): i for i in range(15)}, {str(i): [i, {"n": None}] for i in range(20)}]
+
+    for value in values:
+        assert unpackb(packb(value)) == value
+    # Spot-check against the MessagePack spec
+    assert packb({"type": "done", "chunks": 4}) == b"\x82\xa4type\xa4done\xa6chunks\x04"
+    assert packb(-33) == b"\xd0\xdf"
+    with pytest.raises(TypeError):
+        packb(object())
+
+
+def test_truncated_stream_is_an_error(pure_python):
+    data = frame({"type": "text_delta", "text": "a"}) + frame({"type": "done", "chunks": 1})
+
+    assert list(decode_frames([data[:5], data[5:]])) == [{"type": "text_delta", "text": "a"},
+                                                         {"type": "done", "chunks": 1}]
+    with pytest.raises(ValueError):
+        list(decode_frames([data[:-1]]))
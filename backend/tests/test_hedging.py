@@ -0,0 +1,64 @@
+import itertools
+import time
+
+from common import metrics
+from common.fakes import FakeClient
+from common.hedging import HedgePolicy
+from common.metrics import percentile
+
+
+def heavy_tailed(every=20, fast=0.01, slow=0.4):
+    """One call in ``every`` stalls (a 5% tail by default)."""
+    calls = itertools.count(1)
+    return lambda model: slow if next(calls) % every == 0 else fast
+
+
+def run(policy, client, n):
+    latencies = []
+    for _ in range(n):
+        start = time.monotonic()
+        policy.call(lambda: client.models.generate_content(model='m', contents='hi'))
+        latencies.append(time.monotonic() - start)
+    return sorted(latencies)
+
+
+def test_hedging_cuts_tail_latency_of_heavy_tailed_client():
+    baseline = run(HedgePolicy('off', enabled=False), FakeClient(latency=heavy_tailed()), 150)
+
+    metrics.reset()
+    policy = HedgePolicy('sim', percentile=90, min_samples=20, default_delay=0.05,
+                         min_delay=0.02, budget=0.15)
+    client = FakeClient(latency=heavy_tailed())
+    hedged = run(policy, client, 150)
+
+    assert percentile(baseline, 99) > 0.35
+    assert percentile(hedged, 99) < percentile(baseline, 99) / 2
+    assert metrics.counter('hedging.hedge_wins', policy='sim') > 0
+    assert metrics.counter('hedging.hedged', policy='sim') <= 0.15 * 150 + policy.burst
+
+
+def test_hedge_budget_caps_extra_requests():
+    metrics.reset()
+    policy = HedgePolicy('capped', min_samples=1000, default_delay=0.005, budget=0.05, burst=1)
+    client = FakeClient(latency=0.02)  # every call is "slow"
+    run(policy, client, 40)
+
+    hedged = metrics.counter('hedging.hedged', policy='capped')
+    assert hedged <= 1 + 0.05 * 40
+    assert metrics.counter('hedging.budget_denied', policy='capped') >= 40 - hedged
+    time.sleep(0.05)  # let abandoned attempts finish
+    assert client.count() == 40 + hedged
+
+
+def test_failed_attempt_falls_back_to_the_other():
+    policy = HedgePolicy('errors', min_samples=1000, default_delay=0.01, burst=5)
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            time.sleep(0.05)
+            raise RuntimeError('primary failed')
+        return 'ok'
+
+    assert policy.call(flaky) == 'ok'
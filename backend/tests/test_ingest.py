@@ -0,0 +1,114 @@
+import json
+import os
+import zipfile
+
+import pytest
+
+from common.documents import chunk_pages
+from common.ingest import ingest
+from common.retrieval import LocalRetriever
+
+W = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+PARAGRAPH = "The caseworker explains the reason for contact and the parent's rights. "
+
+
+def write_docx(path, pages):
+    breaks = '<w:p><w:r><w:br w:type="page"/></w:r></w:p>'.join(
+        f'<w:p><w:r><w:t>{text}</w:t></w:r></w:p>' for text in pages)
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("word/document.xml", f'<w:document {W}><w:body>{breaks}</w:body></w:document>')
+
+
+@pytest.fixture
+def materials(tmp_path):
+    root = tmp_path / "materials"
+    (root / "Unit_1").mkdir(parents=True)
+    write_docx(root / "Unit_1" / "Guide_KP_2025-07-01.docx", [PARAGRAPH * 3, "Leave the DHS 1536 pamphlet."])
+    (root / "Unit_1" / "Tips.txt").write_text("Ground rules: it's okay to say I don't know.")
+    (root / "Notes.md").write_text(PARAGRAPH * 40)
+    return root
+
+
+def run(materials, tmp_path, **kwargs):
+    return ingest(str(materials), out=str(tmp_path / "index.json"), max_chars=400, overlap=80, **kwargs)
+
+
+def passages(tmp_path):
+    with open(tmp_path / "index.json") as f:
+        return json.load(f)["passages"]
+
+
+def test_first_run_extracts_pages_with_overlapping_chunks(materials, tmp_path):
+    summary = run(materials, tmp_path, workers=1)
+
+    assert summary["processed"] == 3 and summary["reused"] == 0
+    index = passages(tmp_path)
+    guide = [p for p in index if p["title"] == "Guide_KP_2025-07-01"]
+    assert guide[-1]["page_span"] == {"first_page": 2, "last_page": 2}
+    assert guide[-1]["uri"].endswith("/Curriculum/Unit_1/Guide_KP_2025-07-01.docx")
+    notes = [p["text"] for p in index if p["title"] == "Notes"]
+    assert len(notes) > 2 and all(len(text) <= 400 for text in notes)
+    # Each chunk starts with the end of the one before it
+    assert notes[1][:40] in notes[0]
+    assert LocalRetriever(index).search("DHS 1536 pamphlet", k=1)[0]["title"] == "Guide_KP_2025-07-01"
+
+
+def test_rerun_only_reprocesses_changed_files(materials, tmp_path):
+    run(materials, tmp_path, workers=1)
+    before = passages(tmp_path)
+
+    assert run(materials, tmp_path, workers=1)["processed"] == 0
+    assert passages(tmp_path) == before
+
+    (materials / "Unit_1" / "Tips.txt").write_text("New ground rules.")
+    os.utime(materials / "Notes.md")  # touched, same content
+    (materials / "New.txt").write_text("Protective factors.")
+    summary = run(materials, tmp_path, workers=1)
+
+    assert (summary["processed"], summary["reused"]) == (2, 2)
+    texts = {p["title"]: p["text"] for p in passages(tmp_path)}
+    assert texts["Tips"] == "New ground rules." and texts["New"] == "Protective factors."
+
+    (materials / "New.txt").unlink()
+    summary = run(materials, tmp_path, workers=1)
+    assert summary["removed"] == 1 and summary["processed"] == 0
+    assert "New" not in {p["title"] for p in passages(tmp_path)}
+
+
+def test_changed_chunking_settings_reprocess_everything(materials, tmp_path):
+    run(materials, tmp_path, workers=1)
+    summary = ingest(str(materials), out=str(tmp_path / "index.json"), max_chars=300, overlap=80, workers=1)
+    assert summary["processed"] == 3
+
+
+def test_an_existing_criteria_map_is_rebuilt_with_the_index(materials, tmp_path):
+    assert "criteria_passages" not in run(materials, tmp_path, workers=1)
+    assert not (tmp_path / "criteria.json").exists()
+
+    run(materials, tmp_path, workers=1, criteria=True)
+    (materials / "Unit_1" / "Tips.txt").write_text("Explain the reason for contact and leave the DHS 1536 pamphlet.")
+    summary = run(materials, tmp_path, workers=1)
+
+    assert summary["processed"] == 1 and summary["criteria_passages"] > 0
+    with open(tmp_path / "criteria.json") as f:
+        cited = {p["text"] for p in json.load(f)["passages"]}
+    assert cited <= {p["text"] for p in passages(tmp_path)}
+
+
+@pytest.mark.parametrize("max_chars, overlap", [(400, 400), (400, 900), (400, -1), (0, 0)])
+def test_overlap_must_be_shorter_than_a_chunk(materials, tmp_path, max_chars, overlap):
+    with pytest.raises(ValueError):
+        chunk_pages([(1, PARAGRAPH * 20)], max_chars=max_chars, overlap=overlap)
+    with pytest.raises(ValueError):
+        ingest(str(materials), out=str(tmp_path / "index.json"), max_chars=max_chars, overlap=overlap, workers=1)
+    assert not (tmp_path / "index.json").exists()
+
+
+def test_process_pool_builds_the_same_index(materials, tmp_path):
+    run(materials, tmp_path, workers=1)
+    serial = passages(tmp_path)
+
+    summary = run(materials, tmp_path, workers=2, full=True)
+
+    assert summary["processed"] == 3
+    assert passages(tmp_path) == serial
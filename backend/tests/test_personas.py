@@ -0,0 +1,108 @@
+import os
+import subprocess
+import sys
+
+from flask import Flask
+
+import main as service
+from common import metrics
+from common.fakes import FakeClient
+from common.personas import PersonaPacks, build_packs, compile_pack, format_pack
+
+simulation = service.simulation
+
+CASE_FILE = """Intake Report. The report was received on 03/14/2025 from Jasmine's school.
+Sara Cooper (27) is the mother of Jasmine (6) and Jasper, who is 9 months old.
+Sara lives with her partner Shawn Olson in an apartment on the east side.
+Jasmine told her teacher that Shawn hit her mother in the kitchen.
+Sara appeared anxious and defensive when the school counselor called her.
+Shawn Olson was arrested on April 2, 2025 after a neighbor called the police.
+Sara cried when asked about Jasmine and said she is afraid of losing her children.
+On 2025-02-20 Sara missed a scheduled appointment at the clinic.
+The apartment has two bedrooms and a small kitchen near the entrance door.
+Sara Cooper said Shawn Olson helps with Jasper at night when she works."""
+
+
+def write_scenario(root, scenario_id="cooper", text=CASE_FILE):
+    folder = root / scenario_id
+    folder.mkdir(parents=True, exist_ok=True)
+    (folder / "Intake_Report.txt").write_text(text)
+
+
+def turn(scenario_id):
+    with Flask(__name__).test_request_context(
+            json={'action': 'simulation_chat', 'message': 'Hi, I am from CPS.', 'scenario_id': scenario_id},
+            method='POST'):
+        from flask import request
+        return simulation.simulation_ai(request)
+
+
+def test_pack_sections_are_extracted_and_dated():
+    pack = compile_pack("cooper", [("Intake_Report", CASE_FILE)])
+
+    assert any("(27)" in fact and "Jasmine (6)" in fact for fact in pack['key_facts'])
+    assert any("anxious and defensive" in line for line in pack['emotional_state'])
+    assert [event['date'] for event in pack['timeline']] == ["2025-02-20", "2025-03-14", "2025-04-02"]
+    assert all("bedrooms" not in fact for fact in pack['key_facts'])
+    assert "Timeline:\n- 2025-02-20: On 2025-02-20" in format_pack(pack)
+
+
+def test_build_skips_unchanged_scenarios_and_invalid_folders(tmp_path):
+    write_scenario(tmp_path / "scenarios")
+    (tmp_path / "scenarios" / "Not An Id").mkdir()
+    out = tmp_path / "personas"
+
+    first = build_packs(tmp_path / "scenarios", out)
+    second = build_packs(tmp_path / "scenarios", out)
+    write_scenario(tmp_path / "scenarios", text=CASE_FILE + "\nSara felt overwhelmed on 05/01/2025.")
+    third = build_packs(tmp_path / "scenarios", out)
+
+    assert (first['built'], second['unchanged'], third['built']) == (1, 1, 1)
+    assert first['skipped'] == ["Not An Id"]
+    assert PersonaPacks(str(out)).get("cooper")['timeline'][-1]['date'] == "2025-05-01"
+    assert PersonaPacks(str(out)).get("../cooper") is None
+
+
+def test_turn_pins_pack_and_skips_retrieval(monkeypatch, tmp_path):
+    write_scenario(tmp_path / "scenarios")
+    build_packs(tmp_path / "scenarios", tmp_path / "personas")
+    fake = FakeClient()
+    metrics.reset()
+    monkeypatch.setattr(simulation, "get_client", lambda project, location: fake)
+    monkeypatch.setattr(simulation, "PERSONA_PACKS", PersonaPacks(str(tmp_path / "personas")))
+    simulation.persona_config.cache_clear()
+
+    try:
+        _, status, _ = turn("cooper")
+        turn("baskin")
+    finally:
+        simulation.persona_config.cache_clear()
+
+    assert status == 200
+    pinned, retrieved = fake.calls[0].config, fake.calls[1].config
+    assert not pinned.tools and retrieved.tools
+    assert "Case File Summary (scenario: cooper)" in pinned.system_instruction[-1].text
+    assert len(retrieved.system_instruction) == 1
+    assert metrics.counter('simulation.turns', context='pack') == 1
+    assert metrics.snapshot()['histograms']['simulation.input_tokens{context=rag}']['count'] == 1
+
+
+BLOCK_NUMPY = """
+import sys
+class Block:
+    def find_spec(self, name, path=None, target=None):
+        if name.split('.')[0] == 'numpy':
+            raise ImportError('numpy is not installed')
+sys.meta_path.insert(0, Block())
+sys.path[:0] = ['simulation-function', '.']
+import main
+"""
+
+
+def test_simulation_function_imports_without_numpy():
+    # Its requirements.txt does not list numpy
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {name: value for name, value in os.environ.items() if name != "CW_LAZY_INIT"}
+    result = subprocess.run([sys.executable, "-c", BLOCK_NUMPY], cwd=backend, capture_output=True, text=True,
+                            env=env, timeout=120)
+    assert result.returncode == 0, result.stderr[-2000:]
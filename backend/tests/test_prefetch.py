@@ -0,0 +1,116 @@
+import threading
+
+from flask import Flask
+
+import main as service
+from common import metrics
+from common.fakes import FakeClient
+from common.prefetch import Prefetcher
+from common.personas import PersonaPacks
+
+simulation = service.simulation
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def post(handler, body):
+    with Flask(__name__).test_request_context(json=body, method='POST'):
+        from flask import request
+        return handler(request)
+
+
+def test_wait_reports_how_the_prefetch_was_found():
+    clock = Clock()
+    prefetcher = Prefetcher('test', ttl=60, clock=clock)
+    release = threading.Event()
+    stuck = prefetcher.start(release.wait, 5)
+    slow = prefetcher.start(release.wait, 5)
+    fast = prefetcher.start(lambda: "done")
+    failing = prefetcher.start(lambda: 1 / 0)
+    late = prefetcher.start(lambda: "done")
+
+    assert prefetcher.wait(stuck, timeout=0.01) == ('timeout', None)
+    release.set()
+    status, result = prefetcher.wait(slow, timeout=1)
+    assert status in ('waited', 'ready') and result is True
+    assert prefetcher.wait(fast, timeout=1)[1] == "done"
+    assert prefetcher.wait(failing, timeout=1) == ('error', None)
+    assert prefetcher.wait("unknown", timeout=1) == ('missing', None)
+    clock.now = 61
+    assert prefetcher.wait(late, timeout=1) == ('missing', None)
+
+
+def test_only_the_first_turn_waits_for_and_counts_a_token():
+    metrics.reset()
+    prefetcher = Prefetcher('claimed', ttl=60)
+    token = prefetcher.start(lambda: "done")
+
+    assert prefetcher.wait(token, timeout=1) in (('ready', 'done'), ('waited', 'done'))
+    assert prefetcher.wait(token, timeout=1) == ('missing', None)
+    assert prefetcher.wait(token, timeout=1) == ('missing', None)
+    assert len(prefetcher) == 0
+    assert sum(metrics.counter('prefetch.turns', prefetcher='claimed', status=status)
+               for status in ('ready', 'waited', 'missing')) == 1
+
+
+def test_sessions_are_capped_and_unclaimed_work_is_cancelled():
+    clock = Clock()
+    prefetcher = Prefetcher('capped', ttl=60, workers=1, max_sessions=3, clock=clock)
+    release = threading.Event()
+    ran = []
+    busy = prefetcher.start(release.wait, 5)
+    queued = [prefetcher.start(ran.append, i) for i in range(4)]
+
+    # The oldest tokens were evicted; their work had not started, so it never runs
+    assert len(prefetcher) == 3
+    assert prefetcher.wait(busy, timeout=0) == ('missing', None)
+    assert prefetcher.wait(queued[0], timeout=0) == ('missing', None)
+    release.set()
+    assert prefetcher.wait(queued[-1], timeout=1)[0] in ('waited', 'ready')
+    assert ran == [1, 2, 3]
+    assert metrics.counter('prefetch.evicted', prefetcher='capped') == 2
+    assert metrics.counter('prefetch.cancelled', prefetcher='capped', reason='evicted') == 1
+
+    # Expired tokens are dropped at the next start
+    clock.now = 61
+    prefetcher.start(lambda: None)
+    assert len(prefetcher) == 1
+
+
+def test_start_prefetches_the_first_turn(monkeypatch, tmp_path):
+    (tmp_path / "cooper.json").write_text(
+        '{"version": 1, "scenario_id": "cooper", "key_facts": ["Sara Cooper (27) is the mother of Jasmine (6)."], '
+        '"emotional_state": [], "timeline": []}')
+    fake = FakeClient()
+    metrics.reset()
+    monkeypatch.setattr(simulation, "get_client", lambda project, location: fake)
+    monkeypatch.setattr(simulation, "PERSONA_PACKS", PersonaPacks(str(tmp_path)))
+    simulation.persona_config.cache_clear()
+
+    try:
+        response, status, _ = post(service.cw_mentor_ai, {'action': 'simulation_start', 'scenario_id': 'cooper'})
+        token = response.get_json()['session_token']
+        assert status == 200 and token
+        turn = {'action': 'simulation_chat', 'message': 'Hi', 'scenario_id': 'cooper', 'session_token': token}
+        _, status, _ = post(simulation.simulation_ai, turn)
+        # A client that keeps sending the token does not wait again
+        _, second_status, _ = post(simulation.simulation_ai, {**turn, 'message': 'Why are you here?'})
+        pack_cache = simulation.persona_config.cache_info()
+    finally:
+        simulation.persona_config.cache_clear()
+
+    assert status == second_status == 200
+    assert pack_cache.misses == 1 and pack_cache.hits == 2
+    assert not fake.calls[-1].config.tools
+    # Only the first turn used the prefetch, finished or not
+    assert sum(metrics.counter('prefetch.turns', prefetcher='simulation', status=status)
+               for status in ('ready', 'waited', 'timeout', 'error', 'missing')) == 1
+    assert metrics.counter('prefetch.turns', prefetcher='simulation', status='missing') == 0
+    _, status, _ = post(simulation.simulation_ai, {'action': 'start'})
+    assert status == 400
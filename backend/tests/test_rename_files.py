@@ -0,0 +1,91 @@
+import importlib.util
+import os
+
+import pytest
+
+from conftest import BACKEND_DIR
+
+spec = importlib.util.spec_from_file_location("rename_files", os.path.join(BACKEND_DIR, "rag", "rename_files.py"))
+rename_files = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(rename_files)
+
+
+def listing(root):
+    return sorted(os.path.relpath(os.path.join(d, n), root) for d, dirs, files in os.walk(root) for n in dirs + files)
+
+
+@pytest.fixture
+def materials(tmp_path):
+    root = tmp_path / "materials"
+    unit = root / "Unit 1 (KP 03.24.2025)"
+    (unit / "Slides & Notes").mkdir(parents=True)
+    (unit / "Guide (KP 03.24.2025).pdf").write_text("a")
+    (unit / "Guide_KP_2025-03-24.pdf").write_text("b")  # already clean, keeps its name
+    (unit / "Slides & Notes" / "1. Intro.pptx").write_text("c")
+    (unit / "Slides & Notes" / "1_Intro.pptx").write_text("d")
+    (root / "Tips.txt").write_text("e")
+    return root
+
+
+def test_plan_resolves_collisions_deterministically(materials):
+    ops = rename_files.plan(str(materials))
+
+    paths = dict(rename_files.final_paths(ops))
+    unit = "Unit 1 (KP 03.24.2025)"
+    assert paths[unit] == "Unit_1_KP_2025-03-24"
+    assert paths[os.path.join(unit, "Guide (KP 03.24.2025).pdf")] == "Unit_1_KP_2025-03-24/Guide_KP_2025-03-24_2.pdf"
+    assert paths[os.path.join(unit, "Slides & Notes", "1. Intro.pptx")] == \
+        "Unit_1_KP_2025-03-24/Slides_and_Notes/1_Intro_2.pptx"
+    # Children come before their parents
+    order = [os.path.join(op["dir"], op["old"]) for op in ops]
+    assert order.index(os.path.join(unit, "Slides & Notes")) < order.index(unit)
+    assert rename_files.plan(str(materials)) == ops
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_apply_renames_the_planned_tree(materials, tmp_path, workers):
+    ops = rename_files.plan(str(materials))
+    expected = sorted({new for _, new in rename_files.final_paths(ops)} | {"Tips.txt"} |
+                      {"Unit_1_KP_2025-03-24/Guide_KP_2025-03-24.pdf", "Unit_1_KP_2025-03-24/Slides_and_Notes/1_Intro.pptx"})
+    journal = str(tmp_path / "journal.jsonl")
+    rename_files.write_journal(journal, str(materials), ops)
+
+    assert rename_files.apply(str(materials), ops, journal, workers=workers) == len(ops)
+
+    assert listing(materials) == expected
+    assert rename_files.plan(str(materials)) == []
+
+
+def crash_midway(materials, tmp_path):
+    """Two renames journaled, a third done on disk whose record was lost, then a torn line."""
+    ops = rename_files.plan(str(materials))
+    journal = str(tmp_path / "journal.jsonl")
+    rename_files.write_journal(journal, str(materials), ops)
+    with open(journal, "a") as f:
+        for op in ops[:2]:
+            rename_files._rename(str(materials), op)
+            f.write(f'{{"done": {op["id"]}}}\n')
+        rename_files._rename(str(materials), ops[2])
+        f.write('{"do')
+    return ops, journal
+
+
+def test_resume_finishes_a_crashed_run(materials, tmp_path):
+    ops, journal = crash_midway(materials, tmp_path)
+
+    header, journaled, done = rename_files.read_journal(journal)
+    assert header["status"] == "unfinished" and done == {0, 1}
+    assert rename_files.apply(str(materials), journaled, journal, done=done) == len(ops) - 3
+
+    assert rename_files.plan(str(materials)) == []
+    assert rename_files.read_journal(journal)[0]["status"] == "complete"
+
+
+def test_rollback_restores_the_tree_including_unjournaled_renames(materials, tmp_path):
+    before = listing(materials)
+    ops, journal = crash_midway(materials, tmp_path)
+
+    assert rename_files.rollback(str(materials), journal) == 3
+
+    assert listing(materials) == before
+    assert rename_files.read_journal(journal)[0]["status"] == "rolled_back"
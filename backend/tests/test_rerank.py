@@ -0,0 +1,74 @@
+from flask import Flask
+
+import main as service
+from benchmarks.retrieval_data import recorded_passages
+from common.fakes import FakeClient
+from common.lazy import Lazy
+from common.rerank import rerank, select
+from common.retrieval import LocalRetriever
+from common.retrieval_cache import RetrievalCache
+
+mentorship = service.mentorship
+
+
+def test_adaptive_cut_keeps_only_strong_matches():
+    passages = recorded_passages()
+    query = "give the parent the DHS 1536 pamphlet and go over their rights"
+
+    kept = select(rerank(query, passages))
+
+    assert 1 <= len(kept) < 8
+    assert "6_Initial_Contact_Guide_KP_2025-07-01" in {p['title'] for p in kept}
+    assert all(p['score'] >= 0.6 * kept[0]['score'] for p in kept)
+    assert select(rerank("ok cool", passages)) == []
+    assert len(select(rerank(query, passages), threshold=0.0, relative=0.0, max_k=3)) == 3
+
+
+def test_rerank_mode_sends_excerpts_without_the_tool_and_falls_back_to_it(monkeypatch):
+    fake = FakeClient()
+    monkeypatch.setattr(mentorship, "get_client", lambda project, location: fake)
+    monkeypatch.setattr(mentorship, "RETRIEVAL_MODE", "rerank")
+    retriever = LocalRetriever(recorded_passages())
+    searches = []
+    monkeypatch.setattr(retriever, "search", lambda query, **kw: searches.append(query) or
+                        LocalRetriever.search(retriever, query, **kw))
+    monkeypatch.setattr(mentorship, "MENTORSHIP_RETRIEVER", Lazy(lambda: retriever))
+    monkeypatch.setattr(mentorship, "RETRIEVAL_CACHE", RetrievalCache())
+
+    for message in ("When do I give a parent the DHS 1536 pamphlet?", "thanks!",
+                    "when do I give the parent a DHS 1536 pamphlet"):
+        with Flask(__name__).test_request_context(json={'action': 'mentorship_chat', 'message': message},
+                                                  method='POST'):
+            from flask import request
+            _, status, _ = mentorship.mentorship_ai(request)
+        assert status == 200
+
+    grounded, chitchat, repeat = fake.calls
+    # The reworded repeat is served from the retrieval cache
+    assert len(searches) == 2
+    assert "6_Initial_Contact_Guide_KP_2025-07-01" in repeat.contents[-1].parts[0].text
+    assert not grounded.config.tools and not repeat.config.tools
+    # Nothing cleared the cut, so the model retrieves from its corpus itself
+    assert chitchat.config.tools
+    assert "CURRICULUM EXCERPTS" in grounded.contents[-1].parts[0].text
+    assert "6_Initial_Contact_Guide_KP_2025-07-01" in grounded.contents[-1].parts[0].text
+    assert chitchat.contents[-1].parts[0].text == "thanks!"
+
+
+def test_rerank_mode_uses_the_tool_without_a_mentorship_index(monkeypatch, tmp_path):
+    fake = FakeClient()
+    monkeypatch.setattr(mentorship, "get_client", lambda project, location: fake)
+    monkeypatch.setattr(mentorship, "RETRIEVAL_MODE", "rerank")
+    missing = str(tmp_path / "index.json")
+    monkeypatch.setattr(mentorship, "MENTORSHIP_INDEX_PATH", missing)
+    monkeypatch.setattr(mentorship, "MENTORSHIP_DATASTORE", f"local:{missing}")
+    monkeypatch.setattr(mentorship, "MENTORSHIP_RETRIEVER", Lazy(lambda: LocalRetriever.load(missing)))
+
+    with Flask(__name__).test_request_context(json={'action': 'mentorship_chat', 'message': 'What is a DHS 1536?'},
+                                              method='POST'):
+        from flask import request
+        _, status, _ = mentorship.mentorship_ai(request)
+
+    assert status == 200
+    assert fake.calls[0].config.tools
+    assert fake.calls[0].contents[-1].parts[0].text == 'What is a DHS 1536?'
@@ -0,0 +1,111 @@
+import json
+import zipfile
+
+import pytest
+from flask import Flask
+
+import main as service
+from benchmarks.retrieval_data import cited_queries, load_queries, recorded_passages, recorded_run_passages
+from common.documents import chunk_pages, extract_pages
+from common.fakes import FakeClient
+from common.lazy import Lazy
+from common.retrieval import LocalRetriever, grounding_chunks, passage_key
+
+analysis = service.analysis
+
+W = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+A = 'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main"'
+
+
+@pytest.fixture(scope="module")
+def retriever():
+    return LocalRetriever(recorded_passages())
+
+
+def test_docx_pages_follow_page_breaks(tmp_path):
+    path = tmp_path / "Guide_KP_2025-07-01.docx"
+    body = ('<w:p><w:r><w:t>Introduce yourself.</w:t></w:r></w:p>'
+            '<w:p><w:r><w:br w:type="page"/><w:t>Explain the DHS 1536.</w:t></w:r></w:p>')
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("word/document.xml", f'<w:document {W}><w:body>{body}</w:body></w:document>')
+
+    assert extract_pages(str(path)) == [(1, "Introduce yourself."), (2, "Explain the DHS 1536.")]
+
+
+def test_pptx_pages_are_slides(tmp_path):
+    path = tmp_path / "Intro_PPT.pptx"
+    with zipfile.ZipFile(path, "w") as archive:
+        for number, text in ((2, "Six domains"), (1, "Welcome")):
+            archive.writestr(f"ppt/slides/slide{number}.xml",
+                             f'<p:sld {A} xmlns:p="p"><a:p><a:r><a:t>{text}</a:t></a:r></a:p></p:sld>')
+
+    assert extract_pages(str(path)) == [(1, "Welcome"), (2, "Six domains")]
+
+
+def test_chunks_stay_within_a_page_and_size():
+    pages = [(1, "alpha beta\n" * 30), (2, "gamma")]
+    chunks = chunk_pages(pages, max_chars=100)
+    assert all(len(text) <= 100 for _, _, text in chunks)
+    assert all(first == last for first, last, _ in chunks)
+    assert chunks[-1] == (2, 2, "gamma")
+
+
+def test_hybrid_search_finds_labeled_titles(retriever):
+    hits = retriever.search("give the parent the DHS 1536 pamphlet and go over their rights", k=3)
+    assert hits[0]["title"] == "6_Initial_Contact_Guide_KP_2025-07-01"
+    assert set(hits[0]) >= {"title", "uri", "text", "score"}
+
+    found = sum(bool({h["title"] for h in retriever.search(q["query"], k=5)} & set(q["relevant"]))
+                for q in load_queries())
+    assert found == len(load_queries())
+
+
+def test_cited_sentences_are_labeled_with_the_chunks_they_cite():
+    runs = recorded_run_passages()
+    queries = cited_queries()
+    corpus = {passage_key(p) for p in recorded_passages()}
+
+    assert [len(run) for run in runs] == [16, 15]
+    assert len(queries) >= 15
+    for query in queries:
+        assert "[" not in query["query"] and "Refer to" not in query["query"]
+        assert query["passages"] == [passage_key(runs[query["run"]][n - 1]) for n in query["cited"]]
+    assert sum(set(q["passages"]) <= corpus for q in queries) >= len(queries) - 1
+
+
+def test_save_and_load_round_trip(retriever, tmp_path):
+    path = tmp_path / "index.json"
+    retriever.save(str(path))
+    loaded = LocalRetriever.load(str(path))
+    query = "protective factors such as parental resilience"
+    assert [h["text"] for h in loaded.search(query)] == [h["text"] for h in retriever.search(query)]
+
+
+def test_grounding_chunks_match_serialized_shape():
+    passage = {"title": "Guide", "uri": "gs://b/Guide.pdf", "text": "t", "page_span": {"first_page": 3, "last_page": 3}}
+    assert grounding_chunks([passage, dict(passage, title="Other")])[1] == {
+        "_array_index": 1, "_citation_number": 2,
+        "retrieved_context": {"title": "Other", "uri": "gs://b/Guide.pdf", "text": "t",
+                              "page_span": {"first_page": 3, "last_page": 3}}}
+
+
+def test_local_mode_streams_grounding_first_and_drops_remote_tool(monkeypatch, retriever):
+    fake = FakeClient()
+    monkeypatch.setattr(analysis.client, "get", lambda: fake)
+    monkeypatch.setattr(analysis, "RAG_MODE", "local")
+    monkeypatch.setattr(analysis, "LOCAL_RETRIEVER", Lazy(lambda: retriever))
+    payload = {"action": "analyze", "assessment": {"introduction": "ok"}, "transcript": [
+        {"role": "user", "parts": "Hi, I'm from CPS. Here is the DHS 1536 pamphlet about your rights."}]}
+
+    with Flask(__name__).test_request_context(json=payload, method="POST"):
+        from flask import request
+        response = analysis.social_work_ai(request)
+        body = response.get_data(as_text=True)
+        response.close()
+
+    first = json.loads(body.splitlines()[0])
+    chunks = first["candidates"][0]["grounding_metadata"]["grounding_chunks"]
+    assert chunks[0]["retrieved_context"]["title"] == "6_Initial_Contact_Guide_KP_2025-07-01"
+    call = fake.calls[0]
+    assert not call.config.tools
+    assert "CURRICULUM EXCERPTS" in call.contents[0].parts[0].text
@@ -0,0 +1,109 @@
+import json
+
+import pytest
+from flask import Flask
+
+import main as service
+from benchmarks.retrieval_data import recorded_passages
+from common import metrics
+from common.fakes import FakeClient
+from common.lazy import Lazy
+from common.retrieval import LocalRetriever
+from common.retrieval_cache import RETRIEVAL_CACHE, RetrievalCache
+
+analysis = service.analysis
+
+PASSAGES = [{"title": "Guide", "uri": "gs://curriculum/Guide.pdf", "text": "x" * 100}]
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    metrics.reset()
+    RETRIEVAL_CACHE.clear()
+    yield
+    RETRIEVAL_CACHE.clear()
+
+
+def post(payload):
+    with Flask(__name__).test_request_context(json=payload, method="POST"):
+        from flask import request
+        response = analysis.social_work_ai(request)
+        body = response.get_data(as_text=True)
+        response.close()
+    return [json.loads(line) for line in body.splitlines()]
+
+
+def test_normalized_queries_share_an_entry_per_datastore():
+    cache = RetrievalCache(clock=Clock())
+    cache.put("store-a", "Explain the DHS 1536 pamphlets!", PASSAGES, k=8)
+
+    assert cache.get("store-a", "explain  DHS 1536 pamphlet", k=8) == PASSAGES
+    assert cache.get("store-b", "explain  DHS 1536 pamphlet", k=8) is None
+    assert cache.get("store-a", "explain  DHS 1536 pamphlet", k=5) is None
+    assert cache.stats()["hit_rate"] == pytest.approx(1 / 3)
+
+
+def test_entries_expire_and_bytes_evict_least_recently_used():
+    clock = Clock()
+    size = len(json.dumps(PASSAGES).encode('utf-8'))
+    cache = RetrievalCache(max_bytes=2 * size, ttl=60, clock=clock)
+    cache.put("s", "first", PASSAGES)
+    cache.put("s", "second", PASSAGES)
+    cache.get("s", "first")
+    cache.put("s", "third", PASSAGES)  # evicts "second", the least recently used
+
+    assert cache.get("s", "second") is None
+    assert cache.stats()["bytes"] == 2 * size
+    clock.now = 61
+    assert cache.get("s", "first") is None and cache.stats()["entries"] == 1
+
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"]["retrieval_cache.evictions{cache=retrieval,reason=lru}"] == 1
+    assert snapshot["counters"]["retrieval_cache.evictions{cache=retrieval,reason=ttl}"] == 1
+    assert snapshot["gauges"]["retrieval_cache.bytes{cache=retrieval}"] == size
+
+
+def test_local_mode_searches_once_for_repeated_analyses(monkeypatch):
+    fake = FakeClient()
+    retriever = LocalRetriever(recorded_passages())
+    searches = []
+    search = retriever.search
+    monkeypatch.setattr(retriever, "search", lambda *a, **kw: searches.append(a) or search(*a, **kw))
+    monkeypatch.setattr(analysis.client, "get", lambda: fake)
+    monkeypatch.setattr(analysis, "RAG_MODE", "local")
+    monkeypatch.setattr(analysis, "LOCAL_RETRIEVER", Lazy(lambda: retriever))
+    monkeypatch.setattr(analysis, "COALESCE_ENABLED", False)
+    payload = {"action": "analyze", "assessment": {"introduction": "ok"}, "transcript": [
+        {"role": "user", "parts": "Hi, I'm from CPS. Here is the DHS 1536 pamphlet about your rights."}]}
+
+    first, second = post(payload), post(payload)
+
+    assert len(searches) == 1
+    assert first[0] == second[0]
+    assert RETRIEVAL_CACHE.stats()["hits"] == 1
+
+
+def test_recorded_remote_grounding_is_reused(monkeypatch):
+    fake = FakeClient()
+    monkeypatch.setattr(analysis.client, "get", lambda: fake)
+    monkeypatch.setattr(analysis, "REUSE_GROUNDING", True)
+    monkeypatch.setattr(analysis, "COALESCE_ENABLED", False)
+    payload = {"action": "analyze", "assessment": {"introduction": "ok"}, "transcript": [
+        {"role": "user", "parts": "Hello, I'm here about the report."}]}
+
+    post(payload)
+    lines = post(payload)
+
+    assert fake.calls[0].config.tools and not fake.calls[1].config.tools
+    assert "CURRICULUM EXCERPTS" in fake.calls[1].contents[0].parts[0].text
+    context = lines[0]["candidates"][0]["grounding_metadata"]["grounding_chunks"][0]["retrieved_context"]
+    assert context["title"] == "Initial Contact Guide"
+    assert context["page_span"] == {"first_page": 3, "last_page": 4}
@@ -0,0 +1,84 @@
+import copy
+import time
+
+from google.genai import types
+
+from common import metrics
+from common.genai_config import DEFAULT_MODEL, LIGHT_MODEL
+from common.router import ACTION_POLICIES, ModelRouter, with_thinking
+
+
+def router(**kwargs):
+    policies = {action: copy.copy(policy) for action, policy in ACTION_POLICIES.items()}
+    return ModelRouter(policies, **kwargs)
+
+
+def test_slow_primary_routes_turns_to_the_light_model():
+    r = router(alpha=0.5)
+    assert r.route('simulation_chat', 200).reason == 'preferred'
+
+    for _ in range(3):
+        r.observe(DEFAULT_MODEL, 9.0)
+    route = r.route('simulation_chat', 200)
+
+    assert route.model == LIGHT_MODEL
+    assert route.reason == 'primary_degraded'
+    assert route.thinking_budget == 0
+    assert metrics.counter('router.decisions', action='simulation_chat',
+                           model=LIGHT_MODEL, reason='primary_degraded') >= 1
+
+
+def test_error_rate_counts_against_a_model():
+    r = router(alpha=0.5)
+    r.observe(DEFAULT_MODEL, 1.0, ok=False)
+    assert r.route('mentorship_chat').model == LIGHT_MODEL
+
+    for _ in range(4):
+        r.observe(DEFAULT_MODEL, 1.0)
+    assert r.route('mentorship_chat').model == DEFAULT_MODEL
+
+
+def test_stale_stats_send_traffic_back_to_the_primary():
+    r = router(alpha=1.0, stale_after=0.05)
+    r.observe(DEFAULT_MODEL, 30.0)
+    assert r.route('chat').model == LIGHT_MODEL
+    time.sleep(0.06)
+    assert r.route('chat').model == DEFAULT_MODEL
+
+
+def test_large_transcripts_stay_on_the_primary_and_short_ones_think_less():
+    r = router(alpha=1.0)
+    r.observe(DEFAULT_MODEL, 500.0)
+
+    large = r.route('analyze', 50000)
+    assert (large.model, large.reason, large.thinking_budget) == (DEFAULT_MODEL, 'large_input', None)
+    short = r.route('analyze', 800)
+    assert (short.model, short.thinking_budget) == (LIGHT_MODEL, 8192)
+
+
+def test_env_overrides(monkeypatch):
+    monkeypatch.setenv("CW_MODEL_ANALYZE", "gemini-2.5-pro")
+    monkeypatch.setenv("CW_THINKING_ANALYZE", "4096")
+    r = ModelRouter.from_env()
+    r.observe("gemini-2.5-pro", 500.0)
+
+    route = r.route('analyze', 100)
+    assert (route.model, route.reason, route.thinking_budget) == ("gemini-2.5-pro", 'override', 4096)
+    assert r.primary('analyze') == "gemini-2.5-pro"
+    assert r.route('chat').model == DEFAULT_MODEL
+
+
+def test_thinking_budget_is_applied_to_a_cached_config_copy():
+    base = types.GenerateContentConfig(
+        temperature=0.3,
+        thinking_config=types.ThinkingConfig(thinking_budget=24576, include_thoughts=True),
+    )
+
+    assert with_thinking(base, None) is base
+    reduced = with_thinking(base, 8192)
+    assert reduced is with_thinking(base, 8192)
+    assert reduced.thinking_config.thinking_budget == 8192
+    assert reduced.thinking_config.include_thoughts is True
+    assert reduced.temperature == 0.3
+    assert base.thinking_config.thinking_budget == 24576
+    assert with_thinking(base, 0).thinking_config.include_thoughts is None
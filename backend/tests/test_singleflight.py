@@ -0,0 +1,149 @@
+import json
+import threading
+import time
+
+import pytest
+from flask import Flask
+
+import main as service
+from common.fakes import FakeClient
+from common.singleflight import SingleFlight, request_hash
+
+analysis = service.analysis
+
+TRANSCRIPT = [
+    {"role": "user", "parts": "Hi, I'm Willis from CPS. Are you Sara Cooper?"},
+    {"role": "model", "parts": "Yes. What is this about?"},
+]
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    fake = FakeClient(latency=0.05, chunk_delay=0.05)
+    monkeypatch.setattr(analysis.client, "get", lambda: fake)
+    return fake
+
+
+def run_analysis(app, payload, results, index, headers=None):
+    with app.test_request_context(json=payload, method='POST', headers=headers or {}):
+        from flask import request
+        response = analysis.social_work_ai(request)
+        results[index] = response.get_data(as_text=True)
+        # WSGI servers close the response when streaming ends; that frees
+        # the admission slot
+        response.close()
+
+
+def analyze_concurrently(payloads, headers=None, stagger=0.0):
+    app = Flask(__name__)
+    results = [None] * len(payloads)
+    threads = []
+    for i, payload in enumerate(payloads):
+        thread = threading.Thread(target=run_analysis, args=(app, payload, results, i, headers))
+        thread.start()
+        threads.append(thread)
+        time.sleep(stagger)
+    for thread in threads:
+        thread.join(timeout=10)
+    return results
+
+
+def payload(**overrides):
+    body = {"action": "analyze", "transcript": TRANSCRIPT, "assessment": {"introduction": "ok"}}
+    body.update(overrides)
+    return body
+
+
+def test_concurrent_duplicates_share_one_upstream_stream(fake_client):
+    results = analyze_concurrently([payload() for _ in range(5)])
+
+    assert fake_client.count('generate_content_stream') == 1
+    assert len(set(results)) == 1
+    lines = [json.loads(line) for line in results[0].splitlines()]
+    assert [line["chunk_index"] for line in lines] == [1, 2, 3, 4]
+
+
+def test_late_joiner_receives_buffered_prefix(fake_client):
+    # The second request arrives after the first chunks were produced
+    results = analyze_concurrently([payload(), payload()], stagger=0.12)
+
+    assert fake_client.count('generate_content_stream') == 1
+    assert results[0] == results[1]
+    assert len(results[1].splitlines()) == 4
+
+
+def test_different_requests_are_not_coalesced(fake_client):
+    results = analyze_concurrently([payload(), payload(assessment={"introduction": "other"})])
+
+    assert fake_client.count('generate_content_stream') == 2
+    assert all(len(r.splitlines()) == 4 for r in results)
+    # nprobe changes the local passages in the prompt
+    assert analysis.coalesce_key('analyze', payload(nprobe=1)) != analysis.coalesce_key('analyze', payload(nprobe=8))
+    assert analysis.coalesce_key('analyze', payload(nprobe="8")) == analysis.coalesce_key('analyze', payload(nprobe=8))
+    assert analysis.coalesce_key('supervisor_analysis', payload(nprobe=0)) != \
+        analysis.coalesce_key('supervisor_analysis', payload())
+
+
+def test_idempotency_key_replays_finished_stream(fake_client):
+    first = analyze_concurrently([payload()], headers={'Idempotency-Key': 'abc'})
+    second = analyze_concurrently([payload()], headers={'Idempotency-Key': 'abc'})
+
+    assert fake_client.count('generate_content_stream') == 1
+    assert first == second
+
+
+def test_request_hash_ignores_key_order_and_unrelated_fields():
+    a = request_hash('analyze', {'transcript': [1], 'assessment': {'x': 1, 'y': 2}}, ('transcript', 'assessment'))
+    b = request_hash('analyze', {'assessment': {'y': 2, 'x': 1}, 'transcript': [1], 'idempotencyKey': 'k'},
+                     ('transcript', 'assessment'))
+    assert a == b
+
+
+def test_producer_error_reaches_every_subscriber():
+    group = SingleFlight('test')
+    release = threading.Event()
+
+    def produce():
+        yield 'first'
+        release.wait(1)
+        raise RuntimeError('boom')
+
+    leader = group.stream('k', produce)
+    follower = group.stream('k', produce)
+    release.set()
+    assert list(leader) == ['first']
+    assert list(follower) == ['first']
+    assert group.in_flight() == 0
+
+
+def test_only_requests_attached_to_a_flight_skip_admission(fake_client, monkeypatch):
+    from common import admission
+    from common.admission import AdmissionController, Lane
+
+    monkeypatch.setattr(admission, 'ADMISSION', AdmissionController(lanes=[
+        Lane('heavy', limit=0, max_queue=0, max_wait=0),
+        Lane('interactive', limit=0, max_queue=0, max_wait=0),
+    ]))
+    group = SingleFlight('test')
+    monkeypatch.setattr(analysis, 'ANALYSIS_FLIGHTS', group)
+    release = threading.Event()
+
+    def produce():
+        yield '{"chunk_index": 1}\n'
+        release.wait(1)
+
+    live = group.stream(analysis.coalesce_key('analyze', payload()), produce)
+    app = Flask(__name__)
+    with app.test_request_context(json=payload(), method='POST'):
+        from flask import request
+        joined = analysis.social_work_ai(request)
+    release.set()
+    assert list(live) == ['{"chunk_index": 1}\n']
+    assert joined.get_data(as_text=True) == '{"chunk_index": 1}\n'
+
+    # Nothing to attach to: the request needs a slot, and no stream starts without one
+    with app.test_request_context(json=payload(assessment={"introduction": "other"}), method='POST'):
+        _, status, _ = analysis.social_work_ai(request)
+    assert status == 429
+    assert group.join(analysis.coalesce_key('analyze', payload(assessment={"introduction": "other"}))) is None
+    assert fake_client.count('generate_content_stream') == 0
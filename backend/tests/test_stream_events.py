@@ -0,0 +1,147 @@
+import json
+
+import pytest
+from flask import Flask
+
+import main as service
+from common.fakes import FakeClient, default_stream
+from common.frames import FRAMES_MIMETYPE, FrameDecoder, decode_frames
+from common.stream_events import StreamEncoder, chunk_events
+
+analysis = service.analysis
+
+TRANSCRIPT = [
+    {"role": "user", "parts": "Hi, I'm Willis from CPS. Are you Sara Cooper?"},
+    {"role": "model", "parts": "Yes. What is this about?"},
+]
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    fake = FakeClient()
+    monkeypatch.setattr(analysis.client, "get", lambda: fake)
+    # One line per model chunk (see test_stream_window for merging)
+    monkeypatch.setattr(analysis, "STREAM_WINDOW_MS", 0)
+    return fake
+
+
+def post(headers=None, entry=analysis.social_work_ai, **overrides):
+    body = {"action": "analyze", "transcript": TRANSCRIPT, "assessment": {"introduction": "ok"}, **overrides}
+    with Flask(__name__).test_request_context(json=body, method='POST', headers=headers or {}):
+        from flask import request
+        response = entry(request)
+        data = response.get_data()
+        response.close()
+    return response.mimetype, data
+
+
+def analyze(**overrides):
+    _, data = post(**overrides)
+    return [json.loads(line) for line in data.decode('utf-8').splitlines()]
+
+
+def test_v2_sends_typed_events_ending_in_usage_and_done(fake_client):
+    events = analyze(protocol='v2')
+
+    assert [e['type'] for e in events] == ['thought_delta', 'thought_delta', 'text_delta', 'text_delta',
+                                           'grounding', 'usage', 'done']
+    assert "".join(e['text'] for e in events if e['type'] == 'text_delta') == \
+        '{"overallSummary": "Good start [1].", "strengths": ["Introduced self"]}'
+    assert events[4]['chunks'][0]['title'] == 'Initial Contact Guide'
+    assert events[4]['chunks'][0]['page_span'] == {'first_page': 3, 'last_page': 4}
+    assert events[5] == {'type': 'usage', 'prompt_tokens': 1200, 'output_tokens': 40,
+                         'thought_tokens': 300, 'total_tokens': 1540}
+    assert events[6] == {'type': 'done', 'chunks': 4}
+
+
+def test_v1_is_unchanged_and_does_not_share_a_flight_with_v2(fake_client):
+    v1 = analyze()
+    v2 = analyze(protocol='v2')
+
+    assert [line['chunk_index'] for line in v1] == [1, 2, 3, 4]
+    assert v1[-1]['candidates'][0]['grounding_metadata']['grounding_chunks'][0]['_citation_number'] == 1
+    assert analysis.coalesce_key('analyze', {'protocol': 'v2', 'transcript': TRANSCRIPT}) != \
+        analysis.coalesce_key('analyze', {'transcript': TRANSCRIPT})
+    # The same deltas, whichever protocol carries them
+    encoder = StreamEncoder('v2')
+    expected = [event for index, chunk in enumerate(default_stream(), start=1)
+                for event in chunk_events(analysis.serialize_chunk(chunk, index))]
+    assert v2[:-2] == expected
+    assert encoder.error('boom') == '{"type":"error","message":"boom"}\n'
+
+
+def test_accept_header_negotiates_msgpack_frames_of_the_v2_events(fake_client):
+    mimetype, data = post(headers={'Accept': FRAMES_MIMETYPE})
+    decoder = FrameDecoder()
+    # Bytes split at arbitrary points, as the network delivers them
+    events = [event for start in range(0, len(data), 7) for event in decoder.feed(data[start:start + 7])]
+
+    assert mimetype == FRAMES_MIMETYPE
+    assert decoder.pending == 0
+    assert events == analyze(protocol='v2')
+    assert analysis.coalesce_key('analyze', {'framing': 'msgpack', 'transcript': TRANSCRIPT}) != \
+        analysis.coalesce_key('analyze', {'protocol': 'v2', 'transcript': TRANSCRIPT})
+
+
+def test_combined_service_negotiates_frames_too(fake_client):
+    mimetype, data = post(headers={'Accept': FRAMES_MIMETYPE}, entry=service.cw_mentor_ai)
+
+    assert mimetype == FRAMES_MIMETYPE
+    assert [event['type'] for event in decode_frames([data])][-1] == 'done'
+    assert post(entry=service.cw_mentor_ai)[0] != FRAMES_MIMETYPE
+
+
+def test_thoughts_none_and_summary(fake_client):
+    none = analyze(protocol='v2', thoughts='none')
+    summary = analyze(protocol='v2', thoughts='summary')
+
+    assert fake_client.calls[0].config.thinking_config.include_thoughts is False
+    assert fake_client.calls[1].config.thinking_config.include_thoughts is True
+    assert 'thought_delta' not in [e['type'] for e in none]
+    assert [e['text'] for e in summary if e['type'] == 'thought_delta'] == \
+        ['**Reviewing the transcript**\n\n', '**Matching criteria**\n\n']
+    assert none[-1] == summary[-1] == {'type': 'done', 'chunks': 4}
+
+
+def test_throttled_thoughts_go_out_at_most_once_per_interval():
+    now = [0.0]
+    encoder = StreamEncoder('v2', thoughts='throttled', interval_ms=1000, clock=lambda: now[0])
+
+    def thought(text, at):
+        now[0] = at
+        return encoder.chunk({'candidates': [{'content': {'parts': [{'text': text, 'thought': True}]}}]})
+
+    sent = [thought("a", 0.0), thought("b", 0.4), thought("c", 0.9), thought("d", 1.2), thought("e", 1.5)]
+    answer = encoder.chunk({'candidates': [{'content': {'parts': [{'text': '{}', 'thought': None}]}}]})
+
+    assert [json.loads(line) for line in sent if line] == [
+        {'type': 'thought_delta', 'text': 'a'}, {'type': 'thought_delta', 'text': 'bcd'}]
+    # Held thoughts go out before the answer starts
+    assert [json.loads(line) for line in answer.splitlines()] == [
+        {'type': 'thought_delta', 'text': 'e'}, {'type': 'text_delta', 'text': '{}'}]
+    assert thought("f", 1.7) == ""
+    assert [json.loads(line)['type'] for line in encoder.done().splitlines()] == ['thought_delta', 'done']
+
+
+def test_summary_sends_one_headline_per_thought_however_it_is_split():
+    encoder = StreamEncoder('v2', thoughts='summary')
+
+    def chunk(text, thought=True):
+        return encoder.chunk({'candidates': [{'content': {'parts': [{'text': text, 'thought': thought}]}}]})
+
+    deltas = ["**Reviewing the", " transcript**\n\nThe worker", " introduced themselves. Then",
+              " they explained.\n\n**Match", "ing criteria**\n\nIntroduction is met.", "\n\n**Scoring**\n\n"]
+    sent = [chunk(delta) for delta in deltas] + [chunk('{}', thought=None), encoder.done()]
+    events = [json.loads(line) for body in sent for line in body.splitlines()]
+
+    assert events == [
+        {'type': 'thought_delta', 'text': '**Reviewing the transcript**\n\n'},
+        {'type': 'thought_delta', 'text': '**Matching criteria**\n\n'},
+        {'type': 'thought_delta', 'text': '**Scoring**\n\n'},
+        {'type': 'text_delta', 'text': '{}'},
+        {'type': 'done', 'chunks': 7},
+    ]
+    # An untitled thought still held at the end goes out with done
+    encoder = StreamEncoder('v2', thoughts='summary')
+    assert chunk("Checking the") == chunk(" assessment. Then the rest.") == ""
+    assert json.loads(encoder.done().splitlines()[0]) == {'type': 'thought_delta', 'text': 'Checking the assessment.\n\n'}
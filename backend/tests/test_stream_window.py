@@ -0,0 +1,98 @@
+import json
+import threading
+import time
+
+import pytest
+from flask import Flask
+
+import main as service
+from common.fakes import FakeClient
+from common import stream_window
+from common.stream_window import windowed
+
+analysis = service.analysis
+
+
+def merged(items, window_ms=200, max_bytes=100):
+    return list(windowed(items, lambda item: item[0], lambda a, b: (a[0], a[1] + b[1]),
+                         lambda item: len(item[1]), window_ms, max_bytes))
+
+
+def paced(*steps):
+    for pause, item in steps:
+        time.sleep(pause)
+        yield item
+
+
+def test_runs_of_one_kind_merge_until_kind_change_window_or_size():
+    items = paced((0, ("t", "a")), (0.005, ("t", "b")), (0.005, ("x", "c")), (0.005, ("x", "d")),
+                  (0.4, ("x", "e")), (0.005, (None, "grounding")), (0, ("x", "f" * 100)))
+
+    assert merged(items) == [("t", "ab"), ("x", "cd"), ("x", "e"), (None, "grounding"), ("x", "f" * 100)]
+    assert merged(paced((0, ("x", "ab")), (0, ("x", "cd")), (0, ("x", "e"))), max_bytes=4) == \
+        [("x", "abcd"), ("x", "e")]
+    assert merged([("x", "a"), ("x", "b")], window_ms=0) == [("x", "a"), ("x", "b")]
+
+
+def test_held_chunks_are_flushed_before_an_upstream_error(monkeypatch):
+    def failing():
+        yield ("x", "a")
+        raise RuntimeError("upstream failed")
+
+    stream = windowed(failing(), lambda item: item[0], lambda a, b: a, lambda item: 0, 200, 100)
+    assert next(stream) == ("x", "a")
+    with pytest.raises(RuntimeError):
+        next(stream)
+
+    # In the handler, the two thought chunks of the fake stream go out as one event
+    monkeypatch.setattr(analysis.client, "get", lambda: FakeClient())
+    monkeypatch.setattr(analysis, "STREAM_WINDOW_MS", 1000)
+    body = {"action": "analyze", "transcript": [{"role": "user", "parts": "Hi"}], "protocol": "v2"}
+    with Flask(__name__).test_request_context(json=body, method='POST'):
+        from flask import request
+        response = analysis.social_work_ai(request)
+        events = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        response.close()
+    assert [e['type'] for e in events] == ['thought_delta', 'text_delta', 'text_delta', 'grounding', 'usage', 'done']
+    assert events[0]['text'] == "**Reviewing the transcript**\n\n**Matching criteria**\n\n"
+    assert events[-1] == {'type': 'done', 'chunks': 3}
+
+
+def test_closing_the_response_stops_and_closes_the_upstream(monkeypatch):
+    monkeypatch.setattr(stream_window, "QUEUE_ITEMS", 4)
+    pulled, closed = [], threading.Event()
+
+    def endless():
+        try:
+            while True:
+                pulled.append(len(pulled))
+                yield ("x" if len(pulled) % 2 else "y", "a")
+        finally:
+            closed.set()
+
+    stream = windowed(endless(), lambda item: item[0], lambda a, b: a, lambda item: 0, 200, 100)
+    assert next(stream)[0] == "x"
+    time.sleep(0.1)
+    # The reader stays a bounded number of chunks ahead of a slow client
+    assert len(pulled) <= stream_window.QUEUE_ITEMS + 3
+    stream.close()
+    assert closed.wait(1)
+
+    # A quiet model is closed once its pending chunk arrives
+    release, closed = threading.Event(), threading.Event()
+
+    def quiet():
+        try:
+            yield ("x", "a")
+            release.wait(1)
+            yield ("y", "b")
+            yield ("y", "c")
+        finally:
+            closed.set()
+
+    stream = windowed(quiet(), lambda item: item[0], lambda a, b: a, lambda item: 0, 20, 100)
+    assert next(stream) == ("x", "a")
+    stream.close()
+    assert not closed.is_set()
+    release.set()
+    assert closed.wait(1)
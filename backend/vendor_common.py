@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Copy ``backend/common`` into function directories for standalone deploys.
+
+Each function imports the shared helpers as ``common.*``. In the repo they
+are found through ``backend/`` on ``sys.path``, but a function deployed on
+its own only uploads its own directory. Run this before deploying one: it
+replaces ``<function>/common`` with a fresh copy (without ``__pycache__``),
+which the function then imports ahead of the repo layout. ``--clean``
+removes the copies again. The copies are ignored by git.
+
+Usage:
+    python vendor_common.py [analysis-function ...] [--clean]
+    gcloud functions deploy ... --source=analysis-function
+"""
+import argparse
+import os
+import shutil
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+COMMON_DIR = os.path.join(BACKEND_DIR, "common")
+FUNCTIONS = ("analysis-function", "simulation-function", "mentorship-function")
+
+
+def vendor(function, clean=False):
+    """Replace (or with ``clean``, remove) the copy of ``common`` in ``function``; returns its path."""
+    target = os.path.join(BACKEND_DIR, function, "common")
+    if os.path.islink(target) or os.path.isfile(target):
+        os.remove(target)
+    elif os.path.isdir(target):
+        shutil.rmtree(target)
+    if not clean:
+        shutil.copytree(COMMON_DIR, target, ignore=shutil.ignore_patterns("__pycache__", "*.pyc"))
+    return target
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("functions", nargs="*", metavar="function",
+                        help=f"function directories (default: all of {', '.join(FUNCTIONS)})")
+    parser.add_argument("--clean", action="store_true", help="remove the copies instead")
+    args = parser.parse_args()
+    unknown = sorted(set(args.functions) - set(FUNCTIONS))
+    if unknown:
+        parser.error(f"unknown function directories: {', '.join(unknown)}")
+
+    for function in args.functions or FUNCTIONS:
+        target = vendor(function, clean=args.clean)
+        print(f"{'removed' if args.clean else 'vendored'} {os.path.relpath(target, BACKEND_DIR)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -76,7 +76,9 @@ async function callCloudFunctionForAnalysis(
     action,
     transcript,
     assessment,
-    systemInstruction
+    systemInstruction,
+    // Typed events ({type: 'text_delta' | 'thought_delta' | 'grounding' | 'usage' | 'done' | 'error'})
+    protocol: 'v2'
   };
 
   try {
@@ -109,6 +111,38 @@ async function callCloudFunctionForAnalysis(
     let isThinking = true;
     let thinkingComplete = false;
     let analysisData: any = null;
+    let streamDone = false;
+
+    const handleEvent = (event: any, line: string) => {
+      switch (event.type) {
+        case 'thought_delta':
+          thinkingChunks.push(event.text);
+          isThinking = true;
+          break;
+        case 'text_delta':
+          contentChunks.push(event.text);
+          rawResponseChunks.push(line);
+          if (isThinking) {
+            isThinking = false;
+            thinkingComplete = true;
+          }
+          break;
+        case 'grounding':
+          // [N] in the text cites chunks[N-1]
+          groundingChunks = event.chunks.map((context: any, index: number) => ({
+            _citation_number: index + 1,
+            retrieved_context: context
+          }));
+          rawResponseChunks.push(line);
+          break;
+        case 'done':
+          streamDone = true;
+          break;
+        case 'error':
+          console.error('Analysis stream error:', event.message);
+          break;
+      }
+    };
 
     try {
       while (true) {
@@ -129,39 +163,7 @@ async function callCloudFunctionForAnalysis(
           if (!line.trim()) continue;
           
           try {
-            const chunkData = JSON.parse(line);
-            
-            if (chunkData.candidates && chunkData.candidates.length > 0) {
-              const candidate = chunkData.candidates[0];
-              
-              // Process content parts
-              if (candidate.content && candidate.content.parts) {
-                for (const part of candidate.content.parts) {
-                  if (part.thought === true) {
-                    // This is a thinking chunk
-                    if (part.text) {
-                      thinkingChunks.push(part.text);
-                      isThinking = true;
-                    }
-                  } else if (part.text) {
-                    // This is a content chunk
-                    contentChunks.push(part.text);
-                    rawResponseChunks.push(line);
-                    if (isThinking) {
-                      isThinking = false;
-                      thinkingComplete = true;
-                    }
-                  }
-                }
-              }
-              
-              // Process grounding metadata (usually in final chunk)
-              if (candidate.grounding_metadata && candidate.grounding_metadata.grounding_chunks) {
-                groundingChunks = candidate.grounding_metadata.grounding_chunks;
-                // Also add the raw chunk containing grounding metadata for debugging
-                rawResponseChunks.push(line);
-              }
-            }
+            handleEvent(JSON.parse(line), line);
             
             // Update streaming display
             if (onStreamUpdate) {
@@ -185,22 +187,16 @@ async function callCloudFunctionForAnalysis(
       // Process any remaining data in buffer
       if (buffer.trim()) {
         try {
-          const chunkData = JSON.parse(buffer);
-          if (chunkData.candidates && chunkData.candidates.length > 0) {
-            const candidate = chunkData.candidates[0];
-            if (candidate.content && candidate.content.parts) {
-              for (const part of candidate.content.parts) {
-                if (part.text && part.thought !== true) {
-                  contentChunks.push(part.text);
-                }
-              }
-            }
-          }
+          handleEvent(JSON.parse(buffer), buffer);
         } catch (e) {
           console.error('Error parsing final buffer:', e);
         }
       }
       
+      if (!streamDone) {
+        console.warn('Analysis stream ended without a done event');
+      }
+      
       // Parse the final JSON content
       const fullContent = contentChunks.join('');
       if (fullContent) {
@@ -328,6 +324,7 @@ export function createMentorshipChatSession(systemInstruction: string, history:
 
 async function callMentorshipFunction(message: string, systemInstruction: string, history: Message[]): Promise<string> {
   const requestBody = {
+    action: 'mentorship_chat',
     message,
     systemInstruction,
     history
@@ -357,11 +354,16 @@ async function callMentorshipFunction(message: string, systemInstruction: string
 
 // Simulation chat session using dedicated simulation function
 export function createSimulationChatSession(scenarioId: string, history: Message[] = []) {
+  // Prefetch the scenario while the student reads it; only the first turn passes the token back
+  let sessionToken: Promise<string | undefined> | undefined = startSimulationSession(scenarioId);
   return {
     history: [...history],
     scenarioId,
     async sendMessageStream({ message }: { message: string }) {
-      const response = await callSimulationFunction(message, scenarioId, [...history, { role: 'user', parts: message }]);
+      const pending = sessionToken;
+      sessionToken = undefined;
+      const token = await pending;
+      const response = await callSimulationFunction(message, scenarioId, [...history, { role: 'user', parts: message }], token);
       
       // Simulate streaming by yielding the response
       async function* streamGenerator() {
@@ -373,11 +375,34 @@ export function createSimulationChatSession(scenarioId: string, history: Message
   };
 }
 
-async function callSimulationFunction(message: string, scenarioId: string, history: Message[]): Promise<string> {
+async function startSimulationSession(scenarioId: string): Promise<string | undefined> {
+  try {
+    const response = await fetch(SIMULATION_FUNCTION_URL, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ action: 'simulation_start', scenario_id: scenarioId })
+    });
+    if (!response.ok) {
+      return undefined;
+    }
+    const data = await response.json();
+    return data.session_token;
+  } catch (error) {
+    // Prefetch is optional; the first turn just does the work itself
+    console.warn('Simulation prefetch failed:', error);
+    return undefined;
+  }
+}
+
+async function callSimulationFunction(message: string, scenarioId: string, history: Message[], sessionToken?: string): Promise<string> {
   const requestBody = {
+    action: 'simulation_chat',
     message,
     scenario_id: scenarioId,
-    history
+    history,
+    session_token: sessionToken
   };
 
   try {